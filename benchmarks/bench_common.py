@@ -0,0 +1,41 @@
+"""
+Helpers shared by the benchmarks.
+"""
+
+from __future__ import absolute_import
+import json
+import logging
+
+from dxlclient import Request
+
+# The payload of the requests sent by the benchmarks
+SYSTEM_FIND_PAYLOAD = json.dumps({"command": "system.find",
+                                  "params": {"searchText": "bench"}}).encode(
+                                      encoding="UTF-8")
+
+
+def create_request(topic):
+    """
+    Creates a request for the ``system.find`` command
+
+    :param topic: The request topic of the ePO server
+    :return: The request
+    """
+    request = Request(topic)
+    request.payload = SYSTEM_FIND_PAYLOAD
+    return request
+
+
+def add_log_handler(handler):
+    """
+    Adds a handler to the root logger, with the format used by the service (so
+    that log records are formatted as by the service), and logs records at the
+    INFO level
+
+    :param handler: The handler
+    """
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(name)-12s %(levelname)-8s %(message)s"))
+    root_logger = logging.getLogger()
+    root_logger.addHandler(handler)
+    root_logger.setLevel(logging.INFO)
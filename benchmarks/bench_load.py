@@ -0,0 +1,340 @@
+"""
+Load tests the request processing of the service against a multi-threaded mock
+ePO server (see ``mock_epo.py``), and compares the results to stored baselines.
+
+For each scenario, a mock ePO server is started (in a separate process) with
+the latency distribution, payload size and error rate of the scenario.
+Concurrent clients send requests through the request callback of the service
+(with request dispatch enabled), each client waiting for the response to its
+request before sending the next one. The throughput, the 50th and 99th
+percentile latencies (from receiving the request until its response was sent),
+the error rate and the peak memory (RSS) are reported. Each scenario runs in
+its own process, so that the peak memory is not affected by the other
+scenarios.
+
+Each scenario is run several times, and the median of each metric is reported
+(to reduce the effect of noise from other processes). The results are compared
+to the baselines in ``baselines.json``, and the benchmark exits with a non-zero
+status if a metric regressed by more than the tolerance. Baselines depend on
+the machine they were recorded on: record them again (``--update-baseline``)
+before comparing results on a different machine.
+
+Usage (from the root directory of the repository)::
+
+    python benchmarks/bench_load.py [--scenario NAME] [--update-baseline]
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import warnings
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, ".."))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+# pylint: disable=wrong-import-position
+from bench_common import add_log_handler, create_request
+from dxlclient.message import ErrorResponse
+from mock_epo import MockEpoServerProcess
+from dxleposervice._dispatch import _Dispatcher, _Lane
+from dxleposervice._drain import _InFlightTracker
+from dxleposervice._epo import _Epo
+from dxleposervice.app import _EpoRequestCallback
+from tests.mock_dxlclient import MockDxlClient
+
+try:
+    import resource
+except ImportError: #Windows
+    resource = None
+
+# The default location of the stored baselines
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baselines.json")
+
+# The request topic of the mock ePO server
+REQUEST_TOPIC = "/mcafee/service/epo/remote/bench"
+
+# The load test scenarios: the mock ePO server (latency distribution in
+# milliseconds, payload size in bytes and error rate), the number of concurrent
+# clients, the number of request dispatch threads and the number of requests
+SCENARIOS = {
+    "typical": {
+        "latency": "lognormal:20:0.5", "payloadSize": 4096, "errorRate": 0.0,
+        "concurrency": 16, "threads": 16, "requests": 2000},
+    "large-payload": {
+        "latency": "fixed:20", "payloadSize": 1024 * 1024, "errorRate": 0.0,
+        "concurrency": 8, "threads": 8, "requests": 200},
+    "errors": {
+        "latency": "lognormal:20:0.5", "payloadSize": 4096, "errorRate": 0.2,
+        "concurrency": 16, "threads": 16, "requests": 2000},
+    "slow-epo": {
+        "latency": "lognormal:200:1.0", "payloadSize": 4096, "errorRate": 0.0,
+        "concurrency": 64, "threads": 32, "requests": 1000}
+}
+
+# The metrics compared to the baselines, and whether higher values are better
+COMPARED_METRICS = [("throughput", True), ("p50Ms", False), ("p99Ms", False),
+                    ("peakRssMb", False)]
+
+# The minimum absolute change in latency (in milliseconds) reported as a
+# regression (smaller changes are within the noise of the scheduler)
+MIN_LATENCY_REGRESSION_MS = 2.0
+
+# The number of requests sent before the measured requests (to establish
+# connections and fetch the security token)
+WARMUP_REQUESTS = 50
+
+
+class _ResponseRecorder(MockDxlClient):
+    """
+    A mock DXL client that notifies the client waiting for each response
+    """
+
+    def __init__(self):
+        super(_ResponseRecorder, self).__init__()
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def expect(self, request):
+        """
+        Registers a request whose response is awaited
+
+        :param request: The request
+        :return: An event set (with the response as its ``response`` attribute)
+            when the response is sent
+        """
+        event = threading.Event()
+        with self._lock:
+            self._pending[request.message_id] = event
+        return event
+
+    def send_response(self, response):
+        with self._lock:
+            event = self._pending.pop(response.request_message_id, None)
+        if event is not None:
+            event.response = response
+            event.set()
+
+
+def _percentile(values, percentile):
+    """
+    Returns a percentile of sorted values (nearest rank)
+    """
+    if not values:
+        return 0.0
+    index = int(round(percentile / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(len(values) - 1, index))]
+
+
+def _get_peak_rss_mb():
+    """
+    Returns the peak resident memory of the process (in megabytes)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        peak /= 1024.0
+    return round(peak / 1024.0, 1)
+
+
+def _run_clients(run_client, concurrency):
+    """
+    Runs concurrent clients until they have sent all of their requests
+
+    :param run_client: The function run by each client
+    :param concurrency: The number of clients
+    :return: The elapsed time (in seconds)
+    """
+    clients = [threading.Thread(target=run_client) for _ in range(concurrency)]
+    start = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return time.time() - start
+
+
+def run_scenario(scenario, request_count=None):
+    """
+    Runs a load test scenario
+
+    :param scenario: The scenario
+    :param request_count: The number of requests (optional, overrides the
+        number of requests of the scenario)
+    :return: The results (a dictionary)
+    """
+    request_count = request_count or scenario["requests"]
+    with MockEpoServerProcess(latency=scenario["latency"],
+                              payload_size=scenario["payloadSize"],
+                              error_rate=scenario["errorRate"]) as server:
+        epo = _Epo(name="bench", host="127.0.0.1", port=server.port,
+                   user="bench", password="bench", verify=False)
+        lane = _Lane("default", thread_count=scenario["threads"],
+                     queue_size=scenario["concurrency"] * 2)
+        recorder = _ResponseRecorder()
+        callback = _EpoRequestCallback(
+            recorder, {REQUEST_TOPIC: epo}, dispatcher=_Dispatcher(lane),
+            in_flight=_InFlightTracker())
+
+        lock = threading.Lock()
+        remaining = [WARMUP_REQUESTS + request_count]
+        latencies = []
+        errors = [0]
+
+        def run_client():
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                    measured = remaining[0] < request_count
+                request = create_request(REQUEST_TOPIC)
+                event = recorder.expect(request)
+                start = time.time()
+                callback.on_request(request)
+                event.wait(60)
+                latency = time.time() - start
+                if measured:
+                    with lock:
+                        latencies.append(latency)
+                        if isinstance(getattr(event, "response", None),
+                                      ErrorResponse) or not event.is_set():
+                            errors[0] += 1
+
+        elapsed = _run_clients(run_client, scenario["concurrency"])
+        lane.shutdown()
+        epo.close()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50Ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p99Ms": round(_percentile(latencies, 99) * 1000, 1),
+        "errorRate": round(errors[0] / float(max(1, len(latencies))), 3),
+        "peakRssMb": _get_peak_rss_mb()
+    }
+
+
+def _run_scenario_process(scenario, request_count, results):
+    """
+    Runs a load test scenario (in a separate process) and queues its results.
+    Log records are formatted and written (as by the service), but discarded.
+    """
+    # The mock ePO server uses a self-signed certificate
+    warnings.filterwarnings("ignore", message="Unverified HTTPS request")
+    add_log_handler(logging.FileHandler(os.devnull))
+    results.put(run_scenario(scenario, request_count))
+
+
+def _median_result(runs):
+    """
+    Returns the median of each metric of the runs of a scenario
+    """
+    result = {}
+    for metric in runs[0]:
+        values = sorted(run[metric] for run in runs
+                        if run[metric] is not None)
+        result[metric] = values[len(values) // 2] if values else None
+    return result
+
+
+def compare(name, result, baseline, tolerance):
+    """
+    Compares the results of a scenario to its baseline
+
+    :param name: The name of the scenario
+    :param result: The results of the scenario
+    :param baseline: The baseline results of the scenario
+    :param tolerance: The fraction by which a metric can regress
+    :return: A list of the regressions (messages)
+    """
+    regressions = []
+    for metric, higher_is_better in COMPARED_METRICS:
+        value, expected = result.get(metric), baseline.get(metric)
+        if value is None or not expected:
+            continue
+        if higher_is_better:
+            regressed = value < expected * (1 - tolerance)
+        else:
+            regressed = value > expected * (1 + tolerance)
+            if metric.endswith("Ms"):
+                regressed = regressed and \
+                    value - expected > MIN_LATENCY_REGRESSION_MS
+        if regressed:
+            regressions.append("{0}: {1} regressed from {2} to {3}".format(
+                name, metric, expected, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load tests the request processing of the service")
+    parser.add_argument("--scenario", action="append",
+                        choices=sorted(SCENARIOS),
+                        help="The scenario to run (all scenarios if not "
+                        "specified, can be repeated)")
+    parser.add_argument("--requests", type=int,
+                        help="The number of requests (overrides the number of "
+                        "requests of the scenarios)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="The number of times each scenario is run (the "
+                        "median of each metric is reported)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH,
+                        help="The file the baselines are stored in")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="The fraction by which a metric can regress")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Stores the results as the baselines")
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baselines = json.load(baseline_file)
+
+    regressions = []
+    print("{0:<14} {1:>10} {2:>9} {3:>9} {4:>7} {5:>9}".format(
+        "scenario", "req/s", "p50 ms", "p99 ms", "errors", "RSS MB"))
+    for name in args.scenario or sorted(SCENARIOS):
+        runs = []
+        for _ in range(args.repeat):
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_run_scenario_process,
+                args=(SCENARIOS[name], args.requests, results))
+            process.start()
+            runs.append(results.get())
+            process.join()
+        result = _median_result(runs)
+        print("{0:<14} {1:>10} {2:>9} {3:>9} {4:>7} {5:>9}".format(
+            name, result["throughput"], result["p50Ms"], result["p99Ms"],
+            result["errorRate"], result["peakRssMb"]))
+        if args.update_baseline:
+            baselines[name] = result
+        elif name in baselines:
+            regressions.extend(compare(name, result, baselines[name],
+                                       args.tolerance))
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baselines, baseline_file, indent=4, sort_keys=True)
+            baseline_file.write("\n")
+        print("Baselines stored: {0}".format(args.baseline))
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
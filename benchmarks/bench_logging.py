@@ -0,0 +1,111 @@
+"""
+Measures the per-request overhead of logging in the request path, with
+synchronous logging (the handlers of the logging configuration are invoked by
+the threads processing requests) and asynchronous logging (the handlers are
+invoked by a listener thread, see ``dxleposervice._asynclog``).
+
+Requests are processed by the request callback of the service against a mock ePO
+server, half of which fail (so that an exception with its traceback is logged
+for each failed request). Log records are written to a handler that simulates a
+slow sink (for example, a slow stdout pipe).
+
+Usage (from the root directory of the repository)::
+
+    python benchmarks/bench_logging.py [--requests N] [--sink-delay MS]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import logging
+import os
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, ".."))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+# pylint: disable=wrong-import-position
+from bench_common import add_log_handler, create_request
+from dxleposervice._asynclog import _AsyncLogging
+from dxleposervice.app import _EpoRequestCallback
+from tests.mock_dxlclient import MockDxlClient
+
+
+class _SlowStream(object):
+    """
+    A stream that takes a fixed time to write each record
+    """
+
+    def __init__(self, delay):
+        self._delay = delay
+
+    def write(self, text): # pylint: disable=unused-argument
+        time.sleep(self._delay)
+
+    def flush(self):
+        pass
+
+
+class _MockEpo(object):
+    """
+    An ePO server wrapper that fails every other command
+    """
+
+    name = "bench-epo"
+
+    def __init__(self):
+        self._count = 0
+
+    def execute(self, command, output, req_params): # pylint: disable=unused-argument
+        self._count += 1
+        if self._count % 2:
+            raise Exception("Command failed")
+        return "result"
+
+
+def _run(callback, request_count):
+    """
+    Processes requests and returns the average time per request (in seconds)
+    """
+    request = create_request("/bench/epo")
+    start = time.time()
+    for _ in range(request_count):
+        callback.on_request(request)
+    return (time.time() - start) / request_count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measures the per-request overhead of logging")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="The number of requests to process")
+    parser.add_argument("--sink-delay", type=float, default=1.0,
+                        help="The time (in milliseconds) to write each record")
+    args = parser.parse_args()
+
+    add_log_handler(logging.StreamHandler(
+        _SlowStream(args.sink_delay / 1000.0)))
+
+    callback = _EpoRequestCallback(MockDxlClient(), {"/bench/epo": _MockEpo()})
+    modes = [("no logging", None), ("synchronous", False),
+             ("asynchronous", True)]
+    for name, asynchronous in modes:
+        logging.disable(logging.CRITICAL if asynchronous is None else
+                        logging.NOTSET)
+        async_logging = _AsyncLogging()
+        if asynchronous:
+            if not async_logging.is_supported():
+                print("{0:<14} not supported".format(name))
+                continue
+            async_logging.start()
+        try:
+            average = _run(callback, args.requests)
+        finally:
+            async_logging.stop()
+        print("{0:<14} {1:10.1f} us/request".format(name, average * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+A multi-threaded mock ePO server for load tests, with configurable response
+latencies, payload sizes and error rates.
+
+Unlike the mock server used by the unit tests (``tests/mock_epohttpserver.py``),
+each connection is served by its own thread and connections are kept alive, so
+the server can serve many concurrent requests. Every command other than
+``core.getSecurityToken`` (for example, ``system.find``) responds after a delay
+sampled from the latency distribution, with either an ePO error (at the error
+rate) or a JSON list of records of the payload size.
+
+The server can also be run standalone (for example, to load test a service
+configured to use it)::
+
+    python benchmarks/mock_epo.py --port 8443 --latency lognormal:50:0.5
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import ssl
+import threading
+import time
+
+try: #Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError: #Python 2.7
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+# The directory containing the certificate and key used by the unit tests
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                         "tests")
+DEFAULT_CERTFILE = os.path.join(TESTS_DIR, "client.crt")
+DEFAULT_KEYFILE = os.path.join(TESTS_DIR, "client.key")
+
+# The security token returned by the server
+SECURITY_TOKEN = "mock-security-token"
+
+
+class LatencyDistribution(object):
+    """
+    A distribution of response latencies, specified as ``<name>:<parameters>``
+    (all values in milliseconds):
+
+    * ``fixed:<latency>``
+    * ``uniform:<minimum>:<maximum>``
+    * ``exponential:<mean>``
+    * ``lognormal:<median>:<sigma>`` (a long-tailed distribution, typical of
+      database-backed servers)
+    """
+
+    def __init__(self, spec):
+        """
+        Constructs the distribution
+
+        :param spec: The specification of the distribution
+        """
+        parts = spec.split(":")
+        self.spec = spec
+        self._name = parts[0]
+        try:
+            self._params = [float(part) for part in parts[1:]]
+        except ValueError:
+            raise ValueError("Invalid latency distribution: {0}".format(spec))
+        arity = {"fixed": 1, "uniform": 2, "exponential": 1, "lognormal": 2}
+        if arity.get(self._name) != len(self._params):
+            raise ValueError("Invalid latency distribution: {0}".format(spec))
+
+    def sample(self):
+        """
+        Returns a latency sampled from the distribution
+
+        :return: The latency (in seconds)
+        """
+        if self._name == "fixed":
+            latency = self._params[0]
+        elif self._name == "uniform":
+            latency = random.uniform(*self._params)
+        elif self._name == "exponential":
+            latency = random.expovariate(1.0 / self._params[0]) \
+                if self._params[0] > 0 else 0
+        else:
+            latency = self._params[0] * random.lognormvariate(0,
+                                                              self._params[1])
+        return max(0.0, latency) / 1000.0
+
+
+def create_payload(size):
+    """
+    Returns a JSON list of system records of approximately the specified size
+
+    :param size: The size (in bytes)
+    :return: The payload
+    """
+    record = {"EPOComputerProperties.ComputerName": "system",
+              "EPOComputerProperties.OSType": "Linux",
+              "EPOComputerProperties.Description": ""}
+    record_size = len(json.dumps(record)) + 2
+    records = []
+    for index in range(max(1, size // 200)):
+        entry = dict(record)
+        entry["EPOComputerProperties.ComputerName"] = "system{0}".format(index)
+        entry["EPOComputerProperties.Description"] = "x" * max(
+            0, min(200, size) - record_size)
+        records.append(entry)
+    return json.dumps(records)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class MockEpoServer(object):
+    """
+    A multi-threaded mock ePO server
+    """
+
+    def __init__(self, latency="fixed:0", payload_size=1024, error_rate=0.0,
+                 port=0, certfile=DEFAULT_CERTFILE, keyfile=DEFAULT_KEYFILE):
+        """
+        Constructs the server
+
+        :param latency: The latency distribution (see
+            :class:`LatencyDistribution`)
+        :param payload_size: The size (in bytes) of the result of commands
+        :param error_rate: The fraction of commands that fail
+        :param port: The port the server listens on (0 for any free port)
+        :param certfile: The certificate of the server
+        :param keyfile: The private key of the server
+        """
+        self.latency = LatencyDistribution(latency)
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._result = ("OK:\n" + create_payload(payload_size)).encode("utf-8")
+        self._server = _ThreadingHTTPServer(("127.0.0.1", port),
+                                            self._create_handler())
+        context = ssl.SSLContext(getattr(ssl, "PROTOCOL_TLS_SERVER",
+                                         ssl.PROTOCOL_SSLv23))
+        context.load_cert_chain(certfile, keyfile)
+        self._server.socket = context.wrap_socket(self._server.socket,
+                                                  server_side=True)
+        self._thread = None
+
+    @property
+    def port(self):
+        """
+        The port the server listens on
+        """
+        return self._server.server_address[1]
+
+    def _create_handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Send each response in a single segment (avoids delays from the
+            # interaction of Nagle's algorithm and delayed acknowledgements)
+            disable_nagle_algorithm = True
+            wbufsize = -1
+
+            def do_GET(self): # pylint: disable=invalid-name
+                self.send_result(server.respond(self.path))
+
+            def send_result(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # pylint: disable=redefined-builtin
+                pass
+
+        return _Handler
+
+    def respond(self, path):
+        """
+        Returns the response body for a request
+
+        :param path: The path of the request
+        :return: The response body
+        """
+        if "/remote/core.getSecurityToken" in path:
+            return ("OK:\n" + SECURITY_TOKEN).encode("utf-8")
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency.sample())
+        if random.random() < self.error_rate:
+            return b"Error 1:\nMock ePO failure"
+        return self._result
+
+    def start(self):
+        """
+        Starts serving requests (on a background thread)
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="MockEpoServer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops serving requests
+        """
+        self._server.shutdown()
+        self._thread.join()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def _serve(options, ports, stopped):
+    """
+    Runs a mock ePO server until it is stopped (in a separate process)
+    """
+    with MockEpoServer(**options) as server:
+        ports.put(server.port)
+        stopped.wait()
+
+
+class MockEpoServerProcess(object):
+    """
+    Runs a mock ePO server in a separate process (so that the server does not
+    compete with the code under test for the global interpreter lock)
+    """
+
+    def __init__(self, **options):
+        """
+        Constructs the process
+
+        :param options: The options of the server (see :class:`MockEpoServer`)
+        """
+        self._options = options
+        self._stopped = multiprocessing.Event()
+        self._process = None
+        self.port = None
+
+    def __enter__(self):
+        ports = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self._options, ports, self._stopped),
+            name="MockEpoServer")
+        self._process.start()
+        self.port = ports.get(timeout=30)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stopped.set()
+        self._process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a mock ePO server")
+    parser.add_argument("--port", type=int, default=8443,
+                        help="The port to listen on")
+    parser.add_argument("--latency", default="fixed:0",
+                        help="The latency distribution (for example, "
+                        "lognormal:50:0.5)")
+    parser.add_argument("--payload-size", type=int, default=1024,
+                        help="The size (in bytes) of command results")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="The fraction of commands that fail")
+    parser.add_argument("--certfile", default=DEFAULT_CERTFILE,
+                        help="The certificate of the server")
+    parser.add_argument("--keyfile", default=DEFAULT_KEYFILE,
+                        help="The private key of the server")
+    args = parser.parse_args()
+
+    server = MockEpoServer(args.latency, args.payload_size, args.error_rate,
+                           args.port, args.certfile, args.keyfile)
+    print("Serving mock ePO on port {0} ...".format(server.port))
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
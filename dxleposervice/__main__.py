@@ -8,7 +8,14 @@ import os
 import signal
 import threading
 
+try: #Python 3
+    from configparser import ConfigParser
+except ImportError: #Python 2.7
+    from ConfigParser import ConfigParser
+
 from .app import EpoService
+from ._asynclog import _AsyncLogging
+from ._supervisor import _Supervisor
 
 # Whether the application is running
 running = False
@@ -16,6 +23,65 @@ running = False
 # Condition used to notify that the application should exit
 run_condition = threading.Condition()
 
+# The supervisor (if the service is running in multiple worker processes)
+supervisor = None # pylint: disable=invalid-name
+
+# The application (if it is running in this process)
+application = None # pylint: disable=invalid-name
+
+# The time (in seconds) after the drain timeout that workers are given to shut
+# down before they are killed
+SHUTDOWN_TIMEOUT_MARGIN = 30
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+def restart_handler(signum, frame):
+    """
+    Signal handler invoked to request a rolling restart of the workers
+
+    :param signum: The signal number
+    :param frame: The frame
+    """
+    del signum, frame
+    if supervisor is not None:
+        supervisor.restart()
+
+
+def profile_handler(signum, frame):
+    """
+    Signal handler invoked to start a profile of the application (or stop the
+    profile in progress)
+
+    :param signum: The signal number
+    :param frame: The frame
+    """
+    del frame
+    if supervisor is not None:
+        supervisor.signal_workers(signum)
+    elif application is not None:
+        try:
+            application.toggle_profile()
+        except Exception: # pylint: disable=broad-except
+            logger.exception("Error toggling profile")
+
+
+def get_drain_timeout(config_dir):
+    """
+    Returns the time workers are given to drain their requests on shutdown
+
+    :param config_dir: The location of the configuration files
+    :return: The drain timeout (in seconds)
+    """
+    config = ConfigParser()
+    config.read(os.path.join(config_dir, EpoService.SERVICE_CONFIG_FILE))
+    if config.has_option(EpoService.GENERAL_CONFIG_SECTION,
+                         EpoService.GENERAL_DRAIN_TIMEOUT_CONFIG_PROP):
+        return config.getint(EpoService.GENERAL_CONFIG_SECTION,
+                             EpoService.GENERAL_DRAIN_TIMEOUT_CONFIG_PROP)
+    return EpoService.DEFAULT_DRAIN_TIMEOUT
+
 
 def signal_handler(signum, frame):
     """
@@ -26,6 +92,9 @@ def signal_handler(signum, frame):
     """
     del signum, frame
     global running, run_condition # pylint: disable=global-statement
+    if supervisor is not None:
+        supervisor.stop()
+        return
     with run_condition:
         if running:
             # Stop the application
@@ -34,50 +103,125 @@ def signal_handler(signum, frame):
         else:
             exit(1)
 
-# Signals to register for
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGINT, signal_handler)
-
-# Validate command line
-if len(sys.argv) != 2:
-    print("Usage: dxleposervice <configuration files directory>")
-    sys.exit(1)
-
-#
-# Configure Logging
-#
-
-config_dir = sys.argv[1]
-logging_config_path = os.path.join(config_dir, EpoService.LOGGING_CONFIG_FILE)
-if os.access(logging_config_path, os.R_OK):
-    # Log configuration via configuration file
-    fileConfig(logging_config_path, disable_existing_loggers=False)
-    logger = logging.getLogger()
-else:
-    # Default log configuration (no configuration file)
-    log_formatter = logging.Formatter('%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
-
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(log_formatter)
-
-    logger = logging.getLogger()
-    logger.addHandler(console_handler)
-    logger.setLevel(logging.INFO)
-
-# Create the application
-with EpoService(sys.argv[1]) as app:
-    try:
-        # Run the application
-        app.run()
-        running = True
 
-        with run_condition:
-            # Wait until notified to exit
-            while running:
-                run_condition.wait(60)
+def configure_logging(config_dir):
+    """
+    Configures logging
+
+    :param config_dir: The location of the configuration files
+    """
+    logging_config_path = os.path.join(config_dir, EpoService.LOGGING_CONFIG_FILE)
+    if os.access(logging_config_path, os.R_OK):
+        # Log configuration via configuration file
+        fileConfig(logging_config_path, disable_existing_loggers=False)
+    else:
+        # Default log configuration (no configuration file)
+        log_formatter = logging.Formatter('%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
+
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(log_formatter)
+
+        root_logger = logging.getLogger()
+        root_logger.addHandler(console_handler)
+        root_logger.setLevel(logging.INFO)
+
+
+def run_service(config_dir, worker_id=None):
+    """
+    Runs the application until a signal is received
+
+    :param config_dir: The location of the configuration files
+    :param worker_id: The identifier of the worker process (if the service is
+        running in multiple worker processes)
+    """
+    global running, supervisor, application # pylint: disable=global-statement
+    # A worker process handles signals itself (rather than the supervisor)
+    supervisor = None
+    signal.signal(signal.SIGTERM, signal_handler)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, profile_handler)
+    if worker_id is None:
+        signal.signal(signal.SIGINT, signal_handler)
+    else:
+        # Workers are shut down by the supervisor (via SIGTERM)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if not logging.getLogger().handlers:
+        configure_logging(config_dir)
+    # Log from a background thread (started after the worker process is forked),
+    # so that threads processing requests do not block on the log handlers
+    async_logging = _AsyncLogging()
+    async_logging.start()
 
-    except KeyboardInterrupt:
-        pass
+    try:
+        # Create the application
+        with EpoService(config_dir, worker_id=worker_id) as app:
+            application = app
+            try:
+                # Run the application
+                app.run()
+                running = True
+
+                with run_condition:
+                    # Wait until notified to exit
+                    while running:
+                        run_condition.wait(60)
+
+            except KeyboardInterrupt:
+                pass
+            except: # pylint: disable=bare-except
+                logger.exception("Error occurred, exiting")
+                sys.exit(1)
+    finally:
+        application = None
+        async_logging.stop()
+
+
+def main():
+    """
+    Runs the service (in multiple worker processes if the ``--workers`` option
+    is specified)
+    """
+    global supervisor # pylint: disable=global-statement
+    args = sys.argv[1:]
+    workers = 1
+    if len(args) == 3 and args[1] == "--workers" and args[2].isdigit() and \
+            int(args[2]) > 0:
+        workers = int(args[2])
+        args = args[:1]
+
+    # Validate command line
+    if len(args) != 1:
+        print("Usage: dxleposervice <configuration files directory> [--workers N]")
+        sys.exit(1)
+
+    config_dir = args[0]
+    configure_logging(config_dir)
+
+    if workers == 1:
+        run_service(config_dir)
+        return
+
+    # Workers that have not drained their requests (and shut down) within the
+    # margin after the drain timeout are killed
+    supervisor = _Supervisor(
+        config_dir, EpoService.SERVICE_CONFIG_FILE, workers, run_service,
+        shutdown_timeout=get_drain_timeout(config_dir) +
+        SHUTDOWN_TIMEOUT_MARGIN)
+    # Signals to register for
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, restart_handler)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, profile_handler)
+    try:
+        supervisor.run()
     except: # pylint: disable=bare-except
         logger.exception("Error occurred, exiting")
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+from __future__ import absolute_import
+import logging
+import threading
+import time
+
+from requests.exceptions import RequestException
+
+from ._errors import _OverloadedError
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+# The settings of the limit are kept with its state, which is guarded by a single
+# lock
+class _AimdLimit(object): # pylint: disable=too-many-instance-attributes
+    """
+    An adaptive concurrency limit for a class of commands of a single ePO server.
+
+    The limit is adjusted using AIMD (additive increase, multiplicative decrease).
+    Each completed request that was faster than the latency threshold increases
+    the limit by roughly one request per "window" of requests. A request that
+    was slower than the threshold (or failed to reach the ePO server) reduces the
+    limit by the backoff ratio, at most once per window: the requests that
+    complete after a decrease (until the requests that were in flight and a
+    limit's worth of requests have completed) do not reduce it again, so that a
+    burst of slow responses only reduces the limit once.
+    """
+
+    # The weight given to the latest latency sample in the smoothed latency
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self, initial_limit, min_limit, max_limit, latency_threshold,
+                 backoff_ratio):
+        """
+        Constructs the limit
+
+        :param initial_limit: The initial concurrency limit
+        :param min_limit: The minimum concurrency limit
+        :param max_limit: The maximum concurrency limit
+        :param latency_threshold: The latency (in seconds) above which a request is
+            considered a sign of overload
+        :param backoff_ratio: The ratio the limit is multiplied by when overload
+            is detected
+        """
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._latency_threshold = latency_threshold
+        self._backoff_ratio = backoff_ratio
+        self._limit = float(max(min_limit, min(max_limit, initial_limit)))
+        self._in_flight = 0
+        self._latency = None
+        # The number of requests to complete before the limit can be reduced
+        # again
+        self._decrease_window = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        """
+        The current concurrency limit
+        """
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        """
+        The number of requests currently in flight (including the requests that
+        are queued in a dispatch lane)
+        """
+        return self._in_flight
+
+    @property
+    def latency(self):
+        """
+        The smoothed latency (in seconds) of completed requests (or None if no
+        requests have completed)
+        """
+        return self._latency
+
+    def try_acquire(self):
+        """
+        Attempts to reserve a slot for a request
+
+        :return: Whether a slot was reserved
+        """
+        with self._lock:
+            if self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self, latency, dropped=False):
+        """
+        Releases a slot that was previously reserved and adjusts the limit
+
+        :param latency: The time (in seconds) the request took to complete
+        :param dropped: Whether the request failed in a way that indicates the
+            ePO server is overloaded (connection failure, timeout, etc.)
+        """
+        with self._lock:
+            self._in_flight -= 1
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency += self.LATENCY_SMOOTHING * (latency - self._latency)
+
+            if not dropped and latency <= self._latency_threshold:
+                self._limit = min(self._max_limit,
+                                  self._limit + 1.0 / self._limit)
+            if self._decrease_window > 0:
+                self._decrease_window -= 1
+            elif dropped or latency > self._latency_threshold:
+                self._limit = max(self._min_limit,
+                                  self._limit * self._backoff_ratio)
+                self._decrease_window = max(self._in_flight, int(self._limit))
+
+    def cancel(self):
+        """
+        Releases a slot that was previously reserved for a request that was not
+        executed (the limit is not adjusted)
+        """
+        with self._lock:
+            self._in_flight -= 1
+
+    def retry_after(self):
+        """
+        Returns the suggested delay (in milliseconds) before a rejected request
+        should be retried
+
+        :return: The suggested delay (in milliseconds)
+        """
+        latency = self._latency if self._latency is not None \
+            else self._latency_threshold
+        return max(1, int(latency * 1000))
+
+
+class _Admission(object):
+    """
+    Holds a slot of an :class:`_AimdLimit` from the time a request is admitted
+    (before it is queued) until it has been executed. Used as a context manager
+    that wraps the execution of the request: only the time taken to execute the
+    request (not the time it was queued) is used to adjust the limit.
+    """
+
+    def __init__(self, limit):
+        self._limit = limit
+        self._start = None
+        self._released = False
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        dropped = exc_type is not None and issubclass(exc_type, RequestException)
+        self._released = True
+        self._limit.release(time.time() - self._start, dropped)
+
+    def cancel(self):
+        """
+        Releases the slot if the request was not executed (for example, if it
+        could not be queued)
+        """
+        if not self._released:
+            self._released = True
+            self._limit.cancel()
+
+
+class _AdmissionController(object):
+    """
+    Admission control for requests that are dispatched to ePO servers.
+
+    Tracks a separate adaptive concurrency limit for each class of commands (the
+    dispatch lane of the commands) of each ePO server, so that slow commands
+    (for example, long-running queries) do not reduce the limit for interactive
+    commands. Requests are admitted before they are queued in a dispatch lane,
+    and hold their slot while queued, so that requests that exceed the limit
+    are rejected quickly with an :class:`_OverloadedError` (rather than being
+    queued for an unbounded period of time).
+    """
+
+    # The class of commands that are not dispatched to a lane
+    DEFAULT_CLASS = "default"
+
+    def __init__(self, initial_limit, min_limit, max_limit, latency_threshold,
+                 backoff_ratio, latency_thresholds=None):
+        """
+        Constructs the admission controller
+
+        :param initial_limit: The initial concurrency limit for each ePO server
+        :param min_limit: The minimum concurrency limit for each ePO server
+        :param max_limit: The maximum concurrency limit for each ePO server
+        :param latency_threshold: The latency (in seconds) above which a request is
+            considered a sign of overload
+        :param backoff_ratio: The ratio a limit is multiplied by when overload
+            is detected
+        :param latency_thresholds: The latency thresholds (in seconds) for
+            specific classes of commands, by class name (optional)
+        """
+        self._create_limit = lambda threshold: _AimdLimit(
+            initial_limit, min_limit, max_limit, threshold, backoff_ratio)
+        self._latency_threshold = latency_threshold
+        self._latency_thresholds = dict(
+            (name.lower(), threshold)
+            for name, threshold in (latency_thresholds or {}).items())
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    def get_limit(self, epo_name, command_class=DEFAULT_CLASS):
+        """
+        Returns the adaptive limit for a class of commands of an ePO server
+
+        :param epo_name: The name of the ePO server
+        :param command_class: The class of commands (the name of their dispatch
+            lane)
+        :return: The adaptive limit
+        """
+        command_class = command_class.lower()
+        with self._lock:
+            limit = self._limits.get((epo_name, command_class))
+            if limit is None:
+                limit = self._create_limit(self._latency_thresholds.get(
+                    command_class, self._latency_threshold))
+                self._limits[(epo_name, command_class)] = limit
+            return limit
+
+    def admit(self, epo_name, command_class=DEFAULT_CLASS):
+        """
+        Admits a request for the specified ePO server. An :class:`_OverloadedError`
+        is raised if the concurrency limit for the class of commands of the ePO
+        server has been reached.
+
+        :param epo_name: The name of the ePO server
+        :param command_class: The class of commands (the name of their dispatch
+            lane)
+        :return: The admission, a context manager that must wrap the execution
+            of the request (its ``cancel`` method must be invoked if the request
+            is not executed)
+        """
+        limit = self.get_limit(epo_name, command_class)
+        if not limit.try_acquire():
+            logger.warning(
+                "Rejecting request for ePO server '%s' (class=%s, limit=%d, "
+                "in flight=%d)", epo_name, command_class, limit.limit,
+                limit.in_flight)
+            raise _OverloadedError(epo_name, limit.retry_after())
+        return _Admission(limit)
@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+import logging
+
+from ._metrics import registry
+
+try: #Python 3
+    import queue
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError: #Python 2.7
+    QueueHandler = QueueListener = None
+
+# The number of log records dropped because the logging queue was full
+_dropped_counter = registry.counter(
+    "logging_dropped_records_total",
+    "The number of log records dropped because the logging queue was full")
+
+
+if QueueHandler is not None:
+    class _NonBlockingQueueHandler(QueueHandler):
+        """
+        A queue handler that does not block the logging thread: records are
+        dropped (and counted) if the queue is full, and exception tracebacks are
+        formatted by the listener thread (rather than the logging thread)
+        """
+
+        def prepare(self, record):
+            # Merge the arguments into the message (so that arguments that are
+            # modified later do not change the message). The exception
+            # information is retained for the handlers of the listener.
+            record.msg = record.getMessage()
+            record.args = None
+            return record
+
+        def enqueue(self, record):
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                _dropped_counter.inc()
+else: #Python 2.7
+    _NonBlockingQueueHandler = None # pylint: disable=invalid-name
+
+
+class _AsyncLogging(object):
+    """
+    Routes log records through queues, so that threads processing requests do
+    not block on slow log handlers (for example, a slow stdout pipe or file
+    system). The handlers of each configured logger are replaced with a queue
+    handler, and the original handlers are invoked by a listener thread.
+
+    Asynchronous logging is not available on Python 2.7 (records are logged
+    synchronously).
+    """
+
+    # The maximum number of records waiting to be logged (per logger)
+    QUEUE_SIZE = 10000
+
+    def __init__(self):
+        self._listeners = []
+
+    @staticmethod
+    def is_supported():
+        """
+        Returns whether asynchronous logging is supported
+
+        :return: Whether asynchronous logging is supported
+        """
+        return QueueHandler is not None
+
+    def start(self):
+        """
+        Replaces the handlers of the root logger (and of the other loggers with
+        handlers) with queue handlers
+        """
+        if not self.is_supported() or self._listeners:
+            return
+        loggers = [logging.getLogger()] + [
+            logger for logger in list(logging.Logger.manager.loggerDict.values())
+            if isinstance(logger, logging.Logger) and logger.handlers]
+        for logger in loggers:
+            handlers = list(logger.handlers)
+            if not handlers:
+                continue
+            log_queue = queue.Queue(self.QUEUE_SIZE)
+            listener = QueueListener(log_queue, *handlers,
+                                     respect_handler_level=True)
+            queue_handler = _NonBlockingQueueHandler(log_queue)
+            for handler in handlers:
+                logger.removeHandler(handler)
+            logger.addHandler(queue_handler)
+            listener.start()
+            self._listeners.append((logger, queue_handler, listener, handlers))
+
+    def stop(self):
+        """
+        Logs the queued records and restores the original handlers
+        """
+        listeners, self._listeners = self._listeners, []
+        for logger, queue_handler, listener, handlers in listeners:
+            logger.removeHandler(queue_handler)
+            for handler in handlers:
+                logger.addHandler(handler)
+            listener.stop()
@@ -0,0 +1,151 @@
+from __future__ import absolute_import
+import random
+import threading
+from collections import deque
+
+
+class _LatencyTracker(object):
+    """
+    Tracks the latencies of recent requests and computes percentiles over them
+    """
+
+    def __init__(self, max_samples=200):
+        """
+        Constructs the tracker
+
+        :param max_samples: The number of recent latencies that are retained
+        """
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, latency):
+        """
+        Adds a latency sample
+
+        :param latency: The latency (in seconds)
+        """
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, percent):
+        """
+        Returns a percentile of the retained latencies
+
+        :param percent: The percentile (0 to 100)
+        :return: The latency (in seconds) for the percentile, or ``None`` if no
+            latencies have been recorded
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100.0))]
+
+
+class _HostState(object):
+    """
+    The observed health and latency of a single ePO application server
+    """
+
+    # The weight given to the latest latency sample in the smoothed latency
+    LATENCY_SMOOTHING = 0.2
+    # The minimum health of a host (it is still selected occasionally, so that
+    # its recovery is detected)
+    MIN_HEALTH = 0.05
+    # The amount the health of a host is increased by after a successful request
+    HEALTH_RECOVERY = 0.1
+
+    def __init__(self, remote):
+        self.remote = remote
+        self.health = 1.0
+        self.latency = None
+
+    def get_weight(self, default_latency=None):
+        """
+        Returns the weight of the host for load balancing
+
+        :param default_latency: The latency (in seconds) used if the host has
+            no latency samples (optional)
+        :return: The weight of the host
+        """
+        latency = self.latency if self.latency is not None else default_latency
+        return self.health / max(0.001, latency or 0.001)
+
+
+class _HostBalancer(object):
+    """
+    Distributes requests across the application servers of an ePO server.
+
+    Each server is selected with a probability proportional to its health
+    divided by its smoothed latency. A failed request halves the health of the
+    server; each successful request restores some of it. Servers that have not
+    completed a request yet are preferred while they are healthy (so that every
+    server is measured), and are otherwise weighted with the average latency of
+    the other servers (a server that always fails is never measured).
+    """
+
+    def __init__(self, remotes):
+        """
+        Constructs the balancer
+
+        :param remotes: The remote command clients (one per application server)
+        """
+        self._hosts = [_HostState(remote) for remote in remotes]
+        self._lock = threading.Lock()
+
+    def choose(self, exclude=None):
+        """
+        Selects a server for a request
+
+        :param exclude: A remote command client that must not be selected
+            (optional)
+        :return: The remote command client for the selected server (or ``None``
+            if no server other than the excluded one is available)
+        """
+        with self._lock:
+            hosts = [host for host in self._hosts if host.remote is not exclude]
+            if not hosts:
+                return None
+            if len(hosts) == 1:
+                return hosts[0].remote
+            # Healthy hosts without latency samples are preferred so that every
+            # host is measured
+            for host in hosts:
+                if host.latency is None and host.health >= 1.0:
+                    return host.remote
+            latencies = [host.latency for host in hosts
+                         if host.latency is not None]
+            default_latency = sum(latencies) / len(latencies) \
+                if latencies else None
+            weights = [host.get_weight(default_latency) for host in hosts]
+            value = random.uniform(0, sum(weights))
+            for host, weight in zip(hosts, weights):
+                value -= weight
+                if value <= 0:
+                    return host.remote
+            return hosts[-1].remote
+
+    def record(self, remote, latency, success):
+        """
+        Records the outcome of a request
+
+        :param remote: The remote command client the request was sent to
+        :param latency: The time (in seconds) the request took
+        :param success: Whether the request reached the server successfully
+        """
+        with self._lock:
+            for host in self._hosts:
+                if host.remote is remote:
+                    if success:
+                        host.health = min(1.0, host.health + host.HEALTH_RECOVERY)
+                        if host.latency is None:
+                            host.latency = latency
+                        else:
+                            host.latency += host.LATENCY_SMOOTHING * \
+                                (latency - host.latency)
+                    else:
+                        host.health = max(host.MIN_HEALTH, host.health / 2)
+                    return
@@ -0,0 +1,796 @@
+from __future__ import absolute_import
+import fnmatch
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dxlclient.callbacks import EventCallback
+
+from ._commands import _CommandPatterns
+from ._dispatch import _Lane
+from ._metrics import registry
+from ._scheduler import _PeriodicTask
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+# The number of cache lookups (by result: memory, disk, stale or miss)
+_lookups_counter = registry.counter(
+    "cache_lookups_total",
+    "The number of response cache lookups",
+    ("epo", "result"))
+
+# The number of cache entries removed by invalidation
+_invalidations_counter = registry.counter(
+    "cache_invalidated_entries_total",
+    "The number of response cache entries removed by invalidation",
+    ("epo",))
+
+
+# The attributes of an entry are the columns of the persistent store
+class _CacheEntry(object): # pylint: disable=too-many-instance-attributes
+    """
+    A cached result of an ePO remote command
+    """
+
+    def __init__(self, epo_name, command, output, params, value, expires,
+                 created=None):
+        """
+        Constructs the entry
+
+        :param epo_name: The name of the ePO server the command was invoked on
+        :param command: The command
+        :param output: The output type of the result
+        :param params: The parameters of the command
+        :param value: The result of the command
+        :param expires: The time the entry expires
+        :param created: The time the entry was created (defaults to now)
+        """
+        self.epo_name = epo_name
+        self.command = command
+        self.output = output
+        self.params = params
+        self.value = value
+        self.expires = expires
+        self.created = time.time() if created is None else created
+        self.key = _ResponseCache.make_key(epo_name, command, output, params)
+        # Whether the entry was loaded from the persistent store and has not
+        # been refreshed yet (it is served even if it has expired)
+        self.restored = False
+
+    @property
+    def expired(self):
+        """
+        Whether the entry has expired
+        """
+        return time.time() >= self.expires
+
+
+class _PersistentCacheStore(object):
+    """
+    Stores cache entries in an SQLite database, so that they survive restarts of
+    the service. When the size of the stored results exceeds the limit, the
+    least recently stored entries are removed during compaction.
+
+    Compaction removes entries (and returns the freed pages of the database file
+    via incremental vacuuming) in small batches, so that the store is only
+    locked briefly at a time.
+
+    The store records the generation of the cache (see
+    :attr:`_ResponseCache.generation`) of the latest removal, so that an entry
+    fetched before an invalidation is not stored after the invalidation has
+    removed the matching entries.
+    """
+
+    # The name of the database file within the cache directory
+    FILE_NAME = "dxleposervice-cache.db"
+
+    # The maximum number of entries removed while the store is locked
+    COMPACTION_BATCH_SIZE = 100
+    # The maximum number of pages freed while the store is locked
+    VACUUM_BATCH_PAGES = 256
+    # The "incremental" auto vacuum mode of SQLite
+    INCREMENTAL_VACUUM = 2
+
+    def __init__(self, directory, max_size):
+        """
+        Constructs the store
+
+        :param directory: The directory containing the database
+        :param max_size: The maximum total size (in bytes) of the stored results
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._path = os.path.join(directory, self.FILE_NAME)
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        # Databases created without incremental vacuuming are converted once
+        # (when the store is opened)
+        if self._connection.execute("PRAGMA auto_vacuum").fetchone()[0] != \
+                self.INCREMENTAL_VACUUM:
+            self._connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._connection.execute("VACUUM")
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, epo TEXT, command TEXT, output TEXT, "
+            "params TEXT, value TEXT, size INTEGER, created REAL, expires REAL)")
+        self._connection.commit()
+
+    def get(self, key):
+        """
+        Returns a stored entry
+
+        :param key: The key of the entry
+        :return: The entry (or ``None`` if it is not stored)
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT epo, command, output, params, value, expires, created "
+                "FROM entries WHERE key = ?", (key,)).fetchone()
+        return self._to_entry(row) if row else None
+
+    def put(self, entry, generation=None):
+        """
+        Stores an entry (replacing any existing entry with the same key)
+
+        :param entry: The entry
+        :param generation: The generation of the cache when the entry was added
+            (optional, the entry is not stored if entries have been removed by a
+            later generation)
+        :return: Whether the entry was stored
+        """
+        with self._lock:
+            if generation is not None and generation < self._generation:
+                return False
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.key, entry.epo_name, entry.command, entry.output,
+                 json.dumps(entry.params, sort_keys=True), entry.value,
+                 len(entry.value), entry.created, entry.expires))
+            self._connection.commit()
+        return True
+
+    def remove(self, match, generation=None):
+        """
+        Removes the stored entries that match a condition
+
+        :param match: A function that is invoked with the ePO server name,
+            command and key of each entry, and returns whether it is removed
+        :param generation: The generation of the cache after the removal
+            (optional, entries of earlier generations are no longer stored)
+        :return: The number of removed entries
+        """
+        with self._lock:
+            if generation is not None:
+                self._generation = max(self._generation, generation)
+            keys = [(key,) for key, epo_name, command in self._connection.execute(
+                "SELECT key, epo, command FROM entries").fetchall()
+                    if match(epo_name, command, key)]
+            self._connection.executemany("DELETE FROM entries WHERE key = ?",
+                                         keys)
+            self._connection.commit()
+        return len(keys)
+
+    def entries(self):
+        """
+        Returns the stored entries (most recently stored first)
+
+        :return: A list of the entries
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT epo, command, output, params, value, expires, created "
+                "FROM entries ORDER BY created DESC").fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def compact(self, max_age):
+        """
+        Removes entries that expired more than the specified time ago, and the
+        least recently stored entries while the size of the stored results
+        exceeds the limit
+
+        :param max_age: The time (in seconds) that expired entries are retained
+        :return: The number of removed entries
+        """
+        removed = 0
+        expired = time.time() - max_age
+        while True:
+            with self._lock:
+                count = self._connection.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                    "WHERE expires < ? LIMIT ?)",
+                    (expired, self.COMPACTION_BATCH_SIZE)).rowcount
+                self._connection.commit()
+            removed += count
+            if count < self.COMPACTION_BATCH_SIZE:
+                break
+
+        while True:
+            with self._lock:
+                total_size = self._connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                keys = []
+                for key, size in self._connection.execute(
+                        "SELECT key, size FROM entries ORDER BY created LIMIT ?",
+                        (self.COMPACTION_BATCH_SIZE,)).fetchall():
+                    if total_size <= self._max_size:
+                        break
+                    keys.append((key,))
+                    total_size -= size
+                self._connection.executemany(
+                    "DELETE FROM entries WHERE key = ?", keys)
+                self._connection.commit()
+            removed += len(keys)
+            if not keys or total_size <= self._max_size:
+                break
+
+        if removed:
+            self._vacuum()
+        return removed
+
+    def _vacuum(self):
+        """
+        Returns the free pages of the database to the file system (in batches)
+        """
+        previous = None
+        while True:
+            with self._lock:
+                free_pages = self._connection.execute(
+                    "PRAGMA freelist_count").fetchone()[0]
+                # Stop if no pages were freed by the previous batch
+                if not free_pages or free_pages == previous:
+                    return
+                self._connection.execute("PRAGMA incremental_vacuum({0})".format(
+                    self.VACUUM_BATCH_PAGES)).fetchall()
+            previous = free_pages
+
+    def close(self):
+        """
+        Closes the database
+        """
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def _to_entry(row):
+        epo_name, command, output, params, value, expires, created = row
+        return _CacheEntry(epo_name, command, output, json.loads(params), value,
+                           expires, created)
+
+
+# The memory cache, the persistent store and the refresh threads share the
+# state of the cache (guarded by a single lock)
+class _ResponseCache(object): # pylint: disable=too-many-instance-attributes
+    """
+    Caches the results of read-only ePO remote commands.
+
+    Entries are held in memory (least recently used entries are evicted when the
+    maximum number of entries is reached) and, optionally, in a persistent store.
+    Entries in the persistent store are loaded when the service starts and are
+    served (even if they expired while the service was stopped) until they have
+    been refreshed in the background. At most one refresh per refresh thread is
+    scheduled at a time, so that a restart does not send every cached query to
+    the ePO servers at once.
+
+    An entry that has expired within the stale period is still served, while it
+    is refreshed in the background (stale-while-revalidate).
+
+    When a mutating command is invoked, the entries it may affect are removed.
+    By default, these are the entries for commands in the same namespace (for
+    example, ``system.applyTag`` removes the entries for ``system.find``) and
+    for ``core.executeQuery``.
+    """
+
+    # Patterns matching the commands whose entries are removed when a mutating
+    # command is invoked ("{namespace}" is replaced with the namespace of the
+    # mutating command)
+    DEFAULT_INVALIDATED_COMMANDS = ["{namespace}.*", "core.executeQuery"]
+
+    def __init__(self, ttl, commands=None, ttl_by_command=None,
+                 max_entries=10000, store=None, stale_ttl=0, refresh_threads=1,
+                 refresh_queue_size=10000, invalidated_commands_by_command=None):
+        """
+        Constructs the cache
+
+        :param ttl: The time (in seconds) results are cached for
+        :param commands: Patterns (:mod:`fnmatch`, case-insensitive) matching the
+            commands whose results are cached (defaults to read-only commands)
+        :param ttl_by_command: A dictionary that overrides the time results are
+            cached for specific commands (optional)
+        :param max_entries: The maximum number of entries held in memory
+        :param store: The persistent store (optional)
+        :param stale_ttl: The time (in seconds) after an entry expires that it is
+            still served while it is refreshed in the background
+        :param refresh_threads: The number of threads used to refresh entries in
+            the background
+        :param refresh_queue_size: The maximum number of queued background
+            refreshes
+        :param invalidated_commands_by_command: A dictionary that overrides the
+            patterns matching the commands whose entries are removed when specific
+            mutating commands are invoked (optional)
+        """
+        self._ttl = ttl
+        self._commands = _CommandPatterns(
+            _CommandPatterns.READ_ONLY if commands is None else commands)
+        self._ttl_by_command = dict(
+            (k.lower(), v) for k, v in (ttl_by_command or {}).items())
+        self._max_entries = max_entries
+        self._store = store
+        self._stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._invalidated_commands_by_command = dict(
+            (k.lower(), v) for k, v in
+            (invalidated_commands_by_command or {}).items())
+        self._listeners = []
+        # Incremented on each invalidation, so that results fetched before an
+        # invalidation are not cached
+        self._generation = 0
+        self._refresh_threads = refresh_threads
+        self._refresh_lane = _Lane("cache-refresh", refresh_threads,
+                                   refresh_queue_size)
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def make_key(epo_name, command, output, params):
+        """
+        Returns the key for the result of a command
+
+        :param epo_name: The name of the ePO server
+        :param command: The command
+        :param output: The output type
+        :param params: The parameters of the command
+        :return: The key
+        """
+        return json.dumps([epo_name, command.lower(), output, params],
+                          sort_keys=True)
+
+    def is_cacheable(self, command):
+        """
+        Returns whether the results of a command are cached
+
+        :param command: The command
+        :return: Whether the results of the command are cached
+        """
+        return self._commands.matches(command)
+
+    def get_ttl(self, command):
+        """
+        Returns the time the results of a command are cached for
+
+        :param command: The command
+        :return: The time (in seconds)
+        """
+        return self._ttl_by_command.get(command.lower(), self._ttl)
+
+    def get_entry(self, key):
+        """
+        Returns an entry (expired entries are also returned)
+
+        :param key: The key of the entry
+        :return: The entry (or ``None`` if it is not cached)
+        """
+        return self._lookup(key)[0]
+
+    def _lookup(self, key):
+        """
+        Looks up an entry in memory and then in the persistent store (entries
+        found in the persistent store are added to memory)
+
+        :param key: The key of the entry
+        :return: A ``(entry, result)`` tuple, where result is ``memory``,
+            ``disk`` or ``miss``
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                return entry, "memory"
+        if self._store is not None:
+            generation = self.generation
+            entry = self._store.get(key)
+            if entry is not None:
+                self._add(entry, generation)
+                return entry, "disk"
+        return None, "miss"
+
+    def get(self, epo_name, command, output, params):
+        """
+        Returns the cached result of a command
+
+        :param epo_name: The name of the ePO server
+        :param command: The command
+        :param output: The output type
+        :param params: The parameters of the command
+        :return: The entry (or ``None`` if it is not cached or has expired more
+            than the stale period ago, unless it was loaded from the persistent
+            store and has not been refreshed yet). The entry should be refreshed
+            if it has expired.
+        """
+        entry, result = self._lookup(
+            self.make_key(epo_name, command, output, params))
+        if entry is not None and entry.expired:
+            if entry.restored or time.time() < entry.expires + self._stale_ttl:
+                result = "stale"
+            else:
+                entry, result = None, "miss"
+        _lookups_counter.inc(epo=epo_name, result=result)
+        return entry
+
+    @property
+    def generation(self):
+        """
+        The number of invalidations performed (captured before fetching a result
+        and passed to :meth:`put`)
+        """
+        return self._generation
+
+    def put(self, epo_name, command, output, params, value, generation=None):
+        """
+        Caches the result of a command
+
+        :param epo_name: The name of the ePO server
+        :param command: The command
+        :param output: The output type
+        :param params: The parameters of the command
+        :param value: The result of the command
+        :param generation: The generation of the cache before the result was
+            fetched (optional, the result is not cached if an invalidation has
+            been performed since)
+        :return: The entry (or ``None`` if the result was not cached)
+        """
+        entry = _CacheEntry(epo_name, command, output, params, value,
+                            time.time() + self.get_ttl(command))
+        if generation is None:
+            generation = self.generation
+        if not self._add(entry, generation):
+            return None
+        if self._store is not None:
+            try:
+                # Not stored if an invalidation removed the stored entries
+                # after the entry was added
+                if not self._store.put(entry, generation):
+                    return None
+            except sqlite3.Error as ex:
+                logger.warning("Unable to store cache entry: %s", ex)
+        return entry
+
+    def _add(self, entry, generation=None):
+        """
+        Adds an entry to the in-memory cache (evicting the least recently used
+        entry if necessary)
+
+        :param entry: The entry
+        :param generation: The generation of the cache before the entry was
+            fetched (optional, the entry is not added if an invalidation has
+            been performed since)
+        :return: Whether the entry was added
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._entries.pop(entry.key, None)
+            self._entries[entry.key] = entry
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def add_listener(self, listener):
+        """
+        Adds a listener that is invoked when a mutating command causes entries to
+        be invalidated
+
+        :param listener: A function that is invoked with the name of the ePO
+            server and the patterns matching the invalidated commands
+        """
+        self._listeners.append(listener)
+
+    def invalidate_for(self, epo_name, command):
+        """
+        Removes the entries that may be affected by a mutating command and
+        notifies the listeners
+
+        :param epo_name: The name of the ePO server the command was invoked on
+        :param command: The mutating command
+        :return: The number of removed entries
+        """
+        patterns = self._invalidated_commands_by_command.get(command.lower())
+        if patterns is None:
+            namespace = command.split(".")[0]
+            patterns = [pattern.format(namespace=namespace)
+                        for pattern in self.DEFAULT_INVALIDATED_COMMANDS]
+        removed = self.invalidate(epo_name, patterns)
+        logger.debug("Command %s invalidated %d cached results", command, removed)
+        for listener in self._listeners:
+            try:
+                listener(epo_name, patterns)
+            except Exception:
+                logger.exception("Error notifying cache invalidation listener")
+        return removed
+
+    def invalidate(self, epo_name=None, commands=None, key_pattern=None):
+        """
+        Removes the entries that match all of the specified criteria
+
+        :param epo_name: The name of the ePO server (optional)
+        :param commands: Patterns (:mod:`fnmatch`, case-insensitive) matching the
+            commands (optional)
+        :param key_pattern: A pattern (:mod:`fnmatch`) matching the keys of the
+            entries (optional)
+        :return: The number of removed entries
+        """
+        command_patterns = _CommandPatterns(commands) if commands else None
+
+        def match(entry_epo_name, command, key):
+            return (epo_name is None or entry_epo_name == epo_name) and \
+                (command_patterns is None or command_patterns.matches(command)) \
+                and (key_pattern is None or
+                     fnmatch.fnmatchcase(key, key_pattern))
+
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            keys = [key for key, entry in self._entries.items()
+                    if match(entry.epo_name, entry.command, key)]
+            for key in keys:
+                del self._entries[key]
+        removed = len(keys)
+        if self._store is not None:
+            try:
+                removed = max(removed, self._store.remove(match, generation))
+            except sqlite3.Error as ex:
+                logger.warning("Unable to remove stored cache entries: %s", ex)
+        _invalidations_counter.inc(removed, epo=epo_name or "")
+        return removed
+
+    def refresh(self, epo_name, command, output, params, func):
+        """
+        Schedules a background refresh of the cached result of a command (a result
+        that is already being refreshed is not scheduled again)
+
+        :param epo_name: The name of the ePO server
+        :param command: The command
+        :param output: The output type
+        :param params: The parameters of the command
+        :param func: A function that re-executes the command (and caches its
+            result)
+        :return: Whether the refresh was scheduled
+        """
+        key = self.make_key(epo_name, command, output, params)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+        if not self._refresh_lane.submit(epo_name, self._refresh, key, command,
+                                         func):
+            with self._lock:
+                self._refreshing.discard(key)
+            return False
+        return True
+
+    def _refresh(self, key, command, func):
+        try:
+            func()
+        except Exception as ex:
+            logger.warning("Unable to refresh cached result of command %s: %s",
+                           command, ex)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def load(self):
+        """
+        Loads the entries in the persistent store into memory
+
+        :return: The loaded entries
+        """
+        if self._store is None:
+            return []
+        entries = self._store.entries()[:self._max_entries]
+        for entry in reversed(entries):
+            entry.restored = True
+            self._add(entry)
+        logger.info("Loaded %d cached results", len(entries))
+        return entries
+
+    def refresh_loaded(self, entries, get_refresh):
+        """
+        Refreshes the entries loaded from the persistent store in the
+        background (at most one refresh per refresh thread is scheduled at a
+        time, leaving room in the queue for the refreshes of stale results)
+
+        :param entries: The loaded entries
+        :param get_refresh: A function that is invoked with an entry, and
+            returns a function that re-executes its command (and caches its
+            result), or ``None`` if the entry can not be refreshed
+        """
+        thread = threading.Thread(target=self._refresh_loaded,
+                                  args=(entries, get_refresh),
+                                  name="EpoCacheRestore")
+        thread.daemon = True
+        thread.start()
+
+    def _refresh_loaded(self, entries, get_refresh):
+        slots = threading.Semaphore(self._refresh_threads)
+        for entry in entries:
+            func = get_refresh(entry)
+            if func is None:
+                entry.restored = False
+                continue
+            while not slots.acquire(False):
+                if self._stopped.wait(0.1):
+                    return
+
+            def run(entry=entry, func=func):
+                try:
+                    func()
+                finally:
+                    entry.restored = False
+                    slots.release()
+
+            # Not scheduled if the result is already being refreshed
+            if not self.refresh(entry.epo_name, entry.command, entry.output,
+                                entry.params, run):
+                entry.restored = False
+                slots.release()
+
+    def compact(self):
+        """
+        Compacts the persistent store (removes expired entries and enforces its
+        size limit)
+        """
+        if self._store is not None:
+            removed = self._store.compact(self._stale_ttl)
+            logger.debug("Removed %d cached results during compaction", removed)
+
+    def shutdown(self):
+        """
+        Stops background refreshes and closes the persistent store
+        """
+        self._stopped.set()
+        self._refresh_lane.shutdown()
+        if self._store is not None:
+            self._store.close()
+
+
+class _HotQuery(object):
+    """
+    A query whose result is prefetched periodically, so that it is always cached
+    """
+
+    def __init__(self, epo, command, output, params, interval):
+        """
+        Constructs the query
+
+        :param epo: The ePO server wrapper to invoke the command on
+        :param command: The command
+        :param output: The output type
+        :param params: The parameters of the command
+        :param interval: The time (in seconds) between prefetches
+        """
+        self.epo = epo
+        self.command = command
+        self.output = output
+        self.params = params
+        self.interval = interval
+        self.next_prefetch = 0
+
+
+class _Prefetcher(object):
+    """
+    Periodically refreshes the cached results of hot queries (via the background
+    refreshes of the cache)
+    """
+
+    # The time (in seconds) between checks for queries that are due
+    TICK_INTERVAL = 1.0
+
+    def __init__(self, cache, queries):
+        """
+        Constructs the prefetcher
+
+        :param cache: The response cache
+        :param queries: The hot queries
+        """
+        self._cache = cache
+        self._queries = list(queries)
+        self._task = _PeriodicTask("cache-prefetch", self.TICK_INTERVAL,
+                                   self.prefetch)
+
+    def start(self):
+        """
+        Starts prefetching
+        """
+        self._task.start()
+
+    def shutdown(self):
+        """
+        Stops prefetching
+        """
+        self._task.stop()
+
+    def prefetch(self):
+        """
+        Schedules a refresh of each query that is due
+        """
+        now = time.time()
+        for query in self._queries:
+            if now < query.next_prefetch:
+                continue
+            if self._cache.refresh(
+                    query.epo.name, query.command, query.output, query.params,
+                    lambda query=query: query.epo.refresh(
+                        query.command, query.output, query.params)):
+                query.next_prefetch = now + query.interval
+
+
+class _CacheInvalidationCallback(EventCallback):
+    """
+    Event callback used to remove cache entries when an invalidation event is
+    received (from another service instance or another tool). The event must
+    specify at least one criterion (an event that would remove every entry is
+    ignored). Events sent by the receiving service instance itself are ignored,
+    since it has already removed the entries.
+    """
+
+    # UTF-8 encoding (used for encoding/decoding payloads)
+    UTF_8 = "utf-8"
+
+    # The key in the event used to specify the name of the ePO server (optional)
+    EPO_KEY = "epo"
+    # The key in the event used to specify the pattern (or list of patterns)
+    # matching the commands (optional)
+    CMD_NAME_KEY = "command"
+    # The key in the event used to specify the pattern matching the keys of the
+    # entries (optional)
+    KEY_PATTERN_KEY = "key"
+    # The key in the event used to specify the identifier of the service
+    # instance that sent the event (optional)
+    INSTANCE_KEY = "instance"
+
+    def __init__(self, cache, instance_id=None):
+        """
+        Constructs the callback
+
+        :param cache: The response cache
+        :param instance_id: The identifier of the receiving service instance
+            (optional, events sent by this instance are ignored)
+        """
+        super(_CacheInvalidationCallback, self).__init__()
+        self._cache = cache
+        self._instance_id = instance_id
+
+    def on_event(self, event):
+        """
+        Invoked when an event is received
+
+        :param event: The event that was received
+        """
+        try:
+            event_dict = json.loads(event.payload.decode(encoding=self.UTF_8))
+            if self._instance_id is not None and \
+                    event_dict.get(self.INSTANCE_KEY) == self._instance_id:
+                return
+            commands = event_dict.get(self.CMD_NAME_KEY)
+            if commands is not None and not isinstance(commands, list):
+                commands = [commands]
+            if not (event_dict.get(self.EPO_KEY) or commands or
+                    event_dict.get(self.KEY_PATTERN_KEY)):
+                logger.warning("Ignoring cache invalidation event without "
+                               "criteria")
+                return
+            removed = self._cache.invalidate(
+                event_dict.get(self.EPO_KEY), commands,
+                event_dict.get(self.KEY_PATTERN_KEY))
+            logger.debug("Invalidation event removed %d cached results", removed)
+        except Exception:
+            logger.exception("Error while processing cache invalidation event")
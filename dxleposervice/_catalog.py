@@ -0,0 +1,460 @@
+from __future__ import absolute_import
+import json
+import logging
+import re
+import threading
+import time
+
+from dxlclient.callbacks import RequestCallback
+from dxlclient.message import ErrorResponse, Response
+
+from ._errors import _EpoServiceError, _InvalidRequestError
+from ._metrics import registry
+from ._scheduler import _PeriodicTask
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+# The number of requests rejected by catalog validation
+_rejected_counter = registry.counter(
+    "catalog_rejected_requests_total",
+    "The number of requests rejected by command catalog validation",
+    ("epo", "reason"))
+
+
+class _CatalogCommand(object):
+    """
+    A remote command (and its parameters) listed by the ``core.help`` command
+    """
+
+    def __init__(self, name, required, optional, description):
+        """
+        Constructs the command
+
+        :param name: The name of the command
+        :param required: The required parameters of the command. Each entry is a
+            list of parameter names, one of which must be specified.
+        :param optional: The names of the optional parameters of the command
+        :param description: The description of the command
+        """
+        self.name = name
+        self.required = required
+        self.optional = optional
+        self.description = description
+
+    def get_missing_parameters(self, params):
+        """
+        Returns the required parameters that are missing from a request
+
+        :param params: The parameters of the request
+        :return: A list of the missing parameters (alternatives are delimited
+            by ``|``)
+        """
+        return [" | ".join(group) for group in self.required
+                if not any(name in params for name in group)]
+
+    def to_dict(self):
+        """
+        Returns a dictionary describing the command
+
+        :return: A dictionary describing the command
+        """
+        parameters = []
+        for group in self.required:
+            for name in group:
+                parameter = {"name": name, "required": True}
+                if len(group) > 1:
+                    parameter["alternatives"] = [alt for alt in group
+                                                 if alt != name]
+                parameters.append(parameter)
+        parameters.extend({"name": name, "required": False}
+                          for name in self.optional)
+        return {
+            "name": self.name,
+            "parameters": parameters,
+            "description": self.description
+        }
+
+
+class _Catalog(object):
+    """
+    The remote commands supported by an ePO server (as listed by ``core.help``)
+    """
+
+    # Matches the start of a command listing:
+    # "<name> <param> [<optional param>] <param> | <alternative param> - "
+    ENTRY_PATTERN = re.compile(
+        r"(?P<name>[A-Za-z]\w*\.\w+)"
+        r"(?P<params>(?:[ \t]+(?:\[[^\]\n]*\]|\||[^\s\[\]|\-][^\s\[\]|]*))*)"
+        r"[ \t]+-[ \t]")
+    # Matches a parameter within a command listing
+    PARAM_PATTERN = re.compile(r"\[[^\]]*\]|\||[^\s\[\]|]+")
+    # Matches positional parameters, which are not validated
+    POSITIONAL_PARAM_PATTERN = re.compile(r"^param\d+$")
+    # Matches the start of a line that appears to be a command listing (used to
+    # detect listings that could not be parsed)
+    LISTING_PATTERN = re.compile(r"^[ \t]*[A-Za-z]\w*\.\w+(?:[ \t]|$)",
+                                 re.MULTILINE)
+
+    def __init__(self, commands, complete=True):
+        """
+        Constructs the catalog
+
+        :param commands: The commands in the catalog
+        :param complete: Whether all of the command listings were parsed (if
+            not, requests for commands that are not in the catalog are not
+            rejected)
+        """
+        self._commands = dict((command.name.lower(), command)
+                              for command in commands)
+        self.complete = complete
+        self.loaded = time.time()
+
+    def __len__(self):
+        return len(self._commands)
+
+    @classmethod
+    def parse(cls, help_text):
+        """
+        Parses the result of the ``core.help`` command
+
+        :param help_text: The result of the ``core.help`` command (a JSON list
+            of command listings, or the listings as text)
+        :return: The catalog
+        """
+        listing_count = None
+        try:
+            listings = json.loads(help_text)
+            if isinstance(listings, list):
+                listing_count = len([listing for listing in listings
+                                     if listing.strip()])
+                help_text = "\n".join(listings)
+        except ValueError:
+            pass
+        if listing_count is None:
+            listing_count = len(cls.LISTING_PATTERN.findall(help_text))
+
+        commands = []
+        matches = list(cls.ENTRY_PATTERN.finditer(help_text))
+        for index, match in enumerate(matches):
+            end = matches[index + 1].start() if index + 1 < len(matches) \
+                else len(help_text)
+            required, optional = cls._parse_params(match.group("params"))
+            commands.append(_CatalogCommand(
+                match.group("name"), required, optional,
+                help_text[match.end():end].strip()))
+        return cls(commands, len(commands) >= listing_count)
+
+    @staticmethod
+    def _parse_params(params_text):
+        """
+        Parses the parameters within a command listing
+
+        :param params_text: The parameters within the command listing
+        :return: A ``(required, optional)`` tuple (see :class:`_CatalogCommand`)
+        """
+        required = []
+        optional = []
+        alternative = False
+        for token in _Catalog.PARAM_PATTERN.findall(params_text):
+            if token == "|":
+                alternative = True
+                continue
+            if token.startswith("["):
+                optional.extend(name.split("=")[0] for name in
+                                token.strip("[]").split() if name.split("=")[0])
+            else:
+                name = token.split("=")[0]
+                if alternative and required:
+                    required[-1].append(name)
+                else:
+                    required.append([name])
+            alternative = False
+        return required, optional
+
+    def get(self, command):
+        """
+        Returns the command with the specified name
+
+        :param command: The name of the command (case-insensitive)
+        :return: The command (or ``None`` if it is not in the catalog)
+        """
+        return self._commands.get(command.lower())
+
+    def validate(self, command, params):
+        """
+        Validates that a command is in the catalog and that the required
+        parameters are specified
+
+        :param command: The name of the command
+        :param params: The parameters of the request
+        :return: ``None`` if the request is valid, otherwise the reason it is
+            invalid (``unknown_command`` or ``missing_parameters``) and a message
+        """
+        catalog_command = self.get(command)
+        if catalog_command is None:
+            # The command may be one of the listings that could not be parsed
+            if not self.complete:
+                return None
+            return "unknown_command", "Unknown command: '{0}'".format(command)
+        if any(self.POSITIONAL_PARAM_PATTERN.match(name) for name in params):
+            return None
+        missing = catalog_command.get_missing_parameters(params)
+        if missing:
+            return "missing_parameters", \
+                "Missing required parameters for command '{0}': {1}".format(
+                    command, ", ".join(missing))
+        return None
+
+    def to_dict(self, prefix=None):
+        """
+        Returns a dictionary describing the commands in the catalog
+
+        :param prefix: Only include commands whose names start with the prefix
+            (case-insensitive, optional)
+        :return: A dictionary describing the commands
+        """
+        prefix = (prefix or "").lower()
+        return {
+            "loaded": int(self.loaded),
+            "commands": [self._commands[name].to_dict()
+                         for name in sorted(self._commands)
+                         if name.startswith(prefix)]
+        }
+
+
+class _CatalogManager(object):
+    """
+    Loads (and periodically refreshes) the command catalog of each ePO server,
+    and validates requests against the catalogs. A request for an ePO server
+    whose catalog has not been loaded yet starts loading the catalog in the
+    background, and is not validated (nor are the other requests for the ePO
+    server until the catalog has been loaded). If the catalog can not be loaded
+    (for example, the ePO server is unavailable), it is not loaded again on
+    demand until the retry interval has elapsed. Only one load of the catalog
+    of each ePO server is in progress at a time.
+    """
+
+    # The command used to list the commands supported by an ePO server
+    HELP_COMMAND = "core.help"
+
+    # The minimum time (in seconds) between attempts to load a catalog on demand
+    LOAD_RETRY_INTERVAL = 30
+
+    def __init__(self, epos, refresh_interval):
+        """
+        Constructs the catalog manager
+
+        :param epos: The ePO server wrappers
+        :param refresh_interval: The time (in seconds) between catalog refreshes
+        """
+        self._epos = dict((epo.name, epo) for epo in epos)
+        self._catalogs = {}
+        # The time of the last failed attempt to load each catalog
+        self._failures = {}
+        # The names of the ePO servers whose catalogs are being loaded
+        self._loading = set()
+        self._lock = threading.Lock()
+        self._task = _PeriodicTask("catalog", refresh_interval, self.refresh)
+
+    def start(self):
+        """
+        Starts loading (and periodically refreshing) the catalogs
+        """
+        self._task.start()
+
+    def shutdown(self):
+        """
+        Stops refreshing the catalogs
+        """
+        self._task.stop()
+
+    def refresh(self):
+        """
+        Loads the catalog of each ePO server (the previous catalog of an ePO
+        server is retained if loading fails)
+        """
+        for epo in self._epos.values():
+            with self._lock:
+                if epo.name in self._loading:
+                    continue
+                self._loading.add(epo.name)
+            self._load(epo)
+
+    def _load(self, epo):
+        """
+        Loads the catalog of an ePO server (the name of the ePO server must have
+        been added to the servers whose catalogs are being loaded)
+
+        :param epo: The ePO server wrapper
+        :return: The catalog (or ``None`` if it could not be loaded)
+        """
+        try:
+            return self._load_catalog(epo)
+        finally:
+            with self._lock:
+                self._loading.discard(epo.name)
+
+    def _load_catalog(self, epo):
+        """
+        Loads the catalog of an ePO server
+
+        :param epo: The ePO server wrapper
+        :return: The catalog (or ``None`` if it could not be loaded)
+        """
+        try:
+            catalog = _Catalog.parse(epo.execute(self.HELP_COMMAND, "json", {}))
+        except Exception as ex:
+            logger.warning(
+                "Unable to load command catalog for ePO server '%s': %s",
+                epo.name, ex)
+            catalog = None
+        # An empty catalog indicates that the result could not be parsed (it
+        # is not used, since it would reject every request)
+        if catalog is not None and not catalog:
+            logger.warning(
+                "No commands found in command catalog for ePO server: %s",
+                epo.name)
+            catalog = None
+        if catalog is None:
+            with self._lock:
+                self._failures[epo.name] = time.time()
+            return None
+
+        if not catalog.complete:
+            logger.warning(
+                "Some commands in the command catalog for ePO server '%s' "
+                "could not be parsed, unknown commands are not rejected",
+                epo.name)
+        with self._lock:
+            self._catalogs[epo.name] = catalog
+            self._failures.pop(epo.name, None)
+        logger.info("Loaded %d commands for ePO server: %s",
+                    len(catalog), epo.name)
+        return catalog
+
+    def _load_on_demand(self, epo_name):
+        """
+        Starts loading the catalog of an ePO server in the background, unless it
+        is already being loaded or an attempt to load it failed within the retry
+        interval
+
+        :param epo_name: The name of the ePO server
+        """
+        epo = self._epos.get(epo_name)
+        if epo is None:
+            return
+        with self._lock:
+            if epo_name in self._catalogs or epo_name in self._loading:
+                return
+            failed = self._failures.get(epo_name)
+            if failed is not None and \
+                    time.time() - failed < self.LOAD_RETRY_INTERVAL:
+                return
+            self._loading.add(epo_name)
+        thread = threading.Thread(target=self._load, args=(epo,),
+                                  name="EpoCatalogLoad")
+        thread.daemon = True
+        thread.start()
+
+    def get(self, epo_name):
+        """
+        Returns the catalog of an ePO server
+
+        :param epo_name: The name of the ePO server
+        :return: The catalog (or ``None`` if it has not been loaded)
+        """
+        with self._lock:
+            return self._catalogs.get(epo_name)
+
+    def validate(self, epo_name, command, params):
+        """
+        Validates a request against the catalog of an ePO server
+
+        :param epo_name: The name of the ePO server
+        :param command: The name of the command
+        :param params: The parameters of the request
+        """
+        catalog = self.get(epo_name)
+        if catalog is None:
+            # The request is not validated while the catalog is loaded
+            self._load_on_demand(epo_name)
+            return
+        error = catalog.validate(command, params)
+        if error is not None:
+            reason, message = error
+            _rejected_counter.inc(epo=epo_name, reason=reason)
+            raise _InvalidRequestError(message)
+
+
+class _CatalogRequestCallback(RequestCallback):
+    """
+    Request callback used to handle requests for the command catalog of an ePO
+    server
+    """
+
+    # UTF-8 encoding (used for encoding/decoding payloads)
+    UTF_8 = "utf-8"
+
+    # The key in the request used to specify a single command to describe.
+    # This is optional
+    CMD_NAME_KEY = "command"
+    # The key in the request used to specify a prefix for the names of the
+    # commands to describe. This is optional
+    PREFIX_KEY = "prefix"
+
+    def __init__(self, client, catalog_manager, epo_by_topic):
+        """
+        Constructs the callback
+
+        :param client: The DXL client associated with the service
+        :param catalog_manager: The catalog manager
+        :param epo_by_topic: The ePO server wrappers by associated catalog topics
+        """
+        super(_CatalogRequestCallback, self).__init__()
+        self._dxl_client = client
+        self._catalog_manager = catalog_manager
+        self._epo_by_topic = epo_by_topic
+
+    def on_request(self, request):
+        """
+        Invoked when a request is received
+
+        :param request: The request that was received
+        """
+        try:
+            req_dict = {}
+            if request.payload:
+                req_dict = json.loads(request.payload.decode(
+                    encoding=self.UTF_8))
+
+            epo = self._epo_by_topic[request.destination_topic]
+            catalog = self._catalog_manager.get(epo.name)
+            if catalog is None:
+                raise _EpoServiceError(
+                    "The command catalog for ePO server '{0}' has not been "
+                    "loaded".format(epo.name))
+
+            if req_dict.get(self.CMD_NAME_KEY):
+                command = catalog.get(req_dict[self.CMD_NAME_KEY])
+                if command is None:
+                    raise _InvalidRequestError("Unknown command: '{0}'".format(
+                        req_dict[self.CMD_NAME_KEY]))
+                result = command.to_dict()
+            else:
+                result = catalog.to_dict(req_dict.get(self.PREFIX_KEY))
+
+            response = Response(request)
+            response.payload = json.dumps(result)
+            self._dxl_client.send_response(response)
+
+        except Exception as ex:
+            if isinstance(ex, _EpoServiceError):
+                logger.warning("Error while processing catalog request: %s", ex)
+            else:
+                logger.exception("Error while processing catalog request")
+            self._dxl_client.send_response(
+                ErrorResponse(request,
+                              error_code=getattr(ex, "error_code", 0),
+                              error_message=str(ex).encode(
+                                  encoding=self.UTF_8)))
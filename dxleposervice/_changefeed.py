@@ -0,0 +1,180 @@
+from __future__ import absolute_import
+import hashlib
+import json
+import logging
+
+from ._metrics import registry
+from ._scheduler import _PeriodicTask
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+# The number of changed records published by change feeds
+_changes_counter = registry.counter(
+    "changefeed_records_total",
+    "The number of added, changed and removed records published by change feeds",
+    ("feed", "change"))
+
+# The number of failed change feed polls
+_failures_counter = registry.counter(
+    "changefeed_poll_failures_total",
+    "The number of change feed polls that failed",
+    ("feed",))
+
+
+# The feed holds the settings of its query along with the snapshot of its
+# results
+class _ChangeFeed(object): # pylint: disable=too-many-instance-attributes
+    """
+    Periodically invokes a query on an ePO server, compares the result with the
+    previous result (snapshot), and publishes the added, changed and removed
+    records as DXL events. Consumers that subscribe to the events share a single
+    query, rather than each polling the ePO server.
+
+    Records are identified by a hash of their key properties (or of the whole
+    record if no key properties are specified, in which case changed records are
+    published as a removed and an added record), and are compared using a hash of
+    their content. The first result is used as the initial snapshot (no events
+    are published).
+    """
+
+    # The keys in the published events
+    FEED_KEY = "feed"
+    EPO_KEY = "epo"
+    ADDED_KEY = "added"
+    CHANGED_KEY = "changed"
+    REMOVED_KEY = "removed"
+
+    def __init__(self, name, epo, command, params, topic, interval,
+                 publisher, key_properties=None, batch_size=500):
+        """
+        Constructs the change feed
+
+        :param name: The name of the feed
+        :param epo: The ePO server wrapper
+        :param command: The command
+        :param params: The parameters of the command
+        :param topic: The DXL topic the changes are published to
+        :param interval: The time (in seconds) between polls
+        :param publisher: The function invoked to publish an event (with the topic
+            and the payload of the event)
+        :param key_properties: The properties that identify a record (optional)
+        :param batch_size: The maximum number of records in an event
+        """
+        self.name = name
+        self.epo = epo
+        self.command = command
+        self.params = params
+        self.topic = topic
+        self._publisher = publisher
+        self._key_properties = key_properties
+        self._batch_size = batch_size
+        # The hash of the content and the key (or the whole record) of each
+        # record in the previous result, by the hash of its key
+        self._snapshot = None
+        self._task = _PeriodicTask("changefeed-" + name, interval, self.poll)
+
+    def start(self):
+        """
+        Starts polling
+        """
+        self._task.start()
+
+    def shutdown(self):
+        """
+        Stops polling
+        """
+        self._task.stop()
+
+    @staticmethod
+    def _hash(value):
+        return hashlib.sha1(json.dumps(value, sort_keys=True).encode(
+            "utf-8")).hexdigest()
+
+    def _get_key(self, record):
+        """
+        Returns the properties that identify a record
+
+        :param record: The record
+        :return: The key properties (or the whole record if no key properties
+            are specified)
+        """
+        if not self._key_properties:
+            return record
+        return dict((name, record.get(name)) for name in self._key_properties)
+
+    def poll(self):
+        """
+        Invokes the query and publishes the changes since the previous poll
+
+        :return: The number of changed records (or ``None`` if the poll failed)
+        """
+        try:
+            records = json.loads(self.epo.execute(
+                self.command, "json", dict(self.params),
+                use_local=False))
+            if not isinstance(records, list):
+                raise ValueError("The result is not a list of records")
+        except Exception as ex:
+            _failures_counter.inc(feed=self.name)
+            logger.warning("Unable to poll change feed '%s': %s", self.name, ex)
+            return None
+
+        hashed = []
+        snapshot = {}
+        for record in records:
+            key = self._get_key(record)
+            key_hash = self._hash(key)
+            hashed.append((key_hash, record))
+            snapshot[key_hash] = (self._hash(record), key)
+        previous = self._snapshot
+        if previous is None:
+            self._snapshot = snapshot
+            logger.info("Loaded %d records for change feed: %s", len(snapshot),
+                        self.name)
+            return 0
+
+        added = []
+        changed = []
+        for key_hash, record in hashed:
+            if key_hash not in previous:
+                added.append(record)
+            elif previous[key_hash][0] != snapshot[key_hash][0]:
+                changed.append(record)
+        removed = [key for key_hash, (_, key) in previous.items()
+                   if key_hash not in snapshot]
+        try:
+            self._publish(added, changed, removed)
+        except Exception as ex:
+            # The snapshot is retained, so the changes are published by the next
+            # poll
+            _failures_counter.inc(feed=self.name)
+            logger.warning("Unable to publish changes for change feed '%s': %s",
+                           self.name, ex)
+            return None
+        self._snapshot = snapshot
+        return len(added) + len(changed) + len(removed)
+
+    def _publish(self, added, changed, removed):
+        """
+        Publishes the changes (in batches)
+
+        :param added: The added records
+        :param changed: The changed records
+        :param removed: The keys of the removed records
+        """
+        changes = [(self.ADDED_KEY, record) for record in added] + \
+            [(self.CHANGED_KEY, record) for record in changed] + \
+            [(self.REMOVED_KEY, key) for key in removed]
+        for start in range(0, len(changes), self._batch_size):
+            payload = {self.FEED_KEY: self.name, self.EPO_KEY: self.epo.name,
+                       self.ADDED_KEY: [], self.CHANGED_KEY: [],
+                       self.REMOVED_KEY: []}
+            for change, value in changes[start:start + self._batch_size]:
+                payload[change].append(value)
+            self._publisher(self.topic, payload)
+        for change, count in ((self.ADDED_KEY, len(added)),
+                              (self.CHANGED_KEY, len(changed)),
+                              (self.REMOVED_KEY, len(removed))):
+            if count:
+                _changes_counter.inc(count, feed=self.name, change=change)
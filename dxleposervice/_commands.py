@@ -0,0 +1,34 @@
+from __future__ import absolute_import
+import fnmatch
+
+
+class _CommandPatterns(object):
+    """
+    A set of patterns (:mod:`fnmatch`, case-insensitive) used to match ePO
+    command names
+    """
+
+    # Patterns matching the ePO commands that are read-only
+    READ_ONLY = ["core.help", "core.executeQuery", "*.find*", "*.get*",
+                 "*.list*", "*.search*"]
+
+    def __init__(self, patterns):
+        """
+        Constructs the patterns
+
+        :param patterns: The patterns
+        """
+        self._patterns = [pattern.lower() for pattern in patterns]
+
+    def matches(self, command):
+        """
+        Returns whether the command matches one of the patterns
+
+        :param command: The command name
+        :return: Whether the command matches one of the patterns
+        """
+        command = command.lower()
+        for pattern in self._patterns:
+            if fnmatch.fnmatchcase(command, pattern):
+                return True
+        return False
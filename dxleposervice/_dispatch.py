@@ -0,0 +1,586 @@
+from __future__ import absolute_import
+import fnmatch
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from ._errors import _InvalidRequestError
+from ._metrics import registry
+from ._scheduler import _PeriodicTask
+
+try: #Python 2.7
+    _STRING_TYPES = (str, unicode) # pylint: disable=undefined-variable
+except NameError: #Python 3
+    _STRING_TYPES = (str,)
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+_pool_size_gauge = registry.gauge(
+    "dispatch_pool_size", "The number of worker threads of a lane", ["lane"])
+_utilization_gauge = registry.gauge(
+    "dispatch_pool_utilization",
+    "The fraction of the time the worker threads of a lane were busy (during "
+    "the last sizing interval)", ["lane"])
+_queue_wait_gauge = registry.gauge(
+    "dispatch_queue_wait_average_seconds",
+    "The average time tasks waited in the queue of a lane (during the last "
+    "sizing interval)", ["lane"])
+_demand_gauge = registry.gauge(
+    "dispatch_demand_threads",
+    "The number of worker threads needed for the requests to an ePO server "
+    "(arrival rate multiplied by latency)", ["lane", "epo"])
+_queue_wait_histogram = registry.histogram(
+    "dispatch_queue_wait_seconds",
+    "The time tasks waited in the queue of a lane", ["lane"])
+_tasks_counter = registry.counter(
+    "dispatch_tasks_total", "The number of tasks executed by a lane", ["lane"])
+
+
+# The items, the weights and the round robin position of each client are
+# guarded by a single condition
+class _FairQueue(object): # pylint: disable=too-many-instance-attributes
+    """
+    A bounded queue that is shared fairly across clients.
+
+    Items are queued separately for each client and dequeued using deficit
+    round robin. Each time a client is visited it may dequeue as many items as
+    its weight before the next client is visited. A client that floods the queue
+    can therefore only delay other clients by its share of the workers.
+    """
+
+    def __init__(self, max_size, default_weight=1, weights=None):
+        """
+        Constructs the queue
+
+        :param max_size: The maximum number of items in the queue
+        :param default_weight: The weight of clients without a specific weight
+        :param weights: A dictionary of weights by client identifier (optional)
+        """
+        self._max_size = max_size
+        self._default_weight = default_weight
+        self._weights = dict((k.lower(), v) for k, v in (weights or {}).items())
+        self._items_by_client = {}
+        self._active_clients = deque()
+        self._quantum = 0
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def qsize(self):
+        """
+        Returns the number of items in the queue
+
+        :return: The number of items in the queue
+        """
+        return self._size
+
+    def put(self, client_id, item):
+        """
+        Adds an item to the queue
+
+        :param client_id: The identifier of the client the item belongs to
+        :param item: The item to add
+        :return: Whether the item was added (``False`` if the queue is full)
+        """
+        key = (client_id or "").lower()
+        with self._condition:
+            if self._size >= self._max_size:
+                return False
+            items = self._items_by_client.get(key)
+            if items is None:
+                items = deque()
+                self._items_by_client[key] = items
+                self._active_clients.append(key)
+            items.append(item)
+            self._size += 1
+            self._condition.notify()
+            return True
+
+    @property
+    def closed(self):
+        """
+        Whether the queue has been closed
+        """
+        return self._closed
+
+    def get(self, timeout=None):
+        """
+        Removes the next item from the queue (blocks until an item is available)
+
+        :param timeout: The maximum time (in seconds) to wait for an item
+            (optional)
+        :return: The next item (or ``None`` if the queue has been closed or the
+            timeout expired)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._size == 0:
+                if self._closed:
+                    return None
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    self._condition.wait(remaining)
+
+            key = self._active_clients[0]
+            if self._quantum <= 0:
+                self._quantum = self._weights.get(key, self._default_weight)
+            items = self._items_by_client[key]
+            item = items.popleft()
+            self._size -= 1
+            self._quantum -= 1
+
+            if not items:
+                del self._items_by_client[key]
+                self._active_clients.popleft()
+                self._quantum = 0
+            elif self._quantum <= 0:
+                self._active_clients.rotate(-1)
+            return item
+
+    def close(self):
+        """
+        Closes the queue. Consumers receive ``None`` once the queue is empty.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+# The worker threads and the load samples of a lane are guarded by a single
+# lock
+class _Lane(object): # pylint: disable=too-many-instance-attributes
+    """
+    A class of requests (interactive, bulk, etc.) with its own queue and pool of
+    worker threads. Tasks are dequeued fairly across the DXL clients that sent
+    the requests.
+
+    If a maximum thread count greater than the thread count is specified, the
+    number of worker threads is adjusted (see :class:`_PoolSizer`) between the
+    thread count and the maximum thread count. Threads above the target number
+    exit once they complete their current task (or are idle).
+    """
+
+    # The weight given to the latest task duration in the smoothed duration
+    DURATION_SMOOTHING = 0.2
+    # The time (in seconds) an idle worker thread waits for a task before
+    # checking whether it should exit
+    IDLE_TIMEOUT = 5.0
+
+    def __init__(self, name, thread_count, queue_size, default_weight=1,
+                 weights=None, max_thread_count=None):
+        """
+        Constructs the lane
+
+        :param name: The name of the lane
+        :param thread_count: The number of worker threads (the minimum number if
+            the lane is adaptive)
+        :param queue_size: The maximum number of queued tasks
+        :param default_weight: The weight of clients without a specific weight
+        :param weights: A dictionary of weights by client identifier (optional)
+        :param max_thread_count: The maximum number of worker threads (optional)
+        """
+        self._name = name
+        self._queue = _FairQueue(queue_size, default_weight, weights)
+        self._duration = None
+        self._min_thread_count = thread_count
+        self._max_thread_count = max(thread_count,
+                                     max_thread_count or thread_count)
+        self._target_thread_count = thread_count
+        self._threads = []
+        self._thread_index = 0
+        self._stats_by_key = {}
+        self._queue_wait = 0.0
+        self._dequeued = 0
+        self._busy_time = 0.0
+        self._lock = threading.Lock()
+        with self._lock:
+            for _ in range(thread_count):
+                self._start_thread()
+
+    @property
+    def name(self):
+        """
+        The name of the lane
+        """
+        return self._name
+
+    @property
+    def thread_count(self):
+        """
+        The number of worker threads
+        """
+        return len(self._threads)
+
+    @property
+    def min_thread_count(self):
+        """
+        The minimum number of worker threads
+        """
+        return self._min_thread_count
+
+    @property
+    def max_thread_count(self):
+        """
+        The maximum number of worker threads
+        """
+        return self._max_thread_count
+
+    @property
+    def adaptive(self):
+        """
+        Whether the number of worker threads is adjusted to the load
+        """
+        return self._max_thread_count > self._min_thread_count
+
+    def _start_thread(self):
+        """
+        Starts a worker thread (the lock must be held)
+        """
+        thread = threading.Thread(target=self._run,
+                                  name="EpoDispatch-{0}-{1}".format(
+                                      self._name, self._thread_index))
+        thread.daemon = True
+        self._thread_index += 1
+        self._threads.append(thread)
+        thread.start()
+
+    def resize(self, thread_count):
+        """
+        Sets the target number of worker threads (limited to the minimum and
+        maximum thread counts). Threads are started immediately, surplus threads
+        exit once they complete their current task.
+
+        :param thread_count: The target number of worker threads
+        :return: The target number of worker threads
+        """
+        thread_count = min(self._max_thread_count,
+                           max(self._min_thread_count, thread_count))
+        with self._lock:
+            self._target_thread_count = thread_count
+            if not self._queue.closed:
+                while len(self._threads) < thread_count:
+                    self._start_thread()
+        return thread_count
+
+    def sample(self):
+        """
+        Returns the statistics collected since the previous sample
+
+        :return: A tuple containing a dictionary of ``(arrivals, completed,
+            duration)`` tuples by key (the total duration of the completed
+            tasks), the total time tasks waited in the queue, the number of
+            tasks dequeued, and the total time the worker threads were busy
+        """
+        with self._lock:
+            sample = (self._stats_by_key, self._queue_wait, self._dequeued,
+                      self._busy_time)
+            self._stats_by_key = {}
+            self._queue_wait = 0.0
+            self._dequeued = 0
+            self._busy_time = 0.0
+        return sample
+
+    def _get_stats(self, key):
+        """
+        Returns the ``[arrivals, completed, duration]`` statistics for a key
+        (the lock must be held)
+        """
+        stats = self._stats_by_key.get(key)
+        if stats is None:
+            stats = [0, 0, 0.0]
+            self._stats_by_key[key] = stats
+        return stats
+
+    def submit(self, client_id, func, *args, **kwargs):
+        """
+        Queues a task for execution
+
+        :param client_id: The identifier of the client the task belongs to
+        :param func: The function to invoke
+        :param args: The arguments for the function
+        :param key: The key the statistics of the task are collected under (the
+            name of the ePO server, optional keyword argument)
+        :return: Whether the task was queued (``False`` if the queue is full)
+        """
+        key = kwargs.get("key")
+        with self._lock:
+            # Rejected tasks are counted as arrivals, so that the lane can grow
+            # to the offered load
+            self._get_stats(key)[0] += 1
+        return self._queue.put(client_id, (func, args, key, time.time()))
+
+    def retry_after(self):
+        """
+        Returns an estimate of the delay (in milliseconds) until the queue has
+        room for another task
+
+        :return: The estimated delay (in milliseconds)
+        """
+        with self._lock:
+            duration = self._duration if self._duration is not None else 1.0
+            thread_count = max(1, len(self._threads))
+        return max(1, int(duration * self._queue.qsize() / thread_count * 1000))
+
+    def _retire(self):
+        """
+        Removes the current worker thread if the lane has more threads than its
+        target
+
+        :return: Whether the thread should exit
+        """
+        with self._lock:
+            if len(self._threads) <= self._target_thread_count:
+                return False
+            self._threads.remove(threading.current_thread())
+            return True
+
+    def _run(self):
+        while True:
+            task = self._queue.get(self.IDLE_TIMEOUT if self.adaptive else None)
+            if task is None:
+                if self._queue.closed or self._retire():
+                    return
+                continue
+            func, args, key, queued = task
+            start = time.time()
+            _queue_wait_histogram.observe(start - queued, lane=self._name)
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("Error in dispatch thread")
+            duration = time.time() - start
+            _tasks_counter.inc(lane=self._name)
+            with self._lock:
+                stats = self._get_stats(key)
+                stats[1] += 1
+                stats[2] += duration
+                self._queue_wait += start - queued
+                self._dequeued += 1
+                self._busy_time += duration
+                if self._duration is None:
+                    self._duration = duration
+                else:
+                    self._duration += self.DURATION_SMOOTHING * \
+                        (duration - self._duration)
+            if self._retire():
+                return
+
+    def shutdown(self):
+        """
+        Stops the worker threads once the queued tasks have been executed
+        """
+        self._queue.close()
+
+
+class _PoolSizer(object):
+    """
+    Periodically adjusts the number of worker threads of adaptive lanes to the
+    observed load, and publishes the pool metrics of all lanes.
+
+    The number of threads needed is derived from Little's law: the average
+    number of requests in progress equals their arrival rate multiplied by
+    their latency. The arrival rate and the (smoothed) latency are measured for
+    each ePO server, so a slow ePO server accounts for more threads than a fast
+    one with the same arrival rate. The sum across ePO servers (plus headroom)
+    is the target number of threads. Pools grow immediately but shrink
+    gradually, so that short lulls do not release threads that are needed
+    again shortly after.
+    """
+
+    # The additional capacity (as a fraction) provided above the demand
+    HEADROOM = 0.25
+    # The weight given to the latest latency in the smoothed latency
+    LATENCY_SMOOTHING = 0.3
+    # The weight given to a lower demand in the smoothed demand
+    SHRINK_SMOOTHING = 0.2
+
+    def __init__(self, lanes, interval):
+        """
+        Constructs the sizer
+
+        :param lanes: The lanes
+        :param interval: The time (in seconds) between adjustments
+        """
+        self._lanes = list(lanes)
+        self._interval = interval
+        self._latencies = {}
+        self._demands = {}
+        self._last_sample = time.time()
+        self._task = _PeriodicTask("pool-sizer", interval, self.adjust,
+                                   run_immediately=False)
+
+    def start(self):
+        """
+        Starts adjusting the lanes
+        """
+        self._last_sample = time.time()
+        self._task.start()
+
+    def shutdown(self):
+        """
+        Stops adjusting the lanes
+        """
+        self._task.stop()
+
+    def adjust(self):
+        """
+        Adjusts the number of worker threads of the lanes to the load observed
+        since the previous adjustment
+        """
+        now = time.time()
+        elapsed = max(now - self._last_sample, 0.001)
+        self._last_sample = now
+        for lane in self._lanes:
+            self._adjust_lane(lane, elapsed)
+
+    def _get_demand(self, lane_name, stats_by_key, elapsed):
+        """
+        Returns the (smoothed) number of worker threads needed by a lane, from
+        the arrival rate and the latency of the requests for each ePO server
+        (Little's law)
+
+        :param lane_name: The name of the lane
+        :param stats_by_key: The ``(arrivals, completed, duration)`` tuple for
+            each ePO server, since the previous adjustment
+        :param elapsed: The time (in seconds) since the previous adjustment
+        :return: The number of worker threads needed
+        """
+        latencies = self._latencies.setdefault(lane_name, {})
+        demand = 0.0
+        for key, (arrivals, completed, duration) in stats_by_key.items():
+            latency = latencies.get(key)
+            if completed:
+                if latency is None:
+                    latency = duration / completed
+                else:
+                    latency += self.LATENCY_SMOOTHING * \
+                        (duration / completed - latency)
+                latencies[key] = latency
+            if latency is None:
+                continue
+            key_demand = arrivals / elapsed * latency
+            _demand_gauge.set(key_demand, lane=lane_name, epo=key or "")
+            demand += key_demand
+
+        previous = self._demands.get(lane_name)
+        if previous is not None and demand < previous:
+            demand = previous + self.SHRINK_SMOOTHING * (demand - previous)
+        self._demands[lane_name] = demand
+        return demand
+
+    def _adjust_lane(self, lane, elapsed):
+        """
+        Adjusts the number of worker threads of a lane
+
+        :param lane: The lane
+        :param elapsed: The time (in seconds) since the previous adjustment
+        """
+        stats_by_key, queue_wait, dequeued, busy_time = lane.sample()
+        demand = self._get_demand(lane.name, stats_by_key, elapsed)
+
+        thread_count = lane.thread_count
+        _utilization_gauge.set(
+            min(1.0, busy_time / (elapsed * max(1, thread_count))),
+            lane=lane.name)
+        if lane.adaptive:
+            target = lane.resize(
+                int(math.ceil(demand * (1 + self.HEADROOM))))
+            if target != thread_count:
+                logger.info(
+                    "Resizing request lane '%s' from %d to %d threads "
+                    "(demand %.2f)", lane.name, thread_count, target, demand)
+        _pool_size_gauge.set(lane.thread_count, lane=lane.name)
+        _queue_wait_gauge.set(queue_wait / dequeued if dequeued else 0.0,
+                              lane=lane.name)
+
+
+class _Dispatcher(object):
+    """
+    Routes requests to lanes based on the requested command (or the priority
+    specified by the client), so that a burst of heavy requests can not delay
+    requests in the other lanes.
+
+    Lanes are ranked in decreasing order of priority: the default lane first,
+    followed by the additional lanes (in the order they are specified). A client
+    may only move a request to a lane of the same or a lower priority than the
+    lane of its command.
+    """
+
+    def __init__(self, default_lane, lanes=None, command_patterns=None):
+        """
+        Constructs the dispatcher
+
+        :param default_lane: The lane for commands that do not match a pattern
+            (``None`` to process those requests on the calling thread)
+        :param lanes: The additional lanes, in decreasing order of priority
+            (optional)
+        :param command_patterns: A list of ``(pattern, lane)`` tuples used to
+            associate commands with lanes. Patterns are matched in order using
+            :mod:`fnmatch` (case-insensitive).
+        """
+        self._default_lane = default_lane
+        self._lanes = dict((lane.name.lower(), lane) for lane in lanes or [])
+        if default_lane is not None:
+            self._lanes.setdefault(default_lane.name.lower(), default_lane)
+        # The rank of each lane (lower ranks have a higher priority)
+        self._ranks = dict((lane.name.lower(), rank + 1)
+                           for rank, lane in enumerate(lanes or []))
+        if default_lane is not None:
+            self._ranks[default_lane.name.lower()] = 0
+        self._command_patterns = [(pattern.lower(), lane) for pattern, lane
+                                  in command_patterns or []]
+
+    @property
+    def lanes(self):
+        """
+        The lanes of the dispatcher
+        """
+        return list(self._lanes.values())
+
+    def get_lane(self, command, priority=None):
+        """
+        Returns the lane for a request
+
+        :param command: The requested command
+        :param priority: The name of the lane requested by the client (optional,
+            the lane must not have a higher priority than the lane of the
+            command)
+        :return: The lane (or ``None`` if the request should be processed on the
+            calling thread)
+        """
+        command_lane = self._default_lane
+        command = command.lower()
+        for pattern, lane in self._command_patterns:
+            if fnmatch.fnmatchcase(command, pattern):
+                command_lane = lane
+                break
+
+        if priority is None:
+            return command_lane
+        if not isinstance(priority, _STRING_TYPES):
+            raise _InvalidRequestError("The priority must be a string")
+        lane = self._lanes.get(priority.lower())
+        if lane is None:
+            raise _InvalidRequestError("Unknown priority: {0}".format(priority))
+        # Requests processed on the calling thread have the highest priority
+        if command_lane is not None and self._ranks[lane.name.lower()] < \
+                self._ranks[command_lane.name.lower()]:
+            raise _InvalidRequestError(
+                "The priority of command '{0}' can not be raised to '{1}'".format(
+                    command, priority))
+        return lane
+
+    def shutdown(self):
+        """
+        Stops the worker threads of all lanes once their queued tasks have been
+        executed
+        """
+        for lane in self._lanes.values():
+            lane.shutdown()
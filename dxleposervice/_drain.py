@@ -0,0 +1,54 @@
+from __future__ import absolute_import
+import threading
+import time
+
+
+class _InFlightTracker(object):
+    """
+    Tracks the number of requests that are in progress (including requests that
+    are queued for processing), so that shutdown can wait for them to complete
+    """
+
+    def __init__(self):
+        self._count = 0
+        self._condition = threading.Condition()
+
+    @property
+    def count(self):
+        """
+        The number of requests in progress
+        """
+        with self._condition:
+            return self._count
+
+    def begin(self):
+        """
+        Records the start of a request
+        """
+        with self._condition:
+            self._count += 1
+
+    def end(self):
+        """
+        Records the completion of a request
+        """
+        with self._condition:
+            self._count -= 1
+            if self._count <= 0:
+                self._condition.notify_all()
+
+    def wait(self, timeout):
+        """
+        Waits for the requests in progress to complete
+
+        :param timeout: The maximum time (in seconds) to wait
+        :return: Whether all requests completed
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._count > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
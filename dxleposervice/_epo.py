@@ -6,15 +6,80 @@
 from __future__ import absolute_import
 import json
 import logging
+import threading
+import time
 import warnings
 import requests
 from requests.auth import HTTPBasicAuth
 
+from ._balancer import _HostBalancer, _LatencyTracker
+from ._commands import _CommandPatterns
+from ._errors import _EpoConnectTimeoutError, _EpoReadTimeoutError
+from ._metrics import registry
+from ._timeouts import _TimeoutPolicy
+from ._tracing import tracer
+
+try: #Python 3
+    import queue
+except ImportError: #Python 2.7
+    import Queue as queue
+
 # Configure local logger
 logger = logging.getLogger(__name__)
 
+# The number of retries of requests to ePO servers
+_retries_counter = registry.counter(
+    "epo_request_retries_total",
+    "The number of retries of requests to ePO servers",
+    ("host", "command"))
+
+# The number of requests to ePO servers that timed out
+_timeouts_counter = registry.counter(
+    "epo_request_timeouts_total",
+    "The number of requests to ePO servers that timed out",
+    ("host", "command", "type"))
+
+# The number of hedged requests sent to ePO servers
+_hedges_counter = registry.counter(
+    "epo_hedged_requests_total",
+    "The number of hedged requests sent to ePO servers",
+    ("epo",))
+
+# The time taken by ePO servers to execute commands
+_latency_histogram = registry.histogram(
+    "epo_request_duration_seconds",
+    "The time taken by ePO servers to execute remote commands (including "
+    "retries and fetching the security token)",
+    ("epo", "command"))
+
+# The number of error responses received from ePO servers
+_epo_errors_counter = registry.counter(
+    "epo_errors_total",
+    "The number of error responses received from ePO servers (by ePO error "
+    "code)",
+    ("host", "code"))
+
+# The time taken to fetch security tokens
+_token_histogram = registry.histogram(
+    "epo_token_fetch_duration_seconds",
+    "The time taken to fetch security tokens from ePO servers", ("host",))
+
+
+def _truncate(text, max_length=1000):
+    """
+    Truncates text that is logged (to limit the volume of debug logging)
+
+    :param text: The text
+    :param max_length: The maximum length
+    :return: The text (truncated if it is longer than the maximum length)
+    """
+    return text if len(text) <= max_length else text[:max_length] + "..."
+
 
-class _Epo(object):
+# The wrapper holds the state of the optional features applied to the requests
+# for the ePO server (balancing, hedging, local rendering, caching and the
+# system index)
+class _Epo(object): # pylint: disable=too-many-instance-attributes
     """
     An ePO server that is being wrapped and exposed to the DXL fabric
     """
@@ -29,19 +94,65 @@ class _Epo(object):
     # UTF-8 encoding (used for encoding/decoding payloads)
     UTF_8 = "utf-8"
 
-    def __init__(self, name, host, port, user, password, verify):
+    # The delay (in seconds) before a hedged request is sent until enough
+    # latencies have been recorded to determine the 95th percentile
+    DEFAULT_HEDGE_DELAY = 1.0
+    # The number of recorded latencies (of a command) required to use their 95th
+    # percentile as the delay before a hedged request for the command is sent
+    MIN_HEDGE_SAMPLES = 20
+
+    def __init__(self, name, host, port, user, password, verify,
+                 retry_policy=None, hedge_commands=None, hedge_delay=None,
+                 timeout_policy=None, cache=None, system_index=None):
         """
         Constructs the ePO server wrapper
 
         :param name: The name of the ePO server
-        :param host: The host for the ePO server
+        :param host: The host for the ePO server (or a list of hosts for the
+            application servers of the ePO server)
         :param port: The port for the ePO server
         :param user: The user used to login to the ePO server
         :param password: The password used to login to the ePO server
         :param verify: Whether to verify the ePO server's certificate
+        :param retry_policy: The policy used to retry requests that fail due to
+            transient errors (optional, requests are not retried if not specified)
+        :param hedge_commands: Patterns matching the commands for which a second
+            (hedged) request is sent to another host when the first request is
+            slow (optional, requests are not hedged if not specified)
+        :param hedge_delay: The delay (in seconds) before a hedged request is sent
+            (optional, defaults to the 95th percentile of the recent latencies
+            of the command)
+        :param timeout_policy: The policy that determines the connect and read
+            timeouts for requests (optional, default timeouts are used if not
+            specified)
+        :param cache: The cache used for the results of read-only commands
+            (optional)
+        :param system_index: The system index manager used to answer
+            ``system.find`` requests locally (optional)
         """
         self._name = name
-        self._client = _EpoRemote(host, port, user, password, verify)
+        hosts = host if isinstance(host, list) else [host]
+        self._clients = [_EpoRemote(epo_host, port, user, password, verify,
+                                    retry_policy, timeout_policy)
+                         for epo_host in hosts]
+        self._client = self._clients[0]
+        self._balancer = _HostBalancer(self._clients)
+        # The recent latencies of each hedged command (by lower-case name)
+        self._latencies = {}
+        self._latencies_lock = threading.Lock()
+        self._hedge_commands = _CommandPatterns(hedge_commands) \
+            if hedge_commands else None
+        self._hedge_delay = hedge_delay
+        self._cache = cache
+        self._system_index = system_index
+        self._read_only = _CommandPatterns(_CommandPatterns.READ_ONLY)
+
+    @property
+    def name(self):
+        """
+        The name of the ePO server
+        """
+        return self._name
 
     def lookup_guid(self):
         """
@@ -67,24 +178,217 @@ class _Epo(object):
                 self._name)
             raise
 
-    def execute(self, command, output, req_params):
+    def close(self):
+        """
+        Closes the HTTP connection pools for the ePO server
+        """
+        for client in self._clients:
+            client.close()
+
+    def execute(self, command, output, req_params, use_local=True):
         """
         Invokes a remote command on the ePO server (via HTTP)
 
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :param use_local: Whether the result may be served locally (from the
+            cache or the system index)
+        :return: The result of the command execution
+        """
+        if not use_local:
+            return self._fetch(command, output, req_params)
+        if (self._cache is not None or self._system_index is not None) and \
+                not self._read_only.matches(command):
+            try:
+                return self._fetch(command, output, req_params)
+            finally:
+                # The command may have modified the data of the cached results
+                # (even if it failed)
+                if self._cache is not None:
+                    self._cache.invalidate_for(self._name, command)
+                if self._system_index is not None:
+                    self._system_index.invalidate(self._name, command)
+        # Only requests for JSON results are answered by the index
+        if self._system_index is not None and output == "json" and \
+                self._system_index.is_answerable(command, req_params):
+            result = self._system_index.find(self._name, command, req_params)
+            if result is not None:
+                return result
+            result = self._fetch_cached(command, output, req_params)
+            self._system_index.update(self._name, result)
+            return result
+        return self._fetch_cached(command, output, req_params)
+
+    def _fetch_cached(self, command, output, req_params):
+        """
+        Returns the cached result of a remote command, or invokes the command (and
+        caches its result) if it is not cached
+
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :return: The result of the command execution
+        """
+        if self._cache is None or not self._cache.is_cacheable(command):
+            return self._fetch(command, output, req_params)
+        entry = self._cache.get(self._name, command, output, req_params)
+        if entry is None:
+            return self.refresh(command, output, req_params)
+        if entry.expired:
+            # Serve the stale result while it is refreshed in the background
+            self._cache.refresh(
+                self._name, command, output, req_params,
+                lambda: self.refresh(command, output, req_params))
+        return entry.value
+
+    def refresh(self, command, output, req_params):
+        """
+        Invokes a remote command and caches its result
+
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :return: The result of the command execution
+        """
+        if self._cache is None:
+            return self._fetch(command, output, req_params)
+        # Results fetched while a mutating command is invoked are not cached
+        generation = self._cache.generation
+        result = self._fetch(command, output, req_params)
+        self._cache.put(self._name, command, output, req_params, result,
+                        generation=generation)
+        return result
+
+    def _fetch(self, command, output, req_params):
+        """
+        Invokes a remote command on one (or more, if hedged) of the hosts of the
+        ePO server
+
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :return: The result of the command execution
+        """
+        if self._hedge_commands is not None and len(self._clients) > 1 and \
+                self._hedge_commands.matches(command):
+            return self._execute_hedged(command, output, req_params)
+        return self._invoke(self._balancer.choose(), command, output, req_params)
+
+    def _invoke(self, remote, command, output, req_params):
+        """
+        Invokes a remote command on one of the hosts of the ePO server and records
+        the outcome for load balancing
+
+        :param remote: The remote command client for the host
         :param command: The command to invoke
         :param output: The output type (json, xml, verbose, terse)
         :param req_params: The parameters for the command
         :return: The result of the command execution
         """
-        return self._client.invoke_command(command, req_params, output)
+        start = time.time()
+        try:
+            with tracer.span("epo.invoke", **{"epo.host": remote.host}):
+                result = remote.invoke_command(command, dict(req_params),
+                                               output)
+        except requests.exceptions.RequestException:
+            self._balancer.record(remote, time.time() - start, False)
+            raise
+        finally:
+            _latency_histogram.observe(time.time() - start, epo=self._name,
+                                       command=command)
+        latency = time.time() - start
+        self._balancer.record(remote, latency, True)
+        if self._hedge_commands is not None and \
+                self._hedge_commands.matches(command):
+            self._get_latencies(command).add(latency)
+        return result
+
+    def _get_latencies(self, command):
+        """
+        Returns the tracker of the recent latencies of a hedged command
 
+        :param command: The command
+        :return: The latency tracker
+        """
+        with self._latencies_lock:
+            return self._latencies.setdefault(command.lower(),
+                                              _LatencyTracker())
 
-class _EpoRemote(object):
+    def _get_hedge_delay(self, command):
+        """
+        Returns the delay before a hedged request for a command is sent (the
+        latencies of other commands, such as long-running queries, do not affect
+        the delay)
+
+        :param command: The command
+        :return: The delay (in seconds)
+        """
+        if self._hedge_delay is not None:
+            return self._hedge_delay
+        latencies = self._get_latencies(command)
+        if len(latencies) < self.MIN_HEDGE_SAMPLES:
+            return self.DEFAULT_HEDGE_DELAY
+        return latencies.percentile(95)
+
+    def _execute_hedged(self, command, output, req_params):
+        """
+        Invokes a remote command on one host of the ePO server. If the command has
+        not completed within the hedge delay, it is also invoked on another host
+        and the first successful result is returned.
+
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :return: The result of the command execution
+        """
+        outcomes = queue.Queue()
+        span = tracer.current()
+
+        def attempt(remote):
+            try:
+                with tracer.activate(span):
+                    outcomes.put((True, self._invoke(remote, command, output,
+                                                     req_params)))
+            except Exception as ex:
+                outcomes.put((False, ex))
+
+        def start(remote):
+            thread = threading.Thread(target=attempt, args=(remote,),
+                                      name="EpoHedge-" + self._name)
+            thread.daemon = True
+            thread.start()
+
+        primary = self._balancer.choose()
+        start(primary)
+        attempts = 1
+        try:
+            success, value = outcomes.get(timeout=self._get_hedge_delay(command))
+        except queue.Empty:
+            logger.debug("Sending hedged request for command %s to ePO server: %s",
+                         command, self._name)
+            _hedges_counter.inc(epo=self._name)
+            start(self._balancer.choose(exclude=primary))
+            attempts = 2
+            success, value = outcomes.get()
+
+        # If the first request to complete failed, wait for the other request
+        if not success and attempts == 2:
+            success, value = outcomes.get()
+        if not success:
+            raise value
+        return value
+
+
+# The connection settings are kept with the session and security token of the
+# application server
+class _EpoRemote(object): # pylint: disable=too-many-instance-attributes
     """
     Handles REST invocation of ePO remote commands
     """
 
-    def __init__(self, host, port, username, password, verify):
+    def __init__(self, host, port, username, password, verify,
+                 retry_policy=None, timeout_policy=None):
         """
         Initializes the epoRemote with the information for the target ePO instance
 
@@ -93,17 +397,37 @@ class _EpoRemote(object):
         :param username: the username to run the remote commands as
         :param password: the password for the ePO user
         :param verify: Whether to verify the ePO server's certificate
+        :param retry_policy: The policy used to retry requests that fail due to
+            transient errors (optional)
+        :param timeout_policy: The policy that determines the connect and read
+            timeouts for requests (optional)
         """
 
         logger.debug(
             'Initializing epoRemote for ePO %s on port %s with user %s',
             host, port, username)
 
+        self._host = host
         self._baseurl = 'https://{}:{}/remote'.format(host, port)
         self._auth = HTTPBasicAuth(username, password)
         self._session = requests.Session()
         self._verify = verify
         self._token = ''
+        self._retry_policy = retry_policy
+        self._timeout_policy = timeout_policy or _TimeoutPolicy()
+
+    @property
+    def host(self):
+        """
+        The host of the ePO server
+        """
+        return self._host
+
+    def close(self):
+        """
+        Closes the HTTP connection pool
+        """
+        self._session.close()
 
     def invoke_command(self, command_name, params, output='json'):
         """
@@ -123,56 +447,156 @@ class _EpoRemote(object):
         params['orion.user.security.token'] = self._token
         params[':output'] = output
 
-        return self._parse_response(self._send_request(command_name, params))
+        response = self._send_request(command_name, params)
+        with tracer.span("epo.parse"):
+            return self._parse_response(response, self._host)
 
     def _send_request(self, command_name, params=None):
         """
-        Sends a request to the ePO server with the supplied command name and parameters
+        Sends a request to the ePO server with the supplied command name and parameters.
+        Requests that fail due to transient errors (connection failures, timeouts and
+        502/503/504 responses) are retried as specified by the retry policy.
+        Requests that time out (once retries are exhausted) raise a
+        :class:`_EpoConnectTimeoutError` or :class:`_EpoReadTimeoutError`.
 
         :param command_name: The command name to invoke
         :param params: The parameters to provide for the command
         :return: the response object from ePO
         """
-        logger.debug(
-            'Invoking command %s with the following parameters:', command_name)
-        logger.debug(params)
-        with warnings.catch_warnings():
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Invoking command %s with parameters: %s', command_name,
+                         _truncate(str(params)))
+
+        retry_policy = self._retry_policy
+        max_attempts = retry_policy.get_max_attempts(command_name) \
+            if retry_policy else 1
+        timeout = self._timeout_policy.get_timeout(command_name)
+        start = time.time()
+        attempt = 1
+        while True:
+            response, error = None, None
+            try:
+                response = self._get(command_name, params, timeout)
+            except requests.exceptions.ConnectTimeout:
+                _timeouts_counter.inc(host=self._host, command=command_name,
+                                      type="connect")
+                error = _EpoConnectTimeoutError(self._host, command_name,
+                                                timeout[0])
+            except requests.exceptions.ReadTimeout:
+                _timeouts_counter.inc(host=self._host, command=command_name,
+                                      type="read")
+                error = _EpoReadTimeoutError(self._host, command_name,
+                                             timeout[1])
+            except requests.exceptions.ConnectionError as ex:
+                error = ex
+
+            if error is None and (retry_policy is None or
+                                  not retry_policy.is_retryable_status(
+                                      response.status_code)):
+                return response
+
+            delay = retry_policy.get_delay(attempt, time.time() - start) \
+                if attempt < max_attempts else None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+
+            logger.warning(
+                'Retrying command %s on %s in %.3f seconds (attempt %d failed: %s)',
+                command_name, self._host, delay, attempt,
+                error if error is not None else response.status_code)
+            _retries_counter.inc(host=self._host, command=command_name)
+            time.sleep(delay)
+            attempt += 1
+
+    def _get(self, command_name, params, timeout=None):
+        """
+        Performs a single HTTP request for the supplied command name and parameters
+
+        :param command_name: The command name to invoke
+        :param params: The parameters to provide for the command
+        :param timeout: A ``(connect timeout, read timeout)`` tuple (in seconds)
+        :return: the response object from ePO
+        """
+        url = '{}/{}'.format(self._baseurl, command_name)
+        with warnings.catch_warnings(), \
+                tracer.span("epo.http", **{"epo.command": command_name}) as span:
             warnings.filterwarnings("ignore", ".*subjectAltName.*")
             if not self._verify:
                 warnings.filterwarnings("ignore", "Unverified HTTPS request")
-            return self._session.get(
-                '{}/{}'.format(self._baseurl, command_name),
+            connections = self._get_connection_count(url) \
+                if span.trace_id else None
+            response = self._session.get(
+                url,
                 auth=self._auth,
                 params=params,
-                verify=self._verify)
+                verify=self._verify,
+                timeout=timeout)
+            if span.trace_id:
+                # Whether a connection (and TLS handshake) was established, and
+                # the time until the response headers were received (the rest of
+                # the span is spent reading the response body)
+                span.set_attribute(
+                    "http.new_connection",
+                    connections is not None and
+                    self._get_connection_count(url) != connections)
+                span.set_attribute("http.status_code", response.status_code)
+                span.set_attribute("http.time_to_headers",
+                                   response.elapsed.total_seconds())
+            return response
+
+    def _get_connection_count(self, url):
+        """
+        Returns the number of connections established by the connection pools
+        for a URL (used to determine whether a request established a new
+        connection)
+
+        :param url: The URL
+        :return: The number of connections (or ``None`` if it is not available)
+        """
+        try:
+            pools = self._session.get_adapter(url).poolmanager.pools
+            return sum(pools[key].num_connections for key in pools.keys())
+        except Exception:
+            return None
 
     def _save_token(self):
         """
         Retrieves the security token for this session and saves it for later requests
         """
-        self._token = self._parse_response(
-            self._send_request('core.getSecurityToken'))
+        start = time.time()
+        try:
+            with tracer.span("epo.token"):
+                self._token = self._parse_response(
+                    self._send_request('core.getSecurityToken'), self._host)
+        finally:
+            _token_histogram.observe(time.time() - start, host=self._host)
         logger.debug('Security token received from ePO: %s', self._token)
 
     @staticmethod
-    def _parse_response(response):
+    def _parse_response(response, host=None):
         """
         Parses the response object from ePO. Removes the return status and code
         from the response body and returns just the remote command response.
         Throws an exception if an error response is returned.
 
         :param response: the ePO remote command response object to parse
+        :param host: the host the response was received from (optional)
         :return: the ePO remote command results as a string
         """
         try:
             response_body = response.text
 
-            logger.debug('Response from ePO: %s', response_body)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Response from ePO (%d characters): %s',
+                             len(response_body), _truncate(response_body))
             status = response_body[:response_body.index(':')]
             result = response_body[response_body.index(':') + 1:].strip()
 
             if 'Error' in status:
                 code = int(status[status.index(' '):].strip())
+                _epo_errors_counter.inc(host=host or "", code=code)
                 raise Exception('Response failed with error code ' + str(
                     code) + '. Message: ' + result)
 
@@ -0,0 +1,126 @@
+from __future__ import absolute_import
+from requests.exceptions import ConnectTimeout, ReadTimeout
+
+
+class _EpoServiceError(Exception):
+    """
+    Base class for errors raised by the ePO DXL service that are reported to the
+    invoking client with a specific error code (via the DXL error response)
+    """
+
+    # The error code that is included in the DXL error response
+    ERROR_CODE = 500
+
+    @property
+    def error_code(self):
+        """
+        The error code that is included in the DXL error response
+        """
+        return self.ERROR_CODE
+
+
+class _OverloadedError(_EpoServiceError):
+    """
+    Raised when a request is rejected by admission control because the target
+    ePO server is overloaded
+    """
+
+    ERROR_CODE = 503
+
+    def __init__(self, epo_name, retry_after):
+        """
+        Constructs the error
+
+        :param epo_name: The name of the ePO server that is overloaded
+        :param retry_after: The suggested delay (in milliseconds) before the
+            client retries the request
+        """
+        super(_OverloadedError, self).__init__(
+            "Service overloaded for ePO server '{0}', retry after {1} ms".format(
+                epo_name, retry_after))
+        self.retry_after = retry_after
+
+
+class _RateLimitedError(_EpoServiceError):
+    """
+    Raised when a request is rejected because the invoking client exceeded its
+    configured rate limit
+    """
+
+    ERROR_CODE = 429
+
+    def __init__(self, client_id, retry_after):
+        """
+        Constructs the error
+
+        :param client_id: The identifier of the DXL client that exceeded its limit
+        :param retry_after: The suggested delay (in milliseconds) before the
+            client retries the request
+        """
+        super(_RateLimitedError, self).__init__(
+            "Rate limit exceeded for client '{0}', retry after {1} ms".format(
+                client_id, retry_after))
+        self.retry_after = retry_after
+
+
+class _InvalidRequestError(_EpoServiceError):
+    """
+    Raised when a request is rejected because it is malformed or invalid
+    """
+
+    ERROR_CODE = 400
+
+
+# The ancestors come from the exception hierarchy of requests (the error is
+# also caught as a ConnectTimeout)
+class _EpoConnectTimeoutError(_EpoServiceError, ConnectTimeout): # pylint: disable=too-many-ancestors
+    """
+    Raised when a connection to an ePO server could not be established within
+    the configured connect timeout
+    """
+
+    # "Network connect timeout"
+    ERROR_CODE = 599
+
+    def __init__(self, host, command, timeout):
+        """
+        Constructs the error
+
+        :param host: The host of the ePO server
+        :param command: The command that was being invoked
+        :param timeout: The connect timeout (in seconds)
+        """
+        super(_EpoConnectTimeoutError, self).__init__(
+            "Timed out connecting to ePO server '{0}' for command '{1}' "
+            "(connect timeout {2} ms)".format(
+                host, command, int(timeout * 1000)))
+
+
+class _EpoReadTimeoutError(_EpoServiceError, ReadTimeout):
+    """
+    Raised when an ePO server did not respond within the configured read timeout
+    """
+
+    # "Network read timeout"
+    ERROR_CODE = 598
+
+    def __init__(self, host, command, timeout):
+        """
+        Constructs the error
+
+        :param host: The host of the ePO server
+        :param command: The command that was being invoked
+        :param timeout: The read timeout (in seconds)
+        """
+        super(_EpoReadTimeoutError, self).__init__(
+            "Timed out waiting for ePO server '{0}' to respond to command '{1}' "
+            "(read timeout {2} ms)".format(host, command, int(timeout * 1000)))
+
+
+class _ForbiddenError(_EpoServiceError):
+    """
+    Raised when a request is rejected because the invoking client is not allowed
+    to invoke it
+    """
+
+    ERROR_CODE = 403
@@ -0,0 +1,524 @@
+from __future__ import absolute_import
+import json
+import logging
+import os
+
+from ._cache import _HotQuery, _PersistentCacheStore, _Prefetcher, \
+    _ResponseCache
+from ._changefeed import _ChangeFeed
+from ._metrics import registry
+from ._profiler import _MemorySnapshots, _SamplingProfiler
+from ._scheduler import _PeriodicTask
+from ._slowlog import _SlowRequestLog
+from ._stats import _MetricsFileWriter, _MetricsHttpServer
+from ._sysindex import _SystemIndexManager
+from ._tracing import tracer, _create_exporter
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+# The mixin sets the components of the optional features on the application
+# (see EpoService)
+class _FeatureConfigMixin(object): # pylint: disable=too-many-instance-attributes
+    """
+    Loads the configuration of the optional features of the ePO DXL service
+    (the response cache, the system index, change feeds, metrics, tracing, the
+    slow request log and the profiler). The option helpers are provided by
+    :class:`_RequestConfigMixin`.
+    """
+
+    # The name of the "Cache" section within the ePO service configuration file
+    CACHE_CONFIG_SECTION = "Cache"
+    # Whether the results of read-only commands are cached
+    CACHE_ENABLED_CONFIG_PROP = "enabled"
+    # The time (in seconds) results are cached for
+    CACHE_TTL_CONFIG_PROP = "ttl"
+    # The prefix for properties that specify the time results of a command are
+    # cached for
+    CACHE_TTL_CONFIG_PREFIX = "ttl."
+    # The commands whose results are cached (delimited by commas, wildcards
+    # supported)
+    CACHE_COMMANDS_CONFIG_PROP = "commands"
+    # The maximum number of results held in memory
+    CACHE_MAX_ENTRIES_CONFIG_PROP = "maxEntries"
+    # The directory for the persistent cache (optional, results are only held in
+    # memory if not specified)
+    CACHE_DIRECTORY_CONFIG_PROP = "directory"
+    # The maximum size (in megabytes) of the persistent cache
+    CACHE_MAX_SIZE_CONFIG_PROP = "maxSize"
+    # The time (in seconds) between compactions of the persistent cache
+    CACHE_COMPACT_INTERVAL_CONFIG_PROP = "compactInterval"
+    # The time (in seconds) after a result expires that it is still served while
+    # it is refreshed in the background
+    CACHE_STALE_TTL_CONFIG_PROP = "staleTtl"
+    # The number of threads used to refresh results in the background
+    CACHE_REFRESH_THREADS_CONFIG_PROP = "refreshThreads"
+    # The prefix for properties that specify queries whose results are
+    # prefetched periodically (the value is a JSON object with "epo", "command",
+    # "params", "output" and "interval" properties)
+    CACHE_HOT_QUERY_CONFIG_PREFIX = "hotQuery."
+    # The prefix for properties that specify the commands whose results are
+    # invalidated when a mutating command is invoked (delimited by commas,
+    # wildcards supported)
+    CACHE_INVALIDATE_CONFIG_PREFIX = "invalidate."
+    # The DXL topic for cache invalidation events (optional)
+    CACHE_INVALIDATION_TOPIC_CONFIG_PROP = "invalidationTopic"
+
+    # Default values for the cache
+    DEFAULT_CACHE_TTL = 60
+    DEFAULT_CACHE_MAX_ENTRIES = 10000
+    DEFAULT_CACHE_MAX_SIZE = 100
+    DEFAULT_CACHE_COMPACT_INTERVAL = 3600
+    DEFAULT_CACHE_STALE_TTL = 0
+    DEFAULT_CACHE_REFRESH_THREADS = 1
+
+    # The name of the "SystemIndex" section within the ePO service configuration
+    # file
+    SYSINDEX_CONFIG_SECTION = "SystemIndex"
+    # Whether "system.find" requests are answered from a local index of the
+    # System Tree of each ePO server
+    SYSINDEX_ENABLED_CONFIG_PROP = "enabled"
+    # The time (in seconds) between rebuilds of the indexes
+    SYSINDEX_REFRESH_INTERVAL_CONFIG_PROP = "refreshInterval"
+    # The maximum time (in seconds) after a mutating "system" command is invoked
+    # before the index is rebuilt
+    SYSINDEX_REBUILD_DELAY_CONFIG_PROP = "rebuildDelay"
+    # The command used to export the System Tree
+    SYSINDEX_EXPORT_COMMAND_CONFIG_PROP = "exportCommand"
+    # The parameters of the export command (a JSON object)
+    SYSINDEX_EXPORT_PARAMS_CONFIG_PROP = "exportParams"
+    # The properties of a system that are matched against the search text
+    # (delimited by commas)
+    SYSINDEX_SEARCH_PROPERTIES_CONFIG_PROP = "searchProperties"
+
+    # Default values for the system index
+    DEFAULT_SYSINDEX_REFRESH_INTERVAL = 900
+    DEFAULT_SYSINDEX_REBUILD_DELAY = 30
+
+    # The name of the "ChangeFeed" section within the ePO service configuration
+    # file
+    CHANGEFEED_CONFIG_SECTION = "ChangeFeed"
+    # The prefix for properties that specify queries whose changes are published
+    # as DXL events (the value is a JSON object with "epo", "command", "params",
+    # "key", "topic" and "interval" properties)
+    CHANGEFEED_FEED_CONFIG_PREFIX = "feed."
+    # The maximum number of records in a change event
+    CHANGEFEED_BATCH_SIZE_CONFIG_PROP = "batchSize"
+
+    # The DXL topic format that changes are published to (by default)
+    DXL_CHANGEFEED_FORMAT = "/mcafee/event/epo/remote/changes/{0}"
+
+    # Default values for change feeds
+    DEFAULT_CHANGEFEED_INTERVAL = 300
+    DEFAULT_CHANGEFEED_BATCH_SIZE = 500
+
+    # The name of the "Metrics" section within the ePO service configuration file
+    METRICS_CONFIG_SECTION = "Metrics"
+    # Whether the metrics are available via the DXL stats topic
+    METRICS_TOPIC_ENABLED_CONFIG_PROP = "topicEnabled"
+    # The port of the local HTTP endpoint serving the metrics (0 disables the
+    # endpoint)
+    METRICS_HTTP_PORT_CONFIG_PROP = "httpPort"
+    # The address the HTTP endpoint listens on
+    METRICS_HTTP_ADDRESS_CONFIG_PROP = "httpAddress"
+    # The file the metrics are written to (optional)
+    METRICS_FILE_CONFIG_PROP = "file"
+    # The time (in seconds) between writes of the metrics file
+    METRICS_FILE_INTERVAL_CONFIG_PROP = "fileInterval"
+
+    # The DXL topic used to request the metrics of the service
+    DXL_STATS_TOPIC = "/mcafee/service/epo/remote/stats"
+
+    # Default values for metrics
+    DEFAULT_METRICS_HTTP_ADDRESS = "127.0.0.1"
+    DEFAULT_METRICS_FILE_INTERVAL = 60
+
+    # The name of the "Tracing" section within the ePO service configuration file
+    TRACING_CONFIG_SECTION = "Tracing"
+    # Whether the processing of requests is traced
+    TRACING_ENABLED_CONFIG_PROP = "enabled"
+    # The exporter for traces ("file" or the class of a custom exporter)
+    TRACING_EXPORTER_CONFIG_PROP = "exporter"
+    # The file traces are written to (by the "file" exporter)
+    TRACING_FILE_CONFIG_PROP = "file"
+    # The fraction of requests that are traced
+    TRACING_SAMPLE_RATE_CONFIG_PROP = "sampleRate"
+    # The prefix for properties that are passed to a custom exporter
+    TRACING_EXPORTER_CONFIG_PREFIX = "exporter."
+
+    # Default values for tracing
+    DEFAULT_TRACING_EXPORTER = "file"
+    DEFAULT_TRACING_FILE = "traces.json"
+    DEFAULT_TRACING_SAMPLE_RATE = 1.0
+
+    # The name of the "SlowRequestLog" section within the ePO service
+    # configuration file
+    SLOWLOG_CONFIG_SECTION = "SlowRequestLog"
+    # Whether slow requests are logged
+    SLOWLOG_ENABLED_CONFIG_PROP = "enabled"
+    # The duration (in milliseconds) from which requests are logged
+    SLOWLOG_THRESHOLD_CONFIG_PROP = "threshold"
+    # The fraction of slow requests that are logged
+    SLOWLOG_SAMPLE_RATE_CONFIG_PROP = "sampleRate"
+    # The maximum length of the summary of the request parameters
+    SLOWLOG_MAX_PARAM_LENGTH_CONFIG_PROP = "maxParamLength"
+
+    # Default values for the slow request log
+    DEFAULT_SLOWLOG_THRESHOLD = 5000
+    DEFAULT_SLOWLOG_SAMPLE_RATE = 1.0
+    DEFAULT_SLOWLOG_MAX_PARAM_LENGTH = 200
+
+    # The name of the "Profiler" section within the ePO service configuration
+    # file
+    PROFILER_CONFIG_SECTION = "Profiler"
+    # The directory profiles and memory snapshots are written to
+    PROFILER_DIRECTORY_CONFIG_PROP = "directory"
+    # The duration (in seconds) of a profile (if not specified in the request)
+    PROFILER_DURATION_CONFIG_PROP = "duration"
+    # The maximum duration (in seconds) of a profile requested via DXL
+    PROFILER_MAX_DURATION_CONFIG_PROP = "maxDuration"
+    # The time (in milliseconds) between samples of the thread stacks
+    PROFILER_INTERVAL_CONFIG_PROP = "interval"
+    # The number of frames stored for each memory allocation (when memory
+    # tracing is started)
+    PROFILER_MEMORY_FRAMES_CONFIG_PROP = "memoryFrames"
+    # Whether administrative requests are available via the DXL admin topic
+    PROFILER_TOPIC_ENABLED_CONFIG_PROP = "topicEnabled"
+    # The identifiers of the DXL clients allowed to invoke administrative
+    # requests
+    PROFILER_ALLOWED_CLIENTS_CONFIG_PROP = "allowedClients"
+
+    # The DXL topic used to invoke administrative requests (profiling and memory
+    # snapshots)
+    DXL_ADMIN_TOPIC = "/mcafee/service/epo/remote/admin"
+
+    # Default values for the profiler
+    DEFAULT_PROFILER_DIRECTORY = "profiles"
+    DEFAULT_PROFILER_DURATION = 30
+    DEFAULT_PROFILER_MAX_DURATION = 300
+    DEFAULT_PROFILER_INTERVAL = 10
+
+    def _load_cache(self, config):
+        """
+        Creates the cache for the results of read-only commands if it is enabled
+        in the configuration
+
+        :param config: The application configuration
+        :return: The cache (or ``None`` if it is not enabled)
+        """
+        section = self.CACHE_CONFIG_SECTION
+        if not self._get_boolean_option(config, section,
+                                        self.CACHE_ENABLED_CONFIG_PROP):
+            return None
+
+        store = None
+        directory = self._get_option(config, section,
+                                     self.CACHE_DIRECTORY_CONFIG_PROP)
+        if directory:
+            if not os.path.isabs(directory):
+                directory = os.path.join(self._config_dir, directory)
+            store = _PersistentCacheStore(
+                directory,
+                max_size=self._get_int_option(
+                    config, section, self.CACHE_MAX_SIZE_CONFIG_PROP,
+                    self.DEFAULT_CACHE_MAX_SIZE) * 1024 * 1024)
+            logger.info("Persistent cache directory: %s", directory)
+
+        ttl_by_command = dict(
+            (name, int(value)) for name, value in
+            self._get_prefixed_options(
+                config, section, self.CACHE_TTL_CONFIG_PREFIX).items())
+        invalidated_commands_by_command = dict(
+            (name, [pattern.strip() for pattern in value.split(",")
+                    if pattern.strip()])
+            for name, value in self._get_prefixed_options(
+                config, section, self.CACHE_INVALIDATE_CONFIG_PREFIX).items())
+        cache = _ResponseCache(
+            ttl=self._get_int_option(config, section,
+                                     self.CACHE_TTL_CONFIG_PROP,
+                                     self.DEFAULT_CACHE_TTL),
+            commands=self._get_list_option(config, section,
+                                           self.CACHE_COMMANDS_CONFIG_PROP),
+            ttl_by_command=ttl_by_command,
+            max_entries=self._get_int_option(
+                config, section, self.CACHE_MAX_ENTRIES_CONFIG_PROP,
+                self.DEFAULT_CACHE_MAX_ENTRIES),
+            store=store,
+            stale_ttl=self._get_int_option(
+                config, section, self.CACHE_STALE_TTL_CONFIG_PROP,
+                self.DEFAULT_CACHE_STALE_TTL),
+            refresh_threads=self._get_int_option(
+                config, section, self.CACHE_REFRESH_THREADS_CONFIG_PROP,
+                self.DEFAULT_CACHE_REFRESH_THREADS),
+            invalidated_commands_by_command=invalidated_commands_by_command)
+        self._cache_invalidation_topic = self._get_option(
+            config, section, self.CACHE_INVALIDATION_TOPIC_CONFIG_PROP)
+        if self._cache_invalidation_topic:
+            cache.add_listener(self._send_invalidation_event)
+        if store is not None:
+            self._cache_compaction = _PeriodicTask(
+                "cache-compaction",
+                self._get_int_option(config, section,
+                                     self.CACHE_COMPACT_INTERVAL_CONFIG_PROP,
+                                     self.DEFAULT_CACHE_COMPACT_INTERVAL),
+                cache.compact)
+        logger.info("Response cache enabled.")
+        return cache
+
+    def _load_system_index(self, config):
+        """
+        Creates the system index manager if the system index is enabled in the
+        configuration
+
+        :param config: The application configuration
+        :return: The system index manager (or ``None`` if it is not enabled)
+        """
+        section = self.SYSINDEX_CONFIG_SECTION
+        if not self._get_boolean_option(config, section,
+                                        self.SYSINDEX_ENABLED_CONFIG_PROP):
+            return None
+
+        export_params = self._get_option(
+            config, section, self.SYSINDEX_EXPORT_PARAMS_CONFIG_PROP)
+        if export_params is not None:
+            try:
+                export_params = json.loads(export_params)
+            except ValueError as ex:
+                raise Exception(
+                    "Invalid system index export parameters ({0}): {1}".format(
+                        self.SYSINDEX_EXPORT_PARAMS_CONFIG_PROP, ex))
+        system_index = _SystemIndexManager(
+            refresh_interval=self._get_int_option(
+                config, section, self.SYSINDEX_REFRESH_INTERVAL_CONFIG_PROP,
+                self.DEFAULT_SYSINDEX_REFRESH_INTERVAL),
+            rebuild_delay=self._get_int_option(
+                config, section, self.SYSINDEX_REBUILD_DELAY_CONFIG_PROP,
+                self.DEFAULT_SYSINDEX_REBUILD_DELAY),
+            export_command=self._get_option(
+                config, section, self.SYSINDEX_EXPORT_COMMAND_CONFIG_PROP),
+            export_params=export_params,
+            search_properties=self._get_list_option(
+                config, section, self.SYSINDEX_SEARCH_PROPERTIES_CONFIG_PROP))
+        logger.info("System index enabled.")
+        return system_index
+
+    def _load_hot_queries(self, config):
+        """
+        Creates the prefetcher for the hot queries in the configuration (if any)
+
+        :param config: The application configuration
+        """
+        epo_by_name = dict((epo.name, epo) for epo in self._epo_by_topic.values())
+        queries = []
+        for name, value in sorted(self._get_prefixed_options(
+                config, self.CACHE_CONFIG_SECTION,
+                self.CACHE_HOT_QUERY_CONFIG_PREFIX).items()):
+            try:
+                query = json.loads(value)
+                epo_name = query.get("epo")
+                if epo_name is None and len(epo_by_name) == 1:
+                    epo_name = list(epo_by_name)[0]
+                epo = epo_by_name[epo_name]
+                command = query["command"]
+            except (ValueError, KeyError, AttributeError):
+                raise Exception(
+                    "Invalid hot query ({0}{1}): {2}".format(
+                        self.CACHE_HOT_QUERY_CONFIG_PREFIX, name, value))
+            if not self._cache.is_cacheable(command):
+                raise Exception(
+                    "Hot query ({0}{1}) command is not cached: {2}".format(
+                        self.CACHE_HOT_QUERY_CONFIG_PREFIX, name, command))
+            queries.append(_HotQuery(
+                epo, command, query.get("output", "json"),
+                query.get("params", {}),
+                query.get("interval", self._cache.get_ttl(command) * 0.75)))
+
+        if queries:
+            self._cache_prefetcher = _Prefetcher(self._cache, queries)
+            logger.info("Prefetching %d hot queries", len(queries))
+
+    def _load_change_feeds(self, config):
+        """
+        Creates the change feeds in the configuration (if any)
+
+        :param config: The application configuration
+        """
+        section = self.CHANGEFEED_CONFIG_SECTION
+        epo_by_name = dict((epo.name, epo) for epo in self._epo_by_topic.values())
+        batch_size = self._get_int_option(
+            config, section, self.CHANGEFEED_BATCH_SIZE_CONFIG_PROP,
+            self.DEFAULT_CHANGEFEED_BATCH_SIZE)
+        for name, value in sorted(self._get_prefixed_options(
+                config, section, self.CHANGEFEED_FEED_CONFIG_PREFIX).items()):
+            try:
+                feed = json.loads(value)
+                epo_name = feed.get("epo")
+                if epo_name is None and len(epo_by_name) == 1:
+                    epo_name = list(epo_by_name)[0]
+                epo = epo_by_name[epo_name]
+                command = feed["command"]
+                key_properties = feed.get("key")
+                if key_properties is not None and \
+                        not isinstance(key_properties, list):
+                    key_properties = [key_properties]
+            except (ValueError, KeyError, AttributeError):
+                raise Exception(
+                    "Invalid change feed ({0}{1}): {2}".format(
+                        self.CHANGEFEED_FEED_CONFIG_PREFIX, name, value))
+            self._change_feeds.append(_ChangeFeed(
+                name, epo, command, feed.get("params", {}),
+                feed.get("topic", self.DXL_CHANGEFEED_FORMAT.format(name)),
+                feed.get("interval", self.DEFAULT_CHANGEFEED_INTERVAL),
+                self._send_event, key_properties=key_properties,
+                batch_size=batch_size))
+
+        if self._change_feeds:
+            logger.info("Publishing %d change feeds", len(self._change_feeds))
+
+    def _load_metrics_configuration(self, config):
+        """
+        Creates the metrics exporters that are enabled in the configuration
+
+        When the service runs in multiple worker processes, each worker serves
+        its own metrics: the HTTP port is offset by the worker identifier and the
+        worker identifier is appended to the name of the metrics file.
+
+        :param config: The application configuration
+        """
+        section = self.METRICS_CONFIG_SECTION
+        self._stats_topic_enabled = self._get_boolean_option(
+            config, section, self.METRICS_TOPIC_ENABLED_CONFIG_PROP)
+
+        http_port = self._get_int_option(config, section,
+                                         self.METRICS_HTTP_PORT_CONFIG_PROP)
+        if http_port > 0:
+            self._metrics_http_server = _MetricsHttpServer(
+                registry, http_port + (self._worker_id or 0),
+                self._get_option(config, section,
+                                 self.METRICS_HTTP_ADDRESS_CONFIG_PROP,
+                                 self.DEFAULT_METRICS_HTTP_ADDRESS))
+
+        path = self._get_option(config, section, self.METRICS_FILE_CONFIG_PROP)
+        if path:
+            if not os.path.isabs(path):
+                path = os.path.join(self._config_dir, path)
+            if self._worker_id is not None:
+                path = "{0}.{1}".format(path, self._worker_id)
+            self._metrics_file_writer = _MetricsFileWriter(
+                registry, path,
+                self._get_int_option(config, section,
+                                     self.METRICS_FILE_INTERVAL_CONFIG_PROP,
+                                     self.DEFAULT_METRICS_FILE_INTERVAL))
+            logger.info("Writing metrics to file: %s", path)
+
+    def _load_tracing_configuration(self, config):
+        """
+        Enables tracing of the processing of requests if it is enabled in the
+        configuration
+
+        :param config: The application configuration
+        """
+        section = self.TRACING_CONFIG_SECTION
+        if not self._get_boolean_option(config, section,
+                                        self.TRACING_ENABLED_CONFIG_PROP):
+            return
+
+        exporter_name = self._get_option(config, section,
+                                         self.TRACING_EXPORTER_CONFIG_PROP,
+                                         self.DEFAULT_TRACING_EXPORTER)
+        options = self._get_prefixed_options(
+            config, section, self.TRACING_EXPORTER_CONFIG_PREFIX)
+        if exporter_name == self.DEFAULT_TRACING_EXPORTER:
+            path = self._get_option(config, section,
+                                    self.TRACING_FILE_CONFIG_PROP,
+                                    self.DEFAULT_TRACING_FILE)
+            if not os.path.isabs(path):
+                path = os.path.join(self._config_dir, path)
+            if self._worker_id is not None:
+                path = "{0}.{1}".format(path, self._worker_id)
+            options = {"path": path}
+        try:
+            exporter = _create_exporter(exporter_name, options)
+        except (ValueError, ImportError, AttributeError, TypeError) as ex:
+            raise Exception("Invalid trace exporter ({0}): {1}".format(
+                exporter_name, ex))
+        sample_rate = self._get_float_option(
+            config, section, self.TRACING_SAMPLE_RATE_CONFIG_PROP,
+            self.DEFAULT_TRACING_SAMPLE_RATE)
+        tracer.add_exporter(exporter, sample_rate)
+        logger.info("Tracing configuration: exporter=%s, sampleRate=%s",
+                    exporter_name, sample_rate)
+
+    def _load_slow_log_configuration(self, config):
+        """
+        Enables the slow request log if it is enabled in the configuration
+
+        :param config: The application configuration
+        """
+        section = self.SLOWLOG_CONFIG_SECTION
+        if not self._get_boolean_option(config, section,
+                                        self.SLOWLOG_ENABLED_CONFIG_PROP):
+            return
+
+        threshold = self._get_int_option(config, section,
+                                         self.SLOWLOG_THRESHOLD_CONFIG_PROP,
+                                         self.DEFAULT_SLOWLOG_THRESHOLD)
+        sample_rate = self._get_float_option(
+            config, section, self.SLOWLOG_SAMPLE_RATE_CONFIG_PROP,
+            self.DEFAULT_SLOWLOG_SAMPLE_RATE)
+        # The phases of every request are timed, so that any slow request can
+        # be logged
+        tracer.add_exporter(_SlowRequestLog(
+            threshold / 1000.0, sample_rate,
+            self._get_int_option(config, section,
+                                 self.SLOWLOG_MAX_PARAM_LENGTH_CONFIG_PROP,
+                                 self.DEFAULT_SLOWLOG_MAX_PARAM_LENGTH)))
+        logger.info("Slow request log configuration: threshold=%d, "
+                    "sampleRate=%s", threshold, sample_rate)
+
+    def _load_profiler_configuration(self, config):
+        """
+        Creates the profiler (which can be started via a signal), and the
+        callback for the DXL admin topic if it is enabled in the configuration
+
+        :param config: The application configuration
+        """
+        section = self.PROFILER_CONFIG_SECTION
+        directory = self._get_option(config, section,
+                                     self.PROFILER_DIRECTORY_CONFIG_PROP,
+                                     self.DEFAULT_PROFILER_DIRECTORY)
+        if not os.path.isabs(directory):
+            directory = os.path.join(self._config_dir, directory)
+        self._profiler = _SamplingProfiler(
+            directory,
+            self._get_int_option(config, section,
+                                 self.PROFILER_INTERVAL_CONFIG_PROP,
+                                 self.DEFAULT_PROFILER_INTERVAL) / 1000.0,
+            self._worker_id)
+        self._memory_snapshots = _MemorySnapshots(
+            directory,
+            self._get_int_option(config, section,
+                                 self.PROFILER_MEMORY_FRAMES_CONFIG_PROP,
+                                 _MemorySnapshots.DEFAULT_FRAME_COUNT),
+            self._worker_id)
+        self._profile_duration = self._get_int_option(
+            config, section, self.PROFILER_DURATION_CONFIG_PROP,
+            self.DEFAULT_PROFILER_DURATION)
+
+        if not self._get_boolean_option(config, section,
+                                        self.PROFILER_TOPIC_ENABLED_CONFIG_PROP):
+            return
+        allowed_clients = self._get_list_option(
+            config, section, self.PROFILER_ALLOWED_CLIENTS_CONFIG_PROP, [])
+        if not allowed_clients:
+            raise Exception(
+                "The clients allowed to invoke administrative requests ({0}) "
+                "must be specified if the admin topic is enabled".format(
+                    self.PROFILER_ALLOWED_CLIENTS_CONFIG_PROP))
+        self._admin_allowed_clients = allowed_clients
+        self._profile_max_duration = self._get_int_option(
+            config, section, self.PROFILER_MAX_DURATION_CONFIG_PROP,
+            self.DEFAULT_PROFILER_MAX_DURATION)
+        logger.info("Admin topic enabled for clients: %s",
+                    ",".join(allowed_clients))
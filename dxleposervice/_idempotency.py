@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from ._errors import _InvalidRequestError
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+class _IdempotentEntry(object):
+    """
+    The outcome of a request that was sent with an idempotency key
+    """
+
+    def __init__(self, command, params_hash, expires):
+        """
+        Constructs the entry
+
+        :param command: The command that was requested
+        :param params_hash: The hash of the parameters that were requested
+        :param expires: The time at which the entry expires
+        """
+        self.command = command
+        self.params_hash = params_hash
+        self.expires = expires
+        self.done = False
+        self.result = None
+        self.error = None
+        self.waiters = []
+
+
+def _hash_params(params):
+    """
+    Returns a hash of request parameters (independent of the order of their
+    keys)
+
+    :param params: The parameters (must be serializable as JSON)
+    :return: The hash of the parameters
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode(
+        "utf-8")).hexdigest()
+
+
+class _IdempotencyCache(object):
+    """
+    A bounded cache of request outcomes by client-supplied idempotency key.
+
+    A retry of a request that has completed receives the stored outcome rather
+    than invoking the command again. A retry that arrives while the original
+    request is still in progress receives the outcome when the original request
+    completes. Failed requests are not retained, so a later retry invokes the
+    command again. A key that is reused for a different command (or different
+    parameters) is rejected.
+    """
+
+    def __init__(self, max_entries, ttl):
+        """
+        Constructs the cache
+
+        :param max_entries: The maximum number of entries in the cache
+        :param ttl: The time (in seconds) completed entries are retained for
+        """
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        for key in [key for key, entry in self._entries.items()
+                    if entry.done and entry.expires < now]:
+            del self._entries[key]
+        if len(self._entries) >= self._max_entries:
+            for key in [key for key, entry in self._entries.items()
+                        if entry.done][:len(self._entries) - self._max_entries + 1]:
+                del self._entries[key]
+
+    def get_or_add(self, key, command, request, params=None):
+        """
+        Looks up the entry for an idempotency key. If an entry is found that is
+        still in progress, the request is added to the requests waiting for its
+        outcome. If no entry is found, a new (in progress) entry is added.
+
+        :param key: The idempotency key
+        :param command: The command that was requested
+        :param request: The request that was received
+        :param params: The parameters that were requested (optional)
+        :return: The existing entry (or ``None`` if a new entry was added and the
+            caller must invoke the command)
+        """
+        now = time.time()
+        params_hash = _hash_params(params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.done and entry.expires < now:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self._evict(now)
+                self._entries[key] = _IdempotentEntry(command, params_hash,
+                                                      now + self._ttl)
+                return None
+
+            if entry.command != command:
+                raise _InvalidRequestError(
+                    "Idempotency key was already used for command: {0}".format(
+                        entry.command))
+            if entry.params_hash != params_hash:
+                raise _InvalidRequestError(
+                    "Idempotency key was already used with different "
+                    "parameters")
+            if not entry.done:
+                entry.waiters.append(request)
+            logger.debug("Duplicate request for idempotency key: %s", key)
+            return entry
+
+    def complete(self, key, result=None, error=None):
+        """
+        Records the outcome of the request for an idempotency key
+
+        :param key: The idempotency key
+        :param result: The result of the command (if successful)
+        :param error: The exception raised by the command (if it failed)
+        :return: The requests that were waiting for the outcome
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.done:
+                return []
+            entry.done = True
+            entry.result = result
+            entry.error = error
+            entry.expires = time.time() + self._ttl
+            if error is not None:
+                del self._entries[key]
+            waiters, entry.waiters = entry.waiters, []
+            return waiters
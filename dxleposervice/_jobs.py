@@ -0,0 +1,356 @@
+from __future__ import absolute_import
+import json
+import logging
+import threading
+import time
+import uuid
+
+from dxlclient.callbacks import RequestCallback
+from dxlclient.message import ErrorResponse, Event, Response
+
+from ._dispatch import _Lane
+from ._drain import _InFlightTracker
+from ._errors import _EpoServiceError, _InvalidRequestError, _OverloadedError
+from ._scheduler import _PeriodicTask
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+# A job is a record of the state of a command, read by the status requests
+class _Job(object): # pylint: disable=too-many-instance-attributes
+    """
+    A long-running ePO command that is executed in the background
+    """
+
+    # Job states
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, owner, epo_name, command):
+        """
+        Constructs the job
+
+        :param owner: The identifier of the DXL client that submitted the job
+        :param epo_name: The name of the ePO server the command is invoked on
+        :param command: The command being invoked
+        """
+        self.id = str(uuid.uuid4())
+        self.owner = owner
+        self.epo_name = epo_name
+        self.command = command
+        self.status = self.QUEUED
+        self.finished = None
+        self.chunks = []
+        self.error = None
+
+    @property
+    def done(self):
+        """
+        Whether the job has finished (completed, failed or cancelled)
+        """
+        return self.status in (self.COMPLETED, self.FAILED, self.CANCELLED)
+
+    def to_dict(self):
+        """
+        Returns a dictionary describing the job (excluding its result)
+
+        :return: A dictionary describing the job
+        """
+        job_dict = {
+            "jobId": self.id,
+            "status": self.status,
+            "command": self.command,
+            "chunkCount": len(self.chunks)
+        }
+        if self.error is not None:
+            job_dict["error"] = self.error
+        return job_dict
+
+    @property
+    def size(self):
+        """
+        The size (in characters) of the result of the job
+        """
+        return sum(len(chunk) for chunk in self.chunks)
+
+
+# The limits on retained jobs are kept with the jobs they are applied to (both
+# guarded by the same lock)
+class _JobManager(object): # pylint: disable=too-many-instance-attributes
+    """
+    Executes long-running ePO commands in the background.
+
+    The invoking client receives the identifier of the job immediately. When the
+    job finishes, an event is sent to the topic for the job. Events can be
+    received by any client that is authorized to subscribe to the topic, so they
+    only contain the status of the job (and the number of result chunks). The
+    result can only be retrieved by the client that submitted the job, via the
+    job status topic.
+
+    Finished jobs are retained until the retention period expires, or until the
+    limits on the number of retained jobs or the total size of their results are
+    exceeded (the oldest jobs are discarded first).
+
+    Jobs are only known to the service instance (or worker process) that
+    executes them. The status and cancel topics of the instance are returned to
+    the invoking client, so that its requests for the job reach the instance.
+    """
+
+    # The format for the topics that job events are sent to
+    DXL_JOB_EVENT_FORMAT = "/mcafee/event/epo/remote/job/{0}"
+
+    # The maximum time (in seconds) between removals of expired jobs
+    MAX_PRUNE_INTERVAL = 60
+
+    def __init__(self, thread_count, queue_size, chunk_size, retention,
+                 max_retained_count=None, max_retained_size=None,
+                 in_flight=None, status_topic=None, cancel_topic=None):
+        """
+        Constructs the job manager
+
+        :param thread_count: The number of threads used to execute jobs
+        :param queue_size: The maximum number of queued jobs
+        :param chunk_size: The maximum size (in characters) of a result chunk
+        :param retention: The time (in seconds) finished jobs are retained for
+        :param max_retained_count: The maximum number of finished jobs that are
+            retained (optional, unlimited if not specified)
+        :param max_retained_size: The maximum total size (in characters) of the
+            results of the finished jobs that are retained (optional, unlimited
+            if not specified)
+        :param in_flight: The tracker of the requests in progress (optional,
+            jobs are in progress until they have finished)
+        :param status_topic: The topic used to request the status of the jobs of
+            this service instance (optional)
+        :param cancel_topic: The topic used to cancel the jobs of this service
+            instance (optional)
+        """
+        self._lane = _Lane("jobs", thread_count, queue_size)
+        self._chunk_size = chunk_size
+        self._retention = retention
+        self._max_retained_count = max_retained_count
+        self._max_retained_size = max_retained_size
+        self._in_flight = in_flight or _InFlightTracker()
+        self.status_topic = status_topic
+        self.cancel_topic = cancel_topic
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pruner = _PeriodicTask(
+            "JobPruner", max(1, min(self.MAX_PRUNE_INTERVAL, retention)),
+            self.prune, run_immediately=False)
+        self._pruner.start()
+
+    def prune(self):
+        """
+        Removes the finished jobs that have expired (or that exceed the limits
+        on retained jobs)
+        """
+        with self._lock:
+            self._prune()
+
+    def _prune(self):
+        expired = time.time() - self._retention
+        finished = sorted((job for job in self._jobs.values() if job.done),
+                          key=lambda job: job.finished)
+        size = sum(job.size for job in finished)
+        for index, job in enumerate(finished):
+            if job.finished >= expired and \
+                    (self._max_retained_count is None or
+                     len(finished) - index <= self._max_retained_count) and \
+                    (self._max_retained_size is None or
+                     size <= self._max_retained_size):
+                break
+            del self._jobs[job.id]
+            size -= job.size
+
+    def submit(self, client, owner, epo_name, command, run):
+        """
+        Submits a job for execution
+
+        :param client: The DXL client used to send the job event
+        :param owner: The identifier of the DXL client that submitted the job
+        :param epo_name: The name of the ePO server the command is invoked on
+        :param command: The command being invoked
+        :param run: A function (without parameters) that executes the command and
+            returns its result
+        :return: The job
+        """
+        job = _Job(owner, epo_name, command)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._in_flight.begin()
+        if not self._lane.submit(owner, self._run, client, job, run):
+            self._in_flight.end()
+            with self._lock:
+                del self._jobs[job.id]
+            raise _OverloadedError(epo_name, self._lane.retry_after())
+        logger.debug("Job '%s' submitted (command: %s)", job.id, command)
+        return job
+
+    def _run(self, client, job, run):
+        try:
+            self._execute(client, job, run)
+        finally:
+            self._in_flight.end()
+
+    def _execute(self, client, job, run):
+        with self._lock:
+            if job.status != _Job.QUEUED:
+                return
+            job.status = _Job.RUNNING
+
+        try:
+            result = run()
+            chunks = [result[i:i + self._chunk_size]
+                      for i in range(0, len(result), self._chunk_size)] or [""]
+            status, error = _Job.COMPLETED, None
+        except Exception as ex:
+            logger.exception("Error while executing job '%s'", job.id)
+            chunks, status, error = [], _Job.FAILED, str(ex)
+
+        with self._lock:
+            if job.status == _Job.CANCELLED:
+                return
+            job.chunks, job.status, job.error = chunks, status, error
+            job.finished = time.time()
+            self._prune()
+        self._send_event(client, job)
+
+    def _send_event(self, client, job):
+        # The event does not contain the result (or error) of the job, since
+        # it can be received by clients other than the owner of the job
+        event = Event(self.DXL_JOB_EVENT_FORMAT.format(job.id))
+        event.payload = json.dumps({
+            "jobId": job.id,
+            "status": job.status,
+            "chunkCount": len(job.chunks)
+        })
+        client.send_event(event)
+
+    def _get_job(self, requester, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or requester != job.owner:
+            raise _InvalidRequestError("Unknown job: {0}".format(job_id))
+        return job
+
+    def get_status(self, requester, job_id, chunk=None):
+        """
+        Returns the status of a job (and optionally a chunk of its result)
+
+        :param requester: The identifier of the DXL client requesting the status
+        :param job_id: The identifier of the job
+        :param chunk: The index of the result chunk to include (optional)
+        :return: A dictionary describing the job
+        """
+        if chunk is not None and \
+                (not isinstance(chunk, int) or isinstance(chunk, bool)):
+            raise _InvalidRequestError(
+                "The chunk must be an integer: {0}".format(chunk))
+        with self._lock:
+            self._prune()
+            job = self._get_job(requester, job_id)
+            status = job.to_dict()
+            if chunk is not None:
+                if not 0 <= chunk < len(job.chunks):
+                    raise _InvalidRequestError(
+                        "Invalid chunk for job {0}: {1}".format(job_id, chunk))
+                status["chunk"] = chunk
+                status["result"] = job.chunks[chunk]
+            return status
+
+    def cancel(self, client, requester, job_id):
+        """
+        Cancels a job. A job that is already running can not be interrupted, but
+        its result is discarded.
+
+        :param client: The DXL client used to send the job event
+        :param requester: The identifier of the DXL client cancelling the job
+        :param job_id: The identifier of the job
+        :return: A dictionary describing the job
+        """
+        with self._lock:
+            job = self._get_job(requester, job_id)
+            cancelled = not job.done
+            if cancelled:
+                job.status = _Job.CANCELLED
+                job.finished = time.time()
+        if cancelled:
+            self._send_event(client, job)
+        return job.to_dict()
+
+    def shutdown(self):
+        """
+        Stops the job threads once the queued jobs have been executed
+        """
+        self._pruner.stop()
+        self._lane.shutdown()
+
+
+class _JobRequestCallback(RequestCallback):
+    """
+    Request callback used to handle job status and cancel requests
+    """
+
+    # UTF-8 encoding (used for encoding/decoding payloads)
+    UTF_8 = "utf-8"
+
+    # The key in the request used to specify the job identifier
+    JOB_ID_KEY = "jobId"
+    # The key in the request used to specify the result chunk to retrieve
+    # (status requests only). This is optional
+    CHUNK_KEY = "chunk"
+
+    def __init__(self, client, job_manager, cancel=False):
+        """
+        Constructs the callback
+
+        :param client: The DXL client associated with the service
+        :param job_manager: The job manager
+        :param cancel: Whether the callback handles cancel requests (otherwise
+            status requests)
+        """
+        super(_JobRequestCallback, self).__init__()
+        self._dxl_client = client
+        self._job_manager = job_manager
+        self._cancel = cancel
+
+    def on_request(self, request):
+        """
+        Invoked when a request is received
+
+        :param request: The request that was received
+        """
+        try:
+            req_dict = json.loads(request.payload.decode(encoding=self.UTF_8))
+            if self.JOB_ID_KEY not in req_dict:
+                raise _InvalidRequestError(
+                    "A job identifier was not specified ('{0}')".format(
+                        self.JOB_ID_KEY))
+            job_id = req_dict[self.JOB_ID_KEY]
+
+            if self._cancel:
+                result = self._job_manager.cancel(
+                    self._dxl_client, request.source_client_id, job_id)
+            else:
+                result = self._job_manager.get_status(
+                    request.source_client_id, job_id,
+                    req_dict.get(self.CHUNK_KEY))
+
+            response = Response(request)
+            response.payload = json.dumps(result)
+            self._dxl_client.send_response(response)
+
+        except Exception as ex:
+            if isinstance(ex, _EpoServiceError):
+                logger.warning("Error while processing job request: %s", ex)
+            else:
+                logger.exception("Error while processing job request")
+            self._dxl_client.send_response(
+                ErrorResponse(request,
+                              error_code=getattr(ex, "error_code", 0),
+                              error_message=str(ex).encode(
+                                  encoding=self.UTF_8)))
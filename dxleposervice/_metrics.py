@@ -0,0 +1,346 @@
+from __future__ import absolute_import
+import bisect
+import threading
+
+# The bucket upper bounds (in seconds) of latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+# The bucket upper bounds (in bytes) of size histograms
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                16777216)
+
+
+class _Counter(object):
+    """
+    A counter with a value for each combination of label values
+    """
+
+    # The type of the metric
+    type = "counter"
+    # The maximum number of label value combinations. Values for additional
+    # combinations (for example, caused by clients requesting many different
+    # commands) are recorded with the OTHER label value.
+    MAX_SERIES = 1000
+    # The label value used once the maximum number of combinations is reached
+    OTHER = "_other"
+
+    def __init__(self, name, description, label_names=()):
+        """
+        Constructs the counter
+
+        :param name: The name of the counter
+        :param description: A description of the counter
+        :param label_names: The names of the labels of the counter
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _get_key(self, labels):
+        """
+        Returns the key of the value for the specified label values (the lock
+        must be held)
+
+        :param labels: The label values
+        :return: The key
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        if key not in self._values and len(self._values) >= self.MAX_SERIES:
+            key = tuple(self.OTHER for _ in self.label_names)
+        return key
+
+    def inc(self, amount=1, **labels):
+        """
+        Increments the counter
+
+        :param amount: The amount to increment the counter by
+        :param labels: The label values
+        """
+        with self._lock:
+            key = self._get_key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """
+        Returns the value of the counter for the specified label values
+
+        :param labels: The label values
+        :return: The value of the counter
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        return self._values.get(key, 0)
+
+    def samples(self):
+        """
+        Returns the values of the counter
+
+        :return: A list of ``(labels, value)`` tuples, where labels is a
+            dictionary of label values by name
+        """
+        with self._lock:
+            return [(dict(zip(self.label_names, key)), value)
+                    for key, value in self._values.items()]
+
+
+class _Gauge(_Counter):
+    """
+    A gauge (a value that can go up and down) with a value for each combination
+    of label values
+    """
+
+    # The type of the metric
+    type = "gauge"
+
+    def set(self, value, **labels):
+        """
+        Sets the value of the gauge
+
+        :param value: The value
+        :param labels: The label values
+        """
+        with self._lock:
+            self._values[self._get_key(labels)] = value
+
+
+class _Histogram(_Counter):
+    """
+    A histogram (the number of observed values in each of a set of buckets,
+    along with their count and sum) for each combination of label values
+    """
+
+    # The type of the metric
+    type = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=None):
+        """
+        Constructs the histogram
+
+        :param name: The name of the histogram
+        :param description: A description of the histogram
+        :param label_names: The names of the labels of the histogram
+        :param buckets: The upper bounds of the buckets (optional, defaults to
+            the latency buckets)
+        """
+        super(_Histogram, self).__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets or LATENCY_BUCKETS))
+
+    def observe(self, value, **labels):
+        """
+        Records an observed value
+
+        :param value: The value
+        :param labels: The label values
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._get_key(labels)
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0, 0.0]
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def get(self, **labels):
+        """
+        Returns the value of the histogram for the specified label values
+
+        :param labels: The label values
+        :return: A dictionary containing the cumulative number of values in each
+            bucket (``buckets``, by upper bound), the number of values
+            (``count``) and their sum (``sum``)
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            return self._to_value(self._values.get(key))
+
+    def _to_value(self, entry):
+        """
+        Converts the internal representation of a value (the lock must be held)
+        """
+        counts, count, total = entry or ([0] * (len(self.buckets) + 1), 0, 0.0)
+        cumulative, buckets = 0, []
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            buckets.append((bound, cumulative))
+        return {"buckets": buckets, "count": count, "sum": total}
+
+    def samples(self):
+        """
+        Returns the values of the histogram
+
+        :return: A list of ``(labels, value)`` tuples, where labels is a
+            dictionary of label values by name and value is a dictionary as
+            returned by :meth:`get`
+        """
+        with self._lock:
+            return [(dict(zip(self.label_names, key)), self._to_value(entry))
+                    for key, entry in self._values.items()]
+
+
+class _MetricsRegistry(object):
+    """
+    The metrics collected by the service
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, description, label_names=()):
+        """
+        Returns the counter with the specified name (the counter is created if
+        it does not exist)
+
+        :param name: The name of the counter
+        :param description: A description of the counter
+        :param label_names: The names of the labels of the counter
+        :return: The counter
+        """
+        return self._get_or_create(_Counter, name, description, label_names)
+
+    def gauge(self, name, description, label_names=()):
+        """
+        Returns the gauge with the specified name (the gauge is created if it
+        does not exist)
+
+        :param name: The name of the gauge
+        :param description: A description of the gauge
+        :param label_names: The names of the labels of the gauge
+        :return: The gauge
+        """
+        return self._get_or_create(_Gauge, name, description, label_names)
+
+    def histogram(self, name, description, label_names=(), buckets=None):
+        """
+        Returns the histogram with the specified name (the histogram is created
+        if it does not exist)
+
+        :param name: The name of the histogram
+        :param description: A description of the histogram
+        :param label_names: The names of the labels of the histogram
+        :param buckets: The upper bounds of the buckets (optional, defaults to
+            the latency buckets)
+        :return: The histogram
+        """
+        return self._get_or_create(_Histogram, name, description, label_names,
+                                   buckets=buckets)
+
+    def _get_or_create(self, metric_class, name, description, label_names,
+                       **kwargs):
+        """
+        Returns the metric with the specified name (the metric is created if it
+        does not exist)
+
+        :param metric_class: The class of the metric
+        :param name: The name of the metric
+        :param description: A description of the metric
+        :param label_names: The names of the labels of the metric
+        :return: The metric
+        """
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, description, label_names,
+                                      **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def metrics(self):
+        """
+        Returns the metrics in the registry
+
+        :return: A list of the metrics (sorted by name)
+        """
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def to_dict(self):
+        """
+        Returns the values of the metrics in the registry
+
+        :return: A dictionary containing a list of metrics (``metrics``), each
+            with its name, type, description and samples
+        """
+        return {"metrics": [
+            {"name": metric.name, "type": metric.type,
+             "description": metric.description,
+             "samples": [{"labels": labels,
+                          "value": _to_json_value(metric, value)}
+                         for labels, value in metric.samples()]}
+            for metric in self.metrics()]}
+
+    def to_prometheus_text(self):
+        """
+        Returns the values of the metrics in the registry in the Prometheus
+        text exposition format
+
+        :return: The metrics (as a string)
+        """
+        lines = []
+        for metric in self.metrics():
+            lines.append("# HELP {0} {1}".format(
+                metric.name,
+                metric.description.replace("\\", "\\\\").replace("\n", "\\n")))
+            lines.append("# TYPE {0} {1}".format(metric.name, metric.type))
+            for labels, value in sorted(metric.samples(),
+                                        key=lambda sample: sorted(
+                                            sample[0].items())):
+                if metric.type != _Histogram.type:
+                    lines.append(_format_sample(metric.name, labels, value))
+                    continue
+                for bound, count in value["buckets"]:
+                    bucket_labels = dict(labels)
+                    bucket_labels["le"] = _format_number(bound)
+                    lines.append(_format_sample(
+                        metric.name + "_bucket", bucket_labels, count))
+                lines.append(_format_sample(metric.name + "_count", labels,
+                                            value["count"]))
+                lines.append(_format_sample(metric.name + "_sum", labels,
+                                            value["sum"]))
+        return "\n".join(lines) + "\n"
+
+
+def _to_json_value(metric, value):
+    """
+    Converts the value of a metric to a JSON-compatible value (the buckets of
+    histograms are converted to a dictionary by upper bound)
+    """
+    if metric.type != _Histogram.type:
+        return value
+    return {"buckets": dict((_format_number(bound), count)
+                            for bound, count in value["buckets"]),
+            "count": value["count"], "sum": value["sum"]}
+
+
+def _format_number(value):
+    """
+    Formats a number in the Prometheus text exposition format
+    """
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_sample(name, labels, value):
+    """
+    Formats a sample in the Prometheus text exposition format
+    """
+    if not labels:
+        return "{0} {1}".format(name, _format_number(value))
+    return "{0}{{{1}}} {2}".format(
+        name,
+        ",".join('{0}="{1}"'.format(
+            label, str(label_value).replace("\\", "\\\\").replace(
+                '"', '\\"').replace("\n", "\\n"))
+                 for label, label_value in sorted(labels.items())),
+        _format_number(value))
+
+
+# The registry containing the metrics collected by the service
+registry = _MetricsRegistry()
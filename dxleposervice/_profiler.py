@@ -0,0 +1,373 @@
+from __future__ import absolute_import
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from dxlclient.callbacks import RequestCallback
+from dxlclient.message import ErrorResponse, Response
+
+from ._errors import _EpoServiceError, _ForbiddenError, _InvalidRequestError
+
+try: #Python 3
+    import tracemalloc
+except ImportError: #Python 2.7
+    tracemalloc = None
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+def _get_output_path(directory, prefix, extension, worker_id=None):
+    """
+    Returns the path of a new output file (named after the current time and the
+    worker)
+
+    :param directory: The directory the file is written to
+    :param prefix: The prefix of the file name
+    :param extension: The extension of the file name
+    :param worker_id: The identifier of the worker process (optional)
+    :return: The path of the file
+    """
+    name = "{0}-{1}".format(prefix, time.strftime("%Y%m%d-%H%M%S"))
+    if worker_id is not None:
+        name = "{0}-worker{1}".format(name, worker_id)
+    return os.path.join(directory, "{0}.{1}".format(name, extension))
+
+
+class _SamplingProfiler(object):
+    """
+    A sampling profiler that can be started and stopped while the service is
+    running. The stacks of all threads are sampled at a fixed interval, and are
+    written (when the profile stops) in the collapsed stack format: one line per
+    distinct stack, with the frames delimited by semicolons (outermost first,
+    prefixed by the name of the thread) followed by the number of samples. The
+    file can be rendered as a flame graph (for example, by ``flamegraph.pl`` or
+    speedscope).
+    """
+
+    # The default time (in seconds) between samples
+    DEFAULT_INTERVAL = 0.01
+
+    def __init__(self, directory, interval=DEFAULT_INTERVAL, worker_id=None):
+        """
+        Constructs the profiler
+
+        :param directory: The directory profiles are written to
+        :param interval: The time (in seconds) between samples
+        :param worker_id: The identifier of the worker process (optional,
+            included in the names of the profile files)
+        """
+        self._directory = directory
+        self._interval = interval
+        self._worker_id = worker_id
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = None
+        self._path = None
+
+    @property
+    def running(self):
+        """
+        Whether a profile is in progress
+        """
+        with self._lock:
+            return self._thread is not None
+
+    def start(self, duration):
+        """
+        Starts a profile
+
+        :param duration: The duration (in seconds) of the profile
+        :return: The path of the file the profile will be written to
+        """
+        with self._lock:
+            if self._thread is not None:
+                raise _InvalidRequestError("A profile is already in progress")
+            if not os.path.isdir(self._directory):
+                os.makedirs(self._directory)
+            self._path = _get_output_path(self._directory, "profile",
+                                          "collapsed", self._worker_id)
+            self._stopped = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(duration, self._stopped, self._path),
+                name="EpoProfiler")
+            self._thread.daemon = True
+            self._thread.start()
+        logger.info("Profiling for %d seconds, profile file: %s", duration,
+                    self._path)
+        return self._path
+
+    def stop(self):
+        """
+        Stops the profile in progress (if any) and waits for it to be written
+
+        :return: The path of the profile file (``None`` if no profile was in
+            progress)
+        """
+        with self._lock:
+            thread, path = self._thread, self._path
+            if thread is None:
+                return None
+            self._stopped.set()
+        thread.join()
+        return path
+
+    def _run(self, duration, stopped, path):
+        """
+        Samples the stacks of the threads until the duration has elapsed (or the
+        profile is stopped), and writes the profile
+
+        :param duration: The duration (in seconds) of the profile
+        :param stopped: The event set when the profile is stopped
+        :param path: The path of the profile file
+        """
+        counts = {}
+        samples = 0
+        deadline = time.time() + duration
+        try:
+            while not stopped.wait(self._interval) and time.time() < deadline:
+                self._sample(counts)
+                samples += 1
+            with open(path, "w") as profile_file:
+                for stack in sorted(counts):
+                    profile_file.write("{0} {1}\n".format(stack, counts[stack]))
+            logger.info("Profile written (%d samples): %s", samples, path)
+        except Exception:
+            logger.exception("Error writing profile: %s", path)
+        finally:
+            with self._lock:
+                if self._stopped is stopped:
+                    self._thread = None
+
+    @staticmethod
+    def _sample(counts):
+        """
+        Samples the stacks of the threads (other than the calling thread)
+
+        :param counts: The number of samples of each stack (updated)
+        """
+        names = dict((thread.ident, thread.name)
+                     for thread in threading.enumerate())
+        current = threading.current_thread().ident
+        for thread_id, frame in sys._current_frames().items(): # pylint: disable=protected-access
+            if thread_id == current:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append("{0} ({1}:{2})".format(
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno))
+                frame = frame.f_back
+            frames.append(names.get(thread_id, str(thread_id)))
+            stack = ";".join(reversed(frames)).replace(" ", "_")
+            counts[stack] = counts.get(stack, 0) + 1
+
+
+class _MemorySnapshots(object):
+    """
+    Traces memory allocations (via ``tracemalloc``) and takes snapshots of the
+    allocated memory, to investigate memory growth (for example, from large ePO
+    responses). Tracing slows the allocation of memory, so it is only enabled on
+    request. Snapshots are written in the ``tracemalloc`` format (they can be
+    loaded with ``tracemalloc.Snapshot.load`` and compared to each other).
+
+    Memory tracing is not available on Python 2.7.
+    """
+
+    # The default number of frames stored for each allocation
+    DEFAULT_FRAME_COUNT = 10
+    # The number of locations included in the summary of a snapshot
+    TOP_COUNT = 20
+
+    def __init__(self, directory, frame_count=DEFAULT_FRAME_COUNT,
+                 worker_id=None):
+        """
+        Constructs the snapshots
+
+        :param directory: The directory snapshots are written to
+        :param frame_count: The number of frames stored for each allocation
+        :param worker_id: The identifier of the worker process (optional,
+            included in the names of the snapshot files)
+        """
+        self._directory = directory
+        self._frame_count = frame_count
+        self._worker_id = worker_id
+
+    @staticmethod
+    def _check_supported():
+        """
+        Raises an error if memory tracing is not supported
+        """
+        if tracemalloc is None:
+            raise _InvalidRequestError(
+                "Memory tracing is not supported by this version of Python")
+
+    def start(self):
+        """
+        Starts tracing memory allocations
+        """
+        self._check_supported()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frame_count)
+            logger.info("Memory tracing started")
+
+    def stop(self):
+        """
+        Stops tracing memory allocations (and frees the traces)
+        """
+        self._check_supported()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("Memory tracing stopped")
+
+    def snapshot(self):
+        """
+        Takes a snapshot of the memory allocated since tracing started
+
+        :return: A summary of the snapshot (a dictionary containing the path of
+            the snapshot file, the traced and peak memory, and the locations
+            that allocated the most memory)
+        """
+        self._check_supported()
+        if not tracemalloc.is_tracing():
+            raise _InvalidRequestError("Memory tracing has not been started")
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")])
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        path = _get_output_path(self._directory, "memory", "snapshot",
+                                self._worker_id)
+        snapshot.dump(path)
+        logger.info("Memory snapshot written: %s", path)
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "file": path,
+            "traced": traced,
+            "peak": peak,
+            "top": [{"location": str(stat.traceback),
+                     "size": stat.size,
+                     "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:self.TOP_COUNT]]
+        }
+
+
+# The callback holds the settings of the administrative commands it executes
+class _AdminRequestCallback(RequestCallback): # pylint: disable=too-many-instance-attributes
+    """
+    Request callback used to handle administrative requests (profiling and
+    memory snapshots). Only the DXL clients that are explicitly allowed can
+    invoke the requests (the identifiers of clients are authenticated by the
+    DXL fabric).
+    """
+
+    # UTF-8 encoding (used for encoding/decoding payloads)
+    UTF_8 = "utf-8"
+
+    # The key in the request used to specify the administrative command
+    COMMAND_KEY = "command"
+    # The key in the request used to specify the duration (in seconds) of a
+    # profile. This is optional
+    DURATION_KEY = "duration"
+
+    # The administrative commands
+    PROFILE_START_COMMAND = "profile.start"
+    PROFILE_STOP_COMMAND = "profile.stop"
+    MEMORY_START_COMMAND = "memory.start"
+    MEMORY_SNAPSHOT_COMMAND = "memory.snapshot"
+    MEMORY_STOP_COMMAND = "memory.stop"
+
+    def __init__(self, client, profiler, memory_snapshots, allowed_clients,
+                 default_duration, max_duration, worker_id=None,
+                 instance_topic=None):
+        """
+        Constructs the callback
+
+        :param client: The DXL client associated with the service
+        :param profiler: The sampling profiler
+        :param memory_snapshots: The memory snapshots
+        :param allowed_clients: The identifiers of the DXL clients that are
+            allowed to invoke administrative requests
+        :param default_duration: The duration (in seconds) of a profile if it is
+            not specified in the request
+        :param max_duration: The maximum duration (in seconds) of a profile
+        :param worker_id: The identifier of the worker process (optional)
+        :param instance_topic: The topic used to invoke administrative requests
+            on this service instance (optional)
+        """
+        super(_AdminRequestCallback, self).__init__()
+        self._dxl_client = client
+        self._profiler = profiler
+        self._memory_snapshots = memory_snapshots
+        self._allowed_clients = set(allowed_clients)
+        self._default_duration = default_duration
+        self._max_duration = max_duration
+        self._worker_id = worker_id
+        self._instance_topic = instance_topic
+
+    def on_request(self, request):
+        """
+        Invoked when a request is received
+
+        :param request: The request that was received
+        """
+        try:
+            if request.source_client_id not in self._allowed_clients:
+                raise _ForbiddenError(
+                    "Client '{0}' is not allowed to invoke administrative "
+                    "requests".format(request.source_client_id))
+            req_dict = json.loads(request.payload.decode(encoding=self.UTF_8))
+            result = self._execute(req_dict.get(self.COMMAND_KEY), req_dict)
+            if self._worker_id is not None:
+                result["worker"] = self._worker_id
+            if self._instance_topic is not None:
+                result["topic"] = self._instance_topic
+
+            response = Response(request)
+            response.payload = json.dumps(result)
+            self._dxl_client.send_response(response)
+
+        except Exception as ex:
+            if isinstance(ex, _EpoServiceError):
+                logger.warning("Error while processing admin request: %s", ex)
+            else:
+                logger.exception("Error while processing admin request")
+            self._dxl_client.send_response(
+                ErrorResponse(request,
+                              error_code=getattr(ex, "error_code", 0),
+                              error_message=str(ex).encode(
+                                  encoding=self.UTF_8)))
+
+    def _execute(self, command, req_dict):
+        """
+        Executes an administrative command
+
+        :param command: The command
+        :param req_dict: The request (as a dictionary)
+        :return: The result of the command (as a dictionary)
+        """
+        logger.info("Admin command '%s' requested", command)
+        if command == self.PROFILE_START_COMMAND:
+            duration = req_dict.get(self.DURATION_KEY, self._default_duration)
+            if not isinstance(duration, (int, float)) or duration <= 0 or \
+                    duration > self._max_duration:
+                raise _InvalidRequestError(
+                    "The duration must be between 0 and {0} seconds".format(
+                        self._max_duration))
+            return {"file": self._profiler.start(duration)}
+        if command == self.PROFILE_STOP_COMMAND:
+            return {"file": self._profiler.stop()}
+        if command == self.MEMORY_START_COMMAND:
+            self._memory_snapshots.start()
+            return {}
+        if command == self.MEMORY_SNAPSHOT_COMMAND:
+            return self._memory_snapshots.snapshot()
+        if command == self.MEMORY_STOP_COMMAND:
+            self._memory_snapshots.stop()
+            return {}
+        raise _InvalidRequestError(
+            "Unknown admin command: {0}".format(command))
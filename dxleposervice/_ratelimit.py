@@ -0,0 +1,125 @@
+from __future__ import absolute_import
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from ._errors import _RateLimitedError
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+class _TokenBucket(object):
+    """
+    A token bucket that allows a sustained rate of requests with bursts up to the
+    size of the bucket
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Constructs the bucket
+
+        :param rate: The number of tokens added to the bucket per second
+        :param burst: The maximum number of tokens held by the bucket
+        """
+        self._rate = float(rate)
+        self._burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.time()
+
+    def _refill(self, now):
+        self._tokens = min(self._burst,
+                           self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def try_consume(self, now=None):
+        """
+        Attempts to take a token from the bucket
+
+        :param now: The current time (defaults to :func:`time.time`)
+        :return: Whether a token was available
+        """
+        self._refill(time.time() if now is None else now)
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    def retry_after(self):
+        """
+        Returns the delay (in milliseconds) until the next token is available
+
+        :return: The delay (in milliseconds) until the next token is available
+        """
+        return max(1, int((1.0 - self._tokens) / self._rate * 1000))
+
+
+class _RateLimiter(object):
+    """
+    Per-client rate limits for incoming requests.
+
+    Each DXL client (identified by the source client identifier of its requests)
+    has a token bucket limiting its overall request rate. Commands with a specific
+    limit additionally have a token bucket per client and command.
+    """
+
+    # The maximum number of buckets (the least recently used buckets are
+    # discarded above this number)
+    MAX_BUCKETS = 10000
+
+    def __init__(self, default_limit, client_limits=None, command_limits=None):
+        """
+        Constructs the rate limiter
+
+        :param default_limit: A ``(rate, burst)`` tuple with the limit applied
+            to each client (a rate of ``0`` means unlimited)
+        :param client_limits: A dictionary of ``(rate, burst)`` tuples by client
+            identifier that override the default limit (optional)
+        :param command_limits: A dictionary of ``(rate, burst)`` tuples by command
+            name, applied to each client separately (optional)
+        """
+        self._default_limit = default_limit
+        self._client_limits = dict(
+            (k.lower(), v) for k, v in (client_limits or {}).items())
+        self._command_limits = dict(
+            (k.lower(), v) for k, v in (command_limits or {}).items())
+        # Ordered from the least to the most recently used
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_bucket(self, key, limit):
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = _TokenBucket(*limit)
+            while len(self._buckets) >= self.MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        self._buckets[key] = bucket
+        return bucket
+
+    def check(self, client_id, command):
+        """
+        Consumes a token for a request from the specified client. A
+        :class:`_RateLimitedError` is raised if the client has exceeded its limit.
+
+        :param client_id: The identifier of the client that sent the request
+        :param command: The ePO command being requested
+        """
+        client_key = (client_id or "").lower()
+        command_key = command.lower()
+        client_limit = self._client_limits.get(client_key, self._default_limit)
+        command_limit = self._command_limits.get(command_key)
+
+        with self._lock:
+            buckets = []
+            if client_limit[0] > 0:
+                buckets.append(self._get_bucket((client_key,), client_limit))
+            if command_limit is not None and command_limit[0] > 0:
+                buckets.append(self._get_bucket((client_key, command_key),
+                                                command_limit))
+            for bucket in buckets:
+                if not bucket.try_consume():
+                    logger.warning(
+                        "Rate limit exceeded for client '%s' (command: %s)",
+                        client_id, command)
+                    raise _RateLimitedError(client_id, bucket.retry_after())
@@ -0,0 +1,460 @@
+from __future__ import absolute_import
+import json
+import logging
+import time
+
+from dxlclient.callbacks import RequestCallback
+from dxlclient.message import ErrorResponse, Response
+
+from ._admission import _AdmissionController
+from ._drain import _InFlightTracker
+from ._errors import _EpoServiceError, _InvalidRequestError, _OverloadedError
+from ._metrics import registry, SIZE_BUCKETS
+from ._tracing import tracer
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+# The number of requests received for ePO servers
+_requests_counter = registry.counter(
+    "service_requests_total",
+    "The number of requests received for ePO servers",
+    ("epo", "command"))
+
+# The number of error responses sent for requests
+_errors_counter = registry.counter(
+    "service_request_errors_total",
+    "The number of error responses sent for requests (by service error code)",
+    ("epo", "code"))
+
+# The time taken to process requests
+_duration_histogram = registry.histogram(
+    "service_request_duration_seconds",
+    "The time from receiving a request until its response was sent "
+    "(including the time queued)",
+    ("epo", "command"))
+
+# The sizes of request payloads
+_request_size_histogram = registry.histogram(
+    "service_request_payload_bytes",
+    "The sizes of request payloads", ("epo",), buckets=SIZE_BUCKETS)
+
+# The sizes of response payloads
+_response_size_histogram = registry.histogram(
+    "service_response_payload_bytes",
+    "The sizes of response payloads", ("epo",), buckets=SIZE_BUCKETS)
+
+
+# Each request passes through every component the callback holds (rate
+# limiting, admission control, dispatching, jobs, etc.)
+class _EpoRequestCallback(RequestCallback): # pylint: disable=too-many-instance-attributes
+    """
+    Request callback used to handle incoming service requests
+    """
+
+    # UTF-8 encoding (used for encoding/decoding payloads)
+    UTF_8 = "utf-8"
+
+    # The key in the request used to specify the ePO command to invoke
+    CMD_NAME_KEY = "command"
+    # The key in the request used to specify the output format
+    # (json, xml, verbose, terse). This is optional
+    OUTPUT_KEY = "output"
+    # The key used to specify the parameters for the ePO command
+    PARAMS_KEY = "params"
+    # The key in the request used to specify the lane the request is processed in
+    # (interactive, bulk, etc.). This is optional
+    PRIORITY_KEY = "priority"
+    # The key in the request used to specify that the command should be executed
+    # as a background job. This is optional
+    ASYNC_KEY = "async"
+    # The key in the request used to specify a key that identifies retries of the
+    # same request. This is optional
+    IDEMPOTENCY_KEY = "idempotencyKey"
+
+    # The default output format
+    DEFAULT_OUTPUT = "json"
+
+    # The class of commands (for admission control) of background jobs
+    JOB_COMMAND_CLASS = "jobs"
+
+    def __init__(self, client, epo_by_topic, admission_controller=None,
+                 rate_limiter=None, dispatcher=None, job_manager=None,
+                 idempotency_cache=None, catalog_manager=None, in_flight=None):
+        """
+        Constructs the callback
+
+        :param client: The DXL client associated with the service
+        :param epo_by_topic: The ePO server wrappers by associated request topics
+        :param admission_controller: The admission controller used to reject
+            requests when an ePO server is overloaded (optional)
+        :param rate_limiter: The rate limiter used to reject requests from clients
+            that exceed their limits (optional)
+        :param dispatcher: The dispatcher used to process requests in lanes,
+            fairly across clients (optional, requests are processed on the
+            incoming message thread if not specified)
+        :param job_manager: The job manager used to execute commands in the
+            background (optional, job requests are rejected if not specified)
+        :param idempotency_cache: The cache used to serve retries of requests
+            with idempotency keys (optional)
+        :param catalog_manager: The catalog manager used to reject requests for
+            unknown commands and requests with missing parameters (optional)
+        :param in_flight: The tracker of the requests in progress (optional)
+        """
+        super(_EpoRequestCallback, self).__init__()
+        self._dxl_client = client
+        self._epo_by_topic = epo_by_topic
+        self._admission_controller = admission_controller
+        self._rate_limiter = rate_limiter
+        self._dispatcher = dispatcher
+        self._job_manager = job_manager
+        self._idempotency_cache = idempotency_cache
+        self._catalog_manager = catalog_manager
+        self._in_flight = in_flight or _InFlightTracker()
+
+    def on_request(self, request):
+        """
+        Invoked when a request is received
+
+        :param request: The request that was received
+        """
+        idempotency_key = None
+        queued = False
+        epo_name = None
+        received = time.time()
+        span = tracer.start_trace("dxl.request", request, start=received,
+                                  **{"dxl.topic": request.destination_topic,
+                                     "dxl.client_id": request.source_client_id,
+                                     "dxl.payload_size": len(request.payload)})
+        previous_span = tracer.set_current(span)
+        self._in_flight.begin()
+        try:
+            # Build dictionary from the request payload
+            req_dict = json.loads(request.payload.decode(encoding=self.UTF_8))
+            command, output, req_params = self._parse_request(req_dict)
+
+            # Get the ePO server to invoke the command on
+            epo = self._epo_by_topic[request.destination_topic]
+            epo_name = epo.name
+            self._check_request(request, span, epo, command, req_params)
+
+            # Execute the command as a background job (if requested)
+            if req_dict.get(self.ASYNC_KEY):
+                self._submit_job(request, epo, command, output, req_params)
+                return
+
+            # Serve retries of a request with an idempotency key from the outcome
+            # of the original request
+            idempotency_key, retried = self._check_idempotency(
+                request, req_dict, command, output, req_params)
+            if retried:
+                return
+
+            queued = self._dispatch(request, span, epo, command, output,
+                                    req_params, req_dict.get(self.PRIORITY_KEY),
+                                    idempotency_key, received)
+
+        except Exception as ex:
+            self._send_error_response(request, ex, idempotency_key, epo_name)
+        finally:
+            # Queued requests are in progress until they have been processed
+            if not queued:
+                self._in_flight.end()
+                span.end()
+            tracer.set_current(previous_span)
+
+    def _parse_request(self, req_dict):
+        """
+        Returns the command, output format and parameters of a request
+
+        :param req_dict: The request (as a dictionary)
+        :return: A tuple of the command, the output format and the parameters
+        """
+        # Determine the ePO command
+        if self.CMD_NAME_KEY not in req_dict:
+            raise Exception(
+                "A command name was not specified ('{0}')".format(
+                    self.CMD_NAME_KEY))
+        return (req_dict[self.CMD_NAME_KEY],
+                req_dict.get(self.OUTPUT_KEY, self.DEFAULT_OUTPUT),
+                req_dict.get(self.PARAMS_KEY, {}))
+
+    def _check_request(self, request, span, epo, command, req_params):
+        """
+        Records a request (in its span and the metrics), and rejects it if the
+        command is unknown or the client has exceeded its rate limit
+
+        :param request: The request that was received
+        :param span: The span of the request
+        :param epo: The ePO server wrapper to invoke the command on
+        :param command: The command to invoke
+        :param req_params: The parameters for the command
+        """
+        span.set_attribute("epo.name", epo.name)
+        span.set_attribute("epo.command", command)
+        span.set_detail("epo.params", req_params)
+        _requests_counter.inc(epo=epo.name, command=command)
+        _request_size_histogram.observe(len(request.payload), epo=epo.name)
+
+        # Reject requests for unknown commands (or with missing parameters)
+        if self._catalog_manager is not None:
+            self._catalog_manager.validate(epo.name, command, req_params)
+
+        # Reject the request if the client has exceeded its rate limit
+        if self._rate_limiter is not None:
+            self._rate_limiter.check(request.source_client_id, command)
+
+    def _check_idempotency(self, request, req_dict, command, output,
+                           req_params):
+        """
+        Serves a retry of a request with an idempotency key from the outcome of
+        the original request
+
+        :param request: The request that was received
+        :param req_dict: The request (as a dictionary)
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :return: A tuple of the idempotency key of the request (``None`` if the
+            request has no key) and whether the request is a retry (in which
+            case it must not be processed)
+        """
+        if self._idempotency_cache is None or \
+                req_dict.get(self.IDEMPOTENCY_KEY) is None:
+            return None, False
+
+        # Keys are scoped to the client that sent the request
+        key = (request.source_client_id, request.destination_topic,
+               req_dict[self.IDEMPOTENCY_KEY])
+        entry = self._idempotency_cache.get_or_add(
+            key, command, request, {"output": output, "params": req_params})
+        if entry is None:
+            return key, False
+
+        # Retries of a request that is in progress receive the outcome when the
+        # original request completes
+        if entry.done:
+            self._send_result(request, entry.result)
+        return None, True
+
+    def _dispatch(self, request, span, epo, command, output, req_params,
+                  priority, idempotency_key, received):
+        """
+        Processes a request, in the lane for its command and priority if
+        request dispatch is enabled
+
+        :param request: The request that was received
+        :param span: The span of the request
+        :param epo: The ePO server wrapper to invoke the command on
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :param priority: The priority specified in the request (or ``None``)
+        :param idempotency_key: The idempotency key of the request (or ``None``)
+        :param received: The time the request was received
+        :return: Whether the request was queued (it is processed later)
+        """
+        queued = False
+        admission = None
+        try:
+            # Determine the lane to process the request in
+            lane = None
+            if self._dispatcher is not None:
+                lane = self._dispatcher.get_lane(command, priority)
+
+            # Admit the request before it is queued (the slot is held while the
+            # request is queued), so that requests are rejected quickly when
+            # the ePO server is overloaded
+            if self._admission_controller is not None:
+                admission = self._admission_controller.admit(
+                    epo.name, lane.name if lane is not None
+                    else _AdmissionController.DEFAULT_CLASS)
+
+            if lane is None:
+                self._process(request, epo, command, output, req_params,
+                              idempotency_key, received, admission)
+                return False
+
+            queue_span = span.child("dispatch.queue",
+                                    **{"dispatch.lane": lane.name})
+            queued = lane.submit(request.source_client_id, self._process_queued,
+                                 request, epo, command, output, req_params,
+                                 idempotency_key, received, queue_span,
+                                 admission, key=epo.name)
+            if not queued:
+                raise _OverloadedError(epo.name, lane.retry_after())
+            return True
+        finally:
+            if not queued and admission is not None:
+                admission.cancel()
+
+    def _submit_job(self, request, epo, command, output, req_params):
+        """
+        Submits the ePO remote command for a request as a background job and
+        delivers a response containing the job identifier
+
+        :param request: The request that was received
+        :param epo: The ePO server wrapper to invoke the command on
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        """
+        if self._job_manager is None:
+            raise _InvalidRequestError("Jobs are not enabled for the service")
+
+        job = self._job_manager.submit(
+            self._dxl_client, request.source_client_id, epo.name, command,
+            lambda: self._execute(epo, command, output, req_params))
+
+        result = {
+            "jobId": job.id,
+            "topic": self._job_manager.DXL_JOB_EVENT_FORMAT.format(job.id)
+        }
+        # The job is only known to this service instance
+        if self._job_manager.status_topic is not None:
+            result["statusTopic"] = self._job_manager.status_topic
+        if self._job_manager.cancel_topic is not None:
+            result["cancelTopic"] = self._job_manager.cancel_topic
+        response = Response(request)
+        response.payload = json.dumps(result)
+        self._dxl_client.send_response(response)
+
+    def _process(self, request, epo, command, output, req_params,
+                 idempotency_key=None, received=None, admission=None):
+        """
+        Executes the ePO remote command for a request and delivers the response
+
+        :param request: The request that was received
+        :param epo: The ePO server wrapper to invoke the command on
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :param idempotency_key: The idempotency key of the request (optional)
+        :param received: The time the request was received (optional)
+        :param admission: The admission of the request (optional)
+        """
+        received = received or time.time()
+        try:
+            # Execute the ePO Remote Command
+            with tracer.span("epo.execute", **{"epo.output": output}) as span:
+                result = self._execute(epo, command, output, req_params,
+                                       admission)
+                span.root.set_attribute("epo.result_size", len(result))
+            _response_size_histogram.observe(len(result), epo=epo.name)
+            self._send_result(request, result, idempotency_key)
+
+        except Exception as ex:
+            self._send_error_response(request, ex, idempotency_key, epo.name)
+        finally:
+            if admission is not None:
+                admission.cancel()
+            _duration_histogram.observe(time.time() - received, epo=epo.name,
+                                        command=command)
+
+    def _process_queued(self, request, epo, command, output, req_params,
+                        idempotency_key=None, received=None, queue_span=None,
+                        admission=None):
+        """
+        Processes a request that was queued in a lane
+
+        :param request: The request that was received
+        :param epo: The ePO server wrapper to invoke the command on
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :param idempotency_key: The idempotency key of the request (optional)
+        :param received: The time the request was received (optional)
+        :param queue_span: The span of the time the request was queued (optional)
+        :param admission: The admission of the request (optional)
+        """
+        queue_span = queue_span or tracer.current()
+        queue_span.end()
+        try:
+            with tracer.activate(queue_span.root):
+                self._process(request, epo, command, output, req_params,
+                              idempotency_key, received, admission)
+        finally:
+            self._in_flight.end()
+            queue_span.root.end()
+
+    def _complete_idempotent(self, idempotency_key, result=None, error=None):
+        """
+        Records the outcome for an idempotency key
+
+        :param idempotency_key: The idempotency key (or ``None``)
+        :param result: The result of the command (if successful)
+        :param error: The exception raised by the command (if it failed)
+        :return: The retries that were waiting for the outcome
+        """
+        if idempotency_key is None or self._idempotency_cache is None:
+            return []
+        return self._idempotency_cache.complete(idempotency_key, result, error)
+
+    def _send_result(self, request, result, idempotency_key=None):
+        """
+        Delivers a response containing the result of a command
+
+        :param request: The request that was received
+        :param result: The result of the command execution
+        :param idempotency_key: The idempotency key of the request (optional)
+        """
+        for req in [request] + self._complete_idempotent(idempotency_key,
+                                                         result=result):
+            # Create the response, set payload, and deliver
+            response = Response(req)
+            response.payload = result
+            with tracer.span("dxl.send_response"):
+                self._dxl_client.send_response(response)
+
+    def _send_error_response(self, request, ex, idempotency_key=None,
+                             epo_name=None):
+        """
+        Delivers an error response for a request that failed (must be invoked
+        while handling the exception)
+
+        :param request: The request that failed
+        :param ex: The exception that caused the failure
+        :param idempotency_key: The idempotency key of the request (optional)
+        :param epo_name: The name of the ePO server the request was for
+            (optional)
+        """
+        if isinstance(ex, _EpoServiceError):
+            logger.warning("Error while processing request: %s", ex)
+            # Service-specific error code
+            error_code = ex.error_code
+        else:
+            logger.exception("Error while processing request")
+            error_code = 0
+        _errors_counter.inc(epo=epo_name or "", code=error_code)
+        tracer.current().root.set_attribute("error.code", error_code)
+        tracer.current().root.set_attribute("error.message", str(ex))
+
+        for req in [request] + self._complete_idempotent(idempotency_key,
+                                                         error=ex):
+            # Send error response
+            self._dxl_client.send_response(
+                ErrorResponse(req,
+                              error_code=error_code,
+                              error_message=str(ex).encode(
+                                  encoding=self.UTF_8)))
+
+    def _execute(self, epo, command, output, req_params, admission=None):
+        """
+        Executes the ePO remote command (subject to admission control, if enabled)
+
+        :param epo: The ePO server wrapper to invoke the command on
+        :param command: The command to invoke
+        :param output: The output type (json, xml, verbose, terse)
+        :param req_params: The parameters for the command
+        :param admission: The admission of the request (optional, background
+            jobs are admitted when they are executed)
+        :return: The result of the command execution
+        """
+        if admission is None and self._admission_controller is not None:
+            admission = self._admission_controller.admit(
+                epo.name, self.JOB_COMMAND_CLASS)
+        if admission is None:
+            return epo.execute(command, output, req_params)
+
+        with admission:
+            return epo.execute(command, output, req_params)
@@ -0,0 +1,698 @@
+from __future__ import absolute_import
+import logging
+import os
+
+from ._admission import _AdmissionController
+from ._catalog import _CatalogManager
+from ._commands import _CommandPatterns
+from ._dispatch import _Dispatcher, _Lane, _PoolSizer
+from ._epo import _Epo
+from ._idempotency import _IdempotencyCache
+from ._jobs import _JobManager
+from ._ratelimit import _RateLimiter
+from ._retry import _RetryPolicy
+from ._sharding import _ShardSelector
+from ._timeouts import _TimeoutPolicy
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+class _RequestConfigMixin(object):
+    """
+    Loads the configuration of the ePO servers and of the processing of their
+    requests (sharding, retries, timeouts, admission control, rate limits,
+    request dispatch, jobs, idempotency keys and the command catalog) for the
+    ePO DXL service.
+    """
+
+    # The name of the "General" section within the ePO service configuration file
+    GENERAL_CONFIG_SECTION = "General"
+    # The property used to specify ePO names within the "General" section of the
+    # ePO service configuration file
+    GENERAL_EPO_NAMES_CONFIG_PROP = "epoNames"
+    # The number of shards (service instances) the ePO servers are divided
+    # between
+    GENERAL_SHARD_COUNT_CONFIG_PROP = "shardCount"
+    # The index of the shard served by this service instance
+    GENERAL_SHARD_INDEX_CONFIG_PROP = "shardIndex"
+    # The prefix for properties that explicitly assign ePO servers to a shard
+    # (delimited by commas, the shard index follows the prefix)
+    GENERAL_SHARD_CONFIG_PREFIX = "shard."
+    # The maximum time (in seconds) to wait on shutdown for requests in progress
+    # to complete (after the service has been unregistered)
+    GENERAL_DRAIN_TIMEOUT_CONFIG_PROP = "drainTimeout"
+    # The environment variable that overrides the index of the shard (so that
+    # service instances can share a configuration file)
+    SHARD_INDEX_ENV_VAR = "DXLEPOSERVICE_SHARD_INDEX"
+
+    # The property used to specify the host of an ePO within within the ePO service
+    # configuration file (multiple hosts for the application servers of the ePO can
+    # be specified, delimited by commas)
+    EPO_HOST_CONFIG_PROP = "host"
+    # The property used to specify the port of an ePO server within the ePO service
+    # configuration file (this property is optional)
+    EPO_PORT_CONFIG_PROP = "port"
+    # The property used to specify the user used to login to an ePO server within
+    # the ePO service configuration file
+    EPO_USER_CONFIG_PROP = "user"
+    # The property used to specify the password used to login to an ePO server within the ePO
+    # service configuration file
+    EPO_PASSWORD_CONFIG_PROP = "password"
+    # The property used to specify the unique identifier for the ePO server within
+    # the ePO service configuration file (this property is optional)
+    EPO_UNIQUE_ID_CONFIG_PROP = "uniqueId"
+    # Whether to verify that the hostname in the ePO's certificate matches the ePO
+    # server being connected to. (optional, enabled by default)
+    EPO_VERIFY_CERTIFICATE = "verifyCertificate"
+    # A path to a CA Bundle file containing certificates of trusted CAs.
+    # The CA Bundle is used to ensure that the ePO server being connected to was signed by a
+    # valid authority.
+    EPO_VERIFY_CERT_BUNDLE = "verifyCertBundle"
+    # Whether to send a second (hedged) request to another host when a request for
+    # a read-only command is slow (optional, disabled by default)
+    EPO_HEDGE_REQUESTS_CONFIG_PROP = "hedgeRequests"
+    # The commands that are hedged (delimited by commas, wildcards supported)
+    EPO_HEDGE_COMMANDS_CONFIG_PROP = "hedgeCommands"
+    # The delay (in milliseconds) before a hedged request is sent (optional,
+    # defaults to the 95th percentile of recent latencies)
+    EPO_HEDGE_DELAY_CONFIG_PROP = "hedgeDelay"
+    # The time (in milliseconds) to wait for a connection to the ePO server to be
+    # established (optional)
+    EPO_CONNECT_TIMEOUT_CONFIG_PROP = "connectTimeout"
+    # The time (in milliseconds) to wait for the ePO server to send data (optional)
+    EPO_READ_TIMEOUT_CONFIG_PROP = "readTimeout"
+    # The prefix for properties that specify the connect timeout for a command
+    EPO_CONNECT_TIMEOUT_CONFIG_PREFIX = "connectTimeout."
+    # The prefix for properties that specify the read timeout for a command
+    EPO_READ_TIMEOUT_CONFIG_PREFIX = "readTimeout."
+
+    # Default value for verifying certificates
+    DEFAULT_VERIFY_CERTIFICATE = True
+
+    # The default port used to communicate with an ePO server
+    DEFAULT_EPO_PORT = 8443
+
+    # Default timeouts (in milliseconds) for requests to an ePO server
+    DEFAULT_EPO_CONNECT_TIMEOUT = 10000
+    DEFAULT_EPO_READ_TIMEOUT = 300000
+
+    # The name of the "AdmissionControl" section within the ePO service configuration file
+    ADMISSION_CONFIG_SECTION = "AdmissionControl"
+    # Whether admission control is enabled (optional, disabled by default)
+    ADMISSION_ENABLED_CONFIG_PROP = "enabled"
+    # The initial number of concurrent requests allowed per ePO server
+    ADMISSION_INITIAL_LIMIT_CONFIG_PROP = "initialLimit"
+    # The minimum number of concurrent requests allowed per ePO server
+    ADMISSION_MIN_LIMIT_CONFIG_PROP = "minLimit"
+    # The maximum number of concurrent requests allowed per ePO server
+    ADMISSION_MAX_LIMIT_CONFIG_PROP = "maxLimit"
+    # The latency (in milliseconds) above which a request is a sign of overload
+    ADMISSION_LATENCY_THRESHOLD_CONFIG_PROP = "latencyThreshold"
+    # The prefix of the properties used to specify the latency threshold (in
+    # milliseconds) of the commands of a dispatch lane
+    ADMISSION_LANE_LATENCY_THRESHOLD_CONFIG_PREFIX = "latencyThreshold."
+    # The ratio the limit is multiplied by when overload is detected
+    ADMISSION_BACKOFF_RATIO_CONFIG_PROP = "backoffRatio"
+
+    # Default values for admission control
+    DEFAULT_ADMISSION_INITIAL_LIMIT = 10
+    DEFAULT_ADMISSION_MIN_LIMIT = 1
+    DEFAULT_ADMISSION_MAX_LIMIT = 100
+    DEFAULT_ADMISSION_LATENCY_THRESHOLD = 5000
+    DEFAULT_ADMISSION_BACKOFF_RATIO = 0.9
+
+    # The name of the "RateLimit" section within the ePO service configuration file
+    RATE_LIMIT_CONFIG_SECTION = "RateLimit"
+    # The default limit for each client ("rate[,burst]" in requests per second)
+    RATE_LIMIT_DEFAULT_CONFIG_PROP = "defaultLimit"
+    # The prefix for properties that specify the limit for a specific client
+    RATE_LIMIT_CLIENT_CONFIG_PREFIX = "client."
+    # The prefix for properties that specify the limit for a specific command
+    RATE_LIMIT_COMMAND_CONFIG_PREFIX = "command."
+
+    # The name of the "RequestDispatch" section within the ePO service configuration file
+    DISPATCH_CONFIG_SECTION = "RequestDispatch"
+    # The number of threads used to process requests (0 to process requests on the
+    # incoming message threads)
+    DISPATCH_THREAD_COUNT_CONFIG_PROP = "threadCount"
+    # The maximum number of threads used to process requests (the number of
+    # threads is adjusted to the load between the thread count and this value)
+    DISPATCH_MAX_THREAD_COUNT_CONFIG_PROP = "maxThreadCount"
+    # The time (in seconds) between adjustments of the number of threads
+    DISPATCH_SIZING_INTERVAL_CONFIG_PROP = "sizingInterval"
+    # The maximum number of requests waiting to be processed
+    DISPATCH_QUEUE_SIZE_CONFIG_PROP = "queueSize"
+    # The weight of clients that do not have a specific weight
+    DISPATCH_DEFAULT_WEIGHT_CONFIG_PROP = "defaultWeight"
+    # The prefix for properties that specify the weight for a specific client
+    DISPATCH_WEIGHT_CONFIG_PREFIX = "weight."
+    # The property used to specify the names of additional lanes (each lane has
+    # its own section within the ePO service configuration file)
+    DISPATCH_LANES_CONFIG_PROP = "lanes"
+    # The property used to specify the commands associated with a lane
+    LANE_COMMANDS_CONFIG_PROP = "commands"
+
+    # The name of the lane for requests that are not associated with another lane
+    DEFAULT_LANE_NAME = "default"
+
+    # Default values for request dispatch
+    DEFAULT_DISPATCH_THREAD_COUNT = 0
+    DEFAULT_DISPATCH_QUEUE_SIZE = 1000
+    DEFAULT_DISPATCH_WEIGHT = 1
+    DEFAULT_DISPATCH_SIZING_INTERVAL = 10
+
+    # The name of the "Jobs" section within the ePO service configuration file
+    JOBS_CONFIG_SECTION = "Jobs"
+    # Whether clients may execute commands as background jobs
+    JOBS_ENABLED_CONFIG_PROP = "enabled"
+    # The number of threads used to execute jobs
+    JOBS_THREAD_COUNT_CONFIG_PROP = "threadCount"
+    # The maximum number of queued jobs
+    JOBS_QUEUE_SIZE_CONFIG_PROP = "queueSize"
+    # The maximum size (in characters) of a result chunk
+    JOBS_CHUNK_SIZE_CONFIG_PROP = "chunkSize"
+    # The time (in seconds) finished jobs are retained for
+    JOBS_RETENTION_CONFIG_PROP = "retention"
+    # The maximum number of finished jobs that are retained
+    JOBS_MAX_RETAINED_COUNT_CONFIG_PROP = "maxRetainedJobs"
+    # The maximum total size (in characters) of the results that are retained
+    JOBS_MAX_RETAINED_SIZE_CONFIG_PROP = "maxRetainedSize"
+
+    # Default values for jobs
+    DEFAULT_JOBS_THREAD_COUNT = 2
+    DEFAULT_JOBS_QUEUE_SIZE = 100
+    DEFAULT_JOBS_CHUNK_SIZE = 500000
+    DEFAULT_JOBS_RETENTION = 3600
+    DEFAULT_JOBS_MAX_RETAINED_COUNT = 1000
+    DEFAULT_JOBS_MAX_RETAINED_SIZE = 100000000
+
+    # The name of the "Idempotency" section within the ePO service configuration file
+    IDEMPOTENCY_CONFIG_SECTION = "Idempotency"
+    # Whether outcomes of requests with idempotency keys are retained
+    IDEMPOTENCY_ENABLED_CONFIG_PROP = "enabled"
+    # The maximum number of retained outcomes
+    IDEMPOTENCY_MAX_ENTRIES_CONFIG_PROP = "maxEntries"
+    # The time (in seconds) outcomes are retained for
+    IDEMPOTENCY_TTL_CONFIG_PROP = "ttl"
+
+    # Default values for idempotency
+    DEFAULT_IDEMPOTENCY_MAX_ENTRIES = 10000
+    DEFAULT_IDEMPOTENCY_TTL = 600
+
+    # The name of the "Catalog" section within the ePO service configuration file
+    CATALOG_CONFIG_SECTION = "Catalog"
+    # Whether requests are validated against the command catalog of each ePO
+    # server (as listed by "core.help")
+    CATALOG_ENABLED_CONFIG_PROP = "enabled"
+    # The time (in seconds) between refreshes of the command catalogs
+    CATALOG_REFRESH_INTERVAL_CONFIG_PROP = "refreshInterval"
+
+    # Default values for the command catalog
+    DEFAULT_CATALOG_REFRESH_INTERVAL = 3600
+
+    # Default value for draining requests on shutdown
+    DEFAULT_DRAIN_TIMEOUT = 30
+
+    # The name of the "Retry" section within the ePO service configuration file
+    RETRY_CONFIG_SECTION = "Retry"
+    # The maximum number of attempts for a request (1 disables retries)
+    RETRY_MAX_ATTEMPTS_CONFIG_PROP = "maxAttempts"
+    # The maximum delay (in milliseconds) before the first retry
+    RETRY_INITIAL_DELAY_CONFIG_PROP = "initialDelay"
+    # The maximum delay (in milliseconds) before any retry
+    RETRY_MAX_DELAY_CONFIG_PROP = "maxDelay"
+    # The maximum time (in milliseconds) spent on a request, including retries
+    RETRY_BUDGET_CONFIG_PROP = "budget"
+    # The commands that are retried (delimited by commas, wildcards supported)
+    RETRY_COMMANDS_CONFIG_PROP = "commands"
+    # The prefix for properties that specify the maximum attempts for a command
+    RETRY_MAX_ATTEMPTS_CONFIG_PREFIX = "maxAttempts."
+
+    # Default values for retries
+    DEFAULT_RETRY_MAX_ATTEMPTS = 3
+    DEFAULT_RETRY_INITIAL_DELAY = 100
+    DEFAULT_RETRY_MAX_DELAY = 2000
+    DEFAULT_RETRY_BUDGET = 10000
+
+    @staticmethod
+    def _get_option(config, section, option, default_value=None):
+        return config.get(section, option) \
+            if config.has_option(section, option) else default_value
+
+    @staticmethod
+    def _get_boolean_option(config, section, option, default_value=False):
+        return config.getboolean(section, option) \
+            if config.has_option(section, option) else default_value
+
+    @staticmethod
+    def _get_float_option(config, section, option, default_value=0.0):
+        return config.getfloat(section, option) \
+            if config.has_option(section, option) else default_value
+
+    @staticmethod
+    def _get_list_option(config, section, option, default_value=None):
+        if not config.has_option(section, option):
+            return default_value
+        return [value.strip() for value in config.get(section, option).split(",")
+                if value.strip()]
+
+    @staticmethod
+    def _get_int_option(config, section, option, default_value=0):
+        return config.getint(section, option) \
+            if config.has_option(section, option) else default_value
+
+    def _load_epo(self, config, epo_name, retry_policy):
+        """
+        Creates the wrapper of an ePO server and associates it with the request
+        topic of the ePO server
+
+        :param config: The application configuration
+        :param epo_name: The name of the ePO server (and its configuration section)
+        :param retry_policy: The policy used to retry requests to the ePO server
+        """
+        hosts = [host.strip() for host in
+                 config.get(epo_name, self.EPO_HOST_CONFIG_PROP).split(",")
+                 if host.strip()]
+        user = config.get(epo_name, self.EPO_USER_CONFIG_PROP)
+        password = config.get(epo_name, self.EPO_PASSWORD_CONFIG_PROP)
+
+        # Port (optional)
+        port = self._get_option(config, epo_name, self.EPO_PORT_CONFIG_PROP,
+                                self.DEFAULT_EPO_PORT)
+
+        # Hedged requests (optional)
+        hedge_commands = None
+        hedge_delay = None
+        if self._get_boolean_option(config, epo_name,
+                                    self.EPO_HEDGE_REQUESTS_CONFIG_PROP):
+            hedge_commands = self._get_list_option(
+                config, epo_name, self.EPO_HEDGE_COMMANDS_CONFIG_PROP,
+                _CommandPatterns.READ_ONLY)
+            if config.has_option(epo_name, self.EPO_HEDGE_DELAY_CONFIG_PROP):
+                hedge_delay = config.getint(
+                    epo_name, self.EPO_HEDGE_DELAY_CONFIG_PROP) / 1000.0
+
+        # Create ePO wrapper
+        epo = _Epo(name=epo_name, host=hosts, port=port, user=user,
+                   password=password, verify=self._load_verify(config, epo_name),
+                   retry_policy=retry_policy,
+                   hedge_commands=hedge_commands,
+                   hedge_delay=hedge_delay,
+                   cache=self._cache,
+                   system_index=self._system_index,
+                   timeout_policy=self._load_timeout_policy(config, epo_name))
+
+        # Unique identifier (optional, if not specified attempts to determine GUID)
+        unique_id = self._get_option(config, epo_name,
+                                     self.EPO_UNIQUE_ID_CONFIG_PROP)
+
+        if unique_id is None:
+            logger.info(
+                "Attempting to determine GUID for ePO server: %s ...",
+                epo_name)
+            unique_id = epo.lookup_guid()
+            logger.info(
+                "GUID '%s' found for ePO server: %s", unique_id, epo_name)
+
+        # Create the request topic based on the ePO's unique identifier
+        request_topic = self.DXL_REQUEST_FORMAT.format(unique_id)
+        logger.info(
+            "Request topic '%s' associated with ePO server: %s",
+            request_topic, epo_name)
+        # Associate ePO wrapper instance with the request topic
+        self._epo_by_topic[request_topic] = epo
+        self._epo_by_catalog_topic[
+            self.DXL_CATALOG_FORMAT.format(unique_id)] = epo
+        if self._system_index is not None:
+            self._system_index.add(epo)
+
+    def _load_verify(self, config, epo_name):
+        """
+        Returns how the certificate of an ePO server is verified
+
+        :param config: The application configuration
+        :param epo_name: The name of the ePO server (and its configuration section)
+        :return: Whether to verify the certificate, or the path of the CA bundle
+            used to verify it
+        """
+        # Whether to verify the ePO server's certificate (optional)
+        verify = self._get_boolean_option(config, epo_name,
+                                          self.EPO_VERIFY_CERTIFICATE,
+                                          self.DEFAULT_VERIFY_CERTIFICATE)
+
+        # CA Bundle
+        if verify:
+            ca_bundle = self._get_option(config, epo_name,
+                                         self.EPO_VERIFY_CERT_BUNDLE)
+            if ca_bundle:
+                ca_bundle = self._get_path(ca_bundle)
+                verify = ca_bundle
+
+                if not os.access(verify, os.R_OK):
+                    raise Exception(
+                        "Unable to access CA bundle file/dir ({0}): {1}".format(
+                            self.EPO_VERIFY_CERT_BUNDLE, verify))
+        return verify
+
+    def _select_shard(self, config, epo_names):
+        """
+        Returns the ePO servers assigned to the shard of this service instance
+        (if sharding is enabled in the configuration)
+
+        :param config: The application configuration
+        :param epo_names: The names of the ePO servers
+        :return: The names of the ePO servers served by this instance
+        """
+        section = self.GENERAL_CONFIG_SECTION
+        shard_count = self._get_int_option(
+            config, section, self.GENERAL_SHARD_COUNT_CONFIG_PROP, 1)
+        if shard_count == 1:
+            return epo_names
+
+        shard_index = os.environ.get(self.SHARD_INDEX_ENV_VAR)
+        if shard_index is None:
+            shard_index = self._get_option(
+                config, section, self.GENERAL_SHARD_INDEX_CONFIG_PROP)
+        if shard_index is None:
+            raise Exception(
+                "The shard index ({0}) must be specified if the shard count is "
+                "greater than 1".format(self.GENERAL_SHARD_INDEX_CONFIG_PROP))
+        try:
+            selector = _ShardSelector(
+                shard_count, int(shard_index),
+                dict((int(index), [name.strip() for name in value.split(",")
+                                   if name.strip()])
+                     for index, value in self._get_prefixed_options(
+                         config, section,
+                         self.GENERAL_SHARD_CONFIG_PREFIX).items()))
+        except ValueError as ex:
+            raise Exception("Invalid shard configuration: {0}".format(ex))
+
+        selected = [epo_name for epo_name in epo_names
+                    if selector.selects(epo_name)]
+        logger.info("Serving shard %s of %d, ePO servers: %s", shard_index,
+                    shard_count, ",".join(selected))
+        if not selected:
+            raise Exception(
+                "No ePO servers are assigned to shard {0}".format(shard_index))
+        return selected
+
+    def _load_retry_policy(self, config):
+        """
+        Creates the policy used to retry requests to the ePO servers
+
+        :param config: The application configuration
+        :return: The retry policy
+        """
+        section = self.RETRY_CONFIG_SECTION
+        commands = self._get_list_option(config, section,
+                                         self.RETRY_COMMANDS_CONFIG_PROP)
+        max_attempts_by_command = dict(
+            (name, int(value)) for name, value in
+            self._get_prefixed_options(
+                config, section,
+                self.RETRY_MAX_ATTEMPTS_CONFIG_PREFIX).items())
+
+        return _RetryPolicy(
+            max_attempts=self._get_int_option(
+                config, section, self.RETRY_MAX_ATTEMPTS_CONFIG_PROP,
+                self.DEFAULT_RETRY_MAX_ATTEMPTS),
+            initial_delay=self._get_int_option(
+                config, section, self.RETRY_INITIAL_DELAY_CONFIG_PROP,
+                self.DEFAULT_RETRY_INITIAL_DELAY) / 1000.0,
+            max_delay=self._get_int_option(
+                config, section, self.RETRY_MAX_DELAY_CONFIG_PROP,
+                self.DEFAULT_RETRY_MAX_DELAY) / 1000.0,
+            budget=self._get_int_option(
+                config, section, self.RETRY_BUDGET_CONFIG_PROP,
+                self.DEFAULT_RETRY_BUDGET) / 1000.0,
+            commands=commands,
+            max_attempts_by_command=max_attempts_by_command)
+
+    def _load_timeout_policy(self, config, epo_name):
+        """
+        Creates the policy that determines the timeouts for requests to an ePO
+        server
+
+        :param config: The application configuration
+        :param epo_name: The name of the ePO server (and its configuration section)
+        :return: The timeout policy
+        """
+        def get_timeouts_by_command(prefix):
+            return dict(
+                (name, int(value) / 1000.0) for name, value in
+                self._get_prefixed_options(config, epo_name, prefix).items())
+
+        return _TimeoutPolicy(
+            connect_timeout=self._get_int_option(
+                config, epo_name, self.EPO_CONNECT_TIMEOUT_CONFIG_PROP,
+                self.DEFAULT_EPO_CONNECT_TIMEOUT) / 1000.0,
+            read_timeout=self._get_int_option(
+                config, epo_name, self.EPO_READ_TIMEOUT_CONFIG_PROP,
+                self.DEFAULT_EPO_READ_TIMEOUT) / 1000.0,
+            connect_timeouts_by_command=get_timeouts_by_command(
+                self.EPO_CONNECT_TIMEOUT_CONFIG_PREFIX),
+            read_timeouts_by_command=get_timeouts_by_command(
+                self.EPO_READ_TIMEOUT_CONFIG_PREFIX))
+
+    def _load_admission_configuration(self, config):
+        """
+        Creates the admission controller if it is enabled in the configuration
+
+        :param config: The application configuration
+        """
+        section = self.ADMISSION_CONFIG_SECTION
+        if not self._get_boolean_option(config, section,
+                                        self.ADMISSION_ENABLED_CONFIG_PROP):
+            return
+
+        self._admission_controller = _AdmissionController(
+            initial_limit=self._get_int_option(
+                config, section, self.ADMISSION_INITIAL_LIMIT_CONFIG_PROP,
+                self.DEFAULT_ADMISSION_INITIAL_LIMIT),
+            min_limit=self._get_int_option(
+                config, section, self.ADMISSION_MIN_LIMIT_CONFIG_PROP,
+                self.DEFAULT_ADMISSION_MIN_LIMIT),
+            max_limit=self._get_int_option(
+                config, section, self.ADMISSION_MAX_LIMIT_CONFIG_PROP,
+                self.DEFAULT_ADMISSION_MAX_LIMIT),
+            latency_threshold=self._get_int_option(
+                config, section, self.ADMISSION_LATENCY_THRESHOLD_CONFIG_PROP,
+                self.DEFAULT_ADMISSION_LATENCY_THRESHOLD) / 1000.0,
+            backoff_ratio=self._get_float_option(
+                config, section, self.ADMISSION_BACKOFF_RATIO_CONFIG_PROP,
+                self.DEFAULT_ADMISSION_BACKOFF_RATIO),
+            latency_thresholds=dict(
+                (lane, int(value) / 1000.0)
+                for lane, value in self._get_prefixed_options(
+                    config, section,
+                    self.ADMISSION_LANE_LATENCY_THRESHOLD_CONFIG_PREFIX).items()))
+        logger.info("Admission control enabled.")
+
+    @staticmethod
+    def _get_prefixed_options(config, section, prefix):
+        """
+        Returns the options within a section whose names start with the specified
+        prefix (the prefix is removed from the returned names)
+
+        :param config: The application configuration
+        :param section: The configuration section
+        :param prefix: The option name prefix
+        :return: A dictionary of option values by (unprefixed) name
+        """
+        if not config.has_section(section):
+            return {}
+        prefix = prefix.lower()
+        return dict((name[len(prefix):], value)
+                    for name, value in config.items(section)
+                    if name.lower().startswith(prefix))
+
+    @staticmethod
+    def _parse_rate_limit(value):
+        """
+        Parses a rate limit specified as "rate[,burst]"
+
+        :param value: The rate limit string
+        :return: A ``(rate, burst)`` tuple (the burst defaults to the rate)
+        """
+        parts = [part.strip() for part in value.split(",")]
+        rate = float(parts[0])
+        burst = float(parts[1]) if len(parts) > 1 else max(1.0, rate)
+        return rate, burst
+
+    def _load_rate_limit_configuration(self, config):
+        """
+        Creates the rate limiter if limits are specified in the configuration
+
+        :param config: The application configuration
+        """
+        section = self.RATE_LIMIT_CONFIG_SECTION
+        if not config.has_section(section):
+            return
+
+        default_limit = self._parse_rate_limit(
+            self._get_option(config, section,
+                             self.RATE_LIMIT_DEFAULT_CONFIG_PROP, "0"))
+        client_limits = dict(
+            (name, self._parse_rate_limit(value)) for name, value in
+            self._get_prefixed_options(
+                config, section, self.RATE_LIMIT_CLIENT_CONFIG_PREFIX).items())
+        command_limits = dict(
+            (name, self._parse_rate_limit(value)) for name, value in
+            self._get_prefixed_options(
+                config, section, self.RATE_LIMIT_COMMAND_CONFIG_PREFIX).items())
+
+        self._rate_limiter = _RateLimiter(default_limit, client_limits,
+                                          command_limits)
+        logger.info("Rate limiting enabled.")
+
+    def _load_dispatch_configuration(self, config):
+        """
+        Creates the request dispatcher if it is enabled in the configuration
+
+        :param config: The application configuration
+        """
+        section = self.DISPATCH_CONFIG_SECTION
+        thread_count = self._get_int_option(
+            config, section, self.DISPATCH_THREAD_COUNT_CONFIG_PROP,
+            self.DEFAULT_DISPATCH_THREAD_COUNT)
+        queue_size = self._get_int_option(
+            config, section, self.DISPATCH_QUEUE_SIZE_CONFIG_PROP,
+            self.DEFAULT_DISPATCH_QUEUE_SIZE)
+        default_weight = self._get_int_option(
+            config, section, self.DISPATCH_DEFAULT_WEIGHT_CONFIG_PROP,
+            self.DEFAULT_DISPATCH_WEIGHT)
+        weights = dict(
+            (name, int(value)) for name, value in
+            self._get_prefixed_options(
+                config, section, self.DISPATCH_WEIGHT_CONFIG_PREFIX).items())
+
+        # Additional lanes (each with its own queue and threads)
+        lanes = []
+        command_patterns = []
+        for lane_name in self._get_list_option(
+                config, section, self.DISPATCH_LANES_CONFIG_PROP, []):
+            lane = _Lane(
+                name=lane_name,
+                thread_count=config.getint(
+                    lane_name, self.DISPATCH_THREAD_COUNT_CONFIG_PROP),
+                queue_size=self._get_int_option(
+                    config, lane_name, self.DISPATCH_QUEUE_SIZE_CONFIG_PROP,
+                    queue_size),
+                default_weight=default_weight,
+                weights=weights,
+                max_thread_count=self._get_int_option(
+                    config, lane_name,
+                    self.DISPATCH_MAX_THREAD_COUNT_CONFIG_PROP))
+            lanes.append(lane)
+            command_patterns.extend(
+                (command, lane) for command in self._get_list_option(
+                    config, lane_name, self.LANE_COMMANDS_CONFIG_PROP, []))
+            logger.info("Request lane '%s' configuration: threadCount=%d, "
+                        "maxThreadCount=%d", lane_name, lane.thread_count,
+                        lane.max_thread_count)
+
+        if thread_count <= 0 and not lanes:
+            return
+
+        default_lane = None
+        if thread_count > 0:
+            default_lane = _Lane(
+                name=self.DEFAULT_LANE_NAME,
+                thread_count=thread_count,
+                queue_size=queue_size,
+                default_weight=default_weight,
+                weights=weights,
+                max_thread_count=self._get_int_option(
+                    config, section,
+                    self.DISPATCH_MAX_THREAD_COUNT_CONFIG_PROP))
+
+        self._dispatcher = _Dispatcher(default_lane, lanes, command_patterns)
+        self._pool_sizer = _PoolSizer(
+            self._dispatcher.lanes,
+            self._get_int_option(config, section,
+                                 self.DISPATCH_SIZING_INTERVAL_CONFIG_PROP,
+                                 self.DEFAULT_DISPATCH_SIZING_INTERVAL))
+        logger.info("Request dispatch configuration: threadCount=%d, "
+                    "maxThreadCount=%d", thread_count,
+                    default_lane.max_thread_count if default_lane else 0)
+
+    def _load_jobs_configuration(self, config):
+        """
+        Creates the job manager if jobs are enabled in the configuration
+
+        :param config: The application configuration
+        """
+        section = self.JOBS_CONFIG_SECTION
+        if not self._get_boolean_option(config, section,
+                                        self.JOBS_ENABLED_CONFIG_PROP):
+            return
+
+        thread_count = self._get_int_option(
+            config, section, self.JOBS_THREAD_COUNT_CONFIG_PROP,
+            self.DEFAULT_JOBS_THREAD_COUNT)
+        self._job_manager = _JobManager(
+            thread_count=thread_count,
+            queue_size=self._get_int_option(
+                config, section, self.JOBS_QUEUE_SIZE_CONFIG_PROP,
+                self.DEFAULT_JOBS_QUEUE_SIZE),
+            chunk_size=self._get_int_option(
+                config, section, self.JOBS_CHUNK_SIZE_CONFIG_PROP,
+                self.DEFAULT_JOBS_CHUNK_SIZE),
+            retention=self._get_int_option(
+                config, section, self.JOBS_RETENTION_CONFIG_PROP,
+                self.DEFAULT_JOBS_RETENTION),
+            max_retained_count=self._get_int_option(
+                config, section, self.JOBS_MAX_RETAINED_COUNT_CONFIG_PROP,
+                self.DEFAULT_JOBS_MAX_RETAINED_COUNT),
+            max_retained_size=self._get_int_option(
+                config, section, self.JOBS_MAX_RETAINED_SIZE_CONFIG_PROP,
+                self.DEFAULT_JOBS_MAX_RETAINED_SIZE),
+            in_flight=self._in_flight,
+            status_topic=self._get_instance_topic(self.DXL_JOB_STATUS_TOPIC),
+            cancel_topic=self._get_instance_topic(self.DXL_JOB_CANCEL_TOPIC))
+        logger.info("Job configuration: threadCount=%d", thread_count)
+
+    def _load_idempotency_configuration(self, config):
+        """
+        Creates the idempotency cache if it is enabled in the configuration
+
+        :param config: The application configuration
+        """
+        section = self.IDEMPOTENCY_CONFIG_SECTION
+        if not self._get_boolean_option(config, section,
+                                        self.IDEMPOTENCY_ENABLED_CONFIG_PROP):
+            return
+
+        self._idempotency_cache = _IdempotencyCache(
+            max_entries=self._get_int_option(
+                config, section, self.IDEMPOTENCY_MAX_ENTRIES_CONFIG_PROP,
+                self.DEFAULT_IDEMPOTENCY_MAX_ENTRIES),
+            ttl=self._get_int_option(
+                config, section, self.IDEMPOTENCY_TTL_CONFIG_PROP,
+                self.DEFAULT_IDEMPOTENCY_TTL))
+        logger.info("Idempotency keys enabled.")
+        if self._worker_id is not None:
+            logger.warning(
+                "Idempotency keys are only recognized by the worker process "
+                "that received the original request")
+
+    def _load_catalog_configuration(self, config):
+        """
+        Creates the catalog manager if the command catalog is enabled in the
+        configuration
+
+        :param config: The application configuration
+        """
+        section = self.CATALOG_CONFIG_SECTION
+        if not self._get_boolean_option(config, section,
+                                        self.CATALOG_ENABLED_CONFIG_PROP):
+            return
+
+        self._catalog_manager = _CatalogManager(
+            self._epo_by_topic.values(),
+            refresh_interval=self._get_int_option(
+                config, section, self.CATALOG_REFRESH_INTERVAL_CONFIG_PROP,
+                self.DEFAULT_CATALOG_REFRESH_INTERVAL))
+        logger.info("Command catalog enabled.")
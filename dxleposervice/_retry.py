@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+import random
+
+from ._commands import _CommandPatterns
+
+
+class _RetryPolicy(object):
+    """
+    Determines whether (and when) a failed request to an ePO server is retried.
+
+    Retries are only performed for commands that match one of the configured
+    patterns (by default, read-only commands). The delay before each retry grows
+    exponentially up to a maximum, with full jitter, and no retry is performed
+    once the total time budget for the request would be exceeded.
+    """
+
+    # Patterns matching the read-only commands that are retried by default
+    DEFAULT_COMMANDS = _CommandPatterns.READ_ONLY
+
+    # HTTP status codes that indicate a transient failure
+    RETRY_STATUS_CODES = (502, 503, 504)
+
+    def __init__(self, max_attempts=3, initial_delay=0.1, max_delay=2.0,
+                 budget=10.0, commands=None, max_attempts_by_command=None):
+        """
+        Constructs the retry policy
+
+        :param max_attempts: The maximum number of attempts for a request
+            (including the first)
+        :param initial_delay: The maximum delay (in seconds) before the first retry
+        :param max_delay: The maximum delay (in seconds) before any retry
+        :param budget: The maximum time (in seconds) spent on a request, including
+            all of its attempts
+        :param commands: Patterns (:mod:`fnmatch`, case-insensitive) matching the
+            commands that are retried (defaults to read-only commands)
+        :param max_attempts_by_command: A dictionary that overrides the maximum
+            number of attempts for specific commands (optional)
+        """
+        self._max_attempts = max_attempts
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._budget = budget
+        self._commands = _CommandPatterns(
+            self.DEFAULT_COMMANDS if commands is None else commands)
+        self._max_attempts_by_command = dict(
+            (k.lower(), v) for k, v in (max_attempts_by_command or {}).items())
+
+    def get_max_attempts(self, command):
+        """
+        Returns the maximum number of attempts for the specified command
+
+        :param command: The command name
+        :return: The maximum number of attempts (``1`` if the command is not
+            retried)
+        """
+        max_attempts = self._max_attempts_by_command.get(command.lower())
+        if max_attempts is not None:
+            return max_attempts
+        return self._max_attempts if self._commands.matches(command) else 1
+
+    def get_delay(self, attempt, elapsed):
+        """
+        Returns the delay before the next attempt
+
+        :param attempt: The number of attempts made so far
+        :param elapsed: The time (in seconds) spent on the request so far
+        :return: The delay (in seconds), or ``None`` if the time budget does not
+            allow another attempt
+        """
+        delay = random.uniform(
+            0, min(self._max_delay, self._initial_delay * (2 ** (attempt - 1))))
+        if elapsed + delay >= self._budget:
+            return None
+        return delay
+
+    def is_retryable_status(self, status_code):
+        """
+        Returns whether the HTTP status code indicates a transient failure
+
+        :param status_code: The HTTP status code
+        :return: Whether the HTTP status code indicates a transient failure
+        """
+        return status_code in self.RETRY_STATUS_CODES
@@ -0,0 +1,57 @@
+from __future__ import absolute_import
+import logging
+import threading
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+class _PeriodicTask(object):
+    """
+    Invokes a function periodically on a background thread
+    """
+
+    def __init__(self, name, interval, func, run_immediately=True):
+        """
+        Constructs the task
+
+        :param name: The name of the task (used to name its thread)
+        :param interval: The time (in seconds) between invocations
+        :param func: The function to invoke
+        :param run_immediately: Whether the function is invoked as soon as the
+            task is started (otherwise after the first interval)
+        """
+        self._name = name
+        self._interval = interval
+        self._func = func
+        self._run_immediately = run_immediately
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the task
+        """
+        self._thread = threading.Thread(target=self._run,
+                                        name="EpoTask-" + self._name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the task (an invocation that is in progress is not interrupted)
+        """
+        self._stopped.set()
+
+    def _run(self):
+        """
+        Invokes the function until the task is stopped
+        """
+        if not self._run_immediately:
+            self._stopped.wait(self._interval)
+        while not self._stopped.is_set():
+            try:
+                self._func()
+            except Exception:
+                logger.exception("Error running task: %s", self._name)
+            self._stopped.wait(self._interval)
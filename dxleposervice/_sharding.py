@@ -0,0 +1,76 @@
+from __future__ import absolute_import
+import bisect
+import hashlib
+
+
+class _ShardSelector(object):
+    """
+    Assigns ePO servers to shards (service instances), so that each instance only
+    serves a subset of the ePO servers.
+
+    ePO servers are assigned using consistent hashing: each shard is placed at
+    several points on a hash ring, and an ePO server is assigned to the shard of
+    the first point at or after the hash of its name. When the number of shards
+    changes, only the ePO servers between the points of the added (or removed)
+    shard move. ePO servers can also be assigned to shards explicitly.
+    """
+
+    # The number of points on the hash ring per shard
+    POINTS_PER_SHARD = 100
+
+    def __init__(self, shard_count, shard_index, epo_names_by_shard=None):
+        """
+        Constructs the shard selector
+
+        :param shard_count: The number of shards
+        :param shard_index: The index of the shard of this instance (0 to shard
+            count - 1)
+        :param epo_names_by_shard: The names of the ePO servers explicitly
+            assigned to each shard (by shard index, optional)
+        """
+        if shard_count < 1:
+            raise ValueError("The shard count must be at least 1")
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(
+                "The shard index must be between 0 and {0}".format(
+                    shard_count - 1))
+        self._shard_count = shard_count
+        self._shard_index = shard_index
+        self._shard_by_epo_name = {}
+        for index, epo_names in (epo_names_by_shard or {}).items():
+            if not 0 <= index < shard_count:
+                raise ValueError(
+                    "Invalid shard index for ePO servers {0}: {1}".format(
+                        ",".join(epo_names), index))
+            for epo_name in epo_names:
+                self._shard_by_epo_name[epo_name] = index
+        self._ring = sorted(
+            (self._hash("{0}-{1}".format(index, point)), index)
+            for index in range(shard_count)
+            for point in range(self.POINTS_PER_SHARD))
+        self._ring_hashes = [point_hash for point_hash, _ in self._ring]
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:16], 16)
+
+    def get_shard(self, epo_name):
+        """
+        Returns the shard an ePO server is assigned to
+
+        :param epo_name: The name of the ePO server
+        :return: The index of the shard
+        """
+        if epo_name in self._shard_by_epo_name:
+            return self._shard_by_epo_name[epo_name]
+        position = bisect.bisect_left(self._ring_hashes, self._hash(epo_name))
+        return self._ring[position % len(self._ring)][1]
+
+    def selects(self, epo_name):
+        """
+        Returns whether an ePO server is served by this instance
+
+        :param epo_name: The name of the ePO server
+        :return: Whether the ePO server is assigned to the shard of this instance
+        """
+        return self.get_shard(epo_name) == self._shard_index
@@ -0,0 +1,92 @@
+from __future__ import absolute_import
+import json
+import logging
+import random
+
+from ._tracing import _SpanExporter
+
+# The logger that slow requests are logged to (so that they can be routed to a
+# separate file in the logging configuration)
+slow_logger = logging.getLogger("dxleposervice.slowrequests")
+
+
+def _summarize(params, max_length):
+    """
+    Returns a summary of request parameters that is at most the maximum length
+
+    :param params: The parameters
+    :param max_length: The maximum length of the summary
+    :return: The summary (``name=value`` pairs delimited by commas)
+    """
+    if not isinstance(params, dict):
+        summary = str(params)
+    else:
+        summary = ",".join("{0}={1}".format(name, params[name])
+                           for name in sorted(params))
+    if len(summary) > max_length:
+        summary = summary[:max(0, max_length - 3)] + "..."
+    return summary
+
+
+class _SlowRequestLog(_SpanExporter):
+    """
+    Logs requests that take longer than a threshold, with the sizes of their
+    payloads, a breakdown of the time spent in each phase (from the spans of
+    their traces) and a summary of their parameters.
+
+    Each entry is a single line of JSON logged to the
+    ``dxleposervice.slowrequests`` logger. Only a sample of the slow requests is
+    logged (if a sample rate is specified), so that the log can be left enabled
+    when many requests are slow.
+    """
+
+    def __init__(self, threshold, sample_rate=1.0, max_param_length=200):
+        """
+        Constructs the log
+
+        :param threshold: The duration (in seconds) from which requests are
+            logged
+        :param sample_rate: The fraction of slow requests that are logged
+        :param max_param_length: The maximum length of the parameter summary
+        """
+        self._threshold = threshold
+        self._sample_rate = sample_rate
+        self._max_param_length = max_param_length
+
+    def export(self, spans):
+        root = spans[-1]
+        if root.duration < self._threshold or \
+                random.random() >= self._sample_rate:
+            return
+        slow_logger.warning("Slow request: %s", json.dumps(self.to_entry(spans)))
+
+    def to_entry(self, spans):
+        """
+        Returns the log entry for a request
+
+        :param spans: The spans of the trace of the request (the root span is
+            the last span)
+        :return: The entry (a dictionary)
+        """
+        root = spans[-1]
+        phases = {}
+        for span in spans[:-1]:
+            phases[span.name] = phases.get(span.name, 0) + span.duration
+        attributes = root.attributes
+        entry = {
+            "epo": attributes.get("epo.name"),
+            "command": attributes.get("epo.command"),
+            "durationMs": int(root.duration * 1000),
+            "requestSize": attributes.get("dxl.payload_size"),
+            "responseSize": attributes.get("epo.result_size"),
+            "phasesMs": dict((name, int(duration * 1000))
+                             for name, duration in phases.items()),
+            "clientId": attributes.get("dxl.client_id"),
+            "traceId": root.trace_id
+        }
+        if "error.code" in attributes:
+            entry["errorCode"] = attributes["error.code"]
+        if "epo.params" in root.details:
+            entry["params"] = _summarize(root.details["epo.params"],
+                                         self._max_param_length)
+        return entry
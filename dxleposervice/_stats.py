@@ -0,0 +1,196 @@
+from __future__ import absolute_import
+import json
+import logging
+import os
+import threading
+
+from dxlclient.callbacks import RequestCallback
+from dxlclient.message import ErrorResponse, Response
+
+from ._scheduler import _PeriodicTask
+
+try: #Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError: #Python 2.7
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+# The content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _StatsRequestCallback(RequestCallback):
+    """
+    Request callback used to handle requests for the metrics of the service.
+    The metrics are returned as JSON (or in the Prometheus text exposition
+    format if requested).
+    """
+
+    # UTF-8 encoding (used for encoding/decoding payloads)
+    UTF_8 = "utf-8"
+
+    # The key in the request used to specify the format of the metrics
+    # ("json" or "prometheus"). This is optional
+    FORMAT_KEY = "format"
+    # The format value used to request the Prometheus text exposition format
+    PROMETHEUS_FORMAT = "prometheus"
+
+    def __init__(self, client, registry, worker_id=None, instance_topic=None):
+        """
+        Constructs the callback
+
+        :param client: The DXL client associated with the service
+        :param registry: The metrics registry
+        :param worker_id: The identifier of the worker process (optional)
+        :param instance_topic: The topic used to request the metrics of this
+            service instance (optional)
+        """
+        super(_StatsRequestCallback, self).__init__()
+        self._dxl_client = client
+        self._registry = registry
+        self._worker_id = worker_id
+        self._instance_topic = instance_topic
+
+    def on_request(self, request):
+        """
+        Invoked when a request is received
+
+        :param request: The request that was received
+        """
+        try:
+            req_dict = {}
+            if request.payload:
+                req_dict = json.loads(request.payload.decode(
+                    encoding=self.UTF_8))
+
+            response = Response(request)
+            if req_dict.get(self.FORMAT_KEY) == self.PROMETHEUS_FORMAT:
+                response.payload = self._registry.to_prometheus_text()
+            else:
+                result = self._registry.to_dict()
+                if self._worker_id is not None:
+                    result["worker"] = self._worker_id
+                if self._instance_topic is not None:
+                    result["topic"] = self._instance_topic
+                response.payload = json.dumps(result)
+            self._dxl_client.send_response(response)
+
+        except Exception as ex:
+            logger.exception("Error while processing stats request")
+            self._dxl_client.send_response(
+                ErrorResponse(request, error_code=0,
+                              error_message=str(ex).encode(
+                                  encoding=self.UTF_8)))
+
+
+class _MetricsHttpServer(object):
+    """
+    Serves the metrics of the service in the Prometheus text exposition format
+    over HTTP (at any path)
+    """
+
+    def __init__(self, registry, port, address="127.0.0.1"):
+        """
+        Constructs the server
+
+        :param registry: The metrics registry
+        :param port: The port to listen on
+        :param address: The address to listen on (optional, defaults to the
+            loopback address)
+        """
+        self._registry = registry
+        self._port = port
+        self._address = address
+        self._server = None
+
+    @property
+    def port(self):
+        """
+        The port the server is listening on
+        """
+        return self._server.server_address[1] if self._server else self._port
+
+    def start(self):
+        """
+        Starts serving the metrics on a background thread
+        """
+        registry = self._registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self): # pylint: disable=invalid-name
+                body = registry.to_prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, msg_format, *args):
+                logger.debug("Metrics request: " + msg_format, *args)
+
+        self._server = HTTPServer((self._address, self._port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  name="EpoMetricsHttp")
+        thread.daemon = True
+        thread.start()
+        logger.info("Serving metrics on %s:%d", self._address, self.port)
+
+    def shutdown(self):
+        """
+        Stops serving the metrics
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class _MetricsFileWriter(object):
+    """
+    Periodically writes the metrics of the service to a file in the Prometheus
+    text exposition format (for example, for the node exporter's textfile
+    collector). The file is replaced atomically.
+    """
+
+    def __init__(self, registry, path, interval):
+        """
+        Constructs the writer
+
+        :param registry: The metrics registry
+        :param path: The path of the file
+        :param interval: The time (in seconds) between writes
+        """
+        self._registry = registry
+        self._path = path
+        self._task = _PeriodicTask("metrics-file", interval, self.write)
+
+    def start(self):
+        """
+        Starts writing the metrics
+        """
+        self._task.start()
+
+    def shutdown(self):
+        """
+        Stops writing the metrics (the metrics are written a final time)
+        """
+        self._task.stop()
+        try:
+            self.write()
+        except Exception:
+            logger.exception("Error writing metrics file: %s", self._path)
+
+    def write(self):
+        """
+        Writes the metrics to the file
+        """
+        temp_path = self._path + ".tmp"
+        with open(temp_path, "w") as metrics_file:
+            metrics_file.write(self._registry.to_prometheus_text())
+        if hasattr(os, "replace"):
+            os.replace(temp_path, self._path)
+        else:
+            if os.path.exists(self._path) and os.name == "nt":
+                os.remove(self._path)
+            os.rename(temp_path, self._path)
@@ -0,0 +1,185 @@
+from __future__ import absolute_import
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+try: #Python 3
+    from configparser import ConfigParser
+except ImportError: #Python 2.7
+    from ConfigParser import ConfigParser
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+
+# The worker settings, the worker processes (with their start times) and the
+# stop and restart requests are managed together by the supervisor loop
+class _Supervisor(object): # pylint: disable=too-many-instance-attributes
+    """
+    Runs the service in multiple worker processes (so that request processing is
+    not limited to a single CPU core by the GIL). Each worker runs its own
+    application (and DXL client), and registers the same service type, so the
+    DXL fabric load-balances requests across the workers.
+
+    Workers that exit unexpectedly are restarted. When the supervisor is stopped,
+    every worker is asked to shut down (via ``SIGTERM``) and is killed if it has
+    not exited within the shutdown timeout. When a rolling restart is requested,
+    the workers are restarted one at a time (each worker drains its requests
+    while the other workers continue to serve requests).
+    """
+
+    # The time (in seconds) between checks of the workers
+    CHECK_INTERVAL = 1.0
+    # The minimum time (in seconds) between restarts of a worker
+    RESTART_DELAY = 5.0
+    # The time (in seconds) a restarted worker is given to start before the next
+    # worker is restarted (during a rolling restart)
+    ROLLING_RESTART_DELAY = 10.0
+
+    def __init__(self, config_dir, config_file, worker_count, target,
+                 shutdown_timeout=30.0):
+        """
+        Constructs the supervisor
+
+        :param config_dir: The location of the configuration files for the
+            application
+        :param config_file: The name of the application configuration file
+        :param worker_count: The number of worker processes
+        :param target: The function that runs the application in a worker
+            process (invoked with the configuration directory and the worker
+            identifier)
+        :param shutdown_timeout: The time (in seconds) workers are given to shut
+            down before they are killed
+        """
+        self._config_dir = config_dir
+        self._config_file = config_file
+        self._worker_count = worker_count
+        self._target = target
+        self._shutdown_timeout = shutdown_timeout
+        self._workers = {}
+        self._started = {}
+        self._stopped = threading.Event()
+        self._restart_requested = threading.Event()
+
+    def _validate_config(self):
+        """
+        Validates that the application configuration file can be read (so that
+        the workers do not fail repeatedly)
+        """
+        config_path = os.path.join(self._config_dir, self._config_file)
+        if not os.access(config_path, os.R_OK):
+            raise Exception(
+                "Unable to access configuration file: {0}".format(config_path))
+        ConfigParser().read(config_path)
+
+    def _start_worker(self, worker_id):
+        """
+        Starts a worker process
+
+        :param worker_id: The identifier of the worker (0 to worker count - 1)
+        """
+        process = multiprocessing.Process(
+            target=self._target, args=(self._config_dir, worker_id),
+            name="EpoWorker-{0}".format(worker_id))
+        process.start()
+        self._workers[worker_id] = process
+        self._started[worker_id] = time.time()
+        logger.info("Started worker %d (pid %d)", worker_id, process.pid)
+
+    def run(self):
+        """
+        Starts the workers and supervises them until the supervisor is stopped
+        """
+        self._validate_config()
+        logger.info("Starting %d workers ...", self._worker_count)
+        for worker_id in range(self._worker_count):
+            self._start_worker(worker_id)
+        try:
+            while not self._stopped.wait(self.CHECK_INTERVAL):
+                if self._restart_requested.is_set():
+                    self._restart_requested.clear()
+                    self._rolling_restart()
+                for worker_id, process in list(self._workers.items()):
+                    if process.is_alive():
+                        continue
+                    if time.time() - self._started[worker_id] < \
+                            self.RESTART_DELAY:
+                        continue
+                    logger.warning(
+                        "Worker %d (pid %d) exited with code %s, restarting ...",
+                        worker_id, process.pid, process.exitcode)
+                    self._start_worker(worker_id)
+        finally:
+            self._shutdown()
+
+    def restart(self):
+        """
+        Requests a rolling restart of the workers
+        """
+        self._restart_requested.set()
+
+    def signal_workers(self, signum):
+        """
+        Sends a signal to the running workers
+
+        :param signum: The signal number
+        """
+        for process in list(self._workers.values()):
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    def _rolling_restart(self):
+        """
+        Restarts the workers one at a time
+        """
+        logger.info("Restarting workers ...")
+        for worker_id in sorted(self._workers):
+            if self._stopped.is_set():
+                return
+            process = self._workers[worker_id]
+            if process.is_alive():
+                process.terminate()
+            self._join_worker(worker_id, process,
+                              time.time() + self._shutdown_timeout)
+            self._start_worker(worker_id)
+            self._stopped.wait(self.ROLLING_RESTART_DELAY)
+        logger.info("Workers restarted.")
+
+    def _join_worker(self, worker_id, process, deadline):
+        """
+        Waits for a worker to exit (it is killed if it has not exited by the
+        deadline)
+
+        :param worker_id: The identifier of the worker
+        :param process: The worker process
+        :param deadline: The time the worker is killed at
+        """
+        process.join(max(0, deadline - time.time()))
+        if process.is_alive():
+            logger.warning("Worker %d (pid %d) did not exit, killing ...",
+                           worker_id, process.pid)
+            os.kill(process.pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            process.join()
+
+    def stop(self):
+        """
+        Stops the supervisor (the workers are shut down)
+        """
+        self._stopped.set()
+
+    def _shutdown(self):
+        """
+        Shuts down the workers (workers that do not exit within the shutdown
+        timeout are killed)
+        """
+        logger.info("Stopping workers ...")
+        for process in self._workers.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.time() + self._shutdown_timeout
+        for worker_id, process in self._workers.items():
+            self._join_worker(worker_id, process, deadline)
+        logger.info("Workers stopped.")
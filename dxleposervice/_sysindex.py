@@ -0,0 +1,443 @@
+from __future__ import absolute_import
+import json
+import logging
+import re
+import threading
+
+from ._metrics import registry
+from ._scheduler import _PeriodicTask
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+# The number of system searches answered (or not) by the system index
+_lookups_counter = registry.counter(
+    "sysindex_lookups_total",
+    "The number of system.find requests answered (hit) or not answered "
+    "(miss, stale) by the system index",
+    ("epo", "result"))
+
+
+# Each lookup (by identifier or by trigram) has its own index
+class _SystemIndex(object): # pylint: disable=too-many-instance-attributes
+    """
+    An in-memory index of the systems in the System Tree of an ePO server, used to
+    answer ``system.find`` requests locally.
+
+    Search text is matched (case-insensitively, as a substring, like ePO)
+    against the searched properties of each system, using a trigram index to
+    find the candidates. Search text that is a complete agent GUID or MAC
+    address is also looked up in hash indexes, so that systems are found
+    regardless of the notation of the identifier (braces, delimiters).
+    Search text shorter than a trigram, and search text that does not match any
+    system (the system may have been added since the index was built), is not
+    answered by the index.
+    """
+
+    # The properties of a system record that are indexed
+    NAME_PROPERTY = "EPOComputerProperties.ComputerName"
+    IP_PROPERTY = "EPOComputerProperties.IPAddress"
+    MAC_PROPERTY = "EPOComputerProperties.NetAddress"
+    GUID_PROPERTY = "EPOLeafNode.AgentGUID"
+
+    # The properties of a system record that are matched against the search text
+    # (by default)
+    DEFAULT_SEARCH_PROPERTIES = [
+        NAME_PROPERTY, "EPOComputerProperties.IPHostName", IP_PROPERTY,
+        MAC_PROPERTY, GUID_PROPERTY, "EPOComputerProperties.UserName",
+        "EPOLeafNode.Tags"]
+
+    # Matches complete agent GUIDs (optionally enclosed in braces)
+    GUID_PATTERN = re.compile(r"^\{?[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}\}?$")
+    # Matches complete MAC addresses (optionally delimited by colons or dashes)
+    MAC_PATTERN = re.compile(r"^[0-9a-f]{2}([:\-]?[0-9a-f]{2}){5}$")
+
+    def __init__(self, records, search_properties=None):
+        """
+        Constructs the index
+
+        :param records: The system records (dictionaries)
+        :param search_properties: The properties of a system record that are
+            matched against the search text (optional)
+        """
+        self._search_properties = search_properties or \
+            self.DEFAULT_SEARCH_PROPERTIES
+        self._records = {}
+        self._ids_by_mac = {}
+        self._ids_by_guid = {}
+        self._ids_by_trigram = {}
+        self._name_ids_by_trigram = {}
+        self._values_by_id = {}
+        self._next_id = 0
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def _normalize_guid(guid):
+        return guid.strip().strip("{}").lower()
+
+    @staticmethod
+    def _normalize_mac(mac):
+        return mac.strip().replace(":", "").replace("-", "").lower()
+
+    @staticmethod
+    def _trigrams(text):
+        return set(text[index:index + 3] for index in range(len(text) - 2))
+
+    @staticmethod
+    def _get_text(record, name):
+        value = record.get(name)
+        return u"" if value is None else u"{0}".format(value).lower()
+
+    def _find_id(self, record):
+        """
+        Returns the identifier of the indexed record for the same system (by
+        agent GUID)
+
+        :param record: The system record
+        :return: The identifier (or ``None`` if the system is not indexed)
+        """
+        guid = self._get_text(record, self.GUID_PROPERTY)
+        if guid:
+            ids = self._ids_by_guid.get(self._normalize_guid(guid))
+            if ids:
+                return next(iter(ids))
+        return None
+
+    def _get_index_keys(self, record):
+        """
+        Returns the keys of a system record in each index
+
+        :param record: The system record
+        :return: A list of (index, key) tuples
+        """
+        keys = []
+        for index, name, normalize in (
+                (self._ids_by_mac, self.MAC_PROPERTY, self._normalize_mac),
+                (self._ids_by_guid, self.GUID_PROPERTY, self._normalize_guid)):
+            value = self._get_text(record, name)
+            if value:
+                keys.append((index, normalize(value)))
+        for name in self._search_properties:
+            for trigram in self._trigrams(self._get_text(record, name)):
+                keys.append((self._ids_by_trigram, trigram))
+        for trigram in self._trigrams(self._get_text(record,
+                                                     self.NAME_PROPERTY)):
+            keys.append((self._name_ids_by_trigram, trigram))
+        return keys
+
+    def add(self, record):
+        """
+        Adds a system record to the index (replacing the indexed record for the
+        same system)
+
+        :param record: The system record
+        """
+        record_id = self._find_id(record)
+        if record_id is not None:
+            self._remove(record_id)
+        else:
+            record_id = self._next_id
+            self._next_id += 1
+        self._records[record_id] = record
+        self._values_by_id[record_id] = [
+            self._get_text(record, name) for name in self._search_properties]
+        for index, key in self._get_index_keys(record):
+            index.setdefault(key, set()).add(record_id)
+
+    def _remove(self, record_id):
+        """
+        Removes a record from the index
+
+        :param record_id: The identifier of the record
+        """
+        record = self._records.pop(record_id)
+        del self._values_by_id[record_id]
+        for index, key in self._get_index_keys(record):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del index[key]
+
+    def get(self, mac=None, guid=None):
+        """
+        Returns the systems that exactly match an identifier
+
+        :param mac: The MAC address of the system
+        :param guid: The agent GUID of the system
+        :return: The system records
+        """
+        if mac is not None:
+            ids = self._ids_by_mac.get(self._normalize_mac(mac))
+        elif guid is not None:
+            ids = self._ids_by_guid.get(self._normalize_guid(guid))
+        else:
+            ids = None
+        return [self._records[record_id] for record_id in sorted(ids or [])]
+
+    def find(self, search_text, name_only=False):
+        """
+        Returns the systems matching the search text of a ``system.find``
+        request
+
+        :param search_text: The search text
+        :param name_only: Whether the search text is only matched against the
+            names of the systems
+        :return: The matching system records (or ``None`` if the search cannot
+            be answered by the index)
+        """
+        text = search_text.strip().lower()
+        if len(text) < 3:
+            return None
+        ids = set()
+        if not name_only and self.GUID_PATTERN.match(text):
+            ids.update(self._ids_by_guid.get(self._normalize_guid(text), ()))
+        elif not name_only and self.MAC_PATTERN.match(text):
+            ids.update(self._ids_by_mac.get(self._normalize_mac(text), ()))
+        trigram_index = self._name_ids_by_trigram if name_only \
+            else self._ids_by_trigram
+        candidates = None
+        for trigram in self._trigrams(text):
+            trigram_ids = trigram_index.get(trigram, set())
+            candidates = trigram_ids if candidates is None \
+                else candidates & trigram_ids
+            if not candidates:
+                break
+        for record_id in candidates or ():
+            if name_only:
+                values = [self._get_text(self._records[record_id],
+                                         self.NAME_PROPERTY)]
+            else:
+                values = self._values_by_id[record_id]
+            if any(text in value for value in values):
+                ids.add(record_id)
+        return [self._records[record_id] for record_id in sorted(ids)] or None
+
+
+# The export settings are kept with the indexes they build and the tasks that
+# refresh them
+class _SystemIndexManager(object): # pylint: disable=too-many-instance-attributes
+    """
+    Builds (and periodically rebuilds) the system index of each ePO server from
+    a bulk export of the System Tree, and answers ``system.find`` requests from
+    the indexes.
+
+    The index of an ePO server is updated with the results of the
+    ``system.find`` requests that are not answered locally. After a mutating
+    ``system`` command is invoked, the index is not used until it has been
+    rebuilt (indexes are rebuilt shortly after, so that the rebuilds for a
+    series of commands are combined).
+    """
+
+    # The command answered by the index
+    FIND_COMMAND = "system.find"
+    # The parameters of the command
+    SEARCH_TEXT_PARAM = "searchText"
+    SEARCH_NAME_ONLY_PARAM = "searchNameOnly"
+    # The namespace of the commands that may modify the System Tree
+    SYSTEM_NAMESPACE = "system."
+
+    # The command (and its parameters) used to export the System Tree (by
+    # default)
+    DEFAULT_EXPORT_COMMAND = "system.find"
+    DEFAULT_EXPORT_PARAMS = {"searchText": ""}
+
+    def __init__(self, refresh_interval, rebuild_delay=30, export_command=None,
+                 export_params=None, search_properties=None):
+        """
+        Constructs the system index manager
+
+        :param refresh_interval: The time (in seconds) between index rebuilds
+        :param rebuild_delay: The maximum time (in seconds) after a mutating
+            command is invoked before the index is rebuilt
+        :param export_command: The command used to export the System Tree
+            (optional)
+        :param export_params: The parameters of the export command (optional)
+        :param search_properties: The properties of a system record that are
+            matched against the search text (optional)
+        """
+        self._epos = []
+        self._export_command = export_command or self.DEFAULT_EXPORT_COMMAND
+        self._export_params = self.DEFAULT_EXPORT_PARAMS \
+            if export_params is None else export_params
+        self._search_properties = search_properties
+        self._indexes = {}
+        # The ePO servers whose index is out of date (with the number of times
+        # the index has been marked as out of date)
+        self._stale = {}
+        self._lock = threading.Lock()
+        self._task = _PeriodicTask("system-index", refresh_interval, self.refresh)
+        self._rebuild_task = _PeriodicTask("system-index-rebuild", rebuild_delay,
+                                           self.rebuild_stale,
+                                           run_immediately=False)
+
+    def add(self, epo):
+        """
+        Adds an ePO server whose System Tree is indexed
+
+        :param epo: The ePO server wrapper
+        """
+        self._epos.append(epo)
+
+    def start(self):
+        """
+        Starts building (and periodically rebuilding) the indexes
+        """
+        self._task.start()
+        self._rebuild_task.start()
+
+    def shutdown(self):
+        """
+        Stops rebuilding the indexes
+        """
+        self._task.stop()
+        self._rebuild_task.stop()
+
+    def refresh(self):
+        """
+        Builds the index of each ePO server (the previous index of an ePO server
+        is retained if the export fails)
+        """
+        for epo in self._epos:
+            self.build(epo)
+
+    def rebuild_stale(self):
+        """
+        Rebuilds the indexes that are out of date
+        """
+        with self._lock:
+            stale = set(self._stale)
+        for epo in self._epos:
+            if epo.name in stale:
+                self.build(epo)
+
+    def build(self, epo):
+        """
+        Builds the index of an ePO server
+
+        :param epo: The ePO server wrapper
+        """
+        with self._lock:
+            stale = self._stale.get(epo.name)
+        try:
+            records = json.loads(epo.execute(
+                self._export_command, "json",
+                dict(self._export_params), use_local=False))
+        except Exception as ex:
+            logger.warning(
+                "Unable to export System Tree for ePO server '%s': %s",
+                epo.name, ex)
+            return
+        if not isinstance(records, list):
+            logger.warning(
+                "Unexpected System Tree export result for ePO server: %s",
+                epo.name)
+            return
+        index = _SystemIndex(
+            [record for record in records if isinstance(record, dict)],
+            self._search_properties)
+        with self._lock:
+            self._indexes[epo.name] = index
+            # The index remains out of date if a mutating command was invoked
+            # during the export
+            if self._stale.get(epo.name) == stale:
+                self._stale.pop(epo.name, None)
+        logger.info("Indexed %d systems for ePO server: %s", len(index),
+                    epo.name)
+
+    def get(self, epo_name):
+        """
+        Returns the index of an ePO server
+
+        :param epo_name: The name of the ePO server
+        :return: The index (or ``None`` if it has not been built)
+        """
+        with self._lock:
+            return self._indexes.get(epo_name)
+
+    def invalidate(self, epo_name, command):
+        """
+        Marks the index of an ePO server as out of date if a mutating command may
+        have modified its System Tree (the index is not used until it has been
+        rebuilt)
+
+        :param epo_name: The name of the ePO server
+        :param command: The mutating command
+        """
+        if not command.lower().startswith(self.SYSTEM_NAMESPACE):
+            return
+        with self._lock:
+            self._stale[epo_name] = self._stale.get(epo_name, 0) + 1
+
+    def is_answerable(self, command, req_params):
+        """
+        Returns whether a request may be answered by an index
+
+        :param command: The command
+        :param req_params: The parameters of the request
+        :return: Whether the request may be answered by an index
+        """
+        return command.lower() == self.FIND_COMMAND and \
+            self.SEARCH_TEXT_PARAM in req_params and \
+            set(req_params) <= set([self.SEARCH_TEXT_PARAM,
+                                    self.SEARCH_NAME_ONLY_PARAM])
+
+    def find(self, epo_name, command, req_params):
+        """
+        Answers a ``system.find`` request from the index of an ePO server
+
+        :param epo_name: The name of the ePO server
+        :param command: The command
+        :param req_params: The parameters of the request
+        :return: The result of the command in JSON format (or ``None`` if the
+            request cannot be answered by the index)
+        """
+        if not self.is_answerable(command, req_params):
+            return None
+        with self._lock:
+            index = self._indexes.get(epo_name)
+            stale = epo_name in self._stale
+        if index is None:
+            return None
+        if stale:
+            _lookups_counter.inc(epo=epo_name, result="stale")
+            return None
+        name_only = u"{0}".format(
+            req_params.get(self.SEARCH_NAME_ONLY_PARAM, "")).lower() in \
+            ("true", "1")
+        with self._lock:
+            records = index.find(
+                u"{0}".format(req_params[self.SEARCH_TEXT_PARAM]), name_only)
+        if records is None:
+            _lookups_counter.inc(epo=epo_name, result="miss")
+            return None
+        _lookups_counter.inc(epo=epo_name, result="hit")
+        return json.dumps(records)
+
+    def update(self, epo_name, result):
+        """
+        Updates the index of an ePO server with the result of a ``system.find``
+        request that was not answered by the index
+
+        :param epo_name: The name of the ePO server
+        :param result: The result of the request (in JSON format)
+        """
+        with self._lock:
+            index = self._indexes.get(epo_name)
+        if index is None:
+            return
+        try:
+            records = json.loads(result)
+        except ValueError:
+            return
+        if not isinstance(records, list):
+            return
+        with self._lock:
+            for record in records:
+                if isinstance(record, dict) and \
+                        record.get(_SystemIndex.GUID_PROPERTY):
+                    index.add(record)
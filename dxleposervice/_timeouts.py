@@ -0,0 +1,43 @@
+from __future__ import absolute_import
+
+
+class _TimeoutPolicy(object):
+    """
+    Determines the connect and read timeouts for requests to an ePO server.
+    Each timeout can be overridden for specific commands.
+    """
+
+    def __init__(self, connect_timeout=10.0, read_timeout=300.0,
+                 connect_timeouts_by_command=None, read_timeouts_by_command=None):
+        """
+        Constructs the timeout policy
+
+        :param connect_timeout: The time (in seconds) to wait for a connection to
+            the ePO server to be established
+        :param read_timeout: The time (in seconds) to wait for the ePO server to
+            send data
+        :param connect_timeouts_by_command: A dictionary that overrides the connect
+            timeout for specific commands (optional)
+        :param read_timeouts_by_command: A dictionary that overrides the read
+            timeout for specific commands (optional)
+        """
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._connect_timeouts_by_command = dict(
+            (k.lower(), v) for k, v in
+            (connect_timeouts_by_command or {}).items())
+        self._read_timeouts_by_command = dict(
+            (k.lower(), v) for k, v in (read_timeouts_by_command or {}).items())
+
+    def get_timeout(self, command):
+        """
+        Returns the timeouts for the specified command
+
+        :param command: The command name
+        :return: A ``(connect timeout, read timeout)`` tuple (in seconds), as
+            expected by the ``timeout`` argument of :mod:`requests`
+        """
+        command = command.lower()
+        return (self._connect_timeouts_by_command.get(
+                    command, self._connect_timeout),
+                self._read_timeouts_by_command.get(command, self._read_timeout))
@@ -0,0 +1,466 @@
+from __future__ import absolute_import
+import contextlib
+import importlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from ._metrics import registry
+
+try: #Python 3
+    import queue
+except ImportError: #Python 2.7
+    import Queue as queue
+
+# Configure local logger
+logger = logging.getLogger(__name__)
+
+# The number of spans dropped because the export queue was full
+_dropped_counter = registry.counter(
+    "tracing_dropped_spans_total",
+    "The number of spans dropped because the export queue was full")
+
+# The format of W3C trace context ("traceparent") values
+_TRACEPARENT_PATTERN = re.compile(
+    r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def _new_id(length):
+    """
+    Returns a random identifier
+
+    :param length: The length of the identifier (in hexadecimal characters)
+    :return: The identifier
+    """
+    return "{0:0{1}x}".format(random.getrandbits(length * 4), length)
+
+
+# The public attributes are the exported fields of the span (the root span
+# also holds the state of its trace)
+class _Span(object): # pylint: disable=too-many-instance-attributes
+    """
+    A timed phase of the processing of a request. The spans of a request form a
+    trace, which is exported when its root span ends.
+    """
+
+    def __init__(self, owner, name, trace_id, parent=None, remote_parent_id=None,
+                 start=None, attributes=None, exporters=None):
+        """
+        Constructs the span
+
+        :param owner: The tracer the span belongs to
+        :param name: The name of the span
+        :param trace_id: The identifier of the trace
+        :param parent: The parent span (``None`` for the root span)
+        :param remote_parent_id: The identifier of the parent span in the client
+            that sent the request (root span only, optional)
+        :param start: The start time (optional, defaults to the current time)
+        :param attributes: The attributes of the span (optional)
+        :param exporters: The exporters the trace is exported to (root span
+            only)
+        """
+        self.tracer = owner
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(16)
+        self.parent_id = parent.span_id if parent else remote_parent_id
+        self.start = start if start is not None else time.time()
+        self.end_time = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.details = {}
+        self._root = parent._root if parent else self
+        if parent is None:
+            self._spans = []
+            self._lock = threading.Lock()
+            self._exporters = exporters or []
+
+    @property
+    def root(self):
+        """
+        The root span of the trace
+        """
+        return self._root
+
+    @property
+    def duration(self):
+        """
+        The duration of the span (in seconds, ``None`` if it has not ended)
+        """
+        return None if self.end_time is None else self.end_time - self.start
+
+    def child(self, name, start=None, **attributes):
+        """
+        Creates a child span
+
+        :param name: The name of the span
+        :param start: The start time (optional, defaults to the current time)
+        :param attributes: The attributes of the span
+        :return: The child span
+        """
+        return _Span(self.tracer, name, self.trace_id, parent=self, start=start,
+                     attributes=attributes)
+
+    def set_attribute(self, name, value):
+        """
+        Sets an attribute of the span
+
+        :param name: The name of the attribute
+        :param value: The value of the attribute
+        """
+        self.attributes[name] = value
+
+    def set_detail(self, name, value):
+        """
+        Sets a detail of the span. Details are available to exporters, but are
+        not exported as attributes (for example, values that are large and only
+        summarized by some exporters).
+
+        :param name: The name of the detail
+        :param value: The value of the detail
+        """
+        self.details[name] = value
+
+    def end(self, end=None, error=None):
+        """
+        Ends the span. When the root span ends, the spans of the trace are
+        exported.
+
+        :param end: The end time (optional, defaults to the current time)
+        :param error: The error that caused the phase to fail (optional)
+        """
+        self.end_time = end if end is not None else time.time()
+        if error is not None:
+            self.error = str(error)
+        root = self._root
+        with root._lock:
+            root._spans.append(self)
+            if self is not root:
+                return
+            spans, root._spans = root._spans, []
+        self.tracer.export(spans, self._exporters)
+
+
+class _NoopSpan(object):
+    """
+    A span that is not recorded (used when tracing is disabled, or the request
+    is not sampled)
+    """
+
+    trace_id = None
+    span_id = None
+
+    @property
+    def root(self):
+        return self
+
+    def child(self, name, start=None, **attributes): # pylint: disable=unused-argument
+        return self
+
+    def set_attribute(self, name, value):
+        pass
+
+    def set_detail(self, name, value):
+        pass
+
+    def end(self, end=None, error=None):
+        pass
+
+
+# The span used when tracing is disabled (or a request is not sampled)
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Tracer(object):
+    """
+    Creates the spans of requests and exports them.
+
+    The current span of each thread is tracked, so that code invoked while a
+    request is processed (for example, the ePO remote client) can add spans to
+    the trace of the request without it being passed explicitly. Tracing is
+    disabled until an exporter is added. Each exporter has its own sample rate;
+    a request is only traced if it is sampled for at least one exporter.
+    """
+
+    def __init__(self):
+        self._exporters = []
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        """
+        Whether tracing is enabled
+        """
+        return bool(self._exporters)
+
+    def add_exporter(self, exporter, sample_rate=1.0):
+        """
+        Adds an exporter for completed traces
+
+        :param exporter: The exporter
+        :param sample_rate: The fraction of requests that are exported (requests
+            whose trace context indicates they are sampled are always exported)
+        """
+        self._exporters = self._exporters + [(exporter, sample_rate)]
+
+    def shutdown(self):
+        """
+        Disables tracing and shuts down the exporters
+        """
+        exporters, self._exporters = self._exporters, []
+        for exporter, _ in exporters:
+            exporter.shutdown()
+
+    def start_trace(self, name, message=None, start=None, **attributes):
+        """
+        Starts the root span of a trace for a DXL message. The trace identifier
+        is taken from the W3C trace context (``traceparent``) of the message if
+        present, otherwise it is derived from the message identifier.
+
+        :param name: The name of the span
+        :param message: The DXL message (optional)
+        :param start: The start time (optional, defaults to the current time)
+        :param attributes: The attributes of the span
+        :return: The root span (a span that is not recorded if tracing is
+            disabled or the request is not sampled)
+        """
+        if not self._exporters:
+            return _NOOP_SPAN
+
+        trace_id, parent_id, sampled = None, None, False
+        if message is not None:
+            match = _TRACEPARENT_PATTERN.match(
+                (message.other_fields or {}).get("traceparent", "").lower())
+            if match:
+                trace_id, parent_id = match.group(1), match.group(2)
+                sampled = int(match.group(3), 16) & 1 == 1
+            else:
+                message_id = re.sub("[^0-9a-f]", "",
+                                    (message.message_id or "").lower())
+                if len(message_id) == 32:
+                    trace_id = message_id
+        exporters = [exporter for exporter, sample_rate in self._exporters
+                     if sampled or sample_rate >= 1 or
+                     random.random() < sample_rate]
+        if not exporters:
+            return _NOOP_SPAN
+        return _Span(self, name, trace_id or _new_id(32),
+                     remote_parent_id=parent_id, start=start,
+                     attributes=attributes, exporters=exporters)
+
+    def current(self):
+        """
+        Returns the current span of the calling thread
+
+        :return: The current span (a span that is not recorded if there is no
+            current span)
+        """
+        return getattr(self._local, "span", None) or _NOOP_SPAN
+
+    def set_current(self, span):
+        """
+        Sets the current span of the calling thread
+
+        :param span: The span (``None`` to clear the current span)
+        :return: The previous current span (or ``None``)
+        """
+        previous = getattr(self._local, "span", None)
+        self._local.span = span
+        return previous
+
+    @contextlib.contextmanager
+    def activate(self, span):
+        """
+        Makes a span the current span of the calling thread for the duration of
+        the context
+
+        :param span: The span
+        """
+        previous = self.set_current(span)
+        try:
+            yield span
+        finally:
+            self.set_current(previous)
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """
+        Records a child span of the current span for the duration of the context
+        (the child span is the current span within the context)
+
+        :param name: The name of the span
+        :param attributes: The attributes of the span
+        """
+        span = self.current().child(name, **attributes)
+        with self.activate(span):
+            try:
+                yield span
+            except Exception as ex:
+                span.end(error=ex)
+                raise
+        span.end()
+
+    @staticmethod
+    def export(spans, exporters):
+        """
+        Exports the spans of a completed trace
+
+        :param spans: The spans
+        :param exporters: The exporters the trace was sampled for
+        """
+        for exporter in exporters:
+            try:
+                exporter.export(spans)
+            except Exception:
+                logger.exception("Error exporting spans")
+
+
+class _SpanExporter(object):
+    """
+    The base class for exporters of completed traces. Custom exporters can be
+    specified in the configuration by their class (``module.ClassName``), and
+    are constructed with the ``exporter.`` properties of the ``[Tracing]``
+    section as keyword arguments.
+    """
+
+    def export(self, spans):
+        """
+        Exports the spans of a completed trace (invoked on the thread that
+        processed the request, so it should not block). The root span is the
+        last span.
+
+        :param spans: The spans
+        """
+        raise NotImplementedError()
+
+    def shutdown(self):
+        """
+        Exports any pending spans and releases the resources of the exporter
+        """
+
+
+class _OtlpFileExporter(_SpanExporter):
+    """
+    Writes traces to a file in the OpenTelemetry protocol (OTLP) JSON encoding,
+    one ``ExportTraceServiceRequest`` per line. The file can be imported by the
+    OpenTelemetry Collector (using its file receiver). Spans are written on a
+    background thread; spans are dropped if the queue is full.
+    """
+
+    # The name of the service (resource attribute)
+    SERVICE_NAME = "dxleposervice"
+    # The maximum number of traces waiting to be written
+    QUEUE_SIZE = 10000
+
+    def __init__(self, path):
+        """
+        Constructs the exporter
+
+        :param path: The path of the file (traces are appended)
+        """
+        self._path = path
+        self._queue = queue.Queue(self.QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run,
+                                        name="EpoTraceExporter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def export(self, spans):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            _dropped_counter.inc(len(spans))
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(5)
+
+    def _run(self):
+        with open(self._path, "a") as trace_file:
+            while True:
+                spans = self._queue.get()
+                if spans is None:
+                    return
+                trace_file.write(json.dumps(self.to_otlp(spans)) + "\n")
+                if self._queue.empty():
+                    trace_file.flush()
+
+    @classmethod
+    def to_otlp(cls, spans):
+        """
+        Converts the spans of a trace to the OTLP JSON encoding
+
+        :param spans: The spans
+        :return: The ``ExportTraceServiceRequest`` (as a dictionary)
+        """
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                _to_otlp_attribute("service.name", cls.SERVICE_NAME),
+                _to_otlp_attribute("process.pid", os.getpid())]},
+            "scopeSpans": [{
+                "scope": {"name": cls.SERVICE_NAME},
+                "spans": [_to_otlp_span(span) for span in spans]}]}]}
+
+
+def _to_otlp_attribute(name, value):
+    """
+    Converts an attribute to the OTLP JSON encoding
+    """
+    if isinstance(value, bool):
+        typed_value = {"boolValue": value}
+    elif isinstance(value, int):
+        typed_value = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed_value = {"doubleValue": value}
+    else:
+        typed_value = {"stringValue": str(value)}
+    return {"key": name, "value": typed_value}
+
+
+def _to_otlp_span(span):
+    """
+    Converts a span to the OTLP JSON encoding
+    """
+    otlp_span = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        # SPAN_KIND_SERVER for the root span, SPAN_KIND_INTERNAL otherwise
+        "kind": 2 if span.root is span else 1,
+        "startTimeUnixNano": str(int(span.start * 1e9)),
+        "endTimeUnixNano": str(int(span.end_time * 1e9)),
+        "attributes": [_to_otlp_attribute(name, value) for name, value
+                       in sorted(span.attributes.items())],
+        # STATUS_CODE_ERROR or STATUS_CODE_UNSET
+        "status": {"code": 2, "message": span.error} if span.error else {}
+    }
+    if span.parent_id:
+        otlp_span["parentSpanId"] = span.parent_id
+    return otlp_span
+
+
+def _create_exporter(name, options):
+    """
+    Creates a span exporter
+
+    :param name: The name of the exporter (``file``), or the class of a custom
+        exporter (``module.ClassName``)
+    :param options: The options of the exporter (by name)
+    :return: The exporter
+    """
+    if name == "file":
+        if "path" not in options:
+            raise ValueError("The path of the trace file must be specified")
+        return _OtlpFileExporter(options["path"])
+    module_name, _, class_name = name.rpartition(".")
+    if not module_name:
+        raise ValueError("Unknown span exporter: {0}".format(name))
+    return getattr(importlib.import_module(module_name), class_name)(**options)
+
+
+# The tracer used to trace the processing of requests
+tracer = _Tracer()
@@ -2,19 +2,30 @@ from __future__ import absolute_import
 import logging
 import os
 import json
+import uuid
 
 from dxlbootstrap.app import Application
 from dxlclient.service import ServiceRegistrationInfo
-from dxlclient.callbacks import RequestCallback
-from dxlclient.message import ErrorResponse, Response
-
-from ._epo import _Epo
+from dxlclient.message import Event
+
+from ._cache import _CacheInvalidationCallback
+from ._catalog import _CatalogRequestCallback
+from ._drain import _InFlightTracker
+from ._featureconfig import _FeatureConfigMixin
+from ._jobs import _JobRequestCallback
+from ._metrics import registry
+from ._profiler import _AdminRequestCallback
+from ._request import _EpoRequestCallback
+from ._requestconfig import _RequestConfigMixin
+from ._stats import _StatsRequestCallback
+from ._tracing import tracer
 
 # Configure local logger
 logger = logging.getLogger(__name__)
 
-
-class EpoService(Application):
+# The application owns the components created from its configuration (by the
+# configuration mixins), and starts and stops them together
+class EpoService(Application, _RequestConfigMixin, _FeatureConfigMixin): # pylint: disable=too-many-instance-attributes
     """
     A DXL service that exposes the remote commands of one or more ePO servers to
     the DXL fabric. When a DXL request message is received, the remote command is invoked
@@ -22,59 +33,68 @@ class EpoService(Application):
     client via a DXL response message.
     """
 
+    # The name of the application configuration file
+    SERVICE_CONFIG_FILE = "dxleposervice.config"
+
     # The type of the ePO DXL service that is registered with the fabric
     DXL_SERVICE_TYPE = "/mcafee/service/epo/remote"
     # The format for request topics that are associated with the ePO DXL service
     DXL_REQUEST_FORMAT = "/mcafee/service/epo/remote/{0}"
+    # The topic used to request the status (and result chunks) of a job
+    DXL_JOB_STATUS_TOPIC = "/mcafee/service/epo/remote/job/status"
+    # The topic used to cancel a job
+    DXL_JOB_CANCEL_TOPIC = "/mcafee/service/epo/remote/job/cancel"
+    # The format for the topics of a service instance (or worker process). The
+    # job, stats and admin topics are also registered with the identifier of the
+    # instance appended, so that requests can be sent to the instance that holds
+    # the job (or whose metrics or profile are requested).
+    DXL_INSTANCE_TOPIC_FORMAT = "{0}/{1}"
+    # The format for topics used to request the command catalog of an ePO server
+    DXL_CATALOG_FORMAT = "/mcafee/service/epo/remote/{0}/catalog"
     # The timeout used when registering/unregistering the service
     DXL_SERVICE_REGISTRATION_TIMEOUT = 60
 
-    # The name of the "General" section within the ePO service configuration file
-    GENERAL_CONFIG_SECTION = "General"
-    # The property used to specify ePO names within the "General" section of the
-    # ePO service configuration file
-    GENERAL_EPO_NAMES_CONFIG_PROP = "epoNames"
-
-    # The property used to specify the host of an ePO within within the ePO service
-    # configuration file
-    EPO_HOST_CONFIG_PROP = "host"
-    # The property used to specify the port of an ePO server within the ePO service
-    # configuration file (this property is optional)
-    EPO_PORT_CONFIG_PROP = "port"
-    # The property used to specify the user used to login to an ePO server within
-    # the ePO service configuration file
-    EPO_USER_CONFIG_PROP = "user"
-    # The property used to specify the password used to login to an ePO server within the ePO
-    # service configuration file
-    EPO_PASSWORD_CONFIG_PROP = "password"
-    # The property used to specify the unique identifier for the ePO server within
-    # the ePO service configuration file (this property is optional)
-    EPO_UNIQUE_ID_CONFIG_PROP = "uniqueId"
-    # Whether to verify that the hostname in the ePO's certificate matches the ePO
-    # server being connected to. (optional, enabled by default)
-    EPO_VERIFY_CERTIFICATE = "verifyCertificate"
-    # A path to a CA Bundle file containing certificates of trusted CAs.
-    # The CA Bundle is used to ensure that the ePO server being connected to was signed by a
-    # valid authority.
-    EPO_VERIFY_CERT_BUNDLE = "verifyCertBundle"
-
-    # Default value for verifying certificates
-    DEFAULT_VERIFY_CERTIFICATE = True
-
-    # The default port used to communicate with an ePO server
-    DEFAULT_EPO_PORT = 8443
-
-    def __init__(self, config_dir):
+    def __init__(self, config_dir, worker_id=None):
         """
         Constructor parameters:
 
         :param config_dir: The location of the configuration files for the
             application
+        :param worker_id: The identifier of the worker process (if the service is
+            running in multiple worker processes). Change feeds are only
+            published by the first worker.
         """
-        super(EpoService, self).__init__(config_dir, "dxleposervice.config")
+        super(EpoService, self).__init__(config_dir, self.SERVICE_CONFIG_FILE)
+
+        self._worker_id = worker_id
+        self._instance_id = str(uuid.uuid4())
 
         self._epo_by_topic = {}
+        self._epo_by_catalog_topic = {}
         self._dxl_service = None
+        self._admission_controller = None
+        self._rate_limiter = None
+        self._dispatcher = None
+        self._pool_sizer = None
+        self._job_manager = None
+        self._idempotency_cache = None
+        self._catalog_manager = None
+        self._cache = None
+        self._cache_compaction = None
+        self._cache_prefetcher = None
+        self._cache_invalidation_topic = None
+        self._system_index = None
+        self._change_feeds = []
+        self._stats_topic_enabled = False
+        self._metrics_http_server = None
+        self._metrics_file_writer = None
+        self._profiler = None
+        self._memory_snapshots = None
+        self._profile_duration = self.DEFAULT_PROFILER_DURATION
+        self._profile_max_duration = self.DEFAULT_PROFILER_MAX_DURATION
+        self._admin_allowed_clients = None
+        self._in_flight = _InFlightTracker()
+        self._drain_timeout = self.DEFAULT_DRAIN_TIMEOUT
 
     @property
     def client(self):
@@ -97,16 +117,6 @@ class EpoService(Application):
         """
         logger.info("On 'run' callback.")
 
-    @staticmethod
-    def _get_option(config, section, option, default_value=None):
-        return config.get(section, option) \
-            if config.has_option(section, option) else default_value
-
-    @staticmethod
-    def _get_boolean_option(config, section, option, default_value=False):
-        return config.getboolean(section, option) \
-            if config.has_option(section, option) else default_value
-
     def on_load_configuration(self, config):
         """
         Invoked after the application-specific configuration has been loaded
@@ -125,60 +135,66 @@ class EpoService(Application):
         if len(epo_names_str.strip()) is 0 or len(epo_names) is 0:
             raise Exception(
                 "At least one ePO server must be defined in the service configuration file")
+        epo_names = self._select_shard(config, [epo_name.strip()
+                                                for epo_name in epo_names])
+        self._drain_timeout = self._get_int_option(
+            config, self.GENERAL_CONFIG_SECTION,
+            self.GENERAL_DRAIN_TIMEOUT_CONFIG_PROP, self.DEFAULT_DRAIN_TIMEOUT)
+
+        retry_policy = self._load_retry_policy(config)
+        self._cache = self._load_cache(config)
+        self._system_index = self._load_system_index(config)
 
         # For each ePO specified, create an instance of the ePO object (used to communicate with
         # the ePO server via HTTP)
         for epo_name in epo_names:
-            epo_name = epo_name.strip()
-            host = config.get(epo_name, self.EPO_HOST_CONFIG_PROP)
-            user = config.get(epo_name, self.EPO_USER_CONFIG_PROP)
-            password = config.get(epo_name, self.EPO_PASSWORD_CONFIG_PROP)
-
-            # Port (optional)
-            port = self._get_option(config, epo_name, self.EPO_PORT_CONFIG_PROP,
-                                    self.DEFAULT_EPO_PORT)
-
-            # Whether to verify the ePO server's certificate (optional)
-            verify = self._get_boolean_option(config, epo_name,
-                                              self.EPO_VERIFY_CERTIFICATE,
-                                              self.DEFAULT_VERIFY_CERTIFICATE)
-
-            # CA Bundle
-            if verify:
-                ca_bundle = self._get_option(config, epo_name,
-                                             self.EPO_VERIFY_CERT_BUNDLE)
-                if ca_bundle:
-                    ca_bundle = self._get_path(ca_bundle)
-                    verify = ca_bundle
-
-                    if not os.access(verify, os.R_OK):
-                        raise Exception(
-                            "Unable to access CA bundle file/dir ({0}): {1}".format(
-                                self.EPO_VERIFY_CERT_BUNDLE, verify))
-
-            # Create ePO wrapper
-            epo = _Epo(name=epo_name, host=host, port=port, user=user,
-                       password=password, verify=verify)
-
-            # Unique identifier (optional, if not specified attempts to determine GUID)
-            unique_id = self._get_option(config, epo_name,
-                                         self.EPO_UNIQUE_ID_CONFIG_PROP)
-
-            if unique_id is None:
-                logger.info(
-                    "Attempting to determine GUID for ePO server: %s ...",
-                    epo_name)
-                unique_id = epo.lookup_guid()
-                logger.info(
-                    "GUID '%s' found for ePO server: %s", unique_id, epo_name)
-
-            # Create the request topic based on the ePO's unique identifier
-            request_topic = self.DXL_REQUEST_FORMAT.format(unique_id)
-            logger.info(
-                "Request topic '%s' associated with ePO server: %s",
-                request_topic, epo_name)
-            # Associate ePO wrapper instance with the request topic
-            self._epo_by_topic[request_topic] = epo
+            self._load_epo(config, epo_name.strip(), retry_policy)
+
+        self._load_admission_configuration(config)
+        self._load_rate_limit_configuration(config)
+        self._load_dispatch_configuration(config)
+        self._load_jobs_configuration(config)
+        self._load_idempotency_configuration(config)
+        self._load_catalog_configuration(config)
+        if self._cache is not None:
+            self._load_hot_queries(config)
+        if not self._worker_id:
+            self._load_change_feeds(config)
+        self._load_metrics_configuration(config)
+        self._load_tracing_configuration(config)
+        self._load_slow_log_configuration(config)
+        self._load_profiler_configuration(config)
+
+    def toggle_profile(self):
+        """
+        Starts a profile (of the configured duration), or stops the profile in
+        progress (invoked when the profiling signal is received)
+        """
+        if self._profiler is None:
+            return
+        if self._profiler.running:
+            self._profiler.stop()
+        else:
+            self._profiler.start(self._profile_duration)
+
+    def _start_cache(self):
+        """
+        Loads the results in the persistent cache (they are served immediately
+        and refreshed in the background) and starts periodic compaction
+        """
+        epo_by_name = dict((epo.name, epo) for epo in self._epo_by_topic.values())
+
+        def get_refresh(entry):
+            epo = epo_by_name.get(entry.epo_name)
+            if epo is None:
+                return None
+            return lambda: epo.refresh(entry.command, entry.output, entry.params)
+
+        self._cache.refresh_loaded(self._cache.load(), get_refresh)
+        if self._cache_compaction is not None:
+            self._cache_compaction.start()
+        if self._cache_prefetcher is not None:
+            self._cache_prefetcher.start()
 
     def on_dxl_connect(self):
         """
@@ -186,6 +202,83 @@ class EpoService(Application):
         to the DXL fabric.
         """
         logger.info("On 'DXL connect' callback.")
+        # The background tasks are started once the configuration has been
+        # loaded (the "run" callback is invoked before it is loaded)
+        if self._catalog_manager is not None:
+            self._catalog_manager.start()
+        if self._pool_sizer is not None:
+            self._pool_sizer.start()
+        if self._metrics_http_server is not None:
+            self._metrics_http_server.start()
+        if self._metrics_file_writer is not None:
+            self._metrics_file_writer.start()
+        if self._cache is not None:
+            self._start_cache()
+        if self._system_index is not None:
+            self._system_index.start()
+        for change_feed in self._change_feeds:
+            change_feed.start()
+
+    def on_register_event_handlers(self):
+        """
+        Invoked when event handlers should be registered with the application
+        """
+        if self._cache is not None and self._cache_invalidation_topic:
+            logger.info("Subscribing to cache invalidation topic: %s",
+                        self._cache_invalidation_topic)
+            self.client.add_event_callback(
+                str(self._cache_invalidation_topic),
+                _CacheInvalidationCallback(self._cache, self._instance_id))
+
+    def _send_event(self, topic, payload):
+        """
+        Sends an event with a JSON payload
+
+        :param topic: The DXL topic
+        :param payload: The payload (a dictionary)
+        """
+        event = Event(str(topic))
+        event.payload = json.dumps(payload).encode(encoding="UTF-8")
+        self.client.send_event(event)
+
+    def _send_invalidation_event(self, epo_name, commands):
+        """
+        Sends an event to the cache invalidation topic, so that other service
+        instances remove the results invalidated by a mutating command
+
+        :param epo_name: The name of the ePO server
+        :param commands: The patterns matching the invalidated commands
+        """
+        try:
+            self._send_event(self._cache_invalidation_topic,
+                             {_CacheInvalidationCallback.EPO_KEY: epo_name,
+                              _CacheInvalidationCallback.CMD_NAME_KEY: commands,
+                              _CacheInvalidationCallback.INSTANCE_KEY:
+                                  self._instance_id})
+        except Exception:
+            logger.exception("Error sending cache invalidation event")
+
+    def _get_instance_topic(self, topic):
+        """
+        Returns the topic of this service instance (or worker process) for a
+        topic whose requests depend on the state of the instance
+
+        :param topic: The topic (shared by every service instance)
+        :return: The topic of this service instance
+        """
+        return self.DXL_INSTANCE_TOPIC_FORMAT.format(topic, self._instance_id)
+
+    def _add_instance_topics(self, service, topic, callback):
+        """
+        Adds a topic (shared by every service instance) and the topic of this
+        service instance to the service
+
+        :param service: The service registration information
+        :param topic: The topic
+        :param callback: The request callback for both topics
+        """
+        service.add_topic(topic, callback)
+        service.add_topic(self._get_instance_topic(topic), callback)
 
     def on_register_services(self):
         """
@@ -195,8 +288,33 @@ class EpoService(Application):
         service = ServiceRegistrationInfo(self.client, self.DXL_SERVICE_TYPE)
         for request_topic in self._epo_by_topic:
             service.add_topic(str(request_topic),
-                              _EpoRequestCallback(self.client,
-                                                  self._epo_by_topic))
+                              self._create_request_callback())
+        if self._job_manager is not None:
+            self._add_instance_topics(
+                service, self.DXL_JOB_STATUS_TOPIC,
+                _JobRequestCallback(self.client, self._job_manager))
+            self._add_instance_topics(
+                service, self.DXL_JOB_CANCEL_TOPIC,
+                _JobRequestCallback(self.client, self._job_manager, cancel=True))
+        if self._catalog_manager is not None:
+            catalog_callback = _CatalogRequestCallback(
+                self.client, self._catalog_manager, self._epo_by_catalog_topic)
+            for catalog_topic in self._epo_by_catalog_topic:
+                service.add_topic(str(catalog_topic), catalog_callback)
+        if self._stats_topic_enabled:
+            self._add_instance_topics(
+                service, self.DXL_STATS_TOPIC,
+                _StatsRequestCallback(
+                    self.client, registry, self._worker_id,
+                    self._get_instance_topic(self.DXL_STATS_TOPIC)))
+        if self._admin_allowed_clients:
+            self._add_instance_topics(
+                service, self.DXL_ADMIN_TOPIC,
+                _AdminRequestCallback(
+                    self.client, self._profiler, self._memory_snapshots,
+                    self._admin_allowed_clients, self._profile_duration,
+                    self._profile_max_duration, self._worker_id,
+                    self._get_instance_topic(self.DXL_ADMIN_TOPIC)))
 
         logger.info("Registering service ...")
         self.client.register_service_sync(service,
@@ -205,6 +323,78 @@ class EpoService(Application):
 
         self._dxl_service = service
 
+    def _create_request_callback(self):
+        """
+        Creates the callback used to handle requests for the ePO servers
+
+        :return: The request callback
+        """
+        return _EpoRequestCallback(self.client, self._epo_by_topic,
+                                   admission_controller=self._admission_controller,
+                                   rate_limiter=self._rate_limiter,
+                                   dispatcher=self._dispatcher,
+                                   job_manager=self._job_manager,
+                                   idempotency_cache=self._idempotency_cache,
+                                   catalog_manager=self._catalog_manager,
+                                   in_flight=self._in_flight)
+
+    def destroy(self):
+        """
+        Destroys the application (disconnects from fabric, frees resources, etc.)
+        """
+        self._drain()
+        super(EpoService, self).destroy()
+        self._shutdown(self._pool_sizer, self._dispatcher, self._job_manager,
+                       self._catalog_manager)
+        if self._cache_compaction is not None:
+            self._cache_compaction.stop()
+        self._shutdown(self._cache_prefetcher, self._system_index,
+                       *self._change_feeds)
+        self._shutdown(self._cache)
+        for epo in self._epo_by_topic.values():
+            epo.close()
+        self._shutdown(self._metrics_http_server, self._metrics_file_writer)
+        if self._profiler is not None:
+            self._profiler.stop()
+        tracer.shutdown()
+
+    @staticmethod
+    def _shutdown(*components):
+        """
+        Shuts down the components of the service that are enabled
+
+        :param components: The components (``None`` for components that are
+            not enabled)
+        """
+        for component in components:
+            if component is not None:
+                component.shutdown()
+
+    def _drain(self):
+        """
+        Unregisters the service (so that the fabric sends new requests to other
+        service instances), and waits for the requests in progress to complete
+        (up to the drain timeout)
+        """
+        if self._dxl_service is None:
+            return
+        service = self._dxl_service
+        self._dxl_service = None
+        logger.info("Unregistering service ...")
+        try:
+            self.client.unregister_service_sync(
+                service, self.DXL_SERVICE_REGISTRATION_TIMEOUT)
+        except Exception as ex:
+            logger.warning("Unable to unregister service: %s", ex)
+        count = self._in_flight.count
+        if count:
+            logger.info("Waiting for %d requests in progress to complete ...",
+                        count)
+        if not self._in_flight.wait(self._drain_timeout):
+            logger.warning(
+                "%d requests in progress did not complete within the drain "
+                "timeout", self._in_flight.count)
+
     def _get_path(self, in_path):
         """
         Returns an absolute path for a file specified in the configuration file (supports
@@ -217,80 +407,3 @@ class EpoService(Application):
             if os.path.isfile(config_rel_path):
                 in_path = config_rel_path
         return in_path
-
-
-class _EpoRequestCallback(RequestCallback):
-    """
-    Request callback used to handle incoming service requests
-    """
-
-    # UTF-8 encoding (used for encoding/decoding payloads)
-    UTF_8 = "utf-8"
-
-    # The key in the request used to specify the ePO command to invoke
-    CMD_NAME_KEY = "command"
-    # The key in the request used to specify the output format
-    # (json, xml, verbose, terse). This is optional
-    OUTPUT_KEY = "output"
-    # The key used to specify the parameters for the ePO command
-    PARAMS_KEY = "params"
-
-    # The default output format
-    DEFAULT_OUTPUT = "json"
-
-    def __init__(self, client, epo_by_topic):
-        """
-        Constructs the callback
-
-        :param client: The DXL client associated with the service
-        :param epo_by_topic: The ePO server wrappers by associated request topics
-        """
-        super(_EpoRequestCallback, self).__init__()
-        self._dxl_client = client
-        self._epo_by_topic = epo_by_topic
-
-    def on_request(self, request):
-        """
-        Invoked when a request is received
-
-        :param request: The request that was received
-        """
-        try:
-            # Build dictionary from the request payload
-            req_dict = json.loads(request.payload.decode(encoding=self.UTF_8))
-
-            # Determine the ePO command
-            if self.CMD_NAME_KEY not in req_dict:
-                raise Exception(
-                    "A command name was not specified ('{0}')".format(
-                        self.CMD_NAME_KEY))
-            command = req_dict[self.CMD_NAME_KEY]
-
-            # Determine the request parameters
-            req_params = {}
-            if self.PARAMS_KEY in req_dict:
-                req_params = req_dict[self.PARAMS_KEY]
-
-            # Determine the output format
-            output = self.DEFAULT_OUTPUT
-            if self.OUTPUT_KEY in req_dict:
-                output = req_dict[self.OUTPUT_KEY]
-
-            # Get the ePO server to invoke the command on
-            epo = self._epo_by_topic[request.destination_topic]
-
-            # Execute the ePO Remote Command
-            result = epo.execute(command, output, req_params)
-
-            # Create the response, set payload, and deliver
-            response = Response(request)
-            response.payload = result
-            self._dxl_client.send_response(response)
-
-        except Exception as ex:
-            logger.exception("Error while processing request")
-            # Send error response
-            self._dxl_client.send_response(
-                ErrorResponse(request,
-                              error_message=str(ex).encode(
-                                  encoding=self.UTF_8)))
@@ -1,6 +1,10 @@
 class MockDxlClient(object):
 
     latest_sent_message = ""
+    latest_sent_event = None
 
     def send_response(self, response):
         self.latest_sent_message = response
+
+    def send_event(self, event):
+        self.latest_sent_event = event
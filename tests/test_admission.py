@@ -0,0 +1,157 @@
+import json
+from dxlclient import Request
+from dxlclient.message import ErrorResponse
+
+import dxleposervice._epo
+import dxleposervice.app
+from dxleposervice._admission import _AdmissionController, _AimdLimit
+from dxleposervice._dispatch import _Dispatcher, _Lane
+from dxleposervice._errors import _OverloadedError
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_dxlclient import MockDxlClient
+
+
+class TestAimdLimit(BaseClientTest):
+
+    def test_rejects_when_limit_reached(self):
+        limit = _AimdLimit(initial_limit=2, min_limit=1, max_limit=10,
+                           latency_threshold=1.0, backoff_ratio=0.5)
+
+        self.assertTrue(limit.try_acquire())
+        self.assertTrue(limit.try_acquire())
+        self.assertFalse(limit.try_acquire())
+        self.assertEqual(2, limit.in_flight)
+
+    def test_slow_requests_decrease_limit(self):
+        limit = _AimdLimit(initial_limit=8, min_limit=2, max_limit=10,
+                           latency_threshold=1.0, backoff_ratio=0.5)
+
+        # The limit is reduced at most once per window of requests
+        for _ in range(5):
+            limit.try_acquire()
+            limit.release(2.0)
+        self.assertEqual(4, limit.limit)
+
+        limit.try_acquire()
+        limit.release(2.0)
+        self.assertEqual(2, limit.limit)
+
+    def test_slow_burst_decreases_limit_once(self):
+        limit = _AimdLimit(initial_limit=8, min_limit=1, max_limit=10,
+                           latency_threshold=1.0, backoff_ratio=0.5)
+
+        for _ in range(8):
+            limit.try_acquire()
+        for _ in range(8):
+            limit.release(2.0)
+
+        self.assertEqual(4, limit.limit)
+
+    def test_fast_requests_increase_limit(self):
+        limit = _AimdLimit(initial_limit=2, min_limit=1, max_limit=3,
+                           latency_threshold=1.0, backoff_ratio=0.5)
+
+        for _ in range(20):
+            limit.try_acquire()
+            limit.release(0.01)
+
+        self.assertEqual(3, limit.limit)
+        self.assertEqual(10, limit.retry_after())
+
+
+class TestAdmissionController(BaseClientTest):
+
+    def test_admit_raises_when_overloaded(self):
+        controller = _AdmissionController(
+            initial_limit=1, min_limit=1, max_limit=1,
+            latency_threshold=1.0, backoff_ratio=0.5)
+
+        with controller.admit("epo1"):
+            self.assertRaises(_OverloadedError, controller.admit, "epo1")
+            # Limits are tracked separately for each ePO server
+            with controller.admit("epo2"):
+                pass
+
+        with controller.admit("epo1"):
+            pass
+
+    def test_eporequestcallback_overloaded(self):
+        mock_dxl_client = MockDxlClient()
+        test_topic = "/test/topic"
+
+        epo = dxleposervice._epo._Epo(
+            TEST_EPONAME_BASE, LOCALHOST_IP, 8443, TEST_USER, TEST_PASSWORD, False)
+
+        controller = _AdmissionController(
+            initial_limit=1, min_limit=1, max_limit=1,
+            latency_threshold=1.0, backoff_ratio=0.5)
+        controller.get_limit(epo.name).try_acquire()
+
+        test_request = Request(test_topic)
+        test_request.payload = json.dumps(
+            {"command": CORE_HELP_CMD_NAME}).encode(encoding="UTF-8")
+
+        epo_request_callback = dxleposervice.app._EpoRequestCallback(
+            mock_dxl_client, {test_topic: epo}, controller)
+        epo_request_callback.on_request(test_request)
+
+        response = mock_dxl_client.latest_sent_message
+        self.assertIsInstance(response, ErrorResponse)
+        self.assertEqual(_OverloadedError.ERROR_CODE, response.error_code)
+        self.assertIn(b"retry after", response.error_message)
+
+    def test_limits_per_command_class(self):
+        controller = _AdmissionController(
+            initial_limit=1, min_limit=1, max_limit=1,
+            latency_threshold=1.0, backoff_ratio=0.5,
+            latency_thresholds={"Bulk": 60.0})
+
+        admission = controller.admit("epo1", "bulk")
+        # A slow command class does not use the slots of other classes
+        with controller.admit("epo1"):
+            pass
+        self.assertRaises(_OverloadedError, controller.admit, "epo1", "BULK")
+        admission.cancel()
+        admission.cancel()
+        self.assertEqual(0, controller.get_limit("epo1", "bulk").in_flight)
+
+        # Slow requests only reduce the limit of their own class
+        with controller.admit("epo1", "bulk"):
+            pass
+        self.assertEqual(1, controller.get_limit("epo1", "bulk").limit)
+
+    def test_eporequestcallback_admits_before_queueing(self):
+        mock_dxl_client = MockDxlClient()
+        test_topic = "/test/topic"
+
+        epo = dxleposervice._epo._Epo(
+            TEST_EPONAME_BASE, LOCALHOST_IP, 8443, TEST_USER, TEST_PASSWORD, False)
+        controller = _AdmissionController(
+            initial_limit=1, min_limit=1, max_limit=1,
+            latency_threshold=1.0, backoff_ratio=0.5)
+        # A lane without threads (requests remain queued)
+        lane = _Lane("interactive", thread_count=0, queue_size=1)
+        epo_request_callback = dxleposervice.app._EpoRequestCallback(
+            mock_dxl_client, {test_topic: epo}, controller,
+            dispatcher=_Dispatcher(lane))
+
+        def send_request():
+            test_request = Request(test_topic)
+            test_request.payload = json.dumps(
+                {"command": CORE_HELP_CMD_NAME}).encode(encoding="UTF-8")
+            epo_request_callback.on_request(test_request)
+
+        try:
+            send_request()
+            # The queued request holds the slot of its lane
+            self.assertEqual(
+                1, controller.get_limit(epo.name, "interactive").in_flight)
+            send_request()
+            response = mock_dxl_client.latest_sent_message
+            self.assertIsInstance(response, ErrorResponse)
+            self.assertEqual(_OverloadedError.ERROR_CODE, response.error_code)
+            self.assertEqual(
+                1, controller.get_limit(epo.name, "interactive").in_flight)
+        finally:
+            lane.shutdown()
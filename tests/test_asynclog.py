@@ -0,0 +1,74 @@
+import logging
+import threading
+import unittest
+from mock import patch
+
+from dxleposervice._asynclog import _AsyncLogging
+from dxleposervice._metrics import registry
+from tests.test_base import BaseClientTest
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.records = []
+        self.threads = []
+        self.event = threading.Event()
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+        self.threads.append(threading.current_thread())
+        self.event.wait(5)
+
+
+@unittest.skipUnless(_AsyncLogging.is_supported(),
+                     "Asynchronous logging is not supported")
+class TestAsyncLogging(BaseClientTest):
+
+    def setUp(self):
+        self.logger = logging.getLogger("tests.asynclog")
+        self.logger.propagate = False
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_async_logging(self):
+        async_logging = _AsyncLogging()
+        async_logging.start()
+        try:
+            self.assertNotIn(self.handler, self.logger.handlers)
+            # The logging thread does not block on the (blocked) handler
+            params = {"searchText": "system1"}
+            self.logger.warning("Invoking command with parameters: %s", params)
+            params["searchText"] = "system2"
+            try:
+                raise ValueError("Failed")
+            except ValueError:
+                self.logger.exception("Error while processing request")
+        finally:
+            self.handler.event.set()
+            async_logging.stop()
+
+        self.assertEqual([self.handler], self.logger.handlers)
+        self.assertEqual(
+            "Invoking command with parameters: {'searchText': 'system1'}",
+            self.handler.records[0])
+        self.assertIn("ValueError: Failed", self.handler.records[1])
+        self.assertNotIn(threading.current_thread(), self.handler.threads)
+
+    def test_queue_full(self):
+        dropped = registry.counter("logging_dropped_records_total", "")
+        count = dropped.get()
+        async_logging = _AsyncLogging()
+        with patch.object(_AsyncLogging, "QUEUE_SIZE", 1):
+            async_logging.start()
+        try:
+            for _ in range(5):
+                self.logger.warning("Request")
+            self.assertGreater(dropped.get(), count)
+        finally:
+            self.handler.event.set()
+            async_logging.stop()
@@ -0,0 +1,121 @@
+import threading
+import requests
+from mock import MagicMock
+
+import dxleposervice._epo
+from dxleposervice._balancer import _HostBalancer, _LatencyTracker
+from dxleposervice._metrics import registry
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+
+
+class TestLatencyTracker(BaseClientTest):
+
+    def test_percentile(self):
+        tracker = _LatencyTracker(max_samples=100)
+        self.assertIsNone(tracker.percentile(95))
+
+        for latency in range(200):
+            tracker.add(latency)
+
+        # Only the most recent samples are retained
+        self.assertEqual(100, len(tracker))
+        self.assertEqual(100, tracker.percentile(0))
+        self.assertEqual(195, tracker.percentile(95))
+        self.assertEqual(199, tracker.percentile(100))
+
+
+class TestHostBalancer(BaseClientTest):
+
+    def test_choose_exclude(self):
+        balancer = _HostBalancer(["host1", "host2"])
+
+        self.assertEqual("host2", balancer.choose(exclude="host1"))
+        self.assertIsNone(_HostBalancer(["host1"]).choose(exclude="host1"))
+
+    def test_prefers_healthy_fast_hosts(self):
+        balancer = _HostBalancer(["host1", "host2"])
+        balancer.record("host1", 0.01, True)
+        balancer.record("host2", 0.01, True)
+        for _ in range(5):
+            balancer.record("host2", 0.01, False)
+
+        choices = [balancer.choose() for _ in range(200)]
+        self.assertGreater(choices.count("host1"), 150)
+
+        balancer = _HostBalancer(["host1", "host2"])
+        balancer.record("host1", 0.01, True)
+        balancer.record("host2", 1.0, True)
+
+        choices = [balancer.choose() for _ in range(200)]
+        self.assertGreater(choices.count("host1"), 150)
+
+
+    def test_avoids_failing_unmeasured_host(self):
+        epo = dxleposervice._epo._Epo(
+            "epo1", [LOCALHOST_IP, "127.0.0.2"], 8443, TEST_USER, TEST_PASSWORD,
+            False)
+        failing, working = epo._clients
+        failing.invoke_command = MagicMock(
+            side_effect=requests.exceptions.ConnectionError("down"))
+        working.invoke_command = MagicMock(return_value="ok")
+
+        failures = 0
+        for _ in range(200):
+            try:
+                epo.execute(SYSTEM_FIND_CMD_NAME, "json", {})
+            except requests.exceptions.ConnectionError:
+                failures += 1
+
+        # The host that has never succeeded is only selected occasionally
+        self.assertEqual(200 - failures, working.invoke_command.call_count)
+        self.assertLess(failures, 40)
+
+
+class TestEpoHedging(BaseClientTest):
+
+    def create_epo(self, hedge_delay):
+        epo = dxleposervice._epo._Epo(
+            "epo1", [LOCALHOST_IP, "127.0.0.2"], 8443, TEST_USER, TEST_PASSWORD,
+            False, hedge_commands=[SYSTEM_FIND_CMD_NAME],
+            hedge_delay=hedge_delay)
+        slow, fast = epo._clients
+        release = threading.Event()
+
+        def slow_invoke(*_):
+            release.wait(5)
+            return "slow"
+
+        slow.invoke_command = MagicMock(side_effect=slow_invoke)
+        fast.invoke_command = MagicMock(return_value="fast")
+        # The slow host is always chosen first
+        epo._balancer.choose = MagicMock(side_effect=[slow, fast])
+        return epo, release
+
+    def test_hedged_request(self):
+        epo, release = self.create_epo(0.05)
+        hedges = registry.counter("epo_hedged_requests_total", "")
+        before = hedges.get(epo="epo1")
+
+        self.assertEqual("fast", epo.execute(SYSTEM_FIND_CMD_NAME, "json", {}))
+        self.assertEqual(before + 1, hedges.get(epo="epo1"))
+        release.set()
+
+    def test_no_hedge_for_other_commands(self):
+        epo, release = self.create_epo(0.05)
+        release.set()
+
+        self.assertEqual("slow", epo.execute("system.applyTag", "json", {}))
+        self.assertEqual(0, epo._clients[1].invoke_command.call_count)
+
+    def test_hedge_delay_per_command(self):
+        epo = dxleposervice._epo._Epo(
+            "epo1", [LOCALHOST_IP, "127.0.0.2"], 8443, TEST_USER, TEST_PASSWORD,
+            False, hedge_commands=[SYSTEM_FIND_CMD_NAME, "core.executeQuery"])
+        for _ in range(epo.MIN_HEDGE_SAMPLES):
+            epo._get_latencies("core.executeQuery").add(60.0)
+
+        # Slow queries do not delay the hedged requests of other commands
+        self.assertEqual(60.0, epo._get_hedge_delay("Core.ExecuteQuery"))
+        self.assertEqual(epo.DEFAULT_HEDGE_DELAY,
+                         epo._get_hedge_delay(SYSTEM_FIND_CMD_NAME))
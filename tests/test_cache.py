@@ -0,0 +1,367 @@
+import json
+import shutil
+import tempfile
+import threading
+import time
+from dxlclient import Event
+from mock import MagicMock, patch
+
+import dxleposervice._epo
+from dxleposervice._cache import _CacheEntry, _CacheInvalidationCallback, \
+    _HotQuery, _PersistentCacheStore, _Prefetcher, _ResponseCache
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_epohttpserver import MockServerRunner
+
+FIND_PARAMS = {"searchText": SYSTEM_FIND_OSTYPE_LINUX}
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+
+
+class TestResponseCache(BaseClientTest):
+
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(TestResponseCache, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_get_put(self):
+        cache = _ResponseCache(ttl=60, ttl_by_command={"core.help": 0})
+
+        self.assertTrue(cache.is_cacheable(SYSTEM_FIND_CMD_NAME))
+        self.assertFalse(cache.is_cacheable("system.applyTag"))
+        self.assertIsNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                    FIND_PARAMS))
+
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result")
+        cache.put("epo1", CORE_HELP_CMD_NAME, "json", {}, "help")
+
+        self.assertEqual("result", cache.get("epo1", "System.Find", "json",
+                                             dict(FIND_PARAMS)).value)
+        self.assertIsNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "xml",
+                                    FIND_PARAMS))
+        self.assertIsNone(cache.get("epo2", SYSTEM_FIND_CMD_NAME, "json",
+                                    FIND_PARAMS))
+        # Expired
+        self.assertIsNone(cache.get("epo1", CORE_HELP_CMD_NAME, "json", {}))
+        cache.shutdown()
+
+    def test_max_entries(self):
+        cache = _ResponseCache(ttl=60, max_entries=2)
+
+        for index in range(3):
+            cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                      {"searchText": str(index)}, str(index))
+        cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json", {"searchText": "1"})
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", {"searchText": "3"}, "3")
+
+        self.assertIsNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                    {"searchText": "0"}))
+        self.assertIsNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                    {"searchText": "2"}))
+        self.assertEqual("1", cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                        {"searchText": "1"}).value)
+        cache.shutdown()
+
+    def test_persistent(self):
+        cache = _ResponseCache(
+            ttl=60, store=_PersistentCacheStore(self.directory, 1024 * 1024))
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result")
+        cache.shutdown()
+
+        # The result survives a restart
+        cache = _ResponseCache(
+            ttl=60, store=_PersistentCacheStore(self.directory, 1024 * 1024))
+        entries = cache.load()
+
+        self.assertEqual(1, len(entries))
+        self.assertEqual(FIND_PARAMS, entries[0].params)
+        self.assertEqual("result", cache.get("epo1", SYSTEM_FIND_CMD_NAME,
+                                             "json", FIND_PARAMS).value)
+        cache.shutdown()
+
+    def test_compact(self):
+        store = _PersistentCacheStore(self.directory, 10)
+        now = time.time()
+        store.put(_CacheEntry("epo1", "a.find", "json", {}, "x" * 4, now - 1))
+        store.put(_CacheEntry("epo1", "b.find", "json", {}, "x" * 6, now + 60,
+                              created=now - 10))
+        store.put(_CacheEntry("epo1", "c.find", "json", {}, "x" * 6, now + 60))
+
+        # The expired entry and the least recently stored entry are removed
+        self.assertEqual(2, store.compact(0))
+        self.assertEqual(["c.find"],
+                         [entry.command for entry in store.entries()])
+        store.close()
+
+    def test_compact_batches(self):
+        store = _PersistentCacheStore(self.directory, 1024 * 1024)
+        now = time.time()
+        for index in range(10):
+            store.put(_CacheEntry("epo1", "a.find", "json", {"index": index},
+                                  "x" * 4096, now - 1))
+        store.put(_CacheEntry("epo1", "b.find", "json", {}, "x", now + 60))
+
+        with patch.object(_PersistentCacheStore, "COMPACTION_BATCH_SIZE", 3):
+            self.assertEqual(10, store.compact(0))
+        self.assertEqual(["b.find"],
+                         [entry.command for entry in store.entries()])
+        # The freed pages are returned to the file system
+        self.assertEqual(0, store._connection.execute( # pylint: disable=protected-access
+            "PRAGMA freelist_count").fetchone()[0])
+        store.close()
+
+    def test_restored(self):
+        store = _PersistentCacheStore(self.directory, 1024 * 1024)
+        now = time.time()
+        for index in range(5):
+            store.put(_CacheEntry("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                  {"searchText": str(index)}, str(index),
+                                  now - 60))
+        store.close()
+
+        cache = _ResponseCache(
+            ttl=60, refresh_threads=2,
+            store=_PersistentCacheStore(self.directory, 1024 * 1024))
+        entries = cache.load()
+        # Entries that expired while the service was stopped are served until
+        # they are refreshed
+        entry = cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                          {"searchText": "0"})
+        self.assertTrue(entry.expired)
+        self.assertEqual("0", entry.value)
+
+        lock = threading.Lock()
+        running = [0, 0]
+        release = threading.Event()
+
+        def get_refresh(entry):
+            def refresh():
+                with lock:
+                    running[0] += 1
+                    running[1] = max(running[0], running[1])
+                release.wait(0.1)
+                cache.put(entry.epo_name, entry.command, entry.output,
+                          entry.params, "new")
+                with lock:
+                    running[0] -= 1
+            return refresh
+
+        cache.refresh_loaded(entries, get_refresh)
+        wait_for(lambda: all(not entry.restored for entry in entries))
+
+        # At most one refresh per refresh thread is scheduled at a time
+        self.assertEqual(2, running[1])
+        self.assertEqual("new", cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                          {"searchText": "4"}).value)
+        cache.shutdown()
+
+    def test_refresh(self):
+        cache = _ResponseCache(ttl=60)
+        release = threading.Event()
+        func = MagicMock(side_effect=lambda: release.wait(5))
+
+        self.assertTrue(cache.refresh("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                      FIND_PARAMS, func))
+        # A result that is already being refreshed is not scheduled again
+        self.assertFalse(cache.refresh("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                       FIND_PARAMS, func))
+        release.set()
+        cache.shutdown()
+        wait_for(lambda: func.called)
+        func.assert_called_once_with()
+
+    def test_stale(self):
+        cache = _ResponseCache(ttl=0, stale_ttl=60)
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result")
+
+        entry = cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS)
+        self.assertTrue(entry.expired)
+        self.assertEqual("result", entry.value)
+        cache.shutdown()
+
+    def test_prefetch(self):
+        cache = _ResponseCache(ttl=60)
+        epo = MagicMock()
+        epo.name = "epo1"
+        query = _HotQuery(epo, SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, 30)
+        prefetcher = _Prefetcher(cache, [query])
+
+        prefetcher.prefetch()
+        wait_for(lambda: epo.refresh.called)
+        prefetcher.prefetch()
+
+        epo.refresh.assert_called_once_with(SYSTEM_FIND_CMD_NAME, "json",
+                                            FIND_PARAMS)
+        self.assertGreater(query.next_prefetch, time.time() + 25)
+        cache.shutdown()
+
+
+    def test_invalidate(self):
+        cache = _ResponseCache(
+            ttl=60, store=_PersistentCacheStore(self.directory, 1024 * 1024))
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result")
+        cache.put("epo2", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result")
+        cache.put("epo1", CORE_HELP_CMD_NAME, "json", {}, "help")
+
+        self.assertEqual(1, cache.invalidate("epo1", ["System.*"]))
+        self.assertIsNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                    FIND_PARAMS))
+        self.assertIsNotNone(cache.get("epo2", SYSTEM_FIND_CMD_NAME, "json",
+                                       FIND_PARAMS))
+        self.assertEqual(1, cache.invalidate(key_pattern="*core.help*"))
+        self.assertEqual(["epo2"],
+                         [entry.epo_name for entry in cache._store.entries()])
+        cache.shutdown()
+
+    def test_invalidate_for(self):
+        cache = _ResponseCache(ttl=60, invalidated_commands_by_command={
+            "System.Delete": ["*"]})
+        listener = MagicMock()
+        cache.add_listener(listener)
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result")
+        cache.put("epo1", CORE_HELP_CMD_NAME, "json", {}, "help")
+
+        self.assertEqual(1, cache.invalidate_for("epo1", "system.applyTag"))
+        listener.assert_called_once_with(
+            "epo1", ["system.*", "core.executeQuery"])
+        self.assertEqual(1, cache.invalidate_for("epo1", "system.delete"))
+        cache.shutdown()
+
+    def test_put_after_invalidate(self):
+        cache = _ResponseCache(ttl=60)
+        generation = cache.generation
+        cache.invalidate("epo1")
+
+        # A result fetched before an invalidation is not cached
+        self.assertIsNone(cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                    FIND_PARAMS, "result",
+                                    generation=generation))
+        self.assertIsNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                    FIND_PARAMS))
+        cache.shutdown()
+
+    def test_store_after_invalidate(self):
+        store = _PersistentCacheStore(self.directory, 1024 * 1024)
+        store.remove(lambda *_: True, generation=2)
+
+        # An entry added before the removal is not stored
+        self.assertFalse(store.put(_CacheEntry(
+            "epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result",
+            time.time() + 60), generation=1))
+        entry = _CacheEntry("epo1", CORE_HELP_CMD_NAME, "json", {}, "help",
+                            time.time() + 60)
+        self.assertTrue(store.put(entry, generation=2))
+        self.assertEqual([CORE_HELP_CMD_NAME],
+                         [entry.command for entry in store.entries()])
+        store.close()
+
+    def test_invalidation_callback(self):
+        cache = _ResponseCache(ttl=60)
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result")
+        cache.put("epo1", CORE_HELP_CMD_NAME, "json", {}, "help")
+        callback = _CacheInvalidationCallback(cache)
+
+        event = Event("/test/invalidate")
+        event.payload = json.dumps(
+            {"epo": "epo1", "command": SYSTEM_FIND_CMD_NAME}).encode(
+                encoding="UTF-8")
+        callback.on_event(event)
+
+        self.assertIsNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                    FIND_PARAMS))
+        self.assertIsNotNone(cache.get("epo1", CORE_HELP_CMD_NAME, "json", {}))
+
+        # An event without criteria is ignored
+        event.payload = json.dumps({}).encode(encoding="UTF-8")
+        callback.on_event(event)
+        self.assertIsNotNone(cache.get("epo1", CORE_HELP_CMD_NAME, "json", {}))
+        cache.shutdown()
+
+    def test_invalidation_callback_own_events(self):
+        cache = _ResponseCache(ttl=60)
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result")
+        callback = _CacheInvalidationCallback(cache, "instance1")
+
+        # An event sent by the receiving instance is ignored
+        event = Event("/test/invalidate")
+        event.payload = json.dumps(
+            {"epo": "epo1", "instance": "instance1"}).encode(encoding="UTF-8")
+        callback.on_event(event)
+        self.assertIsNotNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                       FIND_PARAMS))
+
+        # An event sent by another instance is processed
+        event.payload = json.dumps(
+            {"epo": "epo1", "instance": "instance2"}).encode(encoding="UTF-8")
+        callback.on_event(event)
+        self.assertIsNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                    FIND_PARAMS))
+        cache.shutdown()
+
+
+class TestEpoCache(BaseClientTest):
+
+    def test_execute_cached(self):
+        cache = _ResponseCache(ttl=60)
+
+        with MockServerRunner() as server_list:
+            server_info = server_list[0]
+            epo = dxleposervice._epo._Epo(
+                server_info[SERVER_INFO_SERVER_NAME_KEY],
+                LOCALHOST_IP,
+                server_info[SERVER_INFO_SERVER_PORT_KEY],
+                TEST_USER,
+                TEST_PASSWORD,
+                False,
+                cache=cache)
+
+            result = epo.execute(SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS)
+
+        # The server has stopped, the result is served from the cache
+        self.assertEqual(result, epo.execute(SYSTEM_FIND_CMD_NAME, "json",
+                                             FIND_PARAMS))
+        cache.shutdown()
+
+    def test_stale_while_revalidate(self):
+        cache = _ResponseCache(ttl=0, stale_ttl=60)
+        epo = dxleposervice._epo._Epo("epo1", LOCALHOST_IP, 8443, TEST_USER,
+                                      TEST_PASSWORD, False, cache=cache)
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "stale")
+        epo._fetch = MagicMock(return_value="fresh")
+
+        # The stale result is served, and refreshed in the background
+        self.assertEqual("stale", epo.execute(SYSTEM_FIND_CMD_NAME, "json",
+                                              FIND_PARAMS))
+        cache.shutdown()
+        wait_for(lambda: cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                   FIND_PARAMS).value == "fresh")
+        epo._fetch.assert_called_once_with(SYSTEM_FIND_CMD_NAME, "json",
+                                           FIND_PARAMS)
+        self.assertEqual("fresh", cache.get(
+            "epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS).value)
+
+    def test_execute_mutating(self):
+        cache = _ResponseCache(ttl=60)
+        epo = dxleposervice._epo._Epo("epo1", LOCALHOST_IP, 8443, TEST_USER,
+                                      TEST_PASSWORD, False, cache=cache)
+        cache.put("epo1", SYSTEM_FIND_CMD_NAME, "json", FIND_PARAMS, "result")
+        epo._fetch = MagicMock(return_value="true")
+
+        # The mutating command is not cached, and removes the cached results
+        # it may affect
+        self.assertEqual("true", epo.execute("system.applyTag", "json",
+                                             {"names": "x", "tagName": "y"}))
+        self.assertEqual("true", epo.execute("system.applyTag", "json",
+                                             {"names": "x", "tagName": "y"}))
+        self.assertEqual(2, epo._fetch.call_count)
+        self.assertIsNone(cache.get("epo1", SYSTEM_FIND_CMD_NAME, "json",
+                                    FIND_PARAMS))
+        cache.shutdown()
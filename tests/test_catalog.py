@@ -0,0 +1,214 @@
+import json
+import threading
+import time
+from mock import MagicMock
+from dxlclient import Request
+from dxlclient.message import ErrorResponse
+
+import dxleposervice._epo
+import dxleposervice.app
+from dxleposervice._catalog import _Catalog, _CatalogManager, \
+    _CatalogRequestCallback
+from dxleposervice._errors import _InvalidRequestError
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_dxlclient import MockDxlClient
+from tests.mock_epohttpserver import MockServerRunner
+
+HELP_LISTINGS = [
+    "core.executeQuery queryId | target [select] [where] [order] [group] "
+    "[database] [depth] [joinTables] - Executes a SQL query and returns the "
+    "results",
+    "core.help [command] [prefix=<>] - Displays a list of all commands and help "
+    "strings.",
+    "system.applyTag names tagName - Assign the given tag to a supplied list of "
+    "systems.",
+    "system.find searchText [searchNameOnly] - Finds systems in the System Tree"
+]
+
+
+class TestCatalog(BaseClientTest):
+
+    def test_parse(self):
+        catalog = _Catalog.parse(json.dumps(HELP_LISTINGS))
+
+        self.assertEqual(4, len(catalog))
+        command = catalog.get("System.Find")
+        self.assertEqual(SYSTEM_FIND_CMD_NAME, command.name)
+        self.assertEqual([["searchText"]], command.required)
+        self.assertEqual(["searchNameOnly"], command.optional)
+        self.assertEqual("Finds systems in the System Tree", command.description)
+        self.assertEqual([["queryId", "target"]],
+                         catalog.get("core.executeQuery").required)
+        self.assertEqual(["command", "prefix"],
+                         catalog.get(CORE_HELP_CMD_NAME).optional)
+
+    def test_parse_text(self):
+        catalog = _Catalog.parse(HELP_CMD_RESPONSE_PAYLOAD)
+
+        self.assertEqual(2, len(catalog))
+        self.assertEqual("Displays a list of all commands and help \nstrings.",
+                         catalog.get(CORE_HELP_CMD_NAME).description)
+        self.assertEqual(["searchText", "searchNameOnly"],
+                         catalog.get(SYSTEM_FIND_CMD_NAME).optional)
+
+    def test_validate(self):
+        catalog = _Catalog.parse(json.dumps(HELP_LISTINGS))
+
+        self.assertIsNone(catalog.validate(
+            SYSTEM_FIND_CMD_NAME, {"searchText": "Linux"}))
+        self.assertIsNone(catalog.validate("core.executeQuery", {"target": "x"}))
+        self.assertIsNone(catalog.validate("system.applyTag",
+                                           {"param1": "x", "param2": "y"}))
+        self.assertEqual("missing_parameters",
+                         catalog.validate("core.executeQuery", {})[0])
+        self.assertEqual("missing_parameters",
+                         catalog.validate("system.applyTag", {"names": "x"})[0])
+        self.assertEqual("unknown_command",
+                         catalog.validate("system.fnid", {})[0])
+
+    def test_incomplete_catalog(self):
+        catalog = _Catalog.parse(json.dumps(
+            HELP_LISTINGS + ["system.delete names [uninstall] with no separator"]))
+
+        self.assertFalse(catalog.complete)
+        self.assertTrue(_Catalog.parse(json.dumps(HELP_LISTINGS)).complete)
+        # Commands that could not be parsed are not rejected
+        self.assertIsNone(catalog.validate("system.delete", {}))
+        self.assertEqual("missing_parameters",
+                         catalog.validate("core.executeQuery", {})[0])
+
+    def test_to_dict(self):
+        catalog = _Catalog.parse(json.dumps(HELP_LISTINGS))
+
+        commands = catalog.to_dict("system.")["commands"]
+        self.assertEqual(["system.applyTag", SYSTEM_FIND_CMD_NAME],
+                         [command["name"] for command in commands])
+        self.assertEqual(
+            [{"name": "searchText", "required": True},
+             {"name": "searchNameOnly", "required": False}],
+            commands[1]["parameters"])
+
+
+class TestCatalogManager(BaseClientTest):
+
+    @staticmethod
+    def create_epo(name, execute):
+        epo = MagicMock()
+        epo.name = name
+        epo.execute = execute
+        return epo
+
+    def wait_for_catalog(self, catalog_manager, epo_name):
+        deadline = time.time() + 5
+        while catalog_manager.get(epo_name) is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIsNotNone(catalog_manager.get(epo_name))
+
+    def test_load_on_demand(self):
+        epo = self.create_epo(
+            "epo1", MagicMock(return_value=json.dumps(HELP_LISTINGS)))
+        catalog_manager = _CatalogManager([epo], refresh_interval=3600)
+
+        # The first request starts loading the catalog (and is not validated)
+        catalog_manager.validate(epo.name, "system.fnid", {})
+        self.wait_for_catalog(catalog_manager, epo.name)
+
+        self.assertRaises(_InvalidRequestError, catalog_manager.validate,
+                          epo.name, "system.fnid", {})
+        catalog_manager.validate(epo.name, SYSTEM_FIND_CMD_NAME,
+                                 {"searchText": "Linux"})
+        self.assertEqual(1, epo.execute.call_count)
+
+    def test_load_on_demand_in_background(self):
+        loading = threading.Event()
+        release = threading.Event()
+
+        def slow_help(*_):
+            loading.set()
+            release.wait(5)
+            return json.dumps(HELP_LISTINGS)
+
+        slow_epo = self.create_epo("epo1", MagicMock(side_effect=slow_help))
+        epo = self.create_epo(
+            "epo2", MagicMock(return_value=json.dumps(HELP_LISTINGS)))
+        catalog_manager = _CatalogManager([slow_epo, epo],
+                                          refresh_interval=3600)
+        try:
+            # Requests are not validated (nor blocked) while the catalog of
+            # their ePO server is loading, and the catalog is only loaded once
+            catalog_manager.validate(slow_epo.name, "system.fnid", {})
+            self.assertTrue(loading.wait(5))
+            catalog_manager.validate(slow_epo.name, "system.fnid", {})
+            catalog_manager.refresh()
+            self.assertEqual(1, slow_epo.execute.call_count)
+
+            # The catalogs of other ePO servers are loaded independently
+            self.assertIsNotNone(catalog_manager.get(epo.name))
+            self.assertRaises(_InvalidRequestError, catalog_manager.validate,
+                              epo.name, "system.fnid", {})
+        finally:
+            release.set()
+        self.wait_for_catalog(catalog_manager, slow_epo.name)
+
+    def test_load_on_demand_failure(self):
+        epo = self.create_epo("epo1",
+                              MagicMock(side_effect=Exception("Unavailable")))
+        catalog_manager = _CatalogManager([epo], refresh_interval=3600)
+
+        # Requests are not validated if the catalog can not be loaded, and the
+        # catalog is not loaded again until the retry interval has elapsed
+        catalog_manager.validate(epo.name, "system.fnid", {})
+        deadline = time.time() + 5
+        while not catalog_manager._failures and time.time() < deadline:
+            time.sleep(0.01)
+        catalog_manager.validate(epo.name, "system.fnid", {})
+        self.assertEqual(1, epo.execute.call_count)
+
+    def test_eporequestcallback_validation(self):
+        mock_dxl_client = MockDxlClient()
+
+        with MockServerRunner() as server_list:
+            server_info = server_list[0]
+            test_topic = "/test/topic"
+            catalog_topic = "/test/topic/catalog"
+
+            epo = dxleposervice._epo._Epo(
+                server_info[SERVER_INFO_SERVER_NAME_KEY],
+                LOCALHOST_IP,
+                server_info[SERVER_INFO_SERVER_PORT_KEY],
+                TEST_USER,
+                TEST_PASSWORD,
+                False
+            )
+            catalog_manager = _CatalogManager([epo], refresh_interval=3600)
+            catalog_manager.refresh()
+
+        self.assertIsNotNone(catalog_manager.get(epo.name))
+        self.assertRaises(_InvalidRequestError, catalog_manager.validate,
+                          epo.name, "system.fnid", {})
+
+        # Unknown commands are rejected without invoking the (stopped) server
+        epo_request_callback = dxleposervice.app._EpoRequestCallback(
+            mock_dxl_client, {test_topic: epo}, catalog_manager=catalog_manager)
+        test_request = Request(test_topic)
+        test_request.payload = json.dumps(
+            {"command": "system.fnid"}).encode(encoding="UTF-8")
+        epo_request_callback.on_request(test_request)
+
+        response = mock_dxl_client.latest_sent_message
+        self.assertIsInstance(response, ErrorResponse)
+        self.assertEqual(400, response.error_code)
+
+        # The catalog is available to clients
+        catalog_callback = _CatalogRequestCallback(
+            mock_dxl_client, catalog_manager, {catalog_topic: epo})
+        catalog_request = Request(catalog_topic)
+        catalog_request.payload = json.dumps(
+            {"command": SYSTEM_FIND_CMD_NAME}).encode(encoding="UTF-8")
+        catalog_callback.on_request(catalog_request)
+
+        response = mock_dxl_client.latest_sent_message
+        self.assertNotIsInstance(response, ErrorResponse)
+        self.assertEqual(SYSTEM_FIND_CMD_NAME,
+                         json.loads(response.payload)["name"])
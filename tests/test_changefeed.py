@@ -0,0 +1,78 @@
+import json
+from mock import MagicMock
+
+from dxleposervice._changefeed import _ChangeFeed
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+
+KEY_PROPERTY = "EPOLeafNode.AgentGUID"
+
+
+class TestChangeFeed(BaseClientTest):
+
+    def create_feed(self, records, key_properties=None, batch_size=500):
+        epo = MagicMock()
+        epo.name = "epo1"
+        epo.execute.return_value = json.dumps(records)
+        publisher = MagicMock()
+        feed = _ChangeFeed("systems", epo, SYSTEM_FIND_CMD_NAME,
+                           {"searchText": ""}, "/test/changes", 300, publisher,
+                           key_properties=key_properties, batch_size=batch_size)
+        return feed, epo, publisher
+
+    def test_poll(self):
+        feed, epo, publisher = self.create_feed(SYSTEM_FIND_PAYLOAD,
+                                                [KEY_PROPERTY])
+
+        # The first result is the initial snapshot
+        self.assertEqual(0, feed.poll())
+        self.assertFalse(publisher.called)
+        epo.execute.assert_called_once_with(
+            SYSTEM_FIND_CMD_NAME, "json", {"searchText": ""}, use_local=False)
+
+        changed = dict(SYSTEM_FIND_PAYLOAD[0])
+        changed["EPOLeafNode.Tags"] = "Server"
+        added = dict(SYSTEM_FIND_PAYLOAD[1])
+        added[KEY_PROPERTY] = "aaaaaaaa-7777-8888-9999-000000000000"
+        epo.execute.return_value = json.dumps([changed, added])
+
+        self.assertEqual(3, feed.poll())
+        publisher.assert_called_once_with("/test/changes", {
+            "feed": "systems", "epo": "epo1", "added": [added],
+            "changed": [changed],
+            "removed": [{KEY_PROPERTY: SYSTEM_FIND_PAYLOAD[1][KEY_PROPERTY]}]})
+
+        # No changes, no events
+        publisher.reset_mock()
+        self.assertEqual(0, feed.poll())
+        self.assertFalse(publisher.called)
+
+    def test_poll_without_key(self):
+        feed, epo, publisher = self.create_feed(SYSTEM_FIND_PAYLOAD,
+                                                batch_size=1)
+        feed.poll()
+        changed = dict(SYSTEM_FIND_PAYLOAD[0])
+        changed["EPOLeafNode.Tags"] = "Server"
+        epo.execute.return_value = json.dumps([changed, SYSTEM_FIND_PAYLOAD[1]])
+
+        # A changed record is published as an added and a removed record (in
+        # separate events)
+        self.assertEqual(2, feed.poll())
+        self.assertEqual(2, publisher.call_count)
+        self.assertEqual([changed], publisher.call_args_list[0][0][1]["added"])
+        self.assertEqual([SYSTEM_FIND_PAYLOAD[0]],
+                         publisher.call_args_list[1][0][1]["removed"])
+
+    def test_poll_failure(self):
+        feed, epo, publisher = self.create_feed(SYSTEM_FIND_PAYLOAD,
+                                                [KEY_PROPERTY])
+        feed.poll()
+        epo.execute.return_value = json.dumps(SYSTEM_FIND_PAYLOAD[:1])
+        publisher.side_effect = Exception("Not connected")
+
+        self.assertIsNone(feed.poll())
+        # The changes are published by the next poll
+        publisher.side_effect = None
+        self.assertEqual(1, feed.poll())
+        epo.execute.side_effect = Exception("Unavailable")
+        self.assertIsNone(feed.poll())
@@ -0,0 +1,166 @@
+import threading
+import time
+from mock import patch
+
+from dxleposervice._dispatch import _Dispatcher, _FairQueue, _Lane, _PoolSizer
+from dxleposervice._errors import _InvalidRequestError
+from tests.test_base import BaseClientTest
+
+
+class TestFairQueue(BaseClientTest):
+
+    def test_round_robin_across_clients(self):
+        queue = _FairQueue(max_size=100)
+        for index in range(3):
+            queue.put("heavy", "heavy{0}".format(index))
+        queue.put("light", "light0")
+
+        self.assertEqual(["heavy0", "light0", "heavy1", "heavy2"],
+                         [queue.get() for _ in range(4)])
+
+    def test_weights(self):
+        queue = _FairQueue(max_size=100, weights={"Heavy": 2})
+        for index in range(4):
+            queue.put("heavy", "heavy{0}".format(index))
+            queue.put("light", "light{0}".format(index))
+
+        self.assertEqual(["heavy0", "heavy1", "light0", "heavy2", "heavy3",
+                          "light1"],
+                         [queue.get() for _ in range(6)])
+
+    def test_max_size(self):
+        queue = _FairQueue(max_size=1)
+
+        self.assertTrue(queue.put("client1", 1))
+        self.assertFalse(queue.put("client2", 2))
+
+        queue.close()
+        self.assertEqual(1, queue.get())
+        self.assertIsNone(queue.get())
+
+    def test_get_timeout(self):
+        queue = _FairQueue(max_size=1)
+
+        self.assertIsNone(queue.get(0.01))
+        self.assertFalse(queue.closed)
+
+
+class TestLane(BaseClientTest):
+
+    def test_submit(self):
+        lane = _Lane("default", thread_count=2, queue_size=10)
+        done = threading.Event()
+        results = []
+
+        def task(value):
+            results.append(value)
+            done.set()
+
+        self.assertTrue(lane.submit("client1", task, "value"))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(["value"], results)
+        lane.shutdown()
+
+    @patch.object(_Lane, "IDLE_TIMEOUT", 0.01)
+    def test_resize(self):
+        lane = _Lane("default", thread_count=1, queue_size=10,
+                     max_thread_count=3)
+        self.assertTrue(lane.adaptive)
+
+        # The thread count is limited to the minimum and maximum
+        self.assertEqual(3, lane.resize(10))
+        self.assertEqual(3, lane.thread_count)
+        self.assertEqual(1, lane.resize(0))
+
+        # Surplus threads exit once they are idle
+        deadline = time.time() + 5
+        while lane.thread_count > 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(1, lane.thread_count)
+        lane.shutdown()
+
+    def test_sample(self):
+        lane = _Lane("default", thread_count=1, queue_size=10)
+        done = threading.Event()
+        lane.submit("client1", time.sleep, 0.01, key="epo1")
+        lane.submit("client1", done.set, key="epo2")
+        self.assertTrue(done.wait(5))
+
+        stats_by_key, _, dequeued, busy_time = lane.sample()
+        self.assertEqual(2, dequeued)
+        self.assertEqual(1, stats_by_key["epo1"][0])
+        self.assertGreater(stats_by_key["epo1"][2], 0)
+        self.assertGreater(busy_time, 0)
+        self.assertEqual(({}, 0.0, 0, 0.0), lane.sample())
+        lane.shutdown()
+
+
+class TestPoolSizer(BaseClientTest):
+
+    def test_adjust(self):
+        lane = _Lane("default", thread_count=1, queue_size=10,
+                     max_thread_count=20)
+        stats = {"epo1": [20, 20, 20 * 0.5], "epo2": [50, 50, 50 * 0.02]}
+        lane.sample = lambda: (stats, 0.0, 70, 11.0)
+        sizer = _PoolSizer([lane], 10)
+
+        # 2/s * 0.5s + 5/s * 0.02s = 1.1 threads (plus headroom)
+        sizer._last_sample = time.time() - 10
+        sizer.adjust()
+        self.assertEqual(2, lane.thread_count)
+
+        # The slow ePO server needs more threads as its arrival rate increases
+        stats = {"epo1": [100, 100, 100 * 0.5]}
+        sizer._last_sample = time.time() - 10
+        sizer.adjust()
+        self.assertEqual(7, lane.thread_count)
+
+        # The pool shrinks gradually
+        stats = {}
+        sizer._last_sample = time.time() - 10
+        sizer.adjust()
+        self.assertEqual(5, lane._target_thread_count)
+        lane.shutdown()
+
+    def test_fixed(self):
+        lane = _Lane("default", thread_count=2, queue_size=10)
+        lane.sample = lambda: ({"epo1": [100, 100, 100.0]}, 0.0, 100, 20.0)
+        sizer = _PoolSizer([lane], 10)
+
+        sizer.adjust()
+        self.assertFalse(lane.adaptive)
+        self.assertEqual(2, lane.thread_count)
+        lane.shutdown()
+
+
+class TestDispatcher(BaseClientTest):
+
+    def test_getlane(self):
+        interactive = _Lane("interactive", thread_count=0, queue_size=10)
+        bulk = _Lane("bulk", thread_count=0, queue_size=10)
+        dispatcher = _Dispatcher(
+            None, [interactive, bulk],
+            [("system.find", interactive), ("core.*", bulk)])
+
+        self.assertIs(interactive, dispatcher.get_lane("System.Find"))
+        self.assertIs(bulk, dispatcher.get_lane("core.executeQuery"))
+        self.assertIsNone(dispatcher.get_lane("system.applyTag"))
+        self.assertIs(bulk, dispatcher.get_lane("system.find", "Bulk"))
+        self.assertIs(bulk, dispatcher.get_lane("system.applyTag", "bulk"))
+        self.assertRaises(_InvalidRequestError, dispatcher.get_lane,
+                          "core.help", "unknown")
+
+    def test_getlane_priority_can_not_be_raised(self):
+        interactive = _Lane("interactive", thread_count=0, queue_size=10)
+        bulk = _Lane("bulk", thread_count=0, queue_size=10)
+        dispatcher = _Dispatcher(
+            None, [interactive, bulk],
+            [("system.find", interactive), ("core.*", bulk)])
+
+        self.assertRaises(_InvalidRequestError, dispatcher.get_lane,
+                          "core.executeQuery", "Interactive")
+        self.assertIs(bulk, dispatcher.get_lane("core.executeQuery", "bulk"))
+        self.assertRaises(_InvalidRequestError, dispatcher.get_lane,
+                          "system.find", 1)
+        self.assertRaises(_InvalidRequestError, dispatcher.get_lane,
+                          "system.find", ["bulk"])
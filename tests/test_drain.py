@@ -0,0 +1,72 @@
+import json
+import threading
+from dxlclient import Request
+from mock import MagicMock
+
+import dxleposervice.app
+from dxleposervice import EpoService
+from dxleposervice._dispatch import _Dispatcher, _Lane
+from dxleposervice._drain import _InFlightTracker
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_dxlclient import MockDxlClient
+
+
+class TestInFlightTracker(BaseClientTest):
+
+    def test_wait(self):
+        tracker = _InFlightTracker()
+        self.assertTrue(tracker.wait(0))
+
+        tracker.begin()
+        self.assertFalse(tracker.wait(0.05))
+        threading.Timer(0.05, tracker.end).start()
+        self.assertTrue(tracker.wait(5))
+        self.assertEqual(0, tracker.count)
+
+
+class TestDrain(BaseClientTest):
+
+    def test_eporequestcallback_in_flight(self):
+        tracker = _InFlightTracker()
+        release = threading.Event()
+        epo = MagicMock()
+        epo.execute.side_effect = lambda *args: release.wait(5) and "result"
+        lane = _Lane("default", thread_count=1, queue_size=10)
+        callback = dxleposervice.app._EpoRequestCallback(
+            MockDxlClient(), {"/test/topic": epo},
+            dispatcher=_Dispatcher(lane), in_flight=tracker)
+
+        request = Request("/test/topic")
+        request.payload = json.dumps(
+            {"command": SYSTEM_FIND_CMD_NAME}).encode(encoding="UTF-8")
+        callback.on_request(request)
+
+        # The request queued in the lane is in progress until it is processed
+        self.assertEqual(1, tracker.count)
+        release.set()
+        self.assertTrue(tracker.wait(5))
+        lane.shutdown()
+
+    def test_drain(self):
+        epo_service = EpoService(TEST_FOLDER)
+        epo_service._dxl_client = MagicMock()
+        service = MagicMock()
+        epo_service._dxl_service = service
+        epo_service._drain_timeout = 5
+        epo_service._in_flight.begin()
+        order = []
+        epo_service._dxl_client.unregister_service_sync.side_effect = \
+            lambda *args: order.append("unregistered")
+
+        def complete():
+            order.append("completed")
+            epo_service._in_flight.end()
+        threading.Timer(0.1, complete).start()
+
+        # The service is unregistered before waiting for requests to complete
+        epo_service._drain()
+        self.assertEqual(["unregistered", "completed"], order)
+        epo_service._dxl_client.unregister_service_sync.assert_called_once_with(
+            service, EpoService.DXL_SERVICE_REGISTRATION_TIMEOUT)
+        self.assertIsNone(epo_service._dxl_service)
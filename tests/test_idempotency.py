@@ -0,0 +1,106 @@
+import json
+from dxlclient import Request
+from dxlclient.message import ErrorResponse
+
+import dxleposervice._epo
+import dxleposervice.app
+from dxleposervice._errors import _InvalidRequestError
+from dxleposervice._idempotency import _IdempotencyCache
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_dxlclient import MockDxlClient
+from tests.mock_epohttpserver import MockServerRunner
+
+
+class TestIdempotencyCache(BaseClientTest):
+
+    def test_completed_outcome(self):
+        cache = _IdempotencyCache(max_entries=10, ttl=60)
+
+        self.assertIsNone(cache.get_or_add("key1", SYSTEM_FIND_CMD_NAME, "req1"))
+        self.assertEqual([], cache.complete("key1", result="result"))
+
+        entry = cache.get_or_add("key1", SYSTEM_FIND_CMD_NAME, "req2")
+        self.assertTrue(entry.done)
+        self.assertEqual("result", entry.result)
+        self.assertRaises(_InvalidRequestError, cache.get_or_add,
+                          "key1", CORE_HELP_CMD_NAME, "req3")
+
+    def test_params_mismatch(self):
+        cache = _IdempotencyCache(max_entries=10, ttl=60)
+
+        cache.get_or_add("key1", SYSTEM_FIND_CMD_NAME, "req1",
+                         {"searchText": "host1", "names": ["a", "b"]})
+        self.assertIsNotNone(cache.get_or_add(
+            "key1", SYSTEM_FIND_CMD_NAME, "req2",
+            {"names": ["a", "b"], "searchText": "host1"}))
+        self.assertRaises(_InvalidRequestError, cache.get_or_add,
+                          "key1", SYSTEM_FIND_CMD_NAME, "req3",
+                          {"searchText": "host2", "names": ["a", "b"]})
+
+    def test_waiters(self):
+        cache = _IdempotencyCache(max_entries=10, ttl=60)
+
+        cache.get_or_add("key1", SYSTEM_FIND_CMD_NAME, "req1")
+        entry = cache.get_or_add("key1", SYSTEM_FIND_CMD_NAME, "req2")
+
+        self.assertFalse(entry.done)
+        self.assertEqual(["req2"], cache.complete("key1", error=Exception()))
+        # Failed requests are not retained
+        self.assertIsNone(cache.get_or_add("key1", SYSTEM_FIND_CMD_NAME, "req3"))
+
+    def test_max_entries(self):
+        cache = _IdempotencyCache(max_entries=2, ttl=60)
+
+        for index in range(3):
+            key = "key{0}".format(index)
+            cache.get_or_add(key, SYSTEM_FIND_CMD_NAME, "req")
+            cache.complete(key, result="result")
+
+        self.assertIsNone(cache.get_or_add("key0", SYSTEM_FIND_CMD_NAME, "req"))
+        self.assertIsNotNone(cache.get_or_add("key2", SYSTEM_FIND_CMD_NAME, "req"))
+
+    def test_eporequestcallback_retry(self):
+        mock_dxl_client = MockDxlClient()
+        cache = _IdempotencyCache(max_entries=10, ttl=60)
+
+        with MockServerRunner() as server_list:
+            server_info = server_list[0]
+            test_topic = "/test/topic"
+
+            epo = dxleposervice._epo._Epo(
+                server_info[SERVER_INFO_SERVER_NAME_KEY],
+                LOCALHOST_IP,
+                server_info[SERVER_INFO_SERVER_PORT_KEY],
+                TEST_USER,
+                TEST_PASSWORD,
+                False
+            )
+
+            epo_request_callback = dxleposervice.app._EpoRequestCallback(
+                mock_dxl_client, {test_topic: epo}, idempotency_cache=cache)
+
+            test_request = Request(test_topic)
+            test_request.payload = json.dumps(
+                {"command": CORE_HELP_CMD_NAME, "idempotencyKey": "key1"}
+            ).encode(encoding="UTF-8")
+            epo_request_callback.on_request(test_request)
+
+        # The server has stopped, the retry is served from the cache
+        retry_request = Request(test_topic)
+        retry_request.payload = test_request.payload
+        epo_request_callback.on_request(retry_request)
+
+        response = mock_dxl_client.latest_sent_message
+        self.assertNotIsInstance(response, ErrorResponse)
+        self.assertEqual(retry_request.message_id, response.request_message_id)
+        self.assertIn(HELP_CMD_RESPONSE_PAYLOAD, response._payload)
+
+        # Keys are scoped to the client, the request of another client with the
+        # same key invokes the command (which fails, the server has stopped)
+        other_request = Request(test_topic)
+        other_request._source_client_id = "{other-client}" # pylint: disable=protected-access
+        other_request.payload = test_request.payload
+        epo_request_callback.on_request(other_request)
+
+        self.assertIsInstance(mock_dxl_client.latest_sent_message, ErrorResponse)
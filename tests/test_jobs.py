@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from dxlclient import Request
+from dxlclient.message import ErrorResponse
+
+import dxleposervice._epo
+import dxleposervice.app
+from dxleposervice._drain import _InFlightTracker
+from dxleposervice._errors import _InvalidRequestError
+from dxleposervice._jobs import _Job, _JobManager, _JobRequestCallback
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_dxlclient import MockDxlClient
+from tests.mock_epohttpserver import MockServerRunner
+
+
+class TestJobManager(BaseClientTest):
+
+    def wait_for_event(self, job_manager, mock_dxl_client, run):
+        done = threading.Event()
+        send_event = mock_dxl_client.send_event
+
+        def on_event(event):
+            send_event(event)
+            done.set()
+
+        mock_dxl_client.send_event = on_event
+        job = job_manager.submit(mock_dxl_client, "client1", TEST_EPONAME_BASE,
+                                 CORE_HELP_CMD_NAME, run)
+        self.assertTrue(done.wait(5))
+        return job, json.loads(mock_dxl_client.latest_sent_event.payload)
+
+    def test_result_not_in_event(self):
+        job_manager = _JobManager(thread_count=1, queue_size=10,
+                                  chunk_size=100, retention=60)
+        mock_dxl_client = MockDxlClient()
+
+        job, event = self.wait_for_event(job_manager, mock_dxl_client,
+                                         lambda: "result")
+
+        self.assertEqual(job.id, event["jobId"])
+        self.assertEqual(_Job.COMPLETED, event["status"])
+        self.assertEqual(1, event["chunkCount"])
+        self.assertNotIn("result", event)
+        self.assertEqual("result",
+                         job_manager.get_status("client1", job.id, 0)["result"])
+        # Only the owner of the job can retrieve its result
+        self.assertRaises(_InvalidRequestError, job_manager.get_status,
+                          None, job.id)
+        job_manager.shutdown()
+
+    def test_chunked_result(self):
+        job_manager = _JobManager(thread_count=1, queue_size=10,
+                                  chunk_size=4, retention=60)
+        mock_dxl_client = MockDxlClient()
+
+        job, event = self.wait_for_event(job_manager, mock_dxl_client,
+                                         lambda: "0123456789")
+
+        self.assertEqual(3, event["chunkCount"])
+        self.assertNotIn("result", event)
+        self.assertEqual(
+            "0123456789",
+            "".join(job_manager.get_status("client1", job.id, i)["result"]
+                    for i in range(3)))
+        self.assertRaises(_InvalidRequestError, job_manager.get_status,
+                          "client2", job.id)
+        for chunk in (3, -1, "1", 1.5, True):
+            self.assertRaises(_InvalidRequestError, job_manager.get_status,
+                              "client1", job.id, chunk)
+
+        request = Request("/test/job/status")
+        request._source_client_id = "client1" # pylint: disable=protected-access
+        request.payload = json.dumps(
+            {"jobId": job.id, "chunk": "1"}).encode(encoding="UTF-8")
+        _JobRequestCallback(mock_dxl_client, job_manager).on_request(request)
+        self.assertIsInstance(mock_dxl_client.latest_sent_message,
+                              ErrorResponse)
+        self.assertEqual(400, mock_dxl_client.latest_sent_message.error_code)
+        job_manager.shutdown()
+
+    def test_cancel_queued_job(self):
+        job_manager = _JobManager(thread_count=0, queue_size=10,
+                                  chunk_size=100, retention=60)
+        mock_dxl_client = MockDxlClient()
+
+        job = job_manager.submit(mock_dxl_client, "client1", TEST_EPONAME_BASE,
+                                 CORE_HELP_CMD_NAME, lambda: "result")
+        status = job_manager.cancel(mock_dxl_client, "client1", job.id)
+
+        self.assertEqual(_Job.CANCELLED, status["status"])
+        self.assertEqual(
+            _Job.CANCELLED,
+            json.loads(mock_dxl_client.latest_sent_event.payload)["status"])
+
+    def test_retention_limits(self):
+        job_manager = _JobManager(thread_count=1, queue_size=10,
+                                  chunk_size=100, retention=60,
+                                  max_retained_count=2, max_retained_size=8)
+        mock_dxl_client = MockDxlClient()
+
+        jobs = [self.wait_for_event(job_manager, mock_dxl_client,
+                                    lambda: "1234")[0] for _ in range(3)]
+
+        # The oldest job exceeds both the count and the size limits
+        self.assertRaises(_InvalidRequestError, job_manager.get_status,
+                          "client1", jobs[0].id)
+        for job in jobs[1:]:
+            self.assertEqual(_Job.COMPLETED,
+                             job_manager.get_status("client1", job.id)["status"])
+        job_manager.shutdown()
+
+    def test_prune_expired_jobs(self):
+        job_manager = _JobManager(thread_count=1, queue_size=10,
+                                  chunk_size=100, retention=60)
+        mock_dxl_client = MockDxlClient()
+
+        job, _ = self.wait_for_event(job_manager, mock_dxl_client,
+                                     lambda: "result")
+        job.finished = time.time() - 120
+        job_manager.prune()
+
+        self.assertRaises(_InvalidRequestError, job_manager.get_status,
+                          "client1", job.id)
+        job_manager.shutdown()
+
+    def test_jobs_in_flight(self):
+        in_flight = _InFlightTracker()
+        job_manager = _JobManager(thread_count=0, queue_size=10,
+                                  chunk_size=100, retention=60,
+                                  in_flight=in_flight)
+        mock_dxl_client = MockDxlClient()
+
+        job_manager.submit(mock_dxl_client, "client1", TEST_EPONAME_BASE,
+                           CORE_HELP_CMD_NAME, lambda: "result")
+
+        self.assertEqual(1, in_flight.count)
+        job_manager.shutdown()
+
+    def test_eporequestcallback_async(self):
+        job_manager = _JobManager(thread_count=1, queue_size=10,
+                                  chunk_size=100000, retention=60,
+                                  status_topic="/test/job/status/instance1",
+                                  cancel_topic="/test/job/cancel/instance1")
+        mock_dxl_client = MockDxlClient()
+        done = threading.Event()
+        mock_dxl_client.send_event = lambda event: done.set()
+
+        with MockServerRunner() as server_list:
+            server_info = server_list[0]
+            test_topic = "/test/topic"
+
+            epo = dxleposervice._epo._Epo(
+                server_info[SERVER_INFO_SERVER_NAME_KEY],
+                LOCALHOST_IP,
+                server_info[SERVER_INFO_SERVER_PORT_KEY],
+                TEST_USER,
+                TEST_PASSWORD,
+                False
+            )
+
+            test_request = Request(test_topic)
+            test_request.payload = json.dumps(
+                {"command": CORE_HELP_CMD_NAME, "async": True}
+            ).encode(encoding="UTF-8")
+
+            epo_request_callback = dxleposervice.app._EpoRequestCallback(
+                mock_dxl_client, {test_topic: epo}, job_manager=job_manager)
+            epo_request_callback.on_request(test_request)
+
+            response = json.loads(mock_dxl_client.latest_sent_message.payload)
+            self.assertTrue(done.wait(5))
+            status = job_manager.get_status(test_request.source_client_id,
+                                            response["jobId"], 0)
+
+            self.assertEqual(_JobManager.DXL_JOB_EVENT_FORMAT.format(
+                response["jobId"]), response["topic"])
+            # The topics of the service instance that holds the job
+            self.assertEqual("/test/job/status/instance1",
+                             response["statusTopic"])
+            self.assertEqual("/test/job/cancel/instance1",
+                             response["cancelTopic"])
+            self.assertIn(HELP_CMD_RESPONSE_PAYLOAD, status["result"])
+            job_manager.shutdown()
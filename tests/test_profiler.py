@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from dxlclient import Request
+from dxlclient.message import ErrorResponse
+
+from dxleposervice._profiler import _AdminRequestCallback, _MemorySnapshots, \
+    _SamplingProfiler, tracemalloc
+from tests.test_base import BaseClientTest
+from tests.mock_dxlclient import MockDxlClient
+
+ADMIN_CLIENT_ID = "{admin-client}"
+
+
+def busy_function(stopped):
+    while not stopped.is_set():
+        time.sleep(0.001)
+
+
+def create_request(client_id, **req_dict):
+    request = Request("/mcafee/service/epo/remote/admin")
+    request._source_client_id = client_id # pylint: disable=protected-access
+    request.payload = json.dumps(req_dict).encode(encoding="UTF-8")
+    return request
+
+
+class TestSamplingProfiler(BaseClientTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_profile(self):
+        stopped = threading.Event()
+        thread = threading.Thread(target=busy_function, args=(stopped,),
+                                  name="BusyThread")
+        thread.start()
+        profiler = _SamplingProfiler(self.directory, interval=0.001)
+        try:
+            path = profiler.start(60)
+            self.assertTrue(profiler.running)
+            self.assertRaises(Exception, profiler.start, 60)
+            time.sleep(0.2)
+            self.assertEqual(path, profiler.stop())
+        finally:
+            stopped.set()
+            thread.join()
+
+        self.assertFalse(profiler.running)
+        self.assertIsNone(profiler.stop())
+        with open(path) as profile_file:
+            lines = profile_file.read().splitlines()
+        busy_stacks = [line for line in lines
+                       if line.startswith("BusyThread;")]
+        self.assertTrue(busy_stacks)
+        stack, count = busy_stacks[0].rsplit(" ", 1)
+        self.assertIn(";busy_function_(test_profiler.py:", stack)
+        self.assertGreater(int(count), 0)
+
+    def test_duration(self):
+        profiler = _SamplingProfiler(self.directory, interval=0.001)
+        path = profiler.start(0.05)
+        time.sleep(0.5)
+
+        self.assertFalse(profiler.running)
+        self.assertTrue(os.path.exists(path))
+
+
+@unittest.skipIf(tracemalloc is None, "Memory tracing is not supported")
+class TestMemorySnapshots(BaseClientTest):
+
+    def test_snapshot(self):
+        directory = tempfile.mkdtemp()
+        snapshots = _MemorySnapshots(directory)
+        try:
+            self.assertRaises(Exception, snapshots.snapshot)
+            snapshots.start()
+            data = [bytearray(1024) for _ in range(100)]
+            result = snapshots.snapshot()
+            self.assertTrue(os.path.exists(result["file"]))
+            self.assertGreaterEqual(result["traced"], 1024 * 100)
+            self.assertTrue(any("test_profiler.py" in stat["location"]
+                                for stat in result["top"]))
+            del data
+        finally:
+            snapshots.stop()
+            shutil.rmtree(directory)
+
+
+class TestAdminRequestCallback(BaseClientTest):
+
+    def test_requests(self):
+        directory = tempfile.mkdtemp()
+        mock_dxl_client = MockDxlClient()
+        profiler = _SamplingProfiler(directory)
+        callback = _AdminRequestCallback(
+            mock_dxl_client, profiler, _MemorySnapshots(directory),
+            [ADMIN_CLIENT_ID], default_duration=30, max_duration=60)
+        try:
+            callback.on_request(create_request("{other-client}",
+                                               command="profile.start"))
+            self.assertIsInstance(mock_dxl_client.latest_sent_message,
+                                  ErrorResponse)
+            self.assertEqual(403,
+                             mock_dxl_client.latest_sent_message.error_code)
+            self.assertFalse(profiler.running)
+
+            callback.on_request(create_request(
+                ADMIN_CLIENT_ID, command="profile.start", duration=120))
+            self.assertEqual(400,
+                             mock_dxl_client.latest_sent_message.error_code)
+
+            callback.on_request(create_request(ADMIN_CLIENT_ID,
+                                               command="profile.start"))
+            self.assertTrue(profiler.running)
+            callback.on_request(create_request(ADMIN_CLIENT_ID,
+                                               command="profile.stop"))
+            result = json.loads(mock_dxl_client.latest_sent_message.payload)
+            self.assertTrue(os.path.exists(result["file"]))
+        finally:
+            profiler.stop()
+            shutil.rmtree(directory)
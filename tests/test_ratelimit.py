@@ -0,0 +1,90 @@
+import json
+from mock import patch
+from dxlclient import Request
+from dxlclient.message import ErrorResponse
+
+import dxleposervice._epo
+import dxleposervice.app
+from dxleposervice._errors import _RateLimitedError
+from dxleposervice._ratelimit import _RateLimiter, _TokenBucket
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_dxlclient import MockDxlClient
+
+
+class TestTokenBucket(BaseClientTest):
+
+    def test_tryconsume(self):
+        bucket = _TokenBucket(rate=2, burst=2)
+        now = bucket._last
+
+        self.assertTrue(bucket.try_consume(now))
+        self.assertTrue(bucket.try_consume(now))
+        self.assertFalse(bucket.try_consume(now))
+        self.assertEqual(500, bucket.retry_after())
+        self.assertTrue(bucket.try_consume(now + 0.5))
+
+
+class TestRateLimiter(BaseClientTest):
+
+    def test_client_limits(self):
+        limiter = _RateLimiter((1, 1), client_limits={"{Client2}": (1, 2)})
+
+        limiter.check("{client1}", SYSTEM_FIND_CMD_NAME)
+        self.assertRaises(_RateLimitedError, limiter.check,
+                          "{client1}", CORE_HELP_CMD_NAME)
+
+        limiter.check("{client2}", SYSTEM_FIND_CMD_NAME)
+        limiter.check("{client2}", SYSTEM_FIND_CMD_NAME)
+        self.assertRaises(_RateLimitedError, limiter.check,
+                          "{client2}", SYSTEM_FIND_CMD_NAME)
+
+    def test_command_limits(self):
+        limiter = _RateLimiter((0, 0), command_limits={"Core.Help": (1, 1)})
+
+        for _ in range(5):
+            limiter.check("{client1}", SYSTEM_FIND_CMD_NAME)
+        limiter.check("{client1}", CORE_HELP_CMD_NAME)
+        self.assertRaises(_RateLimitedError, limiter.check,
+                          "{client1}", CORE_HELP_CMD_NAME)
+        # Command limits are applied to each client separately
+        limiter.check("{client2}", CORE_HELP_CMD_NAME)
+
+    def test_max_buckets(self):
+        limiter = _RateLimiter((1, 1))
+
+        with patch.object(_RateLimiter, "MAX_BUCKETS", 2):
+            limiter.check("{client1}", SYSTEM_FIND_CMD_NAME)
+            limiter.check("{client2}", SYSTEM_FIND_CMD_NAME)
+            # Using the bucket of client1 makes client2 the least recently used
+            self.assertRaises(_RateLimitedError, limiter.check,
+                              "{client1}", SYSTEM_FIND_CMD_NAME)
+            limiter.check("{client3}", SYSTEM_FIND_CMD_NAME)
+
+            self.assertEqual(2, len(limiter._buckets))
+            self.assertRaises(_RateLimitedError, limiter.check,
+                              "{client1}", SYSTEM_FIND_CMD_NAME)
+            # The bucket of client2 was discarded
+            limiter.check("{client2}", SYSTEM_FIND_CMD_NAME)
+
+    def test_eporequestcallback_ratelimited(self):
+        mock_dxl_client = MockDxlClient()
+        test_topic = "/test/topic"
+
+        epo = dxleposervice._epo._Epo(
+            TEST_EPONAME_BASE, LOCALHOST_IP, 8443, TEST_USER, TEST_PASSWORD, False)
+
+        limiter = _RateLimiter((1, 1))
+        limiter.check(None, CORE_HELP_CMD_NAME)
+
+        test_request = Request(test_topic)
+        test_request.payload = json.dumps(
+            {"command": CORE_HELP_CMD_NAME}).encode(encoding="UTF-8")
+
+        epo_request_callback = dxleposervice.app._EpoRequestCallback(
+            mock_dxl_client, {test_topic: epo}, rate_limiter=limiter)
+        epo_request_callback.on_request(test_request)
+
+        response = mock_dxl_client.latest_sent_message
+        self.assertIsInstance(response, ErrorResponse)
+        self.assertEqual(_RateLimitedError.ERROR_CODE, response.error_code)
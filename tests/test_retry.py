@@ -0,0 +1,87 @@
+import requests
+from mock import patch
+
+import dxleposervice._epo
+from dxleposervice._metrics import registry
+from dxleposervice._retry import _RetryPolicy
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+
+
+def create_response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = b"OK:\ntrue"
+    return response
+
+
+class TestRetryPolicy(BaseClientTest):
+
+    def test_getmaxattempts(self):
+        policy = _RetryPolicy(max_attempts=4,
+                              max_attempts_by_command={"core.executeQuery": 2})
+
+        self.assertEqual(4, policy.get_max_attempts(SYSTEM_FIND_CMD_NAME))
+        self.assertEqual(4, policy.get_max_attempts("core.getSecurityToken"))
+        self.assertEqual(2, policy.get_max_attempts("Core.ExecuteQuery"))
+        self.assertEqual(1, policy.get_max_attempts("system.applyTag"))
+
+    def test_getdelay(self):
+        policy = _RetryPolicy(initial_delay=0.1, max_delay=0.3, budget=1.0)
+
+        for attempt in range(1, 10):
+            delay = policy.get_delay(attempt, 0)
+            self.assertTrue(0 <= delay <= min(0.3, 0.1 * 2 ** (attempt - 1)))
+        self.assertIsNone(policy.get_delay(1, 1.0))
+
+
+class TestEpoRemoteRetry(BaseClientTest):
+
+    def create_epo_remote(self, **kwargs):
+        return dxleposervice._epo._EpoRemote(
+            host=LOCALHOST_IP,
+            port=8443,
+            username=TEST_USER,
+            password=TEST_PASSWORD,
+            verify=False,
+            retry_policy=_RetryPolicy(initial_delay=0.001, **kwargs))
+
+    def test_retry_transient_failures(self):
+        epo_remote = self.create_epo_remote(max_attempts=3)
+        retries = registry.counter("epo_request_retries_total", "")
+        before = retries.get(host=LOCALHOST_IP, command=SYSTEM_FIND_CMD_NAME)
+
+        with patch.object(epo_remote, "_get", side_effect=[
+                requests.exceptions.ConnectionError(),
+                create_response(503),
+                create_response(200)]) as mock_get:
+            response = epo_remote._send_request(SYSTEM_FIND_CMD_NAME, {})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, mock_get.call_count)
+        self.assertEqual(
+            before + 2,
+            retries.get(host=LOCALHOST_IP, command=SYSTEM_FIND_CMD_NAME))
+
+    def test_no_retry_for_mutating_commands(self):
+        epo_remote = self.create_epo_remote(max_attempts=3)
+
+        with patch.object(epo_remote, "_get", side_effect=[
+                requests.exceptions.ConnectionError(),
+                create_response(200)]) as mock_get:
+            self.assertRaises(requests.exceptions.ConnectionError,
+                              epo_remote._send_request, "system.applyTag", {})
+
+        self.assertEqual(1, mock_get.call_count)
+
+    def test_max_attempts(self):
+        epo_remote = self.create_epo_remote(max_attempts=2)
+
+        with patch.object(epo_remote, "_get", side_effect=[
+                create_response(503),
+                create_response(503),
+                create_response(200)]) as mock_get:
+            response = epo_remote._send_request(SYSTEM_FIND_CMD_NAME, {})
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(2, mock_get.call_count)
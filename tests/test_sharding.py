@@ -0,0 +1,59 @@
+from configparser import ConfigParser
+
+from dxleposervice import EpoService
+from dxleposervice._sharding import _ShardSelector
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+
+EPO_NAMES = ["epo{0}".format(index) for index in range(100)]
+
+
+class TestShardSelector(BaseClientTest):
+
+    def test_get_shard(self):
+        selectors = [_ShardSelector(3, index) for index in range(3)]
+
+        # Each ePO server is served by exactly one shard
+        for epo_name in EPO_NAMES:
+            self.assertEqual(1, len([selector for selector in selectors
+                                     if selector.selects(epo_name)]))
+        counts = [len([epo_name for epo_name in EPO_NAMES
+                       if selector.selects(epo_name)])
+                  for selector in selectors]
+        self.assertTrue(all(count > 15 for count in counts))
+
+    def test_add_shard(self):
+        before = _ShardSelector(3, 0)
+        after = _ShardSelector(4, 0)
+
+        # Only ePO servers assigned to the added shard move
+        moved = [epo_name for epo_name in EPO_NAMES
+                 if before.get_shard(epo_name) != after.get_shard(epo_name)]
+        self.assertTrue(all(after.get_shard(epo_name) == 3
+                            for epo_name in moved))
+        self.assertLess(len(moved), 40)
+
+    def test_explicit(self):
+        selector = _ShardSelector(3, 2, {2: ["epo1"], 0: ["epo2"]})
+
+        self.assertTrue(selector.selects("epo1"))
+        self.assertFalse(selector.selects("epo2"))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, _ShardSelector, 0, 0)
+        self.assertRaises(ValueError, _ShardSelector, 2, 2)
+        self.assertRaises(ValueError, _ShardSelector, 2, 0, {3: ["epo1"]})
+
+    def test_select_shard(self):
+        config = ConfigParser()
+        config["General"] = {"epoNames": ",".join(EPO_NAMES),
+                             "shardCount": "2", "shardIndex": "1",
+                             "shard.1": "epo0"}
+        epo_service = EpoService(TEST_FOLDER)
+
+        selected = epo_service._select_shard(config, EPO_NAMES)
+        self.assertIn("epo0", selected)
+        self.assertLess(len(selected), len(EPO_NAMES))
+
+        config["General"]["shardCount"] = "1"
+        self.assertEqual(EPO_NAMES, epo_service._select_shard(config, EPO_NAMES))
@@ -0,0 +1,61 @@
+import json
+from mock import patch
+
+from dxleposervice._slowlog import _SlowRequestLog, _summarize
+from dxleposervice._tracing import _Tracer
+from tests.test_base import BaseClientTest
+
+
+def create_trace(duration):
+    test_tracer = _Tracer()
+    slow_log = _SlowRequestLog(threshold=1.0, max_param_length=20)
+    test_tracer.add_exporter(slow_log)
+
+    root = test_tracer.start_trace(
+        "dxl.request", start=100.0,
+        **{"epo.name": "epo1", "epo.command": "system.find",
+           "dxl.payload_size": 50})
+    root.set_detail("epo.params", {"searchText": "x" * 100})
+    root.child("epo.token", start=100.0).end(end=100.25)
+    root.child("epo.http", start=100.25).end(end=100.5)
+    root.child("epo.http", start=100.5).end(end=100.0 + duration)
+    root.set_attribute("epo.result_size", 2000)
+    return root, slow_log
+
+
+class TestSlowRequestLog(BaseClientTest):
+
+    def test_slow(self):
+        root, _ = create_trace(2.0)
+
+        with patch("dxleposervice._slowlog.slow_logger") as slow_logger:
+            root.end(end=102.0)
+        entry = json.loads(slow_logger.warning.call_args[0][1])
+        self.assertEqual("epo1", entry["epo"])
+        self.assertEqual("system.find", entry["command"])
+        self.assertEqual(2000, entry["durationMs"])
+        self.assertEqual(50, entry["requestSize"])
+        self.assertEqual(2000, entry["responseSize"])
+        self.assertEqual({"epo.token": 250, "epo.http": 1750},
+                         entry["phasesMs"])
+        self.assertEqual(20, len(entry["params"]))
+        self.assertEqual(root.trace_id, entry["traceId"])
+
+    def test_fast(self):
+        root, _ = create_trace(0.9)
+
+        with patch("dxleposervice._slowlog.slow_logger") as slow_logger:
+            root.end(end=100.9)
+        self.assertFalse(slow_logger.warning.called)
+
+    def test_sample_rate(self):
+        root, slow_log = create_trace(2.0)
+        slow_log._sample_rate = 0
+
+        with patch("dxleposervice._slowlog.slow_logger") as slow_logger:
+            root.end(end=102.0)
+        self.assertFalse(slow_logger.warning.called)
+
+    def test_summarize(self):
+        self.assertEqual("a=1,b=2", _summarize({"b": 2, "a": 1}, 20))
+        self.assertEqual("a=12...", _summarize({"a": "123456"}, 7))
@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import tempfile
+from dxlclient import Request
+from dxlclient.message import ErrorResponse
+from mock import MagicMock, patch
+
+try: #Python 3
+    from urllib.request import urlopen
+except ImportError: #Python 2.7
+    from urllib2 import urlopen
+
+import dxleposervice.app
+from dxleposervice._metrics import _Counter, _MetricsRegistry, registry
+from dxleposervice._stats import _MetricsFileWriter, _MetricsHttpServer, \
+    _StatsRequestCallback
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_dxlclient import MockDxlClient
+
+
+def create_registry():
+    metrics = _MetricsRegistry()
+    metrics.counter("requests_total", "The number of requests",
+                    ["epo"]).inc(2, epo="epo1")
+    histogram = metrics.histogram("duration_seconds", "The duration",
+                                  ["epo"], buckets=[0.1, 1.0])
+    histogram.observe(0.05, epo="epo1")
+    histogram.observe(0.5, epo="epo1")
+    histogram.observe(5, epo="epo1")
+    return metrics
+
+
+class TestMetrics(BaseClientTest):
+
+    def test_histogram(self):
+        value = create_registry().histogram(
+            "duration_seconds", "The duration", ["epo"]).get(epo="epo1")
+
+        self.assertEqual([(0.1, 1), (1.0, 2), (float("inf"), 3)],
+                         value["buckets"])
+        self.assertEqual(3, value["count"])
+        self.assertAlmostEqual(5.55, value["sum"])
+
+    def test_prometheus_text(self):
+        text = create_registry().to_prometheus_text()
+
+        self.assertIn("# TYPE duration_seconds histogram\n", text)
+        self.assertIn('duration_seconds_bucket{epo="epo1",le="0.1"} 1\n', text)
+        self.assertIn('duration_seconds_bucket{epo="epo1",le="+Inf"} 3\n', text)
+        self.assertIn('duration_seconds_count{epo="epo1"} 3\n', text)
+        self.assertIn("# TYPE requests_total counter\n", text)
+        self.assertIn('requests_total{epo="epo1"} 2\n', text)
+
+    def test_to_dict(self):
+        metrics = dict((metric["name"], metric)
+                       for metric in create_registry().to_dict()["metrics"])
+
+        self.assertEqual(
+            [{"labels": {"epo": "epo1"}, "value": 2}],
+            metrics["requests_total"]["samples"])
+        self.assertEqual(
+            {"0.1": 1, "1": 2, "+Inf": 3},
+            metrics["duration_seconds"]["samples"][0]["value"]["buckets"])
+
+    def test_max_series(self):
+        counter = _Counter("commands_total", "The commands", ["command"])
+        with patch.object(_Counter, "MAX_SERIES", 2):
+            for index in range(4):
+                counter.inc(command="command{0}".format(index))
+
+        self.assertEqual(2, counter.get(command=_Counter.OTHER))
+        self.assertEqual(3, len(counter.samples()))
+
+
+class TestStats(BaseClientTest):
+
+    def test_stats_request(self):
+        mock_dxl_client = MockDxlClient()
+        callback = _StatsRequestCallback(mock_dxl_client, create_registry(), 1,
+                                         "/test/stats/instance1")
+
+        callback.on_request(Request("/test/stats"))
+        result = json.loads(mock_dxl_client.latest_sent_message.payload)
+        self.assertEqual(1, result["worker"])
+        self.assertEqual("/test/stats/instance1", result["topic"])
+        self.assertEqual(["duration_seconds", "requests_total"],
+                         [metric["name"] for metric in result["metrics"]])
+
+        request = Request("/test/stats")
+        request.payload = json.dumps({"format": "prometheus"}).encode(
+            encoding="UTF-8")
+        callback.on_request(request)
+        self.assertIn("requests_total",
+                      mock_dxl_client.latest_sent_message.payload)
+
+        request.payload = b"invalid"
+        callback.on_request(request)
+        self.assertIsInstance(mock_dxl_client.latest_sent_message,
+                              ErrorResponse)
+
+    def test_http_server(self):
+        server = _MetricsHttpServer(create_registry(), 0)
+        server.start()
+        try:
+            body = urlopen("http://127.0.0.1:{0}/metrics".format(
+                server.port)).read().decode("utf-8")
+            self.assertIn('requests_total{epo="epo1"} 2', body)
+        finally:
+            server.shutdown()
+
+    def test_file_writer(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "metrics.prom")
+            _MetricsFileWriter(create_registry(), path, 60).write()
+            with open(path) as metrics_file:
+                self.assertIn('requests_total{epo="epo1"} 2',
+                              metrics_file.read())
+            self.assertEqual(["metrics.prom"], os.listdir(directory))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_request_metrics(self):
+        epo = MagicMock()
+        epo.name = "stats-epo"
+        epo.execute.return_value = "result"
+        callback = dxleposervice.app._EpoRequestCallback(
+            MockDxlClient(), {"/test/topic": epo})
+
+        request = Request("/test/topic")
+        request.payload = json.dumps(
+            {"command": SYSTEM_FIND_CMD_NAME}).encode(encoding="UTF-8")
+        callback.on_request(request)
+        epo.execute.side_effect = Exception("Failed")
+        callback.on_request(request)
+
+        self.assertEqual(2, registry.counter(
+            "service_requests_total", "", ["epo", "command"]).get(
+                epo="stats-epo", command=SYSTEM_FIND_CMD_NAME))
+        self.assertEqual(1, registry.counter(
+            "service_request_errors_total", "", ["epo", "code"]).get(
+                epo="stats-epo", code=0))
+        self.assertEqual(2, registry.histogram(
+            "service_request_duration_seconds", "", ["epo", "command"]).get(
+                epo="stats-epo", command=SYSTEM_FIND_CMD_NAME)["count"])
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from mock import patch
+
+from dxleposervice._supervisor import _Supervisor
+from tests.test_base import BaseClientTest
+
+
+def run_worker(config_dir, worker_id):
+    # Record the start of the worker, and exit immediately (worker 1) or wait
+    # until terminated
+    with open(os.path.join(config_dir, "worker{0}.{1}".format(
+            worker_id, os.getpid())), "w"):
+        pass
+    if worker_id == 0:
+        time.sleep(60)
+
+
+def wait_for(condition, timeout=10):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.05)
+
+
+class TestSupervisor(BaseClientTest):
+
+    def setUp(self):
+        super(TestSupervisor, self).setUp()
+        self.config_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.config_dir, "test.config"), "w") as f:
+            f.write("[General]\n")
+
+    def tearDown(self):
+        super(TestSupervisor, self).tearDown()
+        shutil.rmtree(self.config_dir)
+
+    def get_starts(self, worker_id):
+        return [name for name in os.listdir(self.config_dir)
+                if name.startswith("worker{0}.".format(worker_id))]
+
+    def test_run(self):
+        supervisor = _Supervisor(self.config_dir, "test.config", 2, run_worker,
+                                 shutdown_timeout=5)
+        with patch.object(_Supervisor, "CHECK_INTERVAL", 0.05), \
+                patch.object(_Supervisor, "RESTART_DELAY", 0.2):
+            thread = threading.Thread(target=supervisor.run)
+            thread.start()
+            try:
+                # The worker that exited is restarted
+                wait_for(lambda: len(self.get_starts(1)) >= 2)
+                self.assertGreaterEqual(len(self.get_starts(1)), 2)
+                self.assertEqual(1, len(self.get_starts(0)))
+            finally:
+                supervisor.stop()
+                thread.join(10)
+        self.assertFalse(thread.is_alive())
+        for process in supervisor._workers.values():
+            self.assertFalse(process.is_alive())
+
+    def test_invalid_config(self):
+        supervisor = _Supervisor(self.config_dir, "missing.config", 2,
+                                 run_worker)
+        self.assertRaises(Exception, supervisor.run)
+        self.assertEqual({}, supervisor._workers)
@@ -0,0 +1,161 @@
+import json
+from mock import MagicMock
+
+import dxleposervice._epo
+from dxleposervice._sysindex import _SystemIndex, _SystemIndexManager
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+
+SYSTEMS = [
+    {
+        "EPOComputerProperties.ComputerName": "web01",
+        "EPOComputerProperties.IPAddress": "10.0.0.1",
+        "EPOComputerProperties.NetAddress": "001122334455",
+        "EPOLeafNode.AgentGUID": "11111111-2222-3333-4444-555555555555",
+        "EPOLeafNode.Tags": "Server"
+    },
+    {
+        "EPOComputerProperties.ComputerName": "web010",
+        "EPOComputerProperties.IPAddress": "10.0.0.10",
+        "EPOComputerProperties.NetAddress": "00112233445A",
+        "EPOLeafNode.AgentGUID": "66666666-7777-8888-9999-000000000000",
+        "EPOLeafNode.Tags": "Workstation"
+    }
+]
+
+
+class TestSystemIndex(BaseClientTest):
+
+    def test_get(self):
+        index = _SystemIndex(SYSTEMS)
+
+        self.assertEqual([SYSTEMS[0]], index.get(mac="00:11:22:33:44:55"))
+        self.assertEqual([SYSTEMS[1]], index.get(
+            guid="{66666666-7777-8888-9999-000000000000}"))
+        self.assertEqual([], index.get(mac="00:11:22:33:44:66"))
+
+    def test_find(self):
+        index = _SystemIndex(SYSTEMS)
+
+        # Substrings of the searched properties (like ePO)
+        self.assertEqual([SYSTEMS[1]], index.find("Web010"))
+        self.assertEqual([SYSTEMS[1]], index.find("10.0.0.10"))
+        self.assertIsNone(index.find("10.0.0.1", name_only=True))
+        self.assertEqual(SYSTEMS, index.find("Web0"))
+        self.assertEqual(SYSTEMS, index.find("10.0.0"))
+        self.assertEqual([SYSTEMS[1]], index.find("workstation"))
+        self.assertEqual([SYSTEMS[1]], index.find("00-11-22-33-44-5a"))
+        self.assertEqual([SYSTEMS[0]], index.find(
+            "11111111-2222-3333-4444-555555555555"))
+        self.assertIsNone(index.find("server", name_only=True))
+        # Not answered by the index
+        self.assertIsNone(index.find("db01"))
+        self.assertIsNone(index.find("we"))
+
+    def test_find_prefix_collisions(self):
+        index = _SystemIndex(SYSTEMS + [
+            {
+                "EPOComputerProperties.ComputerName": "web01.corp",
+                "EPOComputerProperties.IPAddress": "10.0.1.1",
+                "EPOLeafNode.AgentGUID": "aaaaaaaa-2222-3333-4444-555555555555"
+            },
+            {
+                "EPOComputerProperties.ComputerName": "db01",
+                "EPOComputerProperties.IPAddress": "10.0.0.11",
+                "EPOLeafNode.AgentGUID": "bbbbbbbb-2222-3333-4444-555555555555",
+                "EPOLeafNode.Tags": "Backend, Web01"
+            }
+        ])
+
+        def find_names(search_text, name_only=False):
+            return [record["EPOComputerProperties.ComputerName"]
+                    for record in index.find(search_text, name_only)]
+
+        # A name that is a prefix or a substring of other names (and of other
+        # properties)
+        self.assertEqual(["web01", "web010", "web01.corp", "db01"],
+                         find_names("web01"))
+        self.assertEqual(["web01", "web010", "web01.corp"],
+                         find_names("web01", name_only=True))
+        # An IP address that is a prefix of other IP addresses
+        self.assertEqual(["web01", "web010", "db01"], find_names("10.0.0.1"))
+
+    def test_add(self):
+        index = _SystemIndex(SYSTEMS)
+        updated = dict(SYSTEMS[0])
+        updated["EPOComputerProperties.ComputerName"] = "app01"
+        index.add(updated)
+
+        self.assertEqual(2, len(index))
+        self.assertEqual([updated], index.find("app01"))
+        self.assertEqual([SYSTEMS[1]], index.find("web01"))
+
+
+class TestSystemIndexManager(BaseClientTest):
+
+    def create_epo(self, manager):
+        epo = dxleposervice._epo._Epo("epo1", LOCALHOST_IP, 8443, TEST_USER,
+                                      TEST_PASSWORD, False,
+                                      system_index=manager)
+        epo._fetch = MagicMock(return_value=json.dumps(SYSTEMS))
+        manager.add(epo)
+        return epo
+
+    def test_execute(self):
+        manager = _SystemIndexManager(refresh_interval=3600)
+        epo = self.create_epo(manager)
+        manager.refresh()
+        epo._fetch.assert_called_once_with(SYSTEM_FIND_CMD_NAME, "json",
+                                           {"searchText": ""})
+        epo._fetch.reset_mock()
+
+        # Answered by the index
+        self.assertEqual([SYSTEMS[1]], json.loads(epo.execute(
+            SYSTEM_FIND_CMD_NAME, "json", {"searchText": "web010"})))
+        self.assertEqual([SYSTEMS[1]], json.loads(epo.execute(
+            SYSTEM_FIND_CMD_NAME, "json",
+            {"searchText": "web010", "searchNameOnly": "true"})))
+        self.assertFalse(epo._fetch.called)
+
+        # Results in other formats are requested from the ePO server
+        epo.execute(SYSTEM_FIND_CMD_NAME, "xml", {"searchText": "web010"})
+        epo._fetch.assert_called_once_with(SYSTEM_FIND_CMD_NAME, "xml",
+                                           {"searchText": "web010"})
+        epo._fetch.reset_mock()
+
+        # Not answered by the index
+        epo.execute(SYSTEM_FIND_CMD_NAME, "json", {"searchText": "db01"})
+        self.assertEqual(1, epo._fetch.call_count)
+
+    def test_update(self):
+        manager = _SystemIndexManager(refresh_interval=3600)
+        epo = self.create_epo(manager)
+        manager.refresh()
+        added = dict(SYSTEMS[0])
+        added["EPOComputerProperties.ComputerName"] = "db01"
+        added["EPOLeafNode.AgentGUID"] = "aaaaaaaa-2222-3333-4444-555555555555"
+        epo._fetch.return_value = json.dumps([added])
+
+        # The result of a request sent to the ePO server is indexed
+        epo.execute(SYSTEM_FIND_CMD_NAME, "json", {"searchText": "db01"})
+        epo._fetch.reset_mock()
+        self.assertEqual([added], json.loads(epo.execute(
+            SYSTEM_FIND_CMD_NAME, "json", {"searchText": "db01"})))
+        self.assertFalse(epo._fetch.called)
+
+    def test_invalidate(self):
+        manager = _SystemIndexManager(refresh_interval=3600)
+        epo = self.create_epo(manager)
+        manager.refresh()
+
+        epo.execute("system.applyTag", "json",
+                    {"names": "web01", "tagName": "Linux"})
+        epo._fetch.reset_mock()
+
+        # The index is not used until it has been rebuilt
+        epo.execute(SYSTEM_FIND_CMD_NAME, "json", {"searchText": "web01"})
+        self.assertEqual(1, epo._fetch.call_count)
+        manager.rebuild_stale()
+        epo._fetch.reset_mock()
+        epo.execute(SYSTEM_FIND_CMD_NAME, "json", {"searchText": "web01"})
+        self.assertFalse(epo._fetch.called)
@@ -0,0 +1,104 @@
+import json
+import requests
+from mock import patch
+from dxlclient import Request
+from dxlclient.message import ErrorResponse
+
+import dxleposervice._epo
+import dxleposervice.app
+from dxleposervice._errors import _EpoConnectTimeoutError, _EpoReadTimeoutError
+from dxleposervice._metrics import registry
+from dxleposervice._retry import _RetryPolicy
+from dxleposervice._timeouts import _TimeoutPolicy
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_dxlclient import MockDxlClient
+
+
+class TestTimeoutPolicy(BaseClientTest):
+
+    def test_gettimeout(self):
+        policy = _TimeoutPolicy(
+            connect_timeout=5, read_timeout=60,
+            connect_timeouts_by_command={"core.help": 1},
+            read_timeouts_by_command={"core.executeQuery": 600})
+
+        self.assertEqual((5, 60), policy.get_timeout(SYSTEM_FIND_CMD_NAME))
+        self.assertEqual((1, 60), policy.get_timeout(CORE_HELP_CMD_NAME))
+        self.assertEqual((5, 600), policy.get_timeout("Core.ExecuteQuery"))
+
+
+class TestEpoRemoteTimeouts(BaseClientTest):
+
+    def create_epo_remote(self, max_attempts=1):
+        return dxleposervice._epo._EpoRemote(
+            host=LOCALHOST_IP,
+            port=8443,
+            username=TEST_USER,
+            password=TEST_PASSWORD,
+            verify=False,
+            retry_policy=_RetryPolicy(max_attempts=max_attempts,
+                                      initial_delay=0.001),
+            timeout_policy=_TimeoutPolicy(
+                connect_timeout=2, read_timeout=30,
+                read_timeouts_by_command={CORE_HELP_CMD_NAME: 5}))
+
+    def test_timeout_passed_to_request(self):
+        epo_remote = self.create_epo_remote()
+
+        with patch.object(epo_remote._session, "get") as mock_get:
+            epo_remote._send_request(CORE_HELP_CMD_NAME, {})
+
+        self.assertEqual((2, 5), mock_get.call_args[1]["timeout"])
+
+    def test_read_timeout(self):
+        epo_remote = self.create_epo_remote(max_attempts=2)
+        timeouts = registry.counter("epo_request_timeouts_total", "")
+        before = timeouts.get(host=LOCALHOST_IP, command=SYSTEM_FIND_CMD_NAME,
+                              type="read")
+
+        with patch.object(epo_remote._session, "get",
+                          side_effect=requests.exceptions.ReadTimeout()) \
+                as mock_get:
+            with self.assertRaises(_EpoReadTimeoutError) as context:
+                epo_remote._send_request(SYSTEM_FIND_CMD_NAME, {})
+
+        self.assertEqual(2, mock_get.call_count)
+        self.assertEqual(598, context.exception.error_code)
+        self.assertEqual(
+            before + 2,
+            timeouts.get(host=LOCALHOST_IP, command=SYSTEM_FIND_CMD_NAME,
+                         type="read"))
+
+    def test_connect_timeout(self):
+        epo_remote = self.create_epo_remote()
+
+        with patch.object(epo_remote._session, "get",
+                          side_effect=requests.exceptions.ConnectTimeout()):
+            with self.assertRaises(_EpoConnectTimeoutError) as context:
+                epo_remote._send_request(SYSTEM_FIND_CMD_NAME, {})
+
+        self.assertEqual(599, context.exception.error_code)
+        # Timeouts are still treated as request failures (admission control,
+        # load balancing)
+        self.assertIsInstance(context.exception,
+                              requests.exceptions.RequestException)
+
+    def test_eporequestcallback_timeout(self):
+        mock_dxl_client = MockDxlClient()
+        test_topic = "/test/topic"
+        epo = dxleposervice._epo._Epo(
+            "epo1", LOCALHOST_IP, 8443, TEST_USER, TEST_PASSWORD, False)
+        epo_request_callback = dxleposervice.app._EpoRequestCallback(
+            mock_dxl_client, {test_topic: epo})
+
+        test_request = Request(test_topic)
+        test_request.payload = json.dumps(
+            {"command": SYSTEM_FIND_CMD_NAME}).encode(encoding="UTF-8")
+        with patch.object(epo._client._session, "get",
+                          side_effect=requests.exceptions.ReadTimeout()):
+            epo_request_callback.on_request(test_request)
+
+        response = mock_dxl_client.latest_sent_message
+        self.assertIsInstance(response, ErrorResponse)
+        self.assertEqual(598, response.error_code)
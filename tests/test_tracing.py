@@ -0,0 +1,210 @@
+import json
+import os
+import shutil
+import tempfile
+from dxlclient import Request
+from mock import MagicMock
+
+import dxleposervice._epo
+import dxleposervice.app
+from dxleposervice._dispatch import _Dispatcher, _Lane
+from dxleposervice._tracing import _OtlpFileExporter, _SpanExporter, \
+    _Tracer, _create_exporter, tracer
+from tests.test_base import BaseClientTest
+from tests.test_value_constants import *
+from tests.mock_dxlclient import MockDxlClient
+from tests.mock_epohttpserver import MockServerRunner
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class RecordingExporter(_SpanExporter):
+
+    def __init__(self, **options):
+        self.options = options
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append(spans)
+
+
+class TestTracer(BaseClientTest):
+
+    def test_disabled(self):
+        span = _Tracer().start_trace("dxl.request")
+
+        self.assertIsNone(span.trace_id)
+        self.assertIs(span, span.child("epo.execute"))
+
+    def test_trace(self):
+        exporter = RecordingExporter()
+        test_tracer = _Tracer()
+        test_tracer.add_exporter(exporter)
+        request = Request("/test/topic")
+        request.other_fields = {
+            "traceparent": "00-{0}-{1}-01".format(TRACE_ID, PARENT_ID)}
+
+        root = test_tracer.start_trace("dxl.request", request)
+        with test_tracer.activate(root):
+            with test_tracer.span("epo.execute"):
+                with test_tracer.span("epo.http", status=200):
+                    pass
+        self.assertEqual([], exporter.traces)
+        root.end()
+
+        # The spans are exported when the root span ends
+        spans = dict((span.name, span) for span in exporter.traces[0])
+        self.assertEqual(set([TRACE_ID]),
+                         set(span.trace_id for span in spans.values()))
+        self.assertEqual(PARENT_ID, spans["dxl.request"].parent_id)
+        self.assertEqual(spans["dxl.request"].span_id,
+                         spans["epo.execute"].parent_id)
+        self.assertEqual(spans["epo.execute"].span_id,
+                         spans["epo.http"].parent_id)
+        self.assertEqual(200, spans["epo.http"].attributes["status"])
+
+    def test_message_id(self):
+        test_tracer = _Tracer()
+        test_tracer.add_exporter(RecordingExporter())
+        request = Request("/test/topic")
+
+        span = test_tracer.start_trace("dxl.request", request)
+        self.assertEqual(request.message_id.strip("{}").replace("-", ""),
+                         span.trace_id)
+
+    def test_sampling(self):
+        test_tracer = _Tracer()
+        test_tracer.add_exporter(RecordingExporter(), sample_rate=0)
+        request = Request("/test/topic")
+
+        self.assertIsNone(test_tracer.start_trace("dxl.request").trace_id)
+        request.other_fields = {
+            "traceparent": "00-{0}-{1}-01".format(TRACE_ID, PARENT_ID)}
+        self.assertEqual(TRACE_ID, test_tracer.start_trace(
+            "dxl.request", request).trace_id)
+
+    def test_exporter_sample_rates(self):
+        sampled, unsampled = RecordingExporter(), RecordingExporter()
+        test_tracer = _Tracer()
+        test_tracer.add_exporter(sampled)
+        test_tracer.add_exporter(unsampled, sample_rate=0)
+
+        test_tracer.start_trace("dxl.request").end()
+        self.assertEqual(1, len(sampled.traces))
+        self.assertEqual([], unsampled.traces)
+
+    def test_span_error(self):
+        exporter = RecordingExporter()
+        test_tracer = _Tracer()
+        test_tracer.add_exporter(exporter)
+
+        root = test_tracer.start_trace("dxl.request")
+        with test_tracer.activate(root):
+            with self.assertRaises(ValueError):
+                with test_tracer.span("epo.execute"):
+                    raise ValueError("Failed")
+        root.end()
+        self.assertEqual("Failed", exporter.traces[0][0].error)
+
+
+class TestExporters(BaseClientTest):
+
+    def test_otlp_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "traces.json")
+            exporter = _create_exporter("file", {"path": path})
+            self.assertIsInstance(exporter, _OtlpFileExporter)
+            test_tracer = _Tracer()
+            test_tracer.add_exporter(exporter)
+
+            root = test_tracer.start_trace("dxl.request", command="core.help")
+            root.child("epo.execute").end()
+            root.end()
+            test_tracer.shutdown()
+
+            with open(path) as trace_file:
+                lines = trace_file.readlines()
+            self.assertEqual(1, len(lines))
+            spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0][
+                "spans"]
+            self.assertEqual(["epo.execute", "dxl.request"],
+                             [span["name"] for span in spans])
+            self.assertEqual(spans[1]["spanId"], spans[0]["parentSpanId"])
+            self.assertEqual(
+                [{"key": "command", "value": {"stringValue": "core.help"}}],
+                spans[1]["attributes"])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_custom(self):
+        exporter = _create_exporter("tests.test_tracing.RecordingExporter",
+                                    {"endpoint": "localhost"})
+
+        self.assertEqual({"endpoint": "localhost"}, exporter.options)
+        self.assertRaises(ValueError, _create_exporter, "unknown", {})
+
+
+class TestRequestTracing(BaseClientTest):
+
+    def test_queued_request(self):
+        exporter = RecordingExporter()
+        tracer.add_exporter(exporter)
+        lane = _Lane("default", thread_count=1, queue_size=10)
+        try:
+            epo = MagicMock()
+            epo.name = "epo1"
+            epo.execute.return_value = "result"
+            tracker = dxleposervice.app._InFlightTracker()
+            callback = dxleposervice.app._EpoRequestCallback(
+                MockDxlClient(), {"/test/topic": epo},
+                dispatcher=_Dispatcher(lane), in_flight=tracker)
+
+            request = Request("/test/topic")
+            request.payload = json.dumps(
+                {"command": SYSTEM_FIND_CMD_NAME}).encode(encoding="UTF-8")
+            callback.on_request(request)
+            self.assertTrue(tracker.wait(5))
+        finally:
+            lane.shutdown()
+            tracer.shutdown()
+
+        spans = dict((span.name, span) for span in exporter.traces[0])
+        self.assertEqual(
+            set(["dxl.request", "dispatch.queue", "epo.execute",
+                 "dxl.send_response"]), set(spans))
+        self.assertEqual(SYSTEM_FIND_CMD_NAME,
+                         spans["dxl.request"].attributes["epo.command"])
+        self.assertEqual(spans["dxl.request"].span_id,
+                         spans["epo.execute"].parent_id)
+
+    def test_epo_remote(self):
+        exporter = RecordingExporter()
+        test_tracer = _Tracer()
+        test_tracer.add_exporter(exporter)
+        dxleposervice._epo.tracer = test_tracer
+        try:
+            with MockServerRunner() as server_list:
+                epo_remote = dxleposervice._epo._EpoRemote(
+                    host=LOCALHOST_IP,
+                    port=server_list[0][SERVER_INFO_SERVER_PORT_KEY],
+                    username=TEST_USER,
+                    password=TEST_PASSWORD,
+                    verify=False)
+                root = test_tracer.start_trace("dxl.request")
+                with test_tracer.activate(root):
+                    epo_remote.invoke_command("core.help", {})
+                root.end()
+                epo_remote.close()
+        finally:
+            dxleposervice._epo.tracer = tracer
+
+        spans = exporter.traces[0]
+        self.assertEqual(
+            ["epo.http", "epo.token", "epo.http", "epo.parse", "dxl.request"],
+            [span.name for span in spans])
+        self.assertEqual(spans[1].span_id, spans[0].parent_id)
+        self.assertTrue(spans[0].attributes["http.new_connection"])
+        self.assertFalse(spans[2].attributes["http.new_connection"])
+        self.assertEqual(200, spans[2].attributes["http.status_code"])